@@ -1,5 +1,4 @@
 import os
-from groq import Groq
 
 
 class Groq_client:
@@ -11,6 +10,9 @@ class Groq_client:
         if not api_key:
             raise ValueError("Missing GROQ_API_KEY environment variable")
 
+        # Imported here so loading this module (at app import) doesn't load the SDK.
+        from groq import Groq
+
         self.client = Groq(api_key=api_key)
         self.model = groq_model
 
@@ -1,10 +1,8 @@
+import importlib
 from fastapi import HTTPException
 from typing import Dict, Any
 from app.utils.logger import get_logger
-from app.ai_orchestrator.rag.rag_graph import rag_app
-from app.ai_orchestrator.quiz.quiz_graph import quiz_app
-from app.ai_orchestrator.visualizer.visualizer_graph import visualizer_app
-from app.core import model_config
+from app.core import model_config, prompt_manager
 from app.core.langfuse_client import get_langfuse_client
 from langfuse.langchain import CallbackHandler
 from langfuse import propagate_attributes
@@ -18,16 +16,35 @@ _PIPELINE_FEATURE: dict[str, str] = {
     "visualizer": "viz_magic",
 }
 
+# Prompt each pipeline renders — its served version is recorded on the trace.
+_PIPELINE_PROMPT: dict[str, str] = {
+    "rag": "nowry-cards-magic",
+    "quiz": "nowry-quiz-magic",
+    "visualizer": "nowry-viz-magic",
+}
+
+
+# Compiled LangGraph apps, as "module:attribute". Importing LangGraph and building
+# the graphs is the slowest part of app import, so each graph is imported and
+# compiled on its first invoke instead of at startup.
+_GRAPH_PATHS: dict[str, str] = {
+    "rag": "app.ai_orchestrator.rag.rag_graph:rag_app",
+    "quiz": "app.ai_orchestrator.quiz.quiz_graph:quiz_app",
+    "visualizer": "app.ai_orchestrator.visualizer.visualizer_graph:visualizer_app",
+}
+
+
+def _load_graph(path: str):
+    module_name, attribute = path.split(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
 
 class AIOrchestrator:
     """Central controller for LangGraph pipelines."""
 
     def __init__(self):
-        self.graphs = {
-            "rag": rag_app,
-            "quiz": quiz_app,
-            "visualizer": visualizer_app,
-        }
+        # Values are compiled graphs or, until first use, their _GRAPH_PATHS entry.
+        self.graphs: Dict[str, Any] = dict(_GRAPH_PATHS)
         # LLM clients moved to module-level singletons in app.core.model_config (D-13)
 
     def invoke(self, graph_name: str, state: Dict[str, Any]) -> Dict[str, Any]:
@@ -36,6 +53,8 @@ class AIOrchestrator:
             raise HTTPException(status_code=404, detail=f"Unknown graph '{graph_name}'")
 
         graph = self.graphs[graph_name]
+        if isinstance(graph, str):
+            graph = self.graphs[graph_name] = _load_graph(graph)
 
         # Model routing per tier (D-13) — delegates to centralized model_config singleton
         tier: str = state.get("tier", "free")
@@ -51,6 +70,8 @@ class AIOrchestrator:
             "user_id": str(user_id),
             "model": model_name,
         }
+        if graph_name in _PIPELINE_PROMPT:
+            trace_metadata.update(prompt_manager.version_metadata(_PIPELINE_PROMPT[graph_name]))
 
         try:
             logger.info(f"[{graph_name}] Invoking pipeline with state: {state}")
@@ -94,7 +94,45 @@ async def get_firebase_user(request: Request) -> dict:
             status_code=401,
             detail="Authentication required. No Firebase token found."
         )
-    
+
+    return await resolve_firebase_token(token)
+
+
+async def get_websocket_user(websocket, timeout: float = 10.0) -> Optional[dict]:
+    """
+    Authenticate an accepted WebSocket. Browsers cannot set headers on a
+    WebSocket, so besides the Authorization header and the firebase_token
+    cookie the token may arrive as the first frame: {"type": "auth", "token": ...}.
+    Returns None (caller closes the socket) when no valid token is presented.
+    """
+    auth_header = websocket.headers.get("Authorization")
+    token = auth_header.replace("Bearer ", "") if auth_header and auth_header.startswith("Bearer ") else None
+    token = token or websocket.cookies.get("firebase_token")
+
+    if not token:
+        try:
+            frame = await asyncio.wait_for(websocket.receive_json(), timeout=timeout)
+        except Exception:
+            return None
+        if isinstance(frame, dict) and frame.get("type") == "auth":
+            token = frame.get("token")
+    if not token:
+        return None
+
+    try:
+        return await resolve_firebase_token(token)
+    except HTTPException:
+        return None
+
+
+async def resolve_firebase_token(token: str) -> dict:
+    """
+    Validate a Firebase ID token and join it with the MongoDB user
+    (creating or reactivating the document when needed).
+
+    Shared by get_firebase_user (HTTP) and WebSocket endpoints, which receive
+    the token in their first frame instead of a header.
+    """
     # Check cache first
     cached_data = _get_cached_token(token)
     if cached_data:
@@ -158,6 +196,13 @@ async def get_firebase_user(request: Request) -> dict:
                 },
             )
             token_data["user_id"] = str(user["_id"])
+            # Bring back the content the account deletion took, unless the
+            # 30-day retention TTL has purged it already.
+            from app.services import cascade
+            try:
+                await cascade.restore_account(token_data["user_id"])
+            except Exception as exc:
+                logger.warning("Content restore failed for reactivated user %s: %s", token_data["user_id"], exc)
         else:
             # Valid Firebase token but no MongoDB document — first-time sign-in
             # via Google before /auth/register is called.
@@ -1,6 +1,11 @@
+import asyncio
+import hashlib
+import json
 import logging
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from datetime import datetime, timezone
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +50,12 @@ sheets_collection = db["sheets"]
 
 # Blackboards (Phase 7 multi-board)
 blackboards_collection = db["blackboards"]
+# Realtime board ops fanned out across API workers via a change stream
+# (app/services/blackboard_sync.py). Short-lived: expired by TTL.
+blackboard_events_collection = db["blackboard_events"]
+
+# Applied blackboard patches, one per board version (app/utils/blackboard_ops.py).
+blackboard_op_log_collection = db["blackboard_op_log"]
 
 # Comments — user-private, text-anchored annotations on a resource (Books first)
 comments_collection = db["comments"]
@@ -56,6 +67,48 @@ rate_limits_collection = db["rate_limits"]
 # Fork idempotency records — one per (content type, source, user) (ADR-005).
 content_forks_collection = db["content_forks"]
 
+# Anki .apkg import jobs (app/routers/import_apkg.py). One job document per
+# upload plus its parsed cards staged server-side until the user confirms.
+# Both expire after 24 h via TTL, so abandoned imports clean themselves up.
+apkg_imports_collection = db["apkg_imports"]
+apkg_import_cards_collection = db["apkg_import_cards"]
+
+# Per-card review history. Seeded from Anki's revlog on .apkg import so imported
+# mature decks keep their study record alongside the SM-2 fields on the card.
+card_reviews_collection = db["card_reviews"]
+
+# Book images moved out of full_content into the storage backend. One document
+# per (user, content hash) so a repeated figure is uploaded once per user.
+book_images_collection = db["book_images"]
+
+# News feeds (app/services/news_refresher.py): one document per RSS feed URL
+# with its normalized articles and conditional-GET validators. Bounded by the
+# feed list, shared by every worker.
+news_feeds_collection = db["news_feeds"]
+
+# Quiz question bank (app/utils/question_bank.py): generated questions keyed
+# by hash(card fields, question type, prompt version), shared across users.
+question_bank_collection = db["question_bank"]
+
+# Book content stored as one document per top-level Lexical block
+# (app/utils/book_content.py); order and section index live on the book.
+book_blocks_collection = db["book_blocks"]
+
+# Plain-text derivative of each book, rebuilt after every content save
+# (app/utils/book_text.py). _id is the book's _id.
+book_texts_collection = db["book_texts"]
+
+# Per-user daily activity rollups (app/services/activity.py): one document per
+# (user, UTC day), incremented on each review, book save and study session.
+# Streaks and weekly charts read these instead of scanning cards.
+activity_days_collection = db["activity_days"]
+
+# Background data export jobs (app/services/data_export.py). The finished ZIP
+# is stored in GridFS so any worker can serve the download; both the job
+# document (TTL) and its artifact expire after 24 h.
+export_jobs_collection = db["export_jobs"]
+export_files_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="data_exports")
+
 #: Index names for curated official browse (ADR-004). Named so deployment can
 #: verify them, and so the verification step below can report a missing one.
 CURATED_BROWSE_INDEX = "decks_curated_browse"
@@ -165,169 +218,258 @@ async def create_fork_indexes(collection) -> list:
     return missing
 
 
-async def create_indexes():
+#: Soft-delete retention: documents with deleted_at set are purged after 30 days.
+_RETENTION_SECONDS = 2592000  # 60 * 60 * 24 * 30
+
+_SOFT_DELETE_COLLECTIONS = (
+    "books", "book_blocks", "decks", "cards", "tasks", "annual_plans",
+    "goals", "sheets", "blackboards", "comments",
+)
+
+#: Collections app/services/cascade.py soft-deletes and restores as a graph.
+_CASCADE_COLLECTIONS = (
+    "books", "book_blocks", "decks", "cards", "tasks", "study_sessions", "blackboards",
+    "annual_plans", "focus_areas", "priorities", "goals", "activities", "daily_routines",
+)
+
+
+def _index(collection: str, keys, **options) -> tuple:
+    """One index spec: (collection name, [(field, direction)], create_index options)."""
+    if isinstance(keys, str):
+        keys = [(keys, 1)]
+    return collection, [tuple(k) for k in keys], options
+
+
+#: Every index the API relies on, except the verified curation and fork
+#: indexes (see create_curation_indexes / create_fork_indexes). create_indexes()
+#: applies these concurrently per collection and records a fingerprint of the
+#: list, so an unchanged list costs one read at startup.
+INDEX_SPECS: list = [
     # User indexes
-    await users_collection.create_index("firebase_uid", unique=True)
-    await users_collection.create_index("email", unique=True)
-    await users_collection.create_index("username", unique=True)
+    _index("users", "firebase_uid", unique=True),
+    _index("users", "email", unique=True),
+    _index("users", "username", unique=True),
 
     # Data indexes for performance
-    await books_collection.create_index("user_id")
-    await books_collection.create_index("created_at")
-    await decks_collection.create_index("user_id")
-    await decks_collection.create_index("created_at")
-    await cards_collection.create_index("deck_id")
-    await cards_collection.create_index("user_id")
-    await cards_collection.create_index("next_review_date")
-    await tasks_collection.create_index("user_id")
-    await tasks_collection.create_index("status")
+    _index("books", "user_id"),
+    _index("books", "created_at"),
+    _index("decks", "user_id"),
+    _index("decks", "created_at"),
+    _index("cards", "deck_id"),
+    _index("cards", "user_id"),
+    _index("cards", "next_review_date"),
+    _index("tasks", "user_id"),
+    _index("tasks", "status"),
 
     # Content reports (moderation): status, created_at
-    await db["content_reports"].create_index("status")
-    await db["content_reports"].create_index("created_at")
-
-    # Curated official browse + unique approved (topic, rank) — ADR-004
-    await create_curation_indexes(decks_collection)
-
-    # Unique fork key — ADR-005
-    await create_fork_indexes(content_forks_collection)
+    _index("content_reports", "status"),
+    _index("content_reports", "created_at"),
 
     # Annual Planning indexes
-    await annual_plans_collection.create_index("user_id")
-    await annual_plans_collection.create_index([("user_id", 1), ("year", 1)], unique=True)
-    await focus_areas_collection.create_index("annual_plan_id")
-    await priorities_collection.create_index("focus_area_id")
-    await goals_collection.create_index("focus_area_id")
-    await activities_collection.create_index("goal_id")
-    await daily_routines_collection.create_index("user_id", unique=True)
-    await quarter_reports_collection.create_index("annual_plan_id")
+    _index("annual_plans", "user_id"),
+    _index("annual_plans", [("user_id", 1), ("year", 1)], unique=True),
+    _index("focus_areas", "annual_plan_id"),
+    _index("priorities", "focus_area_id"),
+    _index("goals", "focus_area_id"),
+    _index("activities", "goal_id"),
+    _index("priorities", "annual_plan_id"),
+    # Owner stamp on planning children (app/services/planning_scope.py)
+    _index("focus_areas", [("user_id", 1), ("deleted_at", 1)]),
+    _index("priorities", [("user_id", 1), ("deleted_at", 1)]),
+    _index("goals", [("user_id", 1), ("deleted_at", 1)]),
+    _index("activities", [("user_id", 1), ("deleted_at", 1)]),
+    _index("daily_routines", "user_id", unique=True),
+    _index("quarter_reports", "annual_plan_id"),
 
     # Quiz sessions: TTL index — auto-expire sessions after 1 hour.
-    # create_index() is idempotent but WON'T update expireAfterSeconds on an
-    # existing index. Use collMod to update it if it already exists.
-    _QUIZ_TTL_SECONDS = 3600
-    existing_indexes = await quiz_sessions_collection.index_information()
-    if "quiz_sessions_ttl" in existing_indexes:
-        current_ttl = existing_indexes["quiz_sessions_ttl"].get("expireAfterSeconds")
-        if current_ttl != _QUIZ_TTL_SECONDS:
-            await db.command(
-                "collMod",
-                "quiz_sessions",
-                index={"name": "quiz_sessions_ttl", "expireAfterSeconds": _QUIZ_TTL_SECONDS},
-            )
-    else:
-        await quiz_sessions_collection.create_index(
-            "created_at",
-            expireAfterSeconds=_QUIZ_TTL_SECONDS,
-            name="quiz_sessions_ttl",
-        )
-    await quiz_sessions_collection.create_index("session_id", unique=True)
-    await quiz_sessions_collection.create_index("user_id")
+    _index("quiz_sessions", "created_at", expireAfterSeconds=3600, name="quiz_sessions_ttl"),
+    _index("quiz_sessions", "session_id", unique=True),
+    _index("quiz_sessions", "user_id"),
     # Compound index for ownership-scoped session lookups (prevents cross-user access)
-    await quiz_sessions_collection.create_index(
-        [("session_id", 1), ("user_id", 1)],
-        name="quiz_sessions_ownership",
-    )
+    _index("quiz_sessions", [("session_id", 1), ("user_id", 1)], name="quiz_sessions_ownership"),
 
     # AI quiz sessions: TTL 24 hours — stores pre-generated question sets server-side
-    _AI_QUIZ_TTL_SECONDS = 86400  # 24 h
-    ai_existing_indexes = await ai_quiz_sessions_collection.index_information()
-    if "ai_quiz_sessions_ttl" in ai_existing_indexes:
-        current_ai_ttl = ai_existing_indexes["ai_quiz_sessions_ttl"].get("expireAfterSeconds")
-        if current_ai_ttl != _AI_QUIZ_TTL_SECONDS:
-            await db.command(
-                "collMod",
-                "ai_quiz_sessions",
-                index={"name": "ai_quiz_sessions_ttl", "expireAfterSeconds": _AI_QUIZ_TTL_SECONDS},
-            )
-    else:
-        await ai_quiz_sessions_collection.create_index(
-            "created_at",
-            expireAfterSeconds=_AI_QUIZ_TTL_SECONDS,
-            name="ai_quiz_sessions_ttl",
-        )
-    await ai_quiz_sessions_collection.create_index("session_id", unique=True)
-    await ai_quiz_sessions_collection.create_index("user_id")
-    await ai_quiz_sessions_collection.create_index(
-        [("session_id", 1), ("user_id", 1)],
-        name="ai_quiz_sessions_ownership",
-    )
+    _index("ai_quiz_sessions", "created_at", expireAfterSeconds=86400, name="ai_quiz_sessions_ttl"),
+    _index("ai_quiz_sessions", "session_id", unique=True),
+    _index("ai_quiz_sessions", "user_id"),
+    _index("ai_quiz_sessions", [("session_id", 1), ("user_id", 1)], name="ai_quiz_sessions_ownership"),
 
     # study_sessions: permanent history, indexed for analytics queries
-    await study_sessions_collection.create_index("user_id")
-    await study_sessions_collection.create_index("completed_at")
-    await study_sessions_collection.create_index(
-        [("user_id", 1), ("completed_at", -1)],
-        name="study_sessions_user_history",
-    )
-    await study_sessions_collection.create_index("session_type")
-
-    # ── Soft-delete TTL indexes (30-day retention) ──────────────────────────
-    _RETENTION_SECONDS = 2592000  # 30 days: 60 * 60 * 24 * 30
+    _index("study_sessions", "user_id"),
+    _index("study_sessions", "completed_at"),
+    _index("study_sessions", [("user_id", 1), ("completed_at", -1)], name="study_sessions_user_history"),
+    _index("study_sessions", "session_type"),
 
     # Micro Sheets indexes
-    await sheets_collection.create_index("user_id")
-    await sheets_collection.create_index("updated_at")
-
-    _collection_ttl_map = [
-        ("books",         books_collection),
-        ("decks",         decks_collection),
-        ("cards",         cards_collection),
-        ("tasks",         tasks_collection),
-        ("annual_plans",  annual_plans_collection),
-        ("goals",         goals_collection),
-        ("sheets",        sheets_collection),
-        ("blackboards",   blackboards_collection),
-        ("comments",      comments_collection),
-    ]
-
-    for collection_name, collection in _collection_ttl_map:
-        existing_indexes = await collection.index_information()
-        if "soft_delete_ttl" in existing_indexes:
-            current_ttl = existing_indexes["soft_delete_ttl"].get("expireAfterSeconds")
-            if current_ttl != _RETENTION_SECONDS:
-                await db.command(
-                    "collMod",
-                    collection_name,
-                    index={"name": "soft_delete_ttl", "expireAfterSeconds": _RETENTION_SECONDS},
-                )
-        else:
-            await collection.create_index(
-                "deleted_at",
-                expireAfterSeconds=_RETENTION_SECONDS,
-                sparse=True,   # CRITICAL: only index soft-deleted docs (deleted_at != null)
-                name="soft_delete_ttl",
-            )
-
-    logger.info("Soft-delete TTL indexes verified for all content collections.")
+    _index("sheets", "user_id"),
+    _index("sheets", "updated_at"),
+
+    # Soft-delete TTL indexes (30-day retention).
+    # CRITICAL: sparse — only index soft-deleted docs (deleted_at != null).
+    *[
+        _index(name, "deleted_at", expireAfterSeconds=_RETENTION_SECONDS, sparse=True, name="soft_delete_ttl")
+        for name in _SOFT_DELETE_COLLECTIONS
+    ],
+    # Cascade restore (app/services/cascade.py) finds what one deletion took by
+    # its deleted_via stamp; sparse, so live documents stay out of the index.
+    *[
+        _index(name, "deleted_via", sparse=True, name="cascade_deleted_via")
+        for name in _CASCADE_COLLECTIONS
+    ],
 
     # stripe_processed_events: unique on stripe_event_id (deduplication, T-03-02-04)
     # and TTL on processed_at (30 days) so old events are auto-purged
-    await stripe_processed_events_collection.create_index(
-        "stripe_event_id", unique=True
-    )
-    await stripe_processed_events_collection.create_index(
-        "processed_at", expireAfterSeconds=2592000  # 30 days
-    )
+    _index("stripe_processed_events", "stripe_event_id", unique=True),
+    _index("stripe_processed_events", "processed_at", expireAfterSeconds=2592000),
 
     # Phase 7: Blackboard multi-board indexes
-    await db.blackboards.create_index([("owner_user_id", 1)])
-    await db.blackboards.create_index([("collaborators", 1)])
+    _index("blackboards", "owner_user_id"),
+    _index("blackboards", "collaborators"),
 
     # Comments: compound index for the per-user, per-resource privacy filter that
     # every query in app/routers/comments.py enforces (resource + owner together —
     # never resource alone, since shared/public books keep the same _id for every
     # viewer and resource_id-only filtering would leak private notes cross-user).
-    await comments_collection.create_index(
-        [("resource_type", 1), ("resource_id", 1), ("user_id", 1)],
-        name="comments_resource_owner",
-    )
+    _index("comments", [("resource_type", 1), ("resource_id", 1), ("user_id", 1)], name="comments_resource_owner"),
+
+    # Anki import jobs + staged cards: TTL 24 h. Staged cards are read back in
+    # seq order per import during confirm, hence the compound index.
+    _index("apkg_imports", "created_at", expireAfterSeconds=86400, name="apkg_imports_ttl"),
+    _index("apkg_imports", [("import_id", 1), ("user_id", 1)], unique=True, name="apkg_imports_ownership"),
+    # Stale-heartbeat sweep over a user's active jobs (app/routers/import_apkg.py).
+    _index("apkg_imports", [("user_id", 1), ("status", 1)], name="apkg_imports_user_status"),
+    _index("apkg_import_cards", "created_at", expireAfterSeconds=86400, name="apkg_import_cards_ttl"),
+    _index("apkg_import_cards", [("import_id", 1), ("seq", 1)], name="apkg_import_cards_seq"),
+
+    # Data export jobs: TTL 24 h plus the ownership lookup. Artifacts are swept
+    # by upload date, which the GridFS (filename, uploadDate) index can't serve.
+    _index("export_jobs", "created_at", expireAfterSeconds=86400, name="export_jobs_ttl"),
+    _index("export_jobs", [("export_id", 1), ("user_id", 1)], unique=True, name="export_jobs_ownership"),
+    # At most one running export per user (app/services/data_export.py).
+    _index(
+        "export_jobs", "user_id", unique=True,
+        partialFilterExpression={"status": "running"}, name="export_jobs_one_running",
+    ),
+    _index("data_exports.files", "uploadDate", name="data_exports_upload_date"),
+
+    # Card review history: per-card timeline and per-user activity by date.
+    _index("card_reviews", [("card_id", 1), ("reviewed_at", 1)], name="card_reviews_card_timeline"),
+    _index("card_reviews", [("user_id", 1), ("reviewed_at", -1)], name="card_reviews_user_history"),
+
+    # Book images: dedup lookup by content hash within a user's library.
+    _index("book_images", [("user_id", 1), ("sha256", 1)], unique=True, name="book_images_user_hash"),
+
+    # Blackboard realtime events only need to live long enough to be tailed.
+    _index("blackboard_events", "created_at", expireAfterSeconds=3600, name="blackboard_events_ttl"),
+    # Blackboard op log: rebase/catch-up window per board; trimmed by version, expired after a week.
+    _index("blackboard_op_log", [("board_id", 1), ("v", 1)], unique=True, name="blackboard_op_log_board_version"),
+    _index("blackboard_op_log", "created_at", expireAfterSeconds=7 * 86400, name="blackboard_op_log_ttl"),
+
+    # Question bank: _id is the content key; entries unused for 90 days expire.
+    _index("question_bank", "last_used_at", expireAfterSeconds=90 * 86400, name="question_bank_ttl"),
+
+    # Book blocks: removed per book on legacy re-save, soft-deleted per user.
+    _index("book_blocks", "book_id", name="book_blocks_book"),
+    _index("book_blocks", "user_id", name="book_blocks_user"),
+
+    # Book text derivatives: dropped per book on delete, per user on account deletion.
+    _index("book_texts", "user_id", name="book_texts_user"),
+
+    # Activity rollups: _id is "<user_id>:<day>"; reads are a per-user day range.
+    _index("activity_days", [("user_id", 1), ("day", -1)], name="activity_days_user_day"),
 
     # Per-user rate limit buckets: expire each document at its own expires_at
     # (expireAfterSeconds=0 means "delete once expires_at is in the past").
     # Lookups are by _id, so no additional index is needed.
-    await rate_limits_collection.create_index(
-        "expires_at", expireAfterSeconds=0, name="rate_limit_ttl"
+    _index("rate_limits", "expires_at", expireAfterSeconds=0, name="rate_limit_ttl"),
+]
+
+#: Bumped by hand when create_curation_indexes / create_fork_indexes change.
+_VERIFIED_INDEXES_VERSION = 1
+
+# One document recording the fingerprint of the last fully applied INDEX_SPECS.
+schema_meta_collection = db["schema_meta"]
+
+
+def index_fingerprint(specs: list = INDEX_SPECS) -> str:
+    """Stable hash of the index specs; a change to any spec changes it."""
+    encoded = json.dumps([specs, _VERIFIED_INDEXES_VERSION], sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _index_name(keys: list, options: dict) -> str:
+    return options.get("name") or "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+async def _ensure_collection_indexes(collection_name: str, specs: list) -> None:
+    """
+    Create one collection's missing indexes. create_index() is idempotent but
+    WON'T update expireAfterSeconds on an existing index, so a changed TTL is
+    applied with collMod instead.
+    """
+    collection = db[collection_name]
+    existing = await collection.index_information()
+    for _, keys, options in specs:
+        name = _index_name(keys, options)
+        current = existing.get(name)
+        if current is None:
+            await collection.create_index(keys, **{**options, "name": name})
+        elif "expireAfterSeconds" in options and current.get("expireAfterSeconds") != options["expireAfterSeconds"]:
+            await db.command(
+                "collMod",
+                collection_name,
+                index={"name": name, "expireAfterSeconds": options["expireAfterSeconds"]},
+            )
+
+
+async def create_indexes(force: bool = False) -> bool:
+    """
+    Apply INDEX_SPECS plus the verified curation and fork indexes.
+
+    Skipped entirely when the stored fingerprint matches the current specs
+    (set FORCE_INDEX_SYNC=1 or pass ``force`` to re-check anyway). Otherwise
+    collections are handled concurrently; the fingerprint is only recorded
+    when every index is in place. Returns True when indexes were checked.
+    """
+    fingerprint = index_fingerprint()
+    force = force or os.getenv("FORCE_INDEX_SYNC") == "1"
+    if not force:
+        stored = await schema_meta_collection.find_one({"_id": "indexes"}, {"fingerprint": 1})
+        if stored and stored.get("fingerprint") == fingerprint:
+            logger.info("Database indexes unchanged (fingerprint %s) — skipping checks.", fingerprint[:12])
+            return False
+
+    by_collection: dict = {}
+    for spec in INDEX_SPECS:
+        by_collection.setdefault(spec[0], []).append(spec)
+
+    names = list(by_collection)
+    results = await asyncio.gather(
+        *(_ensure_collection_indexes(name, by_collection[name]) for name in names),
+        # Curated official browse + unique approved (topic, rank) — ADR-004
+        create_curation_indexes(decks_collection),
+        # Unique fork key — ADR-005
+        create_fork_indexes(content_forks_collection),
+        return_exceptions=True,
     )
 
-    logger.info("Database indexes created successfully.")
+    failed = False
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            failed = True
+            logger.error("Index creation failed for %s: %s", name, result)
+    for result in results[len(names):]:
+        # The verified index helpers return the names still missing.
+        if isinstance(result, Exception) or result:
+            failed = True
+
+    if failed:
+        logger.warning("Database indexes incomplete — will re-check on next startup.")
+    else:
+        await schema_meta_collection.update_one(
+            {"_id": "indexes"},
+            {"$set": {"fingerprint": fingerprint, "applied_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        logger.info("Database indexes created successfully.")
+    return True
@@ -1,9 +1,14 @@
 """
 Firebase Authentication Configuration
 Handles Firebase Admin SDK setup for token validation
+
+The SDK is initialized on the first token verification rather than at
+import time: resolving default credentials can probe the GCE metadata
+server, and application startup should not wait on that.
 """
 
 import os
+import threading
 import firebase_admin
 from firebase_admin import credentials, auth as firebase_auth
 from dotenv import load_dotenv
@@ -55,8 +60,19 @@ def initialize_firebase():
             firebase_admin.initialize_app()
             print("⚠️  Firebase Admin SDK initialized with default credentials")
 
-# Initialize on module import
-initialize_firebase()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _ensure_firebase() -> None:
+    """Initialize the Admin SDK once, on first use (token checks run in worker threads)."""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if not _initialized:
+            initialize_firebase()
+            _initialized = True
 
 def verify_firebase_token(id_token: str) -> dict:
     """
@@ -72,6 +88,7 @@ def verify_firebase_token(id_token: str) -> dict:
         firebase_admin.auth.InvalidIdTokenError: If token is invalid
         firebase_admin.auth.ExpiredIdTokenError: If token is expired
     """
+    _ensure_firebase()
     try:
         decoded_token = firebase_auth.verify_id_token(id_token)
         return decoded_token
@@ -0,0 +1,47 @@
+"""
+Allowed browser origins, shared by the CORS middleware and WebSocket endpoints.
+
+Defined here so both can import it:
+    from app.core.cors import allowed_origins, origin_allowed
+
+main.py passes ``allowed_origins`` and ``ALLOWED_ORIGIN_REGEX`` to
+CORSMiddleware. CORS does not apply to WebSockets, and a browser sends the
+firebase_token cookie with a cross-site handshake too, so cookie-authenticated
+WebSocket endpoints check ``origin_allowed`` themselves before accepting.
+"""
+
+import os
+import re
+from typing import Optional
+
+# Origins that are always allowed, regardless of environment configuration.
+# ALLOWED_ORIGINS (comma-separated) can add more (e.g. one-off preview URLs).
+DEFAULT_ALLOWED_ORIGINS: list[str] = [
+    "http://localhost:3000",
+    "http://localhost:3001",
+    "http://127.0.0.1:3000",
+    "https://nowry.app",
+    "https://www.nowry.app",
+    "https://dev.nowry.app",
+    "https://www.dev.nowry.app",
+]
+
+# Vercel preview deployments (e.g. https://nowry-git-<branch>-<team>.vercel.app)
+ALLOWED_ORIGIN_REGEX: str = r"https://.*\.vercel\.app"
+
+allowed_origins_env: str = os.getenv("ALLOWED_ORIGINS", "")
+env_origins: list[str] = [
+    origin.strip() for origin in allowed_origins_env.split(",") if origin.strip()
+]
+# dict.fromkeys preserves order while removing duplicates.
+allowed_origins: list[str] = list(dict.fromkeys(DEFAULT_ALLOWED_ORIGINS + env_origins))
+
+
+def origin_allowed(origin: Optional[str]) -> bool:
+    """
+    True when a handshake may proceed: its Origin is one CORS allows, or it
+    has none (non-browser clients; browsers always send one).
+    """
+    if origin is None:
+        return True
+    return origin in allowed_origins or re.fullmatch(ALLOWED_ORIGIN_REGEX, origin) is not None
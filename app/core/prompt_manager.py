@@ -4,6 +4,12 @@ Prompt management layer for Nowry.
 Serves all 8 named prompts from Langfuse at runtime with in-memory caching.
 Falls back to hardcoded constants in core/prompts.py if Langfuse is unavailable.
 
+Requests never call Langfuse. The cache is seeded from the
+langfuse_cache.json snapshot at startup and a background refresher polls
+Langfuse every PROMPT_REFRESH_SECONDS. New versions are compiled off the
+request path and swapped in atomically, so a prompt published in Langfuse
+goes live within one interval.
+
 Usage:
     from app.core import prompt_manager
 
@@ -13,25 +19,48 @@ Usage:
     # No variables:
     system = prompt_manager.get_prompt("nowry-book-expand")
 
-    # Pre-warm at startup (call from lifespan):
-    await prompt_manager.prewarm()
+    # Version serving a prompt right now, merged into trace metadata:
+    trace_metadata = {"feature": "book_expand", **prompt_manager.version_metadata("nowry-book-expand")}
+
+    # At startup (lifespan): serve the JSON snapshot at once, refresh in the background
+    prompt_manager.load_snapshot()
+    prompt_manager.start_refresher()
 
 All callers receive a ready-to-use str. They never interact with LangfusePrompt objects.
 """
 
+import asyncio
 import json
 import logging
+import os
+import tempfile
 from pathlib import Path
-from typing import Optional
+from string import Formatter
+from typing import Callable, NamedTuple, Optional
 import app.core.langfuse_client as _langfuse_client_module
 from app.core import prompts as _fallbacks
 
 logger = logging.getLogger(__name__)
 
-# In-memory cache: populated by prewarm() at startup.
-# Stores raw template strings (NOT compiled — compilation happens per-call with caller's vars).
-# Invalidated by server restart only (no TTL in v1.1 — D-08).
-_prompt_cache: dict[str, str] = {}
+#: Seconds between Langfuse polls. PROMPT_REFRESHER=0 disables polling.
+REFRESH_INTERVAL = int(os.getenv("PROMPT_REFRESH_SECONDS", 300))
+
+_CACHE_PATH = Path(__file__).parent.parent / "config" / "langfuse_cache.json"
+
+
+class CompiledPrompt(NamedTuple):
+    """A template parsed once at load time, with the Langfuse version it came from."""
+    template: str
+    version: Optional[int]
+    fields: frozenset
+    render: Callable[..., str]
+
+
+# In-memory cache: prompt name -> CompiledPrompt. Never mutated in place —
+# load_snapshot() and refresh() build a new dict and rebind it, so a request
+# always sees one consistent set of versions.
+_prompt_cache: dict[str, CompiledPrompt] = {}
+_refresher_task: Optional[asyncio.Task] = None
 
 # Fallback mapping: prompt name -> Python format-string constant from core/prompts.py.
 # Used when Langfuse is unavailable (D-05) and as the SDK fallback= argument (D-02 pitfall).
@@ -46,14 +75,70 @@ _FALLBACKS: dict[str, str] = {
     "nowry-quiz-from-deck": _fallbacks.QUIZ_FROM_DECK_TEMPLATE,
 }
 
+# Variables callers still pass for older Langfuse-hosted versions that the
+# current fallback no longer uses (see rag/text_node.py).
+_LEGACY_VARS: dict[str, frozenset] = {
+    "nowry-cards-magic": frozenset({"sample_number"}),
+}
+
+
+def compile_prompt(template: str, version: Optional[int] = None) -> CompiledPrompt:
+    """
+    Parse ``template`` once. Raises ValueError on a malformed format string,
+    including positional fields (``{}``, ``{0}``): callers only pass keywords.
+    """
+    fields = frozenset(
+        field.split(".")[0].split("[")[0]
+        for _, field, _, _ in Formatter().parse(template)
+        if field is not None
+    )
+    positional = sorted(f for f in fields if not f or f.isdigit())
+    if positional:
+        raise ValueError(f"positional fields are not supported: {positional}")
+    if not fields:
+        # Nothing to substitute: the rendered text never changes.
+        try:
+            rendered = template.format()
+        except (IndexError, KeyError) as exc:
+            raise ValueError(f"cannot render constant template: {exc!r}") from exc
+
+        def render(**vars) -> str:
+            return rendered
+    else:
+        render = template.format
+    return CompiledPrompt(template, version, fields, render)
+
+
+def _accept(name: str, template: str, version: Optional[int]) -> Optional[CompiledPrompt]:
+    """
+    Compile a fetched template, or None when it can't safely replace the current one:
+    it fails to parse, or it needs variables the callers (written against the
+    fallback) never pass.
+    """
+    try:
+        compiled = compile_prompt(template, version)
+    except ValueError as exc:
+        logger.warning("[prompt_manager] '%s' v%s is not a valid template: %s — keeping current", name, version, exc)
+        return None
+    expected = compile_prompt(_FALLBACKS[name]).fields | _LEGACY_VARS.get(name, frozenset())
+    unknown = compiled.fields - expected
+    if unknown:
+        logger.warning(
+            "[prompt_manager] '%s' v%s uses unknown variables %s — keeping current",
+            name, version, sorted(unknown),
+        )
+        return None
+    return compiled
+
 
 def get_prompt(name: str, **vars) -> str:
     """Return a compiled prompt string for the given prompt name.
 
     Resolution order:
-    1. In-memory _prompt_cache (populated by prewarm() — raw template stored, formatted here)
-    2. Langfuse SDK (get_prompt + compile)
-    3. Hardcoded constant from _FALLBACKS (logged WARNING)
+    1. In-memory _prompt_cache (snapshot at startup, then Langfuse via the refresher)
+    2. Hardcoded constant from _FALLBACKS (logged WARNING)
+
+    Never calls Langfuse: a request must not wait on the network for a prompt.
 
     Args:
         name: Prompt name following the nowry-<feature> kebab-case convention (D-03, PM-03).
@@ -62,31 +147,9 @@ def get_prompt(name: str, **vars) -> str:
     Returns:
         Compiled prompt string ready for use as an LLM system/user prompt.
     """
-    # Serve from in-memory cache first (cache holds RAW template strings)
-    if name in _prompt_cache:
-        raw = _prompt_cache[name]
-        return raw.format(**vars) if vars else raw
-
-    # Try Langfuse SDK
-    client = _langfuse_client_module.get_langfuse_client()
-    if client:
-        try:
-            prompt_obj = client.get_prompt(
-                name,
-                type="text",
-                fallback=_FALLBACKS.get(name, ""),
-            )
-            # Langfuse path: use .compile(**vars) which handles {{var}} mustache syntax
-            if vars:
-                return prompt_obj.compile(**vars)
-            else:
-                return prompt_obj.prompt  # raw template, no vars to substitute
-        except Exception as exc:
-            logger.warning(
-                "[prompt_manager] Langfuse fetch failed for '%s': %s — using fallback",
-                name,
-                exc,
-            )
+    entry = _prompt_cache.get(name)
+    if entry is not None:
+        return entry.render(**vars) if vars else entry.template
 
     # Hardcoded fallback (D-05, D-06)
     logger.warning(
@@ -97,59 +160,187 @@ def get_prompt(name: str, **vars) -> str:
     return fallback.format(**vars) if vars else fallback
 
 
-async def prewarm() -> None:
-    """Pre-fetch all 8 prompts into _prompt_cache and write through to langfuse_cache.json.
+def prompt_version(name: str) -> Optional[int]:
+    """Langfuse version currently served for ``name``; None for the hardcoded fallback."""
+    entry = _prompt_cache.get(name)
+    return entry.version if entry is not None else None
+
+
+def version_metadata(name: str) -> dict[str, str]:
+    """Trace metadata naming the prompt and the version served ("fallback" when hardcoded)."""
+    version = prompt_version(name)
+    return {"prompt_name": name, "prompt_version": str(version) if version is not None else "fallback"}
+
+
+def load_snapshot() -> int:
+    """Seed _prompt_cache from langfuse_cache.json (last refresh's write-through).
 
-    Called once at FastAPI startup from the lifespan block (after create_indexes()).
-    Non-raising: a failure for one prompt uses the fallback; the loop continues.
-    Populates langfuse_cache.json["prompts"] for cold-start fallback (D-09).
+    Synchronous and local — no Langfuse call — so startup never waits on the
+    network. Prompts missing from the snapshot use the hardcoded fallbacks.
+    Returns the number of prompts served from the snapshot.
     """
-    client = _langfuse_client_module.get_langfuse_client()
+    global _prompt_cache
+    try:
+        with open(_CACHE_PATH) as f:
+            cache_data = json.load(f)
+    except Exception as exc:
+        logger.warning("[prompt_manager] Could not read prompt snapshot: %s", exc)
+        cache_data = {}
+    snapshot = cache_data.get("prompts") or {}
+    versions = cache_data.get("prompt_versions") or {}
 
+    cache: dict[str, CompiledPrompt] = {}
+    loaded = 0
     for name, fallback_template in _FALLBACKS.items():
-        if client:
-            try:
-                prompt_obj = client.get_prompt(
-                    name,
-                    type="text",
-                    fallback=fallback_template,
-                )
-                # Store RAW template (not compiled — no vars context at prewarm time — Pitfall 4)
-                _prompt_cache[name] = prompt_obj.prompt
-            except Exception as exc:
-                logger.warning(
-                    "[prompt_manager] prewarm failed for '%s': %s — using hardcoded fallback",
-                    name,
-                    exc,
-                )
-                _prompt_cache[name] = fallback_template
-        else:
-            _prompt_cache[name] = fallback_template
-
-    # Also fetch model config from Langfuse and write to cache (D-12, MC-01)
+        template = snapshot.get(name)
+        entry = _accept(name, template, versions.get(name)) if isinstance(template, str) and template else None
+        if entry is not None:
+            loaded += 1
+        cache[name] = entry or compile_prompt(fallback_template)
+    _prompt_cache = cache
+    logger.info("[prompt_manager] Loaded %d/%d prompts from snapshot.", loaded, len(_FALLBACKS))
+    return loaded
+
+
+def _fetch_prompt(client, name: str) -> Optional[tuple[str, Optional[int]]]:
+    try:
+        # cache_ttl_seconds=0: the SDK's own cache would hide new versions from the poll.
+        prompt_obj = client.get_prompt(name, type="text", cache_ttl_seconds=0)
+        # Store RAW template (not compiled with vars — no vars context here — Pitfall 4)
+        return prompt_obj.prompt, getattr(prompt_obj, "version", None)
+    except Exception as exc:
+        logger.warning("[prompt_manager] Refresh failed for '%s': %s — keeping current", name, exc)
+        return None
+
+
+def _fetch_model_config(client) -> Optional[dict]:
+    try:
+        cfg_prompt = client.get_prompt("nowry-model-config", type="text", cache_ttl_seconds=0)
+        return cfg_prompt.config  # dict attached to prompt version
+    except Exception as exc:
+        logger.warning(
+            "[prompt_manager] Could not fetch model config from Langfuse: %s — using subscription_plans.py defaults",
+            exc,
+        )
+        return None
+
+
+async def refresh() -> list[str]:
+    """Poll Langfuse once and swap in any changed prompt versions.
+
+    The Langfuse SDK is synchronous, so each fetch runs in a worker thread and
+    all of them run concurrently. Non-raising: a prompt that fails to fetch or
+    compile keeps its current entry. When anything changed, the new set is
+    written through to langfuse_cache.json for the next cold start (D-09).
+    Returns the names whose template or version changed.
+    """
+    global _prompt_cache
+    current = _prompt_cache
+    client = _langfuse_client_module.get_langfuse_client()
+
+    cache = dict(current)
     model_config_data: Optional[dict] = None
-    if client:  # client was set in the loop above
+    if client:
+        names = list(_FALLBACKS)
+        *fetched, model_config_data = await asyncio.gather(
+            *(asyncio.to_thread(_fetch_prompt, client, name) for name in names),
+            # Also fetch model config from Langfuse and write to cache (D-12, MC-01)
+            asyncio.to_thread(_fetch_model_config, client),
+        )
+        for name, result in zip(names, fetched):
+            if result is None:
+                continue
+            template, version = result
+            existing = cache.get(name)
+            if existing is not None and (existing.template, existing.version) == (template, version):
+                continue
+            entry = _accept(name, template, version)
+            if entry is not None:
+                cache[name] = entry
+    for name, fallback_template in _FALLBACKS.items():
+        cache.setdefault(name, compile_prompt(fallback_template))
+
+    changed = [
+        name for name, entry in cache.items()
+        if name not in current or (current[name].template, current[name].version) != (entry.template, entry.version)
+    ]
+    _prompt_cache = cache  # atomic swap: requests see the old set or the new one, never a mix
+    if changed:
+        for name in changed:
+            logger.info("[prompt_manager] '%s' now serving v%s", name, cache[name].version)
+    if changed or model_config_data is not None:
+        # Write-through off the event loop.
+        await asyncio.to_thread(_write_snapshot, cache, model_config_data)
+    return changed
+
+
+async def prewarm() -> None:
+    """Populate _prompt_cache from Langfuse and write langfuse_cache.json["prompts"] (D-09)."""
+    global _prompt_cache
+    _prompt_cache = {}
+    await refresh()
+
+
+async def _refresh_loop() -> None:
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL)
+        try:
+            await refresh()
+        except Exception as exc:
+            logger.warning("[prompt_manager] Refresh cycle failed: %s", exc)
+
+
+def start_refresher() -> None:
+    """Refresh now, then every REFRESH_INTERVAL (app startup). PROMPT_REFRESHER=0 disables polling."""
+    global _refresher_task
+    if _refresher_task is not None:
+        return
+
+    async def run() -> None:
         try:
-            cfg_prompt = client.get_prompt("nowry-model-config", type="text")
-            model_config_data = cfg_prompt.config  # dict attached to prompt version
+            await refresh()
         except Exception as exc:
-            logger.warning(
-                "[prompt_manager] Could not fetch model config from Langfuse: %s — using subscription_plans.py defaults",
-                exc,
-            )
+            logger.warning("[prompt_manager] Initial refresh failed: %s", exc)
+        if os.getenv("PROMPT_REFRESHER", "1") != "0":
+            await _refresh_loop()
+
+    _refresher_task = asyncio.create_task(run())
+
 
-    # Write-through to langfuse_cache.json (D-09)
+async def stop_refresher() -> None:
+    """Stop the refresh loop (app shutdown)."""
+    global _refresher_task
+    if _refresher_task is not None:
+        _refresher_task.cancel()
+        try:
+            await _refresher_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _refresher_task = None
+
+
+def _write_snapshot(cache: dict, model_config_data: Optional[dict]) -> None:
     try:
-        cache_path = Path(__file__).parent.parent / "config" / "langfuse_cache.json"
-        with open(cache_path) as f:
+        with open(_CACHE_PATH) as f:
             cache_data = json.load(f)
-        cache_data["prompts"] = dict(_prompt_cache)
+        cache_data["prompts"] = {name: entry.template for name, entry in cache.items()}
+        cache_data["prompt_versions"] = {name: entry.version for name, entry in cache.items()}
         if model_config_data is not None:
             cache_data["model_config"] = model_config_data
         cache_data["updated_at"] = None  # updated_at managed by Phase 11 sync script
-        with open(cache_path, "w") as f:
+        # Write a uniquely named sibling file and rename: readers never see a
+        # half-written snapshot, and concurrent workers never share a temp file.
+        with tempfile.NamedTemporaryFile(
+            "w", dir=_CACHE_PATH.parent, prefix=f"{_CACHE_PATH.name}.", suffix=".tmp", delete=False
+        ) as f:
+            tmp_path = f.name
             json.dump(cache_data, f, indent=2)
-        logger.info("[prompt_manager] prewarm complete — %d prompts cached.", len(_prompt_cache))
+        try:
+            os.replace(tmp_path, _CACHE_PATH)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+        logger.info("[prompt_manager] Prompt snapshot written — %d prompts cached.", len(cache))
     except Exception as exc:
         logger.warning(
             "[prompt_manager] Failed to write prompt cache to langfuse_cache.json: %s",
@@ -31,9 +31,14 @@ from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from app.config.database import create_indexes
+from app.core.cors import ALLOWED_ORIGIN_REGEX, allowed_origins
 from app.core.limiter import limiter
 from app.core import langfuse_client as _langfuse_module
 from app.core import prompt_manager
+from app.utils import ids
+from app.utils.process_pool import shutdown_process_pool
+from app.services.blackboard_sync import hub as blackboard_sync_hub
+from app.services import news_refresher, planning_scope, quota
 
 logger = logging.getLogger(__name__)
 from app.routers import (
@@ -67,6 +72,7 @@ from app.routers import (
     sheets,
     goal_ai,
     comments,
+    metrics,
 )
 
 
@@ -95,13 +101,29 @@ async def _flush_langfuse_queue() -> None:
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
+    # Startup — nothing here waits on a third-party network call.
+    # Index checks run concurrently and are skipped when the spec fingerprint matches.
     await create_indexes()
-    # [Phase 10] Pre-warm all 8 prompt templates into _prompt_cache and langfuse_cache.json.
+    # Collections finished by app/migrations/normalize_ids.py get single-form id reads.
+    await ids.load_normalized()
+    # Plan-wide reads switch to user_id lookups once the owner backfill has run.
+    await planning_scope.load_state()
+    # [Phase 10] Serve prompts from the langfuse_cache.json snapshot immediately, then
+    # poll Langfuse in the background so new prompt versions go live without a restart.
     # Non-raising: falls back to core/prompts.py constants on any Langfuse error (D-07).
-    await prompt_manager.prewarm()
+    prompt_manager.load_snapshot()
+    prompt_manager.start_refresher()
+    # Keep RSS feeds warm in the shared store so /news never fetches inline.
+    news_refresher.start_refresher()
+    # Recount plan usage counters periodically (one worker per interval).
+    quota.start_reconciler()
     yield
     # Shutdown
+    await prompt_manager.stop_refresher()
+    await news_refresher.stop_refresher()
+    await quota.stop_reconciler()
+    await blackboard_sync_hub.stop()
+    shutdown_process_pool()
     await _flush_langfuse_queue()
 
 
@@ -116,31 +138,12 @@ app.include_router(stripe_webhooks.router)
 
 app.add_middleware(SlowAPIMiddleware)
 
-# CORS Configuration
-# Origins that are always allowed, regardless of environment configuration.
-# ALLOWED_ORIGINS (comma-separated) can add more (e.g. one-off preview URLs).
-DEFAULT_ALLOWED_ORIGINS: list[str] = [
-    "http://localhost:3000",
-    "http://localhost:3001",
-    "http://127.0.0.1:3000",
-    "https://nowry.app",
-    "https://www.nowry.app",
-    "https://dev.nowry.app",
-    "https://www.dev.nowry.app",
-]
-
-allowed_origins_env: str = os.getenv("ALLOWED_ORIGINS", "")
-env_origins: list[str] = [
-    origin.strip() for origin in allowed_origins_env.split(",") if origin.strip()
-]
-# dict.fromkeys preserves order while removing duplicates.
-allowed_origins: list[str] = list(dict.fromkeys(DEFAULT_ALLOWED_ORIGINS + env_origins))
-
+# CORS Configuration — the origin list lives in app/core/cors.py so the
+# WebSocket endpoints can check handshakes against it too.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
-    # Vercel preview deployments (e.g. https://nowry-git-<branch>-<team>.vercel.app)
-    allow_origin_regex=r"https://.*\.vercel\.app",
+    allow_origin_regex=ALLOWED_ORIGIN_REGEX,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
@@ -175,6 +178,7 @@ app.include_router(illustrations.router)  # Illustration Magic — POST /book/{b
 app.include_router(sheets.router)         # Micro Sheets — CRUD /sheets
 app.include_router(goal_ai.router)        # Goal AI — POST /goal-ai/analyze (Pro-only)
 app.include_router(comments.router, prefix="/v1/comments", tags=["comments"])  # Text-anchored annotations
+app.include_router(metrics.router)        # Operational counters — GET /admin/metrics (admin only)
 
 
 @app.get("/")
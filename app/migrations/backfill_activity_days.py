@@ -0,0 +1,174 @@
+"""
+One-time, idempotent backfill of ``activity_days`` rollups from existing data.
+
+Background
+----------
+Streaks and weekly charts now read the per-user daily rollups written by
+``app/services/activity.py`` on every review, book save and study session.
+Rollups only start counting at deploy time, so without a backfill every
+existing streak would reset. History before that is reconstructed from what
+the database still has:
+
+  1. ``cards.last_reviewed`` — one review per card on its most recent review
+     day (lossy: earlier reviews of the same card were overwritten),
+  2. ``card_reviews`` — the Anki review log kept on ``.apkg`` import,
+  3. ``study_sessions`` — session count and duration per completion day,
+  4. ``books.updated_at`` — the book counted as touched on its last edit day.
+
+Each source is grouped per (user, UTC day) server-side and written with
+``$max`` rather than ``$inc``. The result is a lower bound on what actually
+happened. Overlapping sources are never double counted, counts recorded live
+since deploy are never lowered, and a second run changes nothing.
+
+Standalone script — NOT wired into app startup. Run from ``Nowry-API``:
+
+    .venv/bin/python -m app.migrations.backfill_activity_days           # dry run
+    .venv/bin/python -m app.migrations.backfill_activity_days --apply   # write
+    .venv/bin/python -m app.migrations.backfill_activity_days --days 730 --apply
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from pymongo import UpdateOne
+
+from app.config.database import (
+    activity_days_collection,
+    books_collection,
+    card_reviews_collection,
+    cards_collection,
+    study_sessions_collection,
+)
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Rollup upserts sent per bulk_write.
+BATCH_SIZE: int = 500
+
+#: Default history window, in days.
+DEFAULT_DAYS: int = 366
+
+_DAY = {"$dateToString": {"format": "%Y-%m-%d", "date": "$_at"}}
+
+
+def _pipeline(date_field: str, since: datetime, group: dict[str, Any], extra_match: dict | None = None) -> list:
+    """Group one source collection by (user_id as string, UTC day of ``date_field``)."""
+    match = {date_field: {"$gte": since}, "user_id": {"$ne": None}, **(extra_match or {})}
+    return [
+        {"$match": match},
+        {"$project": {"user_id": {"$toString": "$user_id"}, "_at": f"${date_field}",
+                      "card_type": {"$ifNull": ["$card_type", "flashcard"]},
+                      "duration_seconds": 1, "_id": 1}},
+        {"$group": {"_id": {"user_id": "$user_id", "day": _DAY}, **group}},
+    ]
+
+
+def _sources(since: datetime) -> list[tuple[str, Any, list]]:
+    return [
+        ("cards.last_reviewed", cards_collection, [
+            *_pipeline("last_reviewed", since, {}, {"deleted_at": None})[:2],
+            {"$group": {"_id": {"user_id": "$user_id", "day": _DAY, "type": "$card_type"}, "count": {"$sum": 1}}},
+        ]),
+        ("card_reviews", card_reviews_collection, [
+            *_pipeline("reviewed_at", since, {})[:2],
+            {"$group": {"_id": {"user_id": "$user_id", "day": _DAY, "type": "flashcard"}, "count": {"$sum": 1}}},
+        ]),
+        ("study_sessions", study_sessions_collection, _pipeline(
+            "completed_at", since,
+            {"sessions": {"$sum": 1}, "study_seconds": {"$sum": {"$ifNull": ["$duration_seconds", 0]}}},
+            {"deleted_at": None},
+        )),
+        ("books.updated_at", books_collection, _pipeline(
+            "updated_at", since, {"book_ids": {"$addToSet": {"$toString": "$_id"}}}, {"deleted_at": None},
+        )),
+    ]
+
+
+def _merge(rollups: dict, row: dict) -> None:
+    """Fold one grouped row into the per-(user, day) rollup being built."""
+    key = (row["_id"]["user_id"], row["_id"]["day"])
+    doc = rollups.setdefault(key, {})
+    if "count" in row:
+        reviews = doc.setdefault("reviews", {})
+        kind = row["_id"].get("type") or "flashcard"
+        reviews[kind] = reviews.get(kind, 0) + row["count"]
+    if "sessions" in row:
+        doc["sessions"] = row["sessions"]
+        doc["study_seconds"] = int(row["study_seconds"])
+    if "book_ids" in row:
+        doc["book_ids"] = row["book_ids"]
+
+
+def _build_update(user_id: str, day: str, doc: dict) -> UpdateOne:
+    maximums: dict[str, int] = {}
+    reviews = doc.get("reviews") or {}
+    for kind, count in reviews.items():
+        maximums[f"reviews.{kind}"] = count
+    if reviews:
+        maximums["reviews_total"] = sum(reviews.values())
+    if "book_ids" in doc:
+        maximums["book_saves"] = len(doc["book_ids"])
+    for field in ("sessions", "study_seconds"):
+        if field in doc:
+            maximums[field] = doc[field]
+    update: dict[str, Any] = {
+        "$max": maximums,
+        "$setOnInsert": {"user_id": user_id, "day": day},
+    }
+    if doc.get("book_ids"):
+        update["$addToSet"] = {"book_ids": {"$each": doc["book_ids"]}}
+    return UpdateOne({"_id": f"{user_id}:{day}"}, update, upsert=True)
+
+
+async def backfill_activity_days(apply_changes: bool = False, days: int = DEFAULT_DAYS) -> dict[str, int]:
+    """
+    Rebuild rollups for the last ``days`` days from every source.
+
+    When ``apply_changes`` is False (the default) the run is a dry run: it
+    reports how many rollup documents each source would write and issues none.
+    """
+    mode = "APPLY" if apply_changes else "DRY RUN"
+    since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+    logger.info(f"Starting activity rollup backfill [{mode}] since {since.date()}.")
+
+    stats: dict[str, int] = {}
+    for source, collection, pipeline in _sources(since):
+        rollups: dict = {}
+        async for row in collection.aggregate(pipeline, allowDiskUse=True):
+            _merge(rollups, row)
+
+        operations = [_build_update(user_id, day, doc) for (user_id, day), doc in rollups.items()]
+        written = 0
+        if apply_changes:
+            for start in range(0, len(operations), BATCH_SIZE):
+                result = await activity_days_collection.bulk_write(operations[start:start + BATCH_SIZE], ordered=False)
+                written += result.modified_count + result.upserted_count
+        stats[source] = len(operations)
+        logger.info(f"{source}: {len(operations)} user-day rollup(s), {written} written.")
+
+    if not apply_changes and any(stats.values()):
+        logger.info("Dry run — no documents were modified. Re-run with --apply to write.")
+    return stats
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Backfill activity_days rollups from cards, card_reviews, study_sessions and books. "
+                    "Dry run unless --apply is passed."
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Write the rollups. Without this flag the run is read-only.",
+    )
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help=f"History window (default {DEFAULT_DAYS})")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    asyncio.run(backfill_activity_days(apply_changes=args.apply, days=args.days))
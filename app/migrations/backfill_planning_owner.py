@@ -0,0 +1,142 @@
+"""
+Resumable backfill of ``user_id`` on annual-planning children.
+
+Background
+----------
+Focus areas, priorities, goals and activities are now stamped with their
+owner's ``user_id`` when created, so ownership checks read one document and
+plan-wide reads use user-indexed lookups (``app/services/planning_scope.py``).
+Documents written before that carry only their parent id. This migration
+copies the owner down the tree, one level at a time:
+
+  1. ``annual_plans.user_id`` → ``focus_areas`` and ``priorities`` (``annual_plan_id``)
+  2. ``focus_areas.user_id``  → ``goals`` (``focus_area_id``)
+  3. ``goals.user_id``        → ``activities`` (``goal_id``)
+
+Parents are read in batches and their children updated with one
+``bulk_write`` of ``UpdateMany`` per owner, matching only children that
+still have no ``user_id``, so rerunning after an interruption picks up where
+it stopped and a second full run changes nothing. Soft-deleted documents are
+stamped too, so a restore brings them back already owned. A dry run can only
+follow owners that are already stored, so below the first level it counts
+just the children of parents stamped earlier.
+
+When a full ``--apply`` run ends the flag ``schema_meta`` ``planning_owner``
+is set and workers started afterwards switch plan-wide reads to ``user_id``.
+Children whose parent no longer exists cannot be attributed; they are
+reported, left unstamped, and were already unreachable through any plan.
+
+Standalone script — NOT wired into app startup. Run from ``Nowry-API``:
+
+    .venv/bin/python -m app.migrations.backfill_planning_owner           # dry run
+    .venv/bin/python -m app.migrations.backfill_planning_owner --apply   # write + set flag
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import defaultdict
+from typing import Dict, List
+
+from pymongo import UpdateMany
+
+from app.config.database import db
+from app.services import planning_scope
+from app.utils import ids
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Parent documents read per round.
+BATCH_SIZE: int = 500
+
+#: (parent collection, child collection, child field holding the parent id),
+#: ordered so every parent is stamped before its children are read.
+LEVELS: tuple = (
+    ("annual_plans", "focus_areas", "annual_plan_id"),
+    ("annual_plans", "priorities", "annual_plan_id"),
+    ("focus_areas", "goals", "focus_area_id"),
+    ("goals", "activities", "goal_id"),
+)
+
+
+def _unstamped_children(child: str, field: str, parent_ids: List) -> dict:
+    return {field: {"$in": ids.ref_values(child, field, parent_ids)}, "user_id": None}
+
+
+async def _stamp_level(parent: str, child: str, field: str, apply_changes: bool) -> int:
+    """Stamp (or, dry, count) the unowned children of every owned ``parent``."""
+    touched = 0
+    batch: Dict[str, List] = defaultdict(list)
+    pending = 0
+
+    async def flush() -> int:
+        if apply_changes:
+            operations = [
+                UpdateMany(_unstamped_children(child, field, parent_ids), {"$set": {"user_id": owner}})
+                for owner, parent_ids in batch.items()
+            ]
+            result = await db[child].bulk_write(operations, ordered=False)
+            return result.modified_count
+        every_id = [parent_id for parent_ids in batch.values() for parent_id in parent_ids]
+        return await db[child].count_documents(_unstamped_children(child, field, every_id))
+
+    cursor = db[parent].find({"user_id": {"$ne": None}}, {"user_id": 1}).batch_size(BATCH_SIZE)
+    async for doc in cursor:
+        batch[str(doc["user_id"])].append(doc["_id"])
+        pending += 1
+        if pending >= BATCH_SIZE:
+            touched += await flush()
+            batch.clear()
+            pending = 0
+    if pending:
+        touched += await flush()
+    return touched
+
+
+async def backfill_planning_owner(apply_changes: bool = False) -> Dict[str, int]:
+    """
+    Stamp ``user_id`` on every planning child reachable from an owned plan.
+
+    When ``apply_changes`` is False (the default) the run is a dry run: it
+    reports how many documents would be stamped and writes nothing.
+    """
+    mode = "APPLY" if apply_changes else "DRY RUN"
+    logger.info(f"Starting planning owner backfill [{mode}], batch size {BATCH_SIZE}.")
+
+    report: Dict[str, int] = {}
+    for parent, child, field in LEVELS:
+        stamped = await _stamp_level(parent, child, field, apply_changes)
+        report[child] = report.get(child, 0) + stamped
+        logger.info(f"{child} via {parent}: {stamped} {'stamped' if apply_changes else 'to stamp'}")
+
+    if not apply_changes:
+        logger.info("Dry run — no documents were modified. Re-run with --apply to stamp and set the flag.")
+        return report
+
+    for child in planning_scope.PLANNING_CHILDREN:
+        orphans = await db[child].count_documents({"user_id": None})
+        if orphans:
+            logger.warning(f"{child}: {orphans} documents have no owned parent and stay unstamped")
+        report[f"{child}_orphans"] = orphans
+    await planning_scope.mark_stamped()
+    logger.info("Backfill complete; restart the API so workers switch to user_id reads.")
+    return report
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Stamp user_id on focus areas, priorities, goals and activities. "
+                    "Dry run unless --apply is passed."
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Write the stamps and set the flag. Without this flag the run is read-only.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    asyncio.run(backfill_planning_owner(apply_changes=args.apply))
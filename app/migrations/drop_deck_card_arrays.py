@@ -0,0 +1,97 @@
+"""
+Remove the legacy ``cards`` id array from deck documents.
+
+Background
+----------
+Decks used to carry the id of every card they hold, ``$push``-ed on card
+create/move and ``$pull``-ed on delete. On large decks that array made every
+deck read and write pay for thousands of ids, and it drifted from the truth
+whenever one of the two writes failed. Cards already reference their deck
+through ``cards.deck_id`` (indexed), so the array is no longer written and
+reads go through that index instead.
+
+This migration ``$unset``s the array from every deck that still has one,
+in batches of ``_id``s. It only selects decks where the field exists, so an
+interrupted run resumes by running it again and a second full run changes
+nothing.
+
+Rollout: while clients may still read ``deck.cards`` the API keeps filling
+it on single-deck responses (GET/PUT ``/decks/{id}``) from a ``deck_id``
+query; set ``DECK_CARD_IDS_IN_RESPONSE=0`` once they no longer do. The flag
+does not depend on this migration — responses never read the stored array.
+
+Standalone script — NOT wired into app startup. Run from ``Nowry-API``:
+
+    .venv/bin/python -m app.migrations.drop_deck_card_arrays           # dry run
+    .venv/bin/python -m app.migrations.drop_deck_card_arrays --apply   # unset
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from typing import Dict, List
+
+from app.config.database import decks_collection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Decks updated per update_many.
+BATCH_SIZE: int = 500
+
+_HAS_ARRAY = {"cards": {"$exists": True}}
+
+
+async def _unset(batch: List) -> int:
+    result = await decks_collection.update_many(
+        {"_id": {"$in": batch}, **_HAS_ARRAY}, {"$unset": {"cards": ""}},
+    )
+    return result.modified_count
+
+
+async def drop_deck_card_arrays(apply_changes: bool = False) -> Dict[str, int]:
+    """
+    Unset ``cards`` on every deck that still stores it.
+
+    When ``apply_changes`` is False (the default) the run is a dry run: it
+    reports how many decks carry the array and writes nothing.
+    """
+    mode = "APPLY" if apply_changes else "DRY RUN"
+    logger.info(f"Starting deck card array removal [{mode}], batch size {BATCH_SIZE}.")
+
+    found = 0
+    unset = 0
+    batch: List = []
+    cursor = decks_collection.find(_HAS_ARRAY, {"_id": 1}).batch_size(BATCH_SIZE)
+    async for doc in cursor:
+        found += 1
+        batch.append(doc["_id"])
+        if len(batch) >= BATCH_SIZE:
+            if apply_changes:
+                unset += await _unset(batch)
+            batch = []
+    if batch and apply_changes:
+        unset += await _unset(batch)
+
+    if not apply_changes:
+        logger.info(f"{found} decks store a cards array. Dry run — re-run with --apply to unset it.")
+    else:
+        logger.info(f"Removed the cards array from {unset} of {found} decks.")
+    return {"found": found, "unset": unset}
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Unset the legacy cards id array on decks. Dry run unless --apply is passed."
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Write the changes. Without this flag the run is read-only.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    asyncio.run(drop_deck_card_arrays(apply_changes=args.apply))
@@ -0,0 +1,294 @@
+"""
+One-time, idempotent move of base64 images out of book content.
+
+Background
+----------
+The PDF importer inlined every image as a ``data:image/...;base64,`` URI, so
+imported books carry their images inside ``full_content``. A scanned PDF can
+push a single book document toward Mongo's 16 MB limit, and every
+``GET /books/{id}``, edit, RAG reindex and plain-text walk then drags megabytes
+of base64 through memory. New imports upload images at import time
+(``app/utils/book_images.py``); this migration rewrites existing books the same
+way.
+
+Per book this migration:
+  1. finds every distinct ``data:image`` URI in ``full_content``,
+  2. uploads each distinct image once per user through the storage backend,
+     reusing an existing upload with the same SHA-256,
+  3. replaces the URIs with their URLs and writes ``full_content`` back — only
+     if the book's ``updated_at`` is unchanged, so a concurrent edit is never
+     overwritten (that book is picked up by the next run).
+
+Books already stored as blocks (``app/utils/book_content.py``) have no
+``full_content``; their images sit in ``book_blocks.node``. A second pass
+finds the blocks still embedding an image and rewrites each of their books
+once through ``save_full_content``, so only the changed blocks are replaced
+and a book edited mid-run (a newer ``content_version``) is left for the next
+run.
+
+Standalone script — NOT wired into app startup. Run from ``Nowry-API``:
+
+    .venv/bin/python -m app.migrations.externalize_book_images           # dry run
+    .venv/bin/python -m app.migrations.externalize_book_images --apply   # upload + write
+
+Dry run is the default: it reports how many images and bytes would move and
+neither uploads nor writes. Safe to re-run: a rewritten book no longer matches
+the filter, and images that failed to upload stay inline for the next pass.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from typing import Any
+
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ASCENDING
+
+from app.config.database import book_blocks_collection, books_collection
+from app.utils.book_content import CONTENT_PROJECTION, load_full_content, save_full_content
+from app.utils.book_images import DATA_URI_RE, externalize_inline_images
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Books fetched per page. Small — each candidate carries megabytes of base64.
+BATCH_SIZE: int = 20
+
+#: Only books whose content still embeds an image need inspecting.
+MIGRATION_FILTER: dict[str, Any] = {
+    "full_content": {"$regex": "data:image/"},
+}
+
+#: Fetch only the fields the migration reads.
+PROJECTION: dict[str, int] = {
+    "_id": 1,
+    "user_id": 1,
+    "updated_at": 1,
+    "full_content": 1,
+}
+
+#: Lexical keeps an image's URI in the image node's ``src``. A regex cannot
+#: search a subdocument as text, so blocks are matched on ``src`` down to a
+#: fixed nesting depth (a table cell's paragraph is five levels down).
+IMAGE_SRC_DEPTH: int = 6
+
+#: Only blocks whose node still embeds an image need inspecting.
+BLOCK_FILTER: dict[str, Any] = {
+    "$or": [
+        {"node." + "children." * depth + "src": {"$regex": "data:image/"}}
+        for depth in range(IMAGE_SRC_DEPTH)
+    ],
+}
+
+
+class MigrationStats:
+    """Mutable counters for a single migration run."""
+
+    def __init__(self) -> None:
+        self.scanned: int = 0
+        self.images_found: int = 0
+        self.images_uploaded: int = 0
+        self.images_reused: int = 0
+        self.images_failed: int = 0
+        self.bytes_removed: int = 0
+        self.documents_written: int = 0
+        self.documents_skipped: int = 0
+        self.blocks_scanned: int = 0
+
+
+async def _fetch_page(after_id: ObjectId | None) -> list[dict[str, Any]]:
+    """Fetch one bounded page of candidate books, ordered by ``_id``."""
+    query: dict[str, Any] = dict(MIGRATION_FILTER)
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+
+    return await (
+        books_collection.find(query, PROJECTION)
+        .sort("_id", ASCENDING)
+        .to_list(length=BATCH_SIZE)
+    )
+
+
+async def _migrate_book(book: dict[str, Any], stats: MigrationStats, apply_changes: bool) -> None:
+    content: str = book.get("full_content") or ""
+
+    if not apply_changes:
+        distinct = {m.group(0) for m in DATA_URI_RE.finditer(content)}
+        stats.images_found += len(distinct)
+        stats.bytes_removed += sum(len(m.group(0)) for m in DATA_URI_RE.finditer(content))
+        return
+
+    user_id = book.get("user_id")
+    if not user_id:
+        stats.documents_skipped += 1
+        logger.warning(f"Book {book['_id']} has no user_id — skipped.")
+        return
+
+    new_content, result = await externalize_inline_images(content, user_id)
+    stats.images_found += result.found
+    stats.images_uploaded += result.uploaded
+    stats.images_reused += result.reused
+    stats.images_failed += result.failed
+    stats.bytes_removed += result.bytes_removed
+
+    if new_content == content:
+        return
+
+    update = await books_collection.update_one(
+        {"_id": book["_id"], "updated_at": book.get("updated_at")},
+        {"$set": {"full_content": new_content}},
+    )
+    if update.modified_count:
+        stats.documents_written += 1
+    else:
+        stats.documents_skipped += 1
+        logger.info(f"Book {book['_id']} changed during migration — left for the next run.")
+
+
+async def _fetch_block_page(after_id: ObjectId | None) -> list[dict[str, Any]]:
+    """Fetch one bounded page of candidate blocks, ordered by ``_id``."""
+    query: dict[str, Any] = dict(BLOCK_FILTER)
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+
+    return await (
+        book_blocks_collection.find(query, {"_id": 1, "book_id": 1, "node": 1})
+        .sort("_id", ASCENDING)
+        .to_list(length=BATCH_SIZE)
+    )
+
+
+async def _migrate_block_book(book_id: str, stats: MigrationStats) -> None:
+    """Rewrite one block-stored book's content with its images externalised."""
+    book = await books_collection.find_one(
+        {"_id": ObjectId(book_id) if ObjectId.is_valid(book_id) else book_id}, CONTENT_PROJECTION
+    )
+    if not book:
+        return
+    stats.scanned += 1
+    user_id = book.get("user_id")
+    if not user_id:
+        stats.documents_skipped += 1
+        logger.warning(f"Book {book_id} has no user_id — skipped.")
+        return
+
+    content = await load_full_content(book)
+    new_content, result = await externalize_inline_images(content, user_id)
+    stats.images_found += result.found
+    stats.images_uploaded += result.uploaded
+    stats.images_reused += result.reused
+    stats.images_failed += result.failed
+    stats.bytes_removed += result.bytes_removed
+
+    if new_content == content:
+        return
+
+    try:
+        await save_full_content(book, new_content, datetime.now(timezone.utc))
+    except HTTPException:
+        stats.documents_skipped += 1
+        logger.info(f"Book {book_id} changed during migration — left for the next run.")
+        return
+    stats.documents_written += 1
+
+
+async def _externalize_block_images(stats: MigrationStats, apply_changes: bool) -> None:
+    """Second pass: books stored as blocks, each rewritten once."""
+    after_id: ObjectId | None = None
+    seen: set[str] = set()
+
+    while True:
+        page: list[dict[str, Any]] = await _fetch_block_page(after_id)
+        if not page:
+            break
+        stats.blocks_scanned += len(page)
+
+        for block in page:
+            if not apply_changes:
+                content = json.dumps(block.get("node") or {})
+                stats.images_found += len({m.group(0) for m in DATA_URI_RE.finditer(content)})
+                stats.bytes_removed += sum(len(m.group(0)) for m in DATA_URI_RE.finditer(content))
+                continue
+            # Rewritten blocks get fresh (larger) ids, and images that stay
+            # inline would match again further on: each book is done once.
+            if block["book_id"] not in seen:
+                seen.add(block["book_id"])
+                await _migrate_block_book(block["book_id"], stats)
+
+        if len(page) < BATCH_SIZE:
+            break
+        after_id = page[-1]["_id"]
+
+
+async def externalize_book_images(apply_changes: bool = False) -> MigrationStats:
+    """
+    Page through every book embedding base64 images and move them to storage.
+
+    When ``apply_changes`` is False (the default) the run is a dry run: it
+    reports what would move and neither uploads nor writes.
+    """
+    mode: str = "APPLY" if apply_changes else "DRY RUN"
+    logger.info(f"Starting book image externalisation [{mode}], batch size {BATCH_SIZE}.")
+
+    stats = MigrationStats()
+    after_id: ObjectId | None = None
+    batch_number: int = 0
+
+    while True:
+        page: list[dict[str, Any]] = await _fetch_page(after_id)
+        if not page:
+            break
+
+        batch_number += 1
+        stats.scanned += len(page)
+
+        for book in page:
+            await _migrate_book(book, stats, apply_changes)
+
+        logger.info(
+            f"Batch {batch_number}: scanned {len(page)} book(s), "
+            f"{stats.images_found} image(s) found so far."
+        )
+
+        if len(page) < BATCH_SIZE:
+            break
+        after_id = page[-1]["_id"]
+
+    await _externalize_block_images(stats, apply_changes)
+
+    logger.info(
+        f"Externalisation complete [{mode}]. "
+        f"Scanned {stats.scanned} book(s) and {stats.blocks_scanned} block(s); "
+        f"{stats.images_found} image(s) found "
+        f"({stats.images_uploaded} uploaded, {stats.images_reused} reused, "
+        f"{stats.images_failed} left inline); {stats.bytes_removed} byte(s) removed; "
+        f"{stats.documents_written} written, {stats.documents_skipped} skipped."
+    )
+    if not apply_changes and stats.images_found:
+        logger.info("Dry run — nothing was uploaded or modified. Re-run with --apply to write.")
+
+    return stats
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Upload base64 images embedded in book content to the storage "
+            "backend and replace them with URLs. Dry run unless --apply is passed."
+        )
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Upload images and write the rewritten content. Without this flag the run is read-only.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    asyncio.run(externalize_book_images(apply_changes=args.apply))
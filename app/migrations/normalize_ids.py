@@ -0,0 +1,183 @@
+"""
+Resumable conversion of id fields to one canonical BSON type.
+
+Background
+----------
+Legacy writes left the same id in two shapes: cards whose ``deck_id`` is the
+hex string of an ObjectId, annual-planning documents with a string ``_id``
+(written when PyObjectId still dumped to ``str``) or with an ObjectId where
+the model declares a ``str`` parent id. Reads therefore match both forms
+(``$in``, ``$or``, or a second ``find_one``), doubling index probes.
+
+Canonical types live in ``app/utils/ids.py``:
+
+  - ``cards.deck_id``                           → ObjectId
+  - ``annual_plan_id`` / ``focus_area_id`` / ``goal_id`` on planning children → string
+  - ``_id`` of decks and annual-planning documents → ObjectId
+
+Per collection this migration:
+  1. re-keys string ``_id`` documents under their ObjectId (insert the copy,
+     then delete the original; a copy left by an interrupted run is reused),
+  2. converts every reference field not stored in its canonical type, one
+     ``bulk_write`` per batch, each update guarded on the old value,
+  3. records the collection in ``schema_meta`` (``_id: "id_normalization"``)
+     once nothing non-canonical is left, after which workers started from
+     then on use single-value reads for it. Blackboards are recorded when no
+     legacy ``board_id`` looks like an ObjectId, since such a value would be
+     ambiguous with an ``_id``.
+
+Re-keying copies then deletes, so an edit landing on a legacy document in
+between is lost; run ``--apply`` off-peak. Values that cannot be converted
+(a ``deck_id`` that is not 24-hex) are reported and keep their collection
+unmarked. Every step selects only what is
+still non-canonical, so an interrupted run resumes by running it again.
+
+Standalone script — NOT wired into app startup. Run from ``Nowry-API``:
+
+    .venv/bin/python -m app.migrations.normalize_ids                      # dry run
+    .venv/bin/python -m app.migrations.normalize_ids --apply              # convert + mark
+    .venv/bin/python -m app.migrations.normalize_ids --apply --collection cards
+
+Restart (or redeploy) the API afterwards so workers reload the marked list.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from typing import Any, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.config.database import db
+from app.utils import ids
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Documents converted per bulk_write.
+BATCH_SIZE: int = 500
+
+#: Matches a legacy board_id that could be mistaken for an ObjectId.
+_OBJECT_ID_PATTERN = "^[0-9a-fA-F]{24}$"
+
+
+def _non_canonical(field: str, canonical: str) -> dict:
+    stored = "string" if canonical == ids.OBJECT_ID else "objectId"
+    return {field: {"$type": stored}}
+
+
+def _convert(value: Any, canonical: str) -> Optional[Any]:
+    """The canonical form of ``value``, or None when it can't be converted."""
+    if canonical == ids.STRING:
+        return str(value)
+    return ObjectId(value) if ObjectId.is_valid(value) else None
+
+
+async def _rekey_string_ids(collection: str, apply_changes: bool, stats: dict) -> None:
+    target = db[collection]
+    async for doc in target.find({"_id": {"$type": "string"}}).batch_size(BATCH_SIZE):
+        if not ObjectId.is_valid(doc["_id"]):
+            stats["unconvertible"] += 1
+            continue
+        stats["_id"] += 1
+        if not apply_changes:
+            continue
+        try:
+            await target.insert_one({**doc, "_id": ObjectId(doc["_id"])})
+        except DuplicateKeyError:
+            pass  # copied by an earlier, interrupted run
+        await target.delete_one({"_id": doc["_id"]})
+
+
+async def _convert_field(collection: str, field: str, canonical: str, apply_changes: bool, stats: dict) -> None:
+    target = db[collection]
+    operations: list = []
+
+    async def flush() -> None:
+        # Counted and cleared in both modes, so a dry run holds one batch too.
+        stats[field] = stats.get(field, 0) + len(operations)
+        if apply_changes:
+            await target.bulk_write(operations, ordered=False)
+        operations.clear()
+
+    async for doc in target.find(_non_canonical(field, canonical), {field: 1}).batch_size(BATCH_SIZE):
+        converted = _convert(doc[field], canonical)
+        if converted is None:
+            stats["unconvertible"] += 1
+            continue
+        operations.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: converted}}))
+        if len(operations) >= BATCH_SIZE:
+            await flush()
+    if operations:
+        await flush()
+
+
+async def _remaining(collection: str) -> int:
+    """Documents in ``collection`` still holding a non-canonical id."""
+    target = db[collection]
+    clauses = [
+        _non_canonical(field, canonical)
+        for field, canonical in ids.CANONICAL_REFERENCES.get(collection, {}).items()
+    ]
+    if collection in ids.OBJECT_ID_KEYS:
+        clauses.append({"_id": {"$type": "string"}})
+    if collection == "blackboards":
+        clauses.append({"board_id": {"$regex": _OBJECT_ID_PATTERN}})
+    return await target.count_documents({"$or": clauses}) if clauses else 0
+
+
+def _collections(only: Optional[str]) -> list:
+    names = list(dict.fromkeys([*ids.OBJECT_ID_KEYS, *ids.CANONICAL_REFERENCES, "blackboards"]))
+    return [name for name in names if only in (None, name)]
+
+
+async def normalize_ids(apply_changes: bool = False, collection: Optional[str] = None) -> dict[str, dict]:
+    """
+    Convert and mark every collection (or just ``collection``).
+
+    When ``apply_changes`` is False (the default) the run is a dry run: it
+    reports how many values each collection would convert and writes nothing.
+    """
+    mode = "APPLY" if apply_changes else "DRY RUN"
+    logger.info(f"Starting id normalization [{mode}], batch size {BATCH_SIZE}.")
+
+    report: dict[str, dict] = {}
+    for name in _collections(collection):
+        stats: dict = {"_id": 0, "unconvertible": 0}
+        if name in ids.OBJECT_ID_KEYS:
+            await _rekey_string_ids(name, apply_changes, stats)
+        for field, canonical in ids.CANONICAL_REFERENCES.get(name, {}).items():
+            await _convert_field(name, field, canonical, apply_changes, stats)
+
+        remaining = await _remaining(name)
+        stats["remaining"] = remaining
+        if apply_changes and remaining == 0:
+            await ids.mark_normalized(name)
+            stats["marked"] = True
+        report[name] = stats
+        logger.info(f"{name}: {stats}")
+
+    if not apply_changes:
+        logger.info("Dry run — no documents were modified. Re-run with --apply to convert and mark.")
+    return report
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Convert id fields to their canonical type and mark finished collections. "
+                    "Dry run unless --apply is passed."
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Convert and mark. Without this flag the run is read-only.",
+    )
+    parser.add_argument("--collection", choices=_collections(None), help="Only this collection")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    asyncio.run(normalize_ids(apply_changes=args.apply, collection=args.collection))
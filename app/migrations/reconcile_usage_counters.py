@@ -0,0 +1,66 @@
+"""
+Seed or repair the per-user plan usage counters.
+
+Background
+----------
+Plan limits are enforced against counters on the user document
+(``users.usage``, see ``app/services/quota.py``) instead of a
+``count_documents`` per create. A counter missing on a user is seeded the
+first time that user creates something, and a background loop on the API
+recounts every user periodically. This script runs the same recount on
+demand — to seed every account ahead of the first deploy, or to repair
+counters after a bulk data fix — and reports how many counters drifted.
+
+Counts cover live (not soft-deleted) cards per type and books. Each
+correction is a compare-and-set on the value that was read, so a create
+landing mid-run is never overwritten; rerunning converges.
+
+Standalone script — NOT wired into app startup. Run from ``Nowry-API``:
+
+    .venv/bin/python -m app.migrations.reconcile_usage_counters           # dry run
+    .venv/bin/python -m app.migrations.reconcile_usage_counters --apply   # write
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from typing import Dict
+
+from app.services import quota
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+async def reconcile_usage_counters(apply_changes: bool = False) -> Dict[str, int]:
+    """
+    Recount every user's usage counters.
+
+    When ``apply_changes`` is False (the default) the run is a dry run: it
+    reports how many counters would change and writes nothing.
+    """
+    mode = "APPLY" if apply_changes else "DRY RUN"
+    logger.info(f"Starting usage counter reconcile [{mode}], batch size {quota.BATCH_SIZE}.")
+    report = await quota.reconcile(apply_changes=apply_changes)
+    verb = "corrected" if apply_changes else "to correct"
+    logger.info(f"{report['users']} users checked, {report['corrected']} counters {verb}.")
+    if not apply_changes:
+        logger.info("Dry run — no documents were modified. Re-run with --apply to write.")
+    return report
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Seed or repair users.usage plan counters. Dry run unless --apply is passed."
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Write the corrections. Without this flag the run is read-only.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    asyncio.run(reconcile_usage_counters(apply_changes=args.apply))
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List, Any, Dict
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, List, Any, Dict, Literal
 from datetime import datetime
 
 
@@ -42,6 +42,52 @@ class BlackboardUpdate(BaseModel):
     viewport: Optional[Dict[str, float]] = None
 
 
+# ── Op-based saves: PATCH /blackboards/{board_id} ──────────────────────────────
+
+class BoardOp(BaseModel):
+    """
+    One edit. ``value`` is the full object for add_*, ``{"x", "y"}`` for
+    move_node, and the changed fields for update_* (``data`` merges one level).
+    """
+    op: Literal[
+        "add_node", "move_node", "update_node", "delete_node",
+        "add_edge", "update_edge", "delete_edge",
+    ]
+    id: str = Field(..., min_length=1)
+    value: Optional[Dict[str, Any]] = None
+
+    @model_validator(mode="after")
+    def _check_value(self):
+        if self.op.startswith("delete_"):
+            return self
+        if not self.value:
+            raise ValueError(f"{self.op} requires a value")
+        if self.op == "move_node" and not all(
+            isinstance(self.value.get(axis), (int, float)) for axis in ("x", "y")
+        ):
+            raise ValueError("move_node value must have numeric x and y")
+        if self.op == "add_edge" and not (self.value.get("source") and self.value.get("target")):
+            raise ValueError("add_edge value must have source and target")
+        return self
+
+
+class BlackboardPatchRequest(BaseModel):
+    ops: List[BoardOp] = Field(..., min_length=1, max_length=500)
+
+
+class BlackboardPatchResponse(BaseModel):
+    id: str
+    version: int
+    applied: int           # ops left after compaction
+    rebased: bool = False  # applied on top of patches the client had not seen
+
+
+class BlackboardOpsResponse(BaseModel):
+    version: int
+    entries: List[Dict[str, Any]] = []
+    complete: bool = True  # False: the log no longer reaches back that far — refetch the board
+
+
 # ── Phase 7: New request/response models ──────────────────────────────────────
 
 class CreateBoardRequest(BaseModel):
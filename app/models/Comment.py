@@ -30,6 +30,8 @@ class CommentAnchor(BaseModel):
     start_offset: int                                   # plain-text char offset at creation time
     end_offset: int
     block_index: Optional[int] = None                   # ordinal top-level block, narrows re-search
+    # Offsets index the book's plain-text derivative (app/utils/book_text.py) and
+    # are kept current by server-side re-anchoring after every content save.
 
 
 class Comment(BaseModel, SoftDeleteMixin):
@@ -41,6 +43,7 @@ class Comment(BaseModel, SoftDeleteMixin):
     anchor: CommentAnchor
     body: str = Field(..., min_length=1, max_length=4000)
     resolved: bool = False
+    orphaned: bool = False  # set by server-side re-anchoring when the quote no longer exists
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
 
@@ -77,5 +80,6 @@ class CommentResponse(BaseModel):
     anchor: CommentAnchor
     body: str
     resolved: bool
+    orphaned: bool = False
     created_at: datetime
     updated_at: datetime
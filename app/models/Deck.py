@@ -43,6 +43,9 @@ class Deck(BaseModel, SoftDeleteMixin):
     total_cards: int = 0
     status: Literal["new", "review", "attention", "archived"] = "new"
     tags: Optional[List[str]] = []
+    # Deprecated: decks no longer store their card ids — cards reference the
+    # deck through cards.deck_id. Only filled on single-deck responses while
+    # DECK_CARD_IDS_IN_RESPONSE is on.
     cards: List[PyObjectId] = Field(default_factory=list)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -77,7 +80,6 @@ class Deck(BaseModel, SoftDeleteMixin):
                 "total_cards": 50,
                 "status": "new",
                 "tags": ["idioma", "asia"],
-                "cards": ["64f7b0a9f2a1e3c8b1111111", "64f7b0a9f2a1e3c8b2222222"],
                 "created_at": "2025-10-30T10:00:00Z",
                 "updated_at": "2025-10-31T10:00:00Z",
                 "deleted_at": None,
@@ -8,6 +8,7 @@ from datetime import datetime
 class FocusArea(BaseModel, SoftDeleteMixin):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     annual_plan_id: str
+    user_id: Optional[str] = None  # Owner, stamped from the caller at create time; never taken from the body
     name: str 
     description: Optional[str] = ""
     color: Optional[str] = "#3B82F6"
@@ -15,6 +15,7 @@ class Milestone(BaseModel):
 class Goal(BaseModel, SoftDeleteMixin):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     focus_area_id: str
+    user_id: Optional[str] = None  # Owner, stamped from the caller at create time; never taken from the body
     priority_id: Optional[str] = None
     title: str
     description: Optional[str] = ""
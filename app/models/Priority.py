@@ -9,6 +9,7 @@ class Priority(BaseModel, SoftDeleteMixin):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     annual_plan_id: str
     focus_area_id: Optional[str] = None
+    user_id: Optional[str] = None  # Owner, stamped from the caller at create time; never taken from the body
     title: str
     linked_entity_id: Optional[str] = None
     linked_entity_type: Optional[str] = None # goal, task, routine_morning, routine_afternoon, routine_evening
@@ -0,0 +1,31 @@
+# app/models/agent_stream.py
+"""SSE event payload models for the streaming Study Buddy chat endpoint.
+
+Wire contract (POST /agent/chat/stream):
+    event: token  -> TokenEventData    (reply text as the model produces it)
+    event: tool   -> ToolEventData     (a tool call started / finished / was rejected)
+    event: done   -> ChatResponse      (terminal success event, same body as POST /agent/chat)
+    event: error  -> ErrorEventData    (terminal failure event, see card_stream)
+
+`done.reply` is the authoritative text of the turn: tokens never include the
+[[QUIZ_OFFER:...]] marker or function-call artifacts, and a quiz handoff
+replaces whatever was streamed.
+"""
+from __future__ import annotations
+
+from typing import Literal
+
+from pydantic import BaseModel
+
+
+class TokenEventData(BaseModel):
+    """Payload for a `token` SSE event."""
+
+    text: str
+
+
+class ToolEventData(BaseModel):
+    """Payload for a `tool` SSE event."""
+
+    name: str
+    status: Literal["started", "finished", "rejected"]
@@ -0,0 +1,30 @@
+"""
+Pydantic v2 models for the batch mutation endpoints (priorities, goals,
+activities, tasks).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+from pydantic import BaseModel, Field
+
+#: Most operations accepted in one request.
+MAX_BATCH_OPERATIONS = 100
+
+
+class BatchMutation(BaseModel):
+    """
+    Changes to one document.
+
+    ``changes`` sets top-level fields (only the ones the entity allows);
+    ``milestones`` (goals only) maps a milestone id to the fields to set on it.
+    """
+    id: str
+    changes: Dict[str, Any] = Field(default_factory=dict)
+    milestones: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
+
+
+class BatchMutationRequest(BaseModel):
+    """Payload for PATCH /annual-plan/{entity}/batch and PATCH /tasks/batch."""
+    operations: List[BatchMutation] = Field(..., min_length=1, max_length=MAX_BATCH_OPERATIONS)
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+
+class BookSection(BaseModel):
+    """One entry of a book's section index. ``start``/``count`` are block positions."""
+    title: Optional[str] = None
+    start: int
+    count: int
+
+
+class BookBlock(BaseModel):
+    id: str
+    node: Dict[str, Any]
+
+
+class BookSectionIndex(BaseModel):
+    content_version: int
+    block_count: int
+    sections: List[BookSection]
+
+
+class BookContentRange(BaseModel):
+    content_version: int
+    section_start: int
+    sections: List[BookSection]
+    blocks: List[BookBlock]
+    content_root: Dict[str, Any] = Field(default_factory=dict)
+
+
+class BlockOp(BaseModel):
+    """
+    One block edit. ``update`` and ``delete`` name the block by ``id``;
+    ``insert`` places ``node`` after block ``after`` (``None`` = at the start).
+    """
+    op: Literal["update", "insert", "delete"]
+    id: Optional[str] = None
+    after: Optional[str] = None
+    node: Optional[Dict[str, Any]] = None
+
+    @model_validator(mode="after")
+    def _check_fields(self) -> "BlockOp":
+        if self.op in ("update", "delete") and not self.id:
+            raise ValueError(f"'{self.op}' requires an id")
+        if self.op in ("update", "insert") and self.node is None:
+            raise ValueError(f"'{self.op}' requires a node")
+        return self
+
+
+class BlockPatchRequest(BaseModel):
+    ops: List[BlockOp] = Field(..., min_length=1, max_length=500)
+    base_version: Optional[int] = None
+
+
+class BlockPatchResponse(BaseModel):
+    content_version: int
+    inserted_ids: List[str]
+    # Updated blocks are stored under new ids: old id -> new id.
+    replaced_ids: Dict[str, str] = Field(default_factory=dict)
+    sections: List[BookSection]
@@ -50,14 +50,25 @@ class AccountDeleteResponse(BaseModel):
 class DataExportResponse(BaseModel):
     """Response structure for GET /users/export.
 
-    Note: The actual export endpoint returns a JSONResponse directly
-    (for Content-Disposition header support). This model documents the structure.
+    Note: The actual export endpoint streams a file (JSON, NDJSON or ZIP) with
+    a Content-Disposition header. This model documents the ZIP manifest.
     """
     exported_at: str
     user_email: str
     record_counts: Dict[str, int]
 
 
+class DataExportJobResponse(BaseModel):
+    """Response for POST /users/export/jobs and GET /users/export/jobs/{export_id}."""
+    export_id: str
+    status: str  # running | ready | failed
+    created_at: str
+    size_bytes: Optional[int] = None
+    record_counts: Dict[str, int] = {}
+    download_url: Optional[str] = None
+    error: Optional[str] = None
+
+
 class UserAuthResponse(BaseModel):
     """Response returned by the /register and /login auth endpoints."""
     message: str
@@ -84,6 +95,7 @@ class BlackboardResponse(BaseModel):
     nodes: List[Dict[str, Any]] = []
     edges: List[Dict[str, Any]] = []
     viewport: Optional[Dict[str, Any]] = None
+    version: int = 0  # send back as If-Match on PATCH
     created_at: Optional[Any] = None
     updated_at: Optional[Any] = None
 
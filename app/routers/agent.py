@@ -2,6 +2,7 @@
 Study Buddy Agent Router
 
 POST /agent/chat    — Sends a message to the personalized AI companion.
+POST /agent/chat/stream — Same turn, streamed as Server-Sent Events.
 GET  /agent/me      — Returns the agent's current state (level, mood, messages remaining).
 GET  /agent/nudge   — Returns a proactive nudge message if the user opted in.
 
@@ -22,13 +23,16 @@ import json
 import math
 import os
 import re
+import time
 import uuid as _uuid
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Literal, Optional
+from typing import Any, AsyncGenerator, Literal, Optional
 
 import httpx
 from bson import ObjectId
 from fastapi import APIRouter, Body, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from app.core.limiter import limiter
 from pydantic import BaseModel, field_validator, model_validator
 
@@ -39,6 +43,8 @@ from app.config.subscription_plans import (
     SUBSCRIPTION_PLANS,
     SubscriptionTier,
 )
+from app.models.agent_stream import TokenEventData, ToolEventData
+from app.models.card_stream import ErrorEventData, sse_event
 from app.models.quiz import QuizConfig, QuizOffer
 from app.utils.agent_tools import (
     get_annual_plan_context,
@@ -2570,19 +2576,31 @@ async def generate_animation(
     )
 
 
-@router.post("/chat", response_model=ChatResponse)
-@limiter.limit("20/minute")
-async def chat(
-    request: Request,
-    body: ChatRequest,
-    current_user: dict = Depends(get_firebase_user),
-) -> ChatResponse:
+@dataclass
+class _ChatTurn:
+    """A chat turn resolved up to the LLM call (see _prepare_chat_turn)."""
+
+    user_id: str
+    tier: SubscriptionTier
+    tier_value: str
+    plan_features: dict
+    messages_limit: int
+    history: list
+    system_prompt: str
+    tools: list
+    tool_dispatcher: Any
+    quiz_result_holder: dict
+    client: Any
+    model_name: str
+    trace_metadata: dict
+
+
+async def _prepare_chat_turn(body: ChatRequest, current_user: dict) -> _ChatTurn:
     """
-    Send a message to the Study Buddy.
+    Resolve everything a chat turn needs before the LLM call.
 
-    If the user has enabled Knowledge Access, the Gemini model is equipped
-    with Function Calling tools that let it query the user's library, decks,
-    and annual plan on demand (Hybrid RAG). All tools are read-only.
+    Raises 404 for an unknown user and 429 once the monthly message cap is
+    reached — the streaming endpoint calls this before sending any SSE bytes.
     """
     user_id = current_user.get("user_id")
     user = await users_collection.find_one({"_id": ObjectId(user_id)})
@@ -2674,8 +2692,6 @@ async def chat(
         rag_book_context=rag_book_context,
     )
 
-    history = history_for_llm
-
     client = get_langfuse_client()
     tier_value: str = tier.value if hasattr(tier, "value") else str(tier)
     model_name = TIER_MODEL_NAMES.get(tier_value, TIER_MODEL_NAMES["free"])
@@ -2695,10 +2711,38 @@ async def chat(
 
     tools_for_call = (KNOWLEDGE_TOOLS if knowledge_access else []) + QUIZ_TOOLS
 
-    # ── The ONE LLM call for this turn ────────────────────────────────────────
-    turn_input = history + [{"role": "user", "content": body.message}]
+    tool_dispatcher = functools.partial(
+        _dispatch_tool_call,
+        client=client,
+        default_question_count=default_q_count,
+        quiz_result_holder=quiz_result_holder,
+        user_message=body.message,  # threaded to the server-side quiz intent gate
+    )
+
+    return _ChatTurn(
+        user_id=user_id,
+        tier=tier,
+        tier_value=tier_value,
+        plan_features=plan_features,
+        messages_limit=messages_limit,
+        history=history_for_llm,
+        system_prompt=system_prompt,
+        tools=tools_for_call,
+        tool_dispatcher=tool_dispatcher,
+        quiz_result_holder=quiz_result_holder,
+        client=client,
+        model_name=model_name,
+        trace_metadata=trace_metadata,
+    )
+
+
+def _chat_trace(turn: _ChatTurn, body: ChatRequest) -> tuple:
+    """Langfuse context managers for one turn: (propagate_attributes, generation)."""
+    client = turn.client
+    user_id = turn.user_id
+    tier_value = turn.tier_value
+    turn_input = turn.history + [{"role": "user", "content": body.message}]
 
-    # Set up Langfuse tracing context BEFORE the LLM call (fire-and-forget, TR-06).
     # If construction fails, fall back to no-op context managers — the LLM call
     # below executes exactly once either way, never retried for tracing reasons.
     attrs_cm = contextlib.nullcontext()
@@ -2709,13 +2753,13 @@ async def chat(
                 user_id=user_id,
                 session_id=user_id,  # D-10: stable per-user session across the pet relationship
                 trace_name="smart_pet_chat",
-                metadata=trace_metadata,
+                metadata=turn.trace_metadata,
                 tags=["smart_pet_chat", tier_value],
             )
             gen_cm = client.start_as_current_observation(
                 name="smart_pet_chat",
                 as_type="generation",
-                model=model_name,
+                model=turn.model_name,
                 input=turn_input,
             )
         except Exception as langfuse_exc:
@@ -2725,45 +2769,16 @@ async def chat(
             attrs_cm = contextlib.nullcontext()
             gen_cm = contextlib.nullcontext()
 
-    tool_dispatcher = functools.partial(
-        _dispatch_tool_call,
-        client=client,
-        default_question_count=default_q_count,
-        quiz_result_holder=quiz_result_holder,
-        user_message=body.message,  # threaded to the server-side quiz intent gate
-    )
+    return attrs_cm, gen_cm
 
-    try:
-        with attrs_cm, gen_cm as turn_generation:
-            # ── The ONE LLM call for this turn — executes exactly once ──────
-            reply = await agent_llm.chat(
-                message=body.message,
-                history=history,
-                system_prompt=system_prompt,
-                tools=tools_for_call,
-                tool_dispatcher=tool_dispatcher,
-                user_id=user_id,
-                tier=tier,
-            )
 
-            # Record the result on the Langfuse generation, if one is active.
-            # A failure here is a tracing-only failure: the reply is already in
-            # hand, so we log and continue — never re-invoke agent_llm.chat.
-            if turn_generation is not None:
-                try:
-                    turn_generation.update(output=reply)  # D-13: full reply, no truncation
-                except Exception as langfuse_exc:
-                    logger.warning(
-                        f"[SmartPet] Langfuse tracing failed, continuing without trace: {langfuse_exc}"
-                    )
-    except Exception as exc:
-        # Full details go to the log (and Sentry via the error handler) —
-        # never into the client-facing detail string.
-        logger.error(f"Agent Chat Error: {exc}", exc_info=True)
-        raise HTTPException(
-            status_code=502,
-            detail="AI service error. Please try again.",
-        )
+async def _finish_chat_turn(turn: _ChatTurn, body: ChatRequest, reply: str) -> ChatResponse:
+    """Post-process the model's reply and record the turn (history, XP, usage)."""
+    user_id = turn.user_id
+    tier = turn.tier
+    quiz_result_holder = turn.quiz_result_holder
+    plan_features = turn.plan_features
+    messages_limit = turn.messages_limit
 
     # ── Quiz result processing ──────────────────────────────────────────────
     # Either the model called start_quiz (confidence="high" → quiz_config, and
@@ -2823,6 +2838,196 @@ async def chat(
     )
 
 
+
+
+@router.post("/chat", response_model=ChatResponse)
+@limiter.limit("20/minute")
+async def chat(
+    request: Request,
+    body: ChatRequest,
+    current_user: dict = Depends(get_firebase_user),
+) -> ChatResponse:
+    """
+    Send a message to the Study Buddy.
+
+    If the user has enabled Knowledge Access, the Gemini model is equipped
+    with Function Calling tools that let it query the user's library, decks,
+    and annual plan on demand (Hybrid RAG). All tools are read-only.
+    """
+    turn = await _prepare_chat_turn(body, current_user)
+
+    # Set up Langfuse tracing context BEFORE the LLM call (fire-and-forget, TR-06).
+    attrs_cm, gen_cm = _chat_trace(turn, body)
+
+    try:
+        with attrs_cm, gen_cm as turn_generation:
+            # ── The ONE LLM call for this turn — executes exactly once ──────
+            reply = await agent_llm.chat(
+                message=body.message,
+                history=turn.history,
+                system_prompt=turn.system_prompt,
+                tools=turn.tools,
+                tool_dispatcher=turn.tool_dispatcher,
+                user_id=turn.user_id,
+                tier=turn.tier,
+            )
+
+            # Record the result on the Langfuse generation, if one is active.
+            # A failure here is a tracing-only failure: the reply is already in
+            # hand, so we log and continue — never re-invoke agent_llm.chat.
+            if turn_generation is not None:
+                try:
+                    turn_generation.update(output=reply)  # D-13: full reply, no truncation
+                except Exception as langfuse_exc:
+                    logger.warning(
+                        f"[SmartPet] Langfuse tracing failed, continuing without trace: {langfuse_exc}"
+                    )
+    except Exception as exc:
+        # Full details go to the log (and Sentry via the error handler) —
+        # never into the client-facing detail string.
+        logger.error(f"Agent Chat Error: {exc}", exc_info=True)
+        raise HTTPException(
+            status_code=502,
+            detail="AI service error. Please try again.",
+        )
+
+    return await _finish_chat_turn(turn, body, reply)
+
+
+class _VisibleReplyStream:
+    """
+    Filters streamed tokens down to text the final reply can contain.
+
+    Everything from a [[QUIZ_OFFER:...]] marker or a text-form function call
+    onwards is withheld (chat() strips both), and a token ending in what may
+    be the start of one is held back until the next token settles it.
+    """
+
+    _MARKERS = ("[[QUIZ_OFFER:", "<function=")
+
+    def __init__(self) -> None:
+        self._pending = ""
+        self._hidden = False
+
+    def feed(self, text: str) -> str:
+        if self._hidden:
+            return ""
+        self._pending += text
+        found = [i for i in (self._pending.find(m) for m in self._MARKERS) if i != -1]
+        if found:
+            visible = self._pending[:min(found)]
+            self._pending = ""
+            self._hidden = True
+            return visible
+        hold = 0
+        for marker in self._MARKERS:
+            for size in range(min(len(marker) - 1, len(self._pending)), 0, -1):
+                if self._pending.endswith(marker[:size]):
+                    hold = max(hold, size)
+                    break
+        split = len(self._pending) - hold
+        visible, self._pending = self._pending[:split], self._pending[split:]
+        return visible
+
+    def flush(self) -> str:
+        visible = "" if self._hidden else self._pending
+        self._pending = ""
+        return visible
+
+
+@router.post("/chat/stream")
+@limiter.limit("20/minute")
+async def chat_stream(
+    request: Request,
+    body: ChatRequest,
+    current_user: dict = Depends(get_firebase_user),
+) -> StreamingResponse:
+    """
+    POST /agent/chat, streamed as Server-Sent Events (see app/models/agent_stream.py).
+
+    Tokens are forwarded as the model produces them and tool calls are
+    reported as they run; the terminal `done` event carries the same
+    ChatResponse /chat returns (quiz_config, quiz_offer, XP and level-up).
+    """
+    # Resolved BEFORE the StreamingResponse is returned, so an unknown user or
+    # a reached message cap surfaces as a plain HTTP 404/429 with no SSE bytes.
+    turn = await _prepare_chat_turn(body, current_user)
+    attrs_cm, gen_cm = _chat_trace(turn, body)
+
+    async def event_generator() -> AsyncGenerator[str, None]:
+        start: float = time.monotonic()
+        visible = _VisibleReplyStream()
+        reply: Optional[str] = None
+        try:
+            try:
+                with attrs_cm, gen_cm as turn_generation:
+                    first_token = True
+                    async for event in agent_llm.chat_stream(
+                        message=body.message,
+                        history=turn.history,
+                        system_prompt=turn.system_prompt,
+                        tools=turn.tools,
+                        tool_dispatcher=turn.tool_dispatcher,
+                        user_id=turn.user_id,
+                        tier=turn.tier,
+                    ):
+                        if event.type == "token":
+                            if first_token:
+                                first_token = False
+                                ttft_ms = int((time.monotonic() - start) * 1000)
+                                logger.info(f"[SmartPet] First token after {ttft_ms}ms")
+                                # Langfuse derives time-to-first-token from this.
+                                if turn_generation is not None:
+                                    try:
+                                        turn_generation.update(completion_start_time=datetime.now(timezone.utc))
+                                    except Exception as langfuse_exc:
+                                        logger.warning(
+                                            f"[SmartPet] Langfuse tracing failed, continuing without trace: {langfuse_exc}"
+                                        )
+                            text = visible.feed(event.text)
+                            if text:
+                                yield sse_event("token", TokenEventData(text=text))
+                        elif event.type == "tool":
+                            yield sse_event("tool", ToolEventData(name=event.tool, status=event.status))
+                        elif event.type == "reply":
+                            reply = event.text
+
+                    tail = visible.flush()
+                    if tail:
+                        yield sse_event("token", TokenEventData(text=tail))
+
+                    if turn_generation is not None:
+                        try:
+                            turn_generation.update(output=reply)  # D-13: full reply, no truncation
+                        except Exception as langfuse_exc:
+                            logger.warning(
+                                f"[SmartPet] Langfuse tracing failed, continuing without trace: {langfuse_exc}"
+                            )
+                if reply is None:
+                    raise RuntimeError("stream ended without a reply")
+                response = await _finish_chat_turn(turn, body, reply)
+            except Exception as exc:
+                logger.error(f"Agent Chat Stream Error: {exc}", exc_info=True)
+                yield sse_event(
+                    "error",
+                    ErrorEventData(
+                        code="AI_PIPELINE_FAILED",
+                        message="AI service error. Please try again.",
+                    ),
+                )
+                return
+            yield sse_event("done", response)
+        except asyncio.CancelledError:
+            logger.info("[agent_chat_stream] Client disconnected — stream cancelled")
+            raise
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/generate-personality", response_model=GeneratePersonalityResponse)
 async def generate_personality(
     body: GeneratePersonalityRequest,
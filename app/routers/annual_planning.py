@@ -3,11 +3,15 @@ from fastapi import APIRouter, Depends, HTTPException, Body
 from typing import List, Optional
 from datetime import datetime, timezone
 from bson import ObjectId
+from pymongo import UpdateOne
 
 DATE_KEY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 
 from app.auth.firebase_auth import get_firebase_user
 from app.models.common import MessageResponse, OkResponse, FullAnnualPlanResponse
+from app.models.batch_mutations import BatchMutationRequest
+from app.services import batch_mutations, cascade, planning_scope
+from app.utils import ids
 from app.config.database import (
     annual_plans_collection,
     focus_areas_collection,
@@ -29,58 +33,50 @@ from app.models.QuarterReport import QuarterReport
 from pydantic import BaseModel
 
 async def verify_annual_plan_ownership(plan_id: str, user_id: str):
-    from bson.errors import InvalidId
-    try:
-        obj_id = ObjectId(plan_id)
-    except InvalidId:
-        obj_id = plan_id
-    # Try ObjectId lookup first; fall back to string _id (existing docs may have string _id)
-    plan = await annual_plans_collection.find_one({"_id": obj_id})
-    if not plan:
-        plan = await annual_plans_collection.find_one({"_id": plan_id})
+    # One lookup: both _id forms until annual_plans is normalized (app/utils/ids.py).
+    plan = await annual_plans_collection.find_one(
+        {"_id": ids.id_value("annual_plans", plan_id)}, {"user_id": 1}
+    )
     if not plan or str(plan.get("user_id")) != str(user_id):
         raise HTTPException(status_code=403, detail="Not authorized to access this plan data")
 
+async def _verify_stamped_owner(doc: dict, user_id: str, verify_parent, parent_field: str):
+    # Children carry user_id (app/services/planning_scope.py), so the document
+    # just read answers the check; only unstamped legacy documents walk up.
+    if doc.get("user_id") is None:
+        await verify_parent(doc[parent_field], user_id)
+    elif str(doc["user_id"]) != str(user_id):
+        raise HTTPException(status_code=403, detail="Not authorized to access this plan data")
+
 async def verify_focus_area_ownership(fa_id: str, user_id: str):
-    from bson.errors import InvalidId
-    try:
-        obj_id = ObjectId(fa_id)
-    except InvalidId:
-        obj_id = fa_id
-    # Try ObjectId lookup first; fall back to string _id (PyObjectId model_dump serializes to str)
-    fa = await focus_areas_collection.find_one({"_id": obj_id})
-    if not fa:
-        fa = await focus_areas_collection.find_one({"_id": fa_id})
+    fa = await focus_areas_collection.find_one(
+        {"_id": ids.id_value("focus_areas", fa_id)}, {"user_id": 1, "annual_plan_id": 1}
+    )
     if not fa: raise HTTPException(status_code=404, detail="Focus area not found")
-    await verify_annual_plan_ownership(fa["annual_plan_id"], user_id)
+    await _verify_stamped_owner(fa, user_id, verify_annual_plan_ownership, "annual_plan_id")
 
 async def verify_goal_ownership(goal_id: str, user_id: str):
-    from bson.errors import InvalidId
-    try:
-        obj_id = ObjectId(goal_id)
-    except InvalidId:
-        obj_id = goal_id
-    # Try ObjectId lookup first; fall back to string _id (existing docs may have string _id)
-    goal = await goals_collection.find_one({"_id": obj_id})
-    if not goal:
-        goal = await goals_collection.find_one({"_id": goal_id})
+    goal = await goals_collection.find_one(
+        {"_id": ids.id_value("goals", goal_id)}, {"user_id": 1, "focus_area_id": 1}
+    )
     if not goal: raise HTTPException(status_code=404, detail="Goal not found")
-    await verify_focus_area_ownership(goal["focus_area_id"], user_id)
+    await _verify_stamped_owner(goal, user_id, verify_focus_area_ownership, "focus_area_id")
 
 async def verify_priority_ownership(priority_id: str, user_id: str):
-    from bson.errors import InvalidId
-    try:
-        obj_id = ObjectId(priority_id)
-    except InvalidId:
-        obj_id = priority_id
-    p = await priorities_collection.find_one({"_id": obj_id})
-    if not p:
-        # Fallback: legacy priority stored with string _id
-        p = await priorities_collection.find_one({"_id": priority_id})
+    p = await priorities_collection.find_one(
+        {"_id": ids.id_value("priorities", priority_id)}, {"user_id": 1, "annual_plan_id": 1}
+    )
     if not p:
         raise HTTPException(status_code=404, detail="Priority not found")
-    await verify_annual_plan_ownership(p["annual_plan_id"], user_id)
+    await _verify_stamped_owner(p, user_id, verify_annual_plan_ownership, "annual_plan_id")
 
+async def verify_activity_ownership(activity_id: str, user_id: str):
+    act = await activities_collection.find_one(
+        {"_id": ids.id_value("activities", activity_id)}, {"user_id": 1, "goal_id": 1}
+    )
+    if not act:
+        raise HTTPException(status_code=404, detail="Activity not found")
+    await _verify_stamped_owner(act, user_id, verify_goal_ownership, "goal_id")
 
 router = APIRouter(
     prefix="/annual-plan",
@@ -194,6 +190,28 @@ async def get_annual_plan(
     return plan
 
 
+async def _plan_tree(user_id: str, plan_id: str) -> tuple:
+    """Live focus areas, goals and activities of one plan.
+
+    Each level is one $in query on the ids of the level above, so a read
+    never loads more than this plan. Once every child carries user_id
+    (app/services/planning_scope.py) the queries are also scoped to the owner.
+    """
+    scope = {"user_id": user_id, "deleted_at": None} if planning_scope.owner_stamped() else {"deleted_at": None}
+
+    areas = await focus_areas_collection.find({**scope, "annual_plan_id": plan_id}).to_list(length=10)
+    goals, activities = [], []
+    if areas:
+        goals = await goals_collection.find(
+            {**scope, "focus_area_id": {"$in": ids.ref_values("goals", "focus_area_id", [a["_id"] for a in areas])}}
+        ).to_list(length=100 * len(areas))
+    if goals:
+        activities = await activities_collection.find(
+            {**scope, "goal_id": {"$in": ids.ref_values("activities", "goal_id", [g["_id"] for g in goals])}}
+        ).to_list(length=500)
+    return areas, goals, activities
+
+
 @router.get("/full", response_model=FullAnnualPlanResponse)
 async def get_full_annual_plan(
     current_user: dict = Depends(get_firebase_user),
@@ -206,8 +224,8 @@ async def get_full_annual_plan(
     Replaces the 3-level sequential waterfall:
       /annual-plan  →  /focus-areas + /priorities  →  /goals × N
 
-    All DB queries run concurrently via asyncio.gather so the response time is
-    bounded by the slowest single query, not the sum of all of them.
+    DB queries run concurrently via asyncio.gather; within the plan tree each
+    level is one $in query on the level above (see _plan_tree).
     """
     import asyncio
 
@@ -223,8 +241,8 @@ async def get_full_annual_plan(
 
     plan_id = str(plan["_id"])
 
-    # Level 2: focus areas, priorities, and quarter reports in parallel
-    areas_coro = focus_areas_collection.find({"annual_plan_id": plan_id, "deleted_at": None}).to_list(length=10)
+    # Focus areas, goals and activities, priorities, and quarter reports in parallel
+    tree_coro = _plan_tree(user_id, plan_id)
     # D-03 sort — is_active DESC groups active before inactive within non-completed
     # (aggregation $ifNull normalizes missing is_active on legacy docs — WR-02 fix)
     priorities_coro = priorities_collection.aggregate(
@@ -232,28 +250,10 @@ async def get_full_annual_plan(
     ).to_list(length=50)
     reports_coro = quarter_reports_collection.find({"annual_plan_id": plan_id, "deleted_at": None}).to_list(length=10)
 
-    areas, priorities, reports = await asyncio.gather(areas_coro, priorities_coro, reports_coro)
-
-    # Level 3: goals for every area — all in parallel
-    goal_lists = await asyncio.gather(
-        *[goals_collection.find({"focus_area_id": str(area["_id"]), "deleted_at": None}).to_list(length=100) for area in areas]
+    (areas, all_goals, all_activities), priorities, reports = await asyncio.gather(
+        tree_coro, priorities_coro, reports_coro
     )
 
-    # Attach goals to each area and build flat goals list
-    goals_by_area = {}
-    all_goals = []
-    goal_ids = []
-    for area, area_goals in zip(areas, goal_lists):
-        area_id = str(area["_id"])
-        goals_by_area[area_id] = area_goals
-        all_goals.extend(area_goals)
-        goal_ids.extend([str(g["_id"]) for g in area_goals])
-
-    # Level 4: activities for all goals
-    all_activities = []
-    if goal_ids:
-        all_activities = await activities_collection.find({"goal_id": {"$in": goal_ids}, "deleted_at": None}).to_list(length=500)
-
     def serialize(doc):
         """Convert ObjectId and other non-serializable types to strings."""
         if doc is None:
@@ -411,55 +411,32 @@ async def delete_annual_plan(
     user_id = current_user.get("user_id")
     await verify_annual_plan_ownership(id, user_id)
 
-    try:
-        obj_id = ObjectId(id)
-    except Exception:
-        obj_id = id
-
-    now = datetime.now(timezone.utc)
-    soft_delete_update = {
-        "$set": {
-            "deleted_at": now,
-            "deleted_by": user_id,
-            "updated_at": now,
-        }
-    }
-
-    # 1. Soft-delete the plan itself
-    await annual_plans_collection.update_one({"_id": obj_id}, soft_delete_update)
-
-    # 2. CASCADE: Soft-delete all focus areas belonging to this plan
-    await focus_areas_collection.update_many(
-        {"annual_plan_id": id, "deleted_at": None},
-        soft_delete_update,
+    # Plans, focus areas, goals, activities and priorities, however many there are.
+    await cascade.soft_delete(
+        "annual_plans", {"_id": ids.id_value("annual_plans", id)},
+        via=cascade.root_key("annual_plans", id), user_id=user_id,
     )
 
-    # 3. Get focus_area IDs to cascade further (include already-deleted ones for completeness)
-    focus_area_ids = [
-        str(fa["_id"])
-        for fa in await focus_areas_collection.find(
-            {"annual_plan_id": id}
-        ).to_list(length=1000)
-    ]
+    return {"message": "Annual plan and all related data deleted successfully"}
 
-    if focus_area_ids:
-        # 4. CASCADE: Soft-delete all goals linked to these focus areas
-        await goals_collection.update_many(
-            {"focus_area_id": {"$in": focus_area_ids}, "deleted_at": None},
-            soft_delete_update,
-        )
-        # 5. CASCADE: Soft-delete all activities linked to these focus areas
-        await activities_collection.update_many(
-            {"focus_area_id": {"$in": focus_area_ids}, "deleted_at": None},
-            soft_delete_update,
-        )
-        # 6. CASCADE: Soft-delete all priorities linked to these focus areas
-        await priorities_collection.update_many(
-            {"focus_area_id": {"$in": focus_area_ids}, "deleted_at": None},
-            soft_delete_update,
-        )
 
-    return {"message": "Annual plan and all related data deleted successfully"}
+@router.post("/{id}/restore", response_model=MessageResponse)
+async def restore_annual_plan(
+    id: str,
+    current_user: dict = Depends(get_firebase_user),
+):
+    """
+    Undo DELETE /annual-plan/{id} within the 30-day retention window. Restores
+    exactly what that deletion removed; children deleted on their own stay deleted.
+    """
+    await verify_annual_plan_ownership(id, current_user.get("user_id"))
+    restored = await cascade.restore(
+        "annual_plans", {"_id": ids.id_value("annual_plans", id)},
+        via=cascade.root_key("annual_plans", id),
+    )
+    if not restored.get("annual_plans"):
+        raise HTTPException(status_code=404, detail="No deleted annual plan to restore")
+    return {"message": "Annual plan and all related data restored successfully"}
 
 
 # --- Quarter Reports ---
@@ -673,6 +650,7 @@ async def create_focus_area(
     if count >= 3:
         raise HTTPException(status_code=400, detail="Maximum 3 focus areas allowed")
         
+    focus_area.user_id = user_id
     result = await focus_areas_collection.insert_one(focus_area.model_dump(by_alias=True))
     created = await focus_areas_collection.find_one({"_id": result.inserted_id})
     return created
@@ -722,47 +700,16 @@ async def delete_focus_area(
     now = datetime.now(timezone.utc)
 
     # 1. Verify ownership
-    focus_area = await focus_areas_collection.find_one({
-        "_id": ObjectId(id),
-        "user_id": user_id,
-        "deleted_at": None
-    })
-    
-    if not focus_area:
-        raise HTTPException(status_code=404, detail="Focus area not found")
-    
-    soft_delete_update = {
-        "$set": {
-            "deleted_at": now,
-            "deleted_by": user_id,
-            "updated_at": now
-        }
-    }
-    
-    # 2. Soft delete the focus area
-    await focus_areas_collection.update_one(
-        {"_id": ObjectId(id)},
-        soft_delete_update
-    )
-    
-    # 3. CASCADE: Soft delete all related goals
-    await goals_collection.update_many(
-        {"focus_area_id": id, "deleted_at": None},
-        soft_delete_update
-    )
-    
-    # 4. CASCADE: Soft delete all activities in these goals
-    await activities_collection.update_many(
-        {"focus_area_id": id, "deleted_at": None},
-        soft_delete_update
-    )
-    
-    # 5. CASCADE: Soft delete all related priorities
-    await priorities_collection.update_many(
-        {"focus_area_id": id, "deleted_at": None},
-        soft_delete_update
+    await verify_focus_area_ownership(id, user_id)
+
+    # 2. Soft delete the focus area with its goals, their activities, and priorities
+    counts = await cascade.soft_delete(
+        "focus_areas", {"_id": ids.id_value("focus_areas", id)},
+        via=cascade.root_key("focus_areas", id), user_id=user_id, now=now,
     )
-    
+    if not counts.get("focus_areas"):
+        raise HTTPException(status_code=404, detail="Focus area not found")
+
     return {"message": "Focus area and all related data deleted successfully"}
 
 
@@ -802,6 +749,7 @@ async def create_priority(
 ):
     user_id = current_user.get("user_id")
     await verify_annual_plan_ownership(priority.annual_plan_id, user_id)
+    priority.user_id = user_id
     result = await priorities_collection.insert_one(priority.model_dump(by_alias=True))
     return await priorities_collection.find_one({"_id": result.inserted_id})
 
@@ -920,8 +868,6 @@ async def reorder_priorities(
     values (0-indexed). Validates that all IDs belong to the given plan
     before performing any writes (D-09/D-10).
     """
-    from bson.errors import InvalidId
-
     user_id = current_user.get("user_id")
 
     # Guard: oversized payload (DoS defense — T-20-03)
@@ -936,18 +882,9 @@ async def reorder_priorities(
     # Auth + plan ownership (D-12)
     await verify_annual_plan_ownership(payload.annual_plan_id, user_id)
 
-    # Build ObjectId list with string fallback for legacy docs (D-09, Pattern 4)
-    obj_ids = []
-    for pid in payload.priority_ids:
-        try:
-            obj_ids.append(ObjectId(pid))
-        except InvalidId:
-            obj_ids.append(pid)
-
-    # Include both ObjectId and string forms in $in — covers legacy string-_id docs
-    all_id_forms = obj_ids + payload.priority_ids
+    # Both _id forms until priorities is normalized — covers legacy string-_id docs (D-09)
     valid_count = await priorities_collection.count_documents({
-        "_id": {"$in": all_id_forms},
+        "_id": {"$in": ids.id_values("priorities", payload.priority_ids)},
         "annual_plan_id": payload.annual_plan_id,
         "deleted_at": None,
     })
@@ -957,22 +894,38 @@ async def reorder_priorities(
             detail="One or more priority IDs do not belong to this plan",
         )
 
-    # Sequential update_one loop — all-or-nothing validation already passed (D-10)
-    for index, (pid, obj_id) in enumerate(zip(payload.priority_ids, obj_ids)):
-        result = await priorities_collection.update_one(
-            {"_id": obj_id},
-            {"$set": {"order": index, "updated_at": datetime.now(timezone.utc)}},
-        )
-        if result.matched_count == 0:
-            # Fallback: document has string _id (legacy doc)
-            await priorities_collection.update_one(
-                {"_id": pid},
-                {"$set": {"order": index, "updated_at": datetime.now(timezone.utc)}},
+    # One bulk_write — all-or-nothing validation already passed (D-10). Each
+    # filter matches either _id form, so legacy string-_id docs need no retry.
+    now = datetime.now(timezone.utc)
+    await priorities_collection.bulk_write(
+        [
+            UpdateOne(
+                {"_id": ids.id_value("priorities", pid), "annual_plan_id": payload.annual_plan_id},
+                {"$set": {"order": index, "updated_at": now}},
             )
+            for index, pid in enumerate(payload.priority_ids)
+        ],
+        ordered=False,
+    )
 
     return {"ok": True}
 
 
+@router.patch("/priorities/batch", response_model=List[Priority])
+async def batch_update_priorities(
+    payload: BatchMutationRequest,
+    current_user: dict = Depends(get_firebase_user),
+):
+    """
+    Apply changes to many priorities in one round-trip (reorders, bulk
+    check-offs). Ownership is checked once for the whole batch and every
+    change is written with one bulk_write; returns the updated priorities
+    in request order.
+    """
+    result = await batch_mutations.apply_batch("priorities", current_user.get("user_id"), payload.operations)
+    return result.documents
+
+
 # --- Goals ---
 
 @router.get("/goals", response_model=List[Goal])
@@ -994,9 +947,23 @@ async def create_goal(
 ):
     user_id = current_user.get("user_id")
     await verify_focus_area_ownership(goal.focus_area_id, user_id)
+    goal.user_id = user_id
     result = await goals_collection.insert_one(goal.model_dump(by_alias=True))
     return await goals_collection.find_one({"_id": result.inserted_id})
 
+@router.patch("/goals/batch", response_model=List[Goal])
+async def batch_update_goals(
+    payload: BatchMutationRequest,
+    current_user: dict = Depends(get_firebase_user),
+):
+    """
+    Apply changes to many goals — fields and milestone check-offs — in one
+    round-trip. A status change (un)archives linked priorities like PUT
+    /goals/{id}. Returns the updated goals in request order.
+    """
+    result = await batch_mutations.apply_batch("goals", current_user.get("user_id"), payload.operations)
+    return result.documents
+
 @router.put("/goals/{id}", response_model=Goal)
 async def update_goal(
     id: str,
@@ -1101,35 +1068,16 @@ async def delete_goal(id: str, current_user: dict = Depends(get_firebase_user)):
     now = datetime.now(timezone.utc)
 
     # 1. Verify ownership
-    goal = await goals_collection.find_one({
-        "_id": ObjectId(id),
-        "user_id": user_id,
-        "deleted_at": None
-    })
-    
-    if not goal:
-        raise HTTPException(status_code=404, detail="Goal not found")
-    
-    soft_delete_update = {
-        "$set": {
-            "deleted_at": now,
-            "deleted_by": user_id,
-            "updated_at": now
-        }
-    }
-    
-    # 2. Soft delete the goal
-    await goals_collection.update_one(
-        {"_id": ObjectId(id)},
-        soft_delete_update
-    )
-    
-    # 3. CASCADE: Soft delete all related activities
-    await activities_collection.update_many(
-        {"goal_id": id, "deleted_at": None},
-        soft_delete_update
+    await verify_goal_ownership(id, user_id)
+
+    # 2. Soft delete the goal and its activities
+    counts = await cascade.soft_delete(
+        "goals", {"_id": ids.id_value("goals", id)},
+        via=cascade.root_key("goals", id), user_id=user_id, now=now,
     )
-    
+    if not counts.get("goals"):
+        raise HTTPException(status_code=404, detail="Goal not found")
+
     return {"message": "Goal and all activities deleted successfully"}
 
 
@@ -1154,9 +1102,19 @@ async def create_activity(
     user_id = current_user.get("user_id")
     await verify_goal_ownership(goal_id, user_id)
     activity.goal_id = goal_id
+    activity.user_id = user_id
     result = await activities_collection.insert_one(activity.model_dump(by_alias=True))
     return await activities_collection.find_one({"_id": result.inserted_id})
 
+@router.patch("/activities/batch", response_model=List[Activity])
+async def batch_update_activities(
+    payload: BatchMutationRequest,
+    current_user: dict = Depends(get_firebase_user),
+):
+    """Apply changes to many activities (e.g. a day's completions) in one round-trip."""
+    result = await batch_mutations.apply_batch("activities", current_user.get("user_id"), payload.operations)
+    return result.documents
+
 @router.put("/activities/{id}", response_model=Activity)
 async def update_activity(
     id: str,
@@ -1169,10 +1127,7 @@ async def update_activity(
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid ID format")
 
-    existing_act = await activities_collection.find_one({"_id": obj_id})
-    if not existing_act:
-        raise HTTPException(status_code=404, detail="Activity not found")
-    await verify_goal_ownership(existing_act["goal_id"], user_id)
+    await verify_activity_ownership(id, user_id)
 
     result = await activities_collection.update_one(
         {"_id": obj_id},
@@ -1194,6 +1149,7 @@ async def update_activity(
 @router.delete("/activities/{id}", response_model=MessageResponse)
 async def delete_activity(id: str, current_user: dict = Depends(get_firebase_user)):
     user_id = current_user.get("user_id")
+    await verify_activity_ownership(id, user_id)
     now = datetime.now(timezone.utc)
     soft_delete_update = {
         "$set": {
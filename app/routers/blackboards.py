@@ -1,12 +1,19 @@
 import asyncio
 import html
 import re
-from fastapi import APIRouter, Depends, HTTPException
-from app.auth.firebase_auth import get_firebase_user
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from app.auth.firebase_auth import get_firebase_user, get_websocket_user
 from app.auth.dependencies import get_subscription_tier
 from app.config.database import db
 from app.config.subscription_plans import SubscriptionTier
+from app.core.cors import origin_allowed
 from app.models.Blackboard import (
+    BlackboardOpsResponse,
+    BlackboardPatchRequest,
+    BlackboardPatchResponse,
     BlackboardUpdate,
     CreateBoardRequest,
     InviteCollaboratorRequest,
@@ -15,6 +22,8 @@ from app.models.Blackboard import (
 )
 from app.models.common import BlackboardResponse, OkResponse
 from app.ai_orchestrator.orchestrator import orchestrator
+from app.services.blackboard_sync import hub as sync_hub
+from app.utils import blackboard_ops, ids
 from bson import ObjectId
 from datetime import datetime, timezone
 
@@ -26,6 +35,45 @@ def _serialize(doc: dict) -> dict:
     return doc
 
 
+def _board_filter(board_id: str) -> dict:
+    """Match a board by ObjectId or legacy board_id string in a single query.
+
+    Once blackboards are normalized no legacy board_id looks like an ObjectId,
+    so an ObjectId-shaped id is a plain _id equality (app/utils/ids.py).
+    """
+    if ObjectId.is_valid(board_id):
+        if ids.is_normalized("blackboards"):
+            return {"_id": ObjectId(board_id)}
+        return {"$or": [{"_id": ObjectId(board_id)}, {"board_id": board_id}]}
+    return {"board_id": board_id}
+
+
+def _writable_by(user_id: str) -> dict:
+    """Owner or collaborator; legacy boards (no owner_user_id) stay open."""
+    return {"$or": [
+        {"owner_user_id": None},
+        {"owner_user_id": user_id},
+        {"collaborators": user_id},
+    ]}
+
+
+def _check_access(board: dict, user_id: str) -> None:
+    if board.get("owner_user_id") is not None:
+        owner = board.get("owner_user_id")
+        collaborators = board.get("collaborators", [])
+        if owner != user_id and user_id not in collaborators:
+            raise HTTPException(status_code=403, detail="board_access_denied")
+
+
+#: Board reads never load the legacy op_log array (see app/utils/blackboard_ops.py).
+_NO_OP_LOG = {"op_log": 0}
+
+
+def _version_filter(version: int) -> dict:
+    # Boards saved before versioning have no field; they are version 0.
+    return {"version": {"$in": [0, None]}} if version == 0 else {"version": version}
+
+
 async def _resolve_owner_names(boards) -> dict:
     """Map owner_user_id -> display name for a batch of board documents.
 
@@ -122,10 +170,10 @@ async def list_boards(current_user: dict = Depends(get_firebase_user)):
     # owner deleted their account are soft-deleted by the users.py cascade and
     # therefore drop out of every collaborator's list too (no orphaned boards).
     owned = await db.blackboards.find(
-        {"owner_user_id": user_id, "deleted_at": None}
+        {"owner_user_id": user_id, "deleted_at": None}, _NO_OP_LOG
     ).to_list(length=100)
     shared = await db.blackboards.find(
-        {"collaborators": user_id, "deleted_at": None}
+        {"collaborators": user_id, "deleted_at": None}, _NO_OP_LOG
     ).to_list(length=100)
 
     # Merge, deduplicating by _id (owned takes precedence)
@@ -150,21 +198,12 @@ async def list_boards(current_user: dict = Depends(get_firebase_user)):
 async def get_blackboard(board_id: str, current_user: dict = Depends(get_firebase_user)):
     user_id = current_user.get("user_id")
 
-    # Two-step lookup: ObjectId first, then legacy board_id string (same as PUT).
-    # The caller's user_id is deliberately NOT part of either Mongo filter — a
+    # Single lookup by ObjectId or legacy board_id string (same as PUT).
+    # The caller's user_id is deliberately NOT part of the Mongo filter — a
     # collaborator is not the owner, so filtering on user_id here would 404 every
     # shared board. Access is enforced by the guard below instead.
-    # "deleted_at": None keeps soft-deleted (orphaned) boards out of both steps.
-    doc = None
-    try:
-        doc = await db.blackboards.find_one(
-            {"_id": ObjectId(board_id), "deleted_at": None}
-        )
-    except Exception:
-        pass
-
-    if not doc:
-        doc = await db.blackboards.find_one({"board_id": board_id, "deleted_at": None})
+    # "deleted_at": None keeps soft-deleted (orphaned) boards out.
+    doc = await db.blackboards.find_one({"$and": [_board_filter(board_id), {"deleted_at": None}]}, _NO_OP_LOG)
 
     if not doc:
         raise HTTPException(status_code=404, detail="board_not_found")
@@ -186,35 +225,22 @@ async def get_blackboard(board_id: str, current_user: dict = Depends(get_firebas
 async def save_blackboard(
     board_id: str,
     update: BlackboardUpdate,
+    if_match: Optional[str] = Header(default=None, alias="If-Match"),
     current_user: dict = Depends(get_firebase_user),
 ):
     user_id = current_user.get("user_id")
     now = datetime.now(timezone.utc)
 
-    # Fetch existing board to check ownership (Phase 7 guard)
-    existing = None
-    try:
-        existing = await db.blackboards.find_one({"_id": ObjectId(board_id)})
-    except Exception:
-        pass
-
-    if not existing:
-        # Fall back to legacy board_id string field
-        existing = await db.blackboards.find_one({"board_id": board_id})
+    # Single lookup by ObjectId or legacy board_id string (Phase 7 guard below)
+    existing = await db.blackboards.find_one(_board_filter(board_id), {"owner_user_id": 1, "collaborators": 1})
 
     if not existing:
         raise HTTPException(status_code=404, detail="board_not_found")
 
-    if existing.get("owner_user_id") is not None:
-        # Phase 7 board: enforce owner/collaborator guard
-        owner = existing.get("owner_user_id")
-        collaborators = existing.get("collaborators", [])
-        if owner != user_id and user_id not in collaborators:
-            raise HTTPException(status_code=403, detail="board_access_denied")
-
     # Legacy boards (no owner_user_id): allow save for backward compat
+    _check_access(existing, user_id)
 
-    update_fields: dict = {"updated_at": now}
+    update_fields: dict = {}
     if update.name is not None:
         update_fields["name"] = update.name
     if update.nodes is not None:
@@ -224,16 +250,176 @@ async def save_blackboard(
     if update.viewport is not None:
         update_fields["viewport"] = update.viewport
 
+    # Whole-board saves bump the version too, so PATCH clients notice them.
+    # If-Match is optional here; when sent, a stale save gets 409.
+    query: dict = {"_id": existing["_id"]}
+    expected = blackboard_ops.parse_if_match(if_match) if isinstance(if_match, str) else None
+    if expected is not None and expected >= 0:
+        query.update(_version_filter(expected))
+
     result = await db.blackboards.find_one_and_update(
-        {"_id": existing["_id"]},
-        {"$set": update_fields},
+        query,
+        blackboard_ops.replace_pipeline(update_fields, now),
+        projection=_NO_OP_LOG,
         return_document=True,
     )
     if result is None:
+        if expected is not None and expected >= 0:
+            raise HTTPException(status_code=409, detail="version_conflict")
         raise HTTPException(status_code=404, detail="board_not_found")
+    if "nodes" in update_fields or "edges" in update_fields:
+        # Not logged: older patches cannot rebase across a replaced board.
+        # Open realtime rooms reload it.
+        await sync_hub.publish({"board_id": str(result["_id"]), "kind": "reload"})
+    else:
+        # A name or viewport change touches no node or edge.
+        await blackboard_ops.record(str(result["_id"]), result["version"], user_id, [], now)
     return _serialize(result)
 
 
+# ── PATCH /{board_id} — Op-based save with optimistic concurrency ──────────
+@router.patch("/{board_id}", response_model=BlackboardPatchResponse)
+async def patch_blackboard(
+    board_id: str,
+    body: BlackboardPatchRequest,
+    response: Response,
+    if_match: Optional[str] = Header(default=None, alias="If-Match"),
+    current_user: dict = Depends(get_firebase_user),
+):
+    """
+    Apply node/edge ops atomically. ``If-Match`` carries the board version
+    the client last saw. A stale patch is rebased when the patches it missed
+    touched other nodes and edges; otherwise it gets 409 ``version_conflict``
+    and should refetch. ``If-Match: *`` applies regardless of version.
+    """
+    user_id = current_user.get("user_id")
+    base = blackboard_ops.parse_if_match(if_match)
+    if base is None:
+        raise HTTPException(status_code=428, detail="if_match_required")
+
+    now = datetime.now(timezone.utc)
+    ops = blackboard_ops.compact_ops(op.model_dump() for op in body.ops)
+    ids = blackboard_ops.touched_ids(ops)
+    pipeline = blackboard_ops.patch_pipeline(ops, now)
+    scope = [_board_filter(board_id), {"deleted_at": None}]
+    expected = base
+
+    # One round trip on the happy path: access and version are both part of
+    # the update filter. Only a miss pays for the diagnostic read.
+    for _ in range(3):
+        guards = [_writable_by(user_id)]
+        if expected >= 0:
+            guards.append(_version_filter(expected))
+        result = await db.blackboards.find_one_and_update(
+            {"$and": scope + guards},
+            pipeline,
+            projection={"version": 1},
+            return_document=True,
+        )
+        if result is not None:
+            await blackboard_ops.record(str(result["_id"]), result["version"], user_id, ops, now)
+            response.headers["ETag"] = blackboard_ops.etag(result["version"])
+            await sync_hub.publish({"board_id": str(result["_id"]), "kind": "ops", "ops": ops, "user_id": user_id})
+            return BlackboardPatchResponse(
+                id=str(result["_id"]),
+                version=result["version"],
+                applied=len(ops),
+                rebased=expected != base,
+            )
+
+        board = await db.blackboards.find_one(
+            {"$and": scope},
+            {"owner_user_id": 1, "collaborators": 1, "version": 1},
+        )
+        if not board:
+            raise HTTPException(status_code=404, detail="board_not_found")
+        _check_access(board, user_id)
+        current = board.get("version") or 0
+        missed = await blackboard_ops.entries_since(str(board["_id"]), base, current) if base >= 0 else []
+        if not blackboard_ops.can_rebase(missed, base, current, ids):
+            raise HTTPException(status_code=409, detail="version_conflict")
+        expected = current
+
+    raise HTTPException(status_code=409, detail="version_conflict")
+
+
+# ── WS /{board_id}/ws — Realtime sync between collaborators ───────────────
+@router.websocket("/{board_id}/ws")
+async def blackboard_socket(websocket: WebSocket, board_id: str):
+    """
+    Client frames: {"type": "auth", "token"} (first, unless a header/cookie
+    carries it), {"type": "ops", "ops": [BoardOp...]}, {"type": "ping"}.
+    Server frames: snapshot (on join), ops, ack, presence, pong, error.
+    Close codes: 4401 unauthenticated, 4403 no access, 4404 no such board.
+    A handshake from an origin CORS does not allow is refused (HTTP 403):
+    the browser would attach the firebase_token cookie to it.
+    """
+    if not origin_allowed(websocket.headers.get("origin")):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    user = await get_websocket_user(websocket)
+    if not user or not user.get("user_id"):
+        await websocket.close(code=4401)
+        return
+    user_id = user["user_id"]
+
+    board = await db.blackboards.find_one({"$and": [_board_filter(board_id), {"deleted_at": None}]}, _NO_OP_LOG)
+    if not board:
+        await websocket.close(code=4404)
+        return
+    try:
+        _check_access(board, user_id)
+    except HTTPException:
+        await websocket.close(code=4403)
+        return
+
+    room = await sync_hub.join(board, websocket, user_id)
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "invalid_json"})
+                continue
+            kind = message.get("type") if isinstance(message, dict) else None
+            if kind == "ops":
+                try:
+                    request = BlackboardPatchRequest(ops=message.get("ops") or [])
+                except ValidationError:
+                    await websocket.send_json({"type": "error", "detail": "invalid_ops"})
+                    continue
+                await sync_hub.submit(room, [op.model_dump() for op in request.ops], user_id, websocket)
+            elif kind == "ping":
+                await websocket.send_json({"type": "pong"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await sync_hub.leave(room, websocket)
+
+
+# ── GET /{board_id}/ops — Patches since a version (catch-up for clients) ────
+@router.get("/{board_id}/ops", response_model=BlackboardOpsResponse)
+async def get_blackboard_ops(
+    board_id: str,
+    since: int = Query(..., ge=0),
+    current_user: dict = Depends(get_firebase_user),
+):
+    board = await db.blackboards.find_one(
+        {"$and": [_board_filter(board_id), {"deleted_at": None}]},
+        {"owner_user_id": 1, "collaborators": 1, "version": 1},
+    )
+    if not board:
+        raise HTTPException(status_code=404, detail="board_not_found")
+    _check_access(board, current_user.get("user_id"))
+
+    current = board.get("version") or 0
+    entries = await blackboard_ops.entries_since(str(board["_id"]), since, current)
+    # Unlogged versions (whole-board replaces, clears) leave gaps the client cannot replay.
+    complete = [e["v"] for e in entries] == list(range(since + 1, current + 1))
+    return BlackboardOpsResponse(version=current, entries=entries if complete else [], complete=complete)
+
+
 # ── Phase 7: PUT /{board_id}/invite — Add a collaborator ───────────────────
 @router.put("/{board_id}/invite", response_model=OkResponse)
 async def invite_collaborator(
@@ -361,12 +547,12 @@ async def clear_blackboard(board_id: str, current_user: dict = Depends(get_fireb
     # clear silently no-op'd while still returning ok.
     board = None
     try:
-        board = await db.blackboards.find_one({"_id": ObjectId(board_id)})
+        board = await db.blackboards.find_one({"_id": ObjectId(board_id)}, _NO_OP_LOG)
     except Exception:
         pass
 
     if not board:
-        board = await db.blackboards.find_one({"board_id": board_id})
+        board = await db.blackboards.find_one({"board_id": board_id}, _NO_OP_LOG)
 
     if not board:
         raise HTTPException(status_code=404, detail="board_not_found")
@@ -382,8 +568,17 @@ async def clear_blackboard(board_id: str, current_user: dict = Depends(get_fireb
 
     # Legacy boards (no owner_user_id): allow clear for backward compat
 
+    # Bump the version without logging it so pending PATCHes cannot rebase
+    # onto the cleared board.
     await db.blackboards.update_one(
         {"_id": board["_id"]},
-        {"$set": {"nodes": [], "edges": [], "viewport": {"x": 0, "y": 0, "zoom": 1}, "updated_at": now}},
+        {
+            "$set": {"nodes": [], "edges": [], "viewport": {"x": 0, "y": 0, "zoom": 1}, "updated_at": now},
+            "$unset": {"op_log": ""},
+            "$inc": {"version": 1},
+        },
     )
+    # Open realtime rooms reload the empty board and drop their unsaved ops,
+    # which would otherwise be written back onto it.
+    await sync_hub.publish({"board_id": str(board["_id"]), "kind": "reload", "discard_pending": True})
     return {"ok": True}
@@ -1,14 +1,31 @@
 import os
-from datetime import datetime, timezone
+import tempfile
+from datetime import datetime
 from typing import List, Optional
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Form
 from pymongo.collection import Collection
 from bson import ObjectId
 from app.models.Book import Book, BookSummary
 from app.models.ai_expand import AIExpandRequest, AIExpandResponse
-from app.config.database import books_collection
+from app.models.book_blocks import (
+    BlockPatchRequest,
+    BlockPatchResponse,
+    BookContentRange,
+    BookSectionIndex,
+)
+from app.config.database import books_collection, book_texts_collection
+from app.utils.book_content import (
+    ensure_blocks,
+    load_blocks,
+    patch_blocks,
+    save_full_content,
+    with_full_content,
+)
 from app.auth.firebase_auth import get_firebase_user
 from app.auth.dependencies import require_ownership, track_ai_usage
+from app.services import activity, cascade, quota
+from app.utils import book_search
+from app.utils.book_text import refresh_book_text
 from app.utils.logger import get_logger
 from app.core.model_config import get_client_for_tier, TIER_MODEL_NAMES
 from app.core.langfuse_client import get_langfuse_client
@@ -19,6 +36,15 @@ logger = get_logger(__name__)
 
 _GROQ_MODEL: str = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
 
+# POST /book/import: uploads are copied to disk in 1 MB chunks, and preview
+# mode only extracts the first PREVIEW_PAGE_LIMIT pages.
+UPLOAD_CHUNK_BYTES: int = 1024 * 1024
+PREVIEW_PAGE_LIMIT: int = 10
+
+# Book lists never load content: neither the legacy full_content string nor
+# the block index, section index and root of block-stored books.
+_SUMMARY_PROJECTION: dict = {"full_content": 0, "block_index": 0, "sections": 0, "content_root": 0}
+
 
 router = APIRouter(
     prefix="/book",
@@ -47,38 +73,19 @@ async def create_book(
     book.user_id = user_id
 
     # --- Subscription Limit Check ---
-    from app.config.database import users_collection
-    from app.config.subscription_plans import SUBSCRIPTION_PLANS, SubscriptionTier
-
-    # Get user subscription
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    subscription_data = user.get("subscription", {"tier": "free"})
-    tier_key = subscription_data.get("tier", "free")
-    plan = SUBSCRIPTION_PLANS.get(tier_key, SUBSCRIPTION_PLANS[SubscriptionTier.FREE])
-
-    book_limit = plan["limits"]["books"]
-
-    # Check limit if not unlimited (-1)
-    if book_limit != -1:
-        current_book_count = await books_collection.count_documents({
-            "user_id": user_id,
-            "deleted_at": None  # Only count non-deleted books
-        })
-        if current_book_count >= book_limit:
-            raise HTTPException(
-                status_code=403,
-                detail=f"Book limit reached for {plan['name']} plan. Upgrade to create more books.",
-            )
+    # Checked and claimed with one conditional $inc (app/services/quota.py).
+    await quota.reserve(user_id, "books")
     # --------------------------------
     
     logger.info(f"Creating book: {book.title}")
     # Exclude _id to let MongoDB generate it as ObjectId
     book_dict = book.model_dump(by_alias=True, exclude={'id'})
 
-    new_book = await books_collection.insert_one(book_dict)
+    try:
+        new_book = await books_collection.insert_one(book_dict)
+    except Exception:
+        await quota.release(user_id, "books")
+        raise
     book_id = str(new_book.inserted_id)
     logger.info(f"Book inserted with ID: {book_id}")
 
@@ -119,31 +126,43 @@ async def edit_book(
     # Add updated_at timestamp
     update_data["updated_at"] = datetime.now()
 
-    res = await books_collection.update_one(
-        {"_id": ObjectId(existing_book["_id"]) if len(existing_book["_id"]) == 24 else existing_book["_id"]},
-        {"$set": update_data},
-    )
+    book_filter = {"_id": ObjectId(existing_book["_id"]) if len(existing_book["_id"]) == 24 else existing_book["_id"]}
+    full_content = update_data.pop("full_content", None)
+
+    if full_content is not None:
+        # Content goes to block storage: only the changed blocks are written.
+        # The client saves whole documents without a version, so a lost race
+        # with a concurrent save is retried once against the fresh book
+        # (last write wins, as before).
+        try:
+            await save_full_content(existing_book, full_content, update_data["updated_at"], update_data)
+        except HTTPException as e:
+            if e.status_code != 409:
+                raise
+            fresh = await books_collection.find_one(book_filter)
+            if not fresh:
+                raise HTTPException(status_code=404, detail="Book not found")
+            fresh["_id"] = str(fresh["_id"])
+            await save_full_content(fresh, full_content, update_data["updated_at"], update_data)
+    else:
+        res = await books_collection.update_one(book_filter, {"$set": update_data})
+        if res.matched_count == 0:
+            raise HTTPException(status_code=404, detail="Book not found")
 
-    if res.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Book not found")
+    await activity.record(current_user.get("user_id"), book_id=str(existing_book["_id"]))
 
     # Fetch and return the updated book
-    updated_book = await books_collection.find_one({"_id": ObjectId(existing_book["_id"]) if len(existing_book["_id"]) == 24 else existing_book["_id"]})
+    updated_book = await books_collection.find_one(book_filter)
     if updated_book:
         updated_book["_id"] = str(updated_book["_id"])
 
-        # Trigger background RAG indexing if content changed
-        if "full_content" in update_data and update_data["full_content"]:
-            from app.utils.book_rag import index_book
-            user_id: str = current_user["uid"]
+        # Rebuild the text derivative (and RAG index) if content changed
+        if full_content:
             background_tasks.add_task(
-                index_book,
-                book_id=str(existing_book["_id"]),
-                user_id=user_id,
-                raw_content=update_data["full_content"],
+                _refresh_book_derivatives, str(existing_book["_id"]), current_user["uid"]
             )
 
-        return updated_book
+        return await with_full_content(updated_book)
     
     raise HTTPException(status_code=500, detail="Error fetching updated book")
 
@@ -151,30 +170,27 @@ async def edit_book(
 @router.delete("/delete/{book_id}", summary="Soft delete a book by ID", status_code=204)
 async def delete_book(
     book_id: str,
-    books_collection: Collection = Depends(get_books_collection),
     book: dict = Depends(require_ownership(get_books_collection, "book_id")),
 ):
     """
     Soft delete a book (sets deleted_at timestamp).
     Also auto-unpublishes if the book was public.
     """
-    now = datetime.now(timezone.utc)
+    book_filter = ObjectId(book["_id"]) if len(book["_id"]) == 24 else book["_id"]
 
     try:
-        # Soft delete + auto-unpublish
-        result = await books_collection.update_one(
-            {"_id": ObjectId(book["_id"]) if len(book["_id"]) == 24 else book["_id"]},
-            {
-                "$set": {
-                    "deleted_at": now,
-                    "deleted_by": book.get("user_id"),
-                    "is_public": False,  # Auto-unpublish
-                    "updated_at": now
-                }
-            }
+        # The book and its blocks, auto-unpublished and stamped deleted_via.
+        counts = await cascade.soft_delete(
+            "books", {"_id": book_filter},
+            via=cascade.root_key("books", book["_id"]),
+            user_id=book.get("user_id"),
         )
 
-        if result.modified_count > 0:
+        if counts.get("books"):
+            await quota.release(book.get("user_id"), "books")
+            # The text derivative is rebuilt from blocks on demand; drop it.
+            await book_texts_collection.delete_one({"_id": book_filter})
+            book_search.cache.discard(str(book["_id"]))
             logger.info(f"Book soft-deleted successfully: {book_id}")
             return None
 
@@ -195,10 +211,10 @@ async def search_books(
     import re
     safe_title = re.escape(title)
     
-    # Search books by title (case-insensitive), excluding full_content for performance, and locked to the user
+    # Search books by title (case-insensitive), excluding content for performance, and locked to the user
     cursor = books_collection.find(
         {"title": {"$regex": safe_title, "$options": "i"}, "user_id": user_id, "deleted_at": None},
-        {"full_content": 0}
+        _SUMMARY_PROJECTION
     )
     books = await cursor.to_list(length=100)  # Limit to 100 books for safety
     return books
@@ -216,13 +232,13 @@ async def get_all_books(
     logger.debug(f"Total books for user {user_id}: {total_count}")
 
     # Retrieve all books for the current user that are NOT soft-deleted
-    # Exclude full_content significantly improves performance for large documents
+    # Excluding content significantly improves performance for large documents
     cursor = books_collection.find(
         {
             "user_id": user_id,
             "deleted_at": None  # Only books where deleted_at is None
         },
-        {"full_content": 0}
+        _SUMMARY_PROJECTION
     )
     books = await cursor.to_list(length=100)  # Limit to 100 books for safety
 
@@ -236,7 +252,101 @@ async def get_all_books(
 async def get_book_by_id(
     book: dict = Depends(require_ownership(get_books_collection, "book_id")),
 ):
-    return book
+    return await with_full_content(book)
+
+
+async def _refresh_book_derivatives(book_id: str, user_id: str) -> None:
+    """
+    Background work after a content save: store the plain-text derivative,
+    index it for lexical search, then re-anchor comments and re-embed for
+    RAG from it — both skipped when the text did not change.
+    """
+    from app.utils.book_rag import index_book
+    from app.utils.comment_anchoring import reanchor_comments
+
+    try:
+        refreshed = await refresh_book_text(book_id)
+    except Exception as e:
+        logger.error(f"Text derivative refresh failed for book {book_id}: {e}", exc_info=True)
+        return
+    if not refreshed:
+        return
+    await book_search.index_derivative(book_id, refreshed["derivative"], refreshed["content_version"])
+    if refreshed["changed"]:
+        try:
+            await reanchor_comments(book_id, refreshed["previous"], refreshed["derivative"])
+        except Exception as e:
+            logger.error(f"Comment re-anchoring failed for book {book_id}: {e}", exc_info=True)
+        await index_book(book_id=book_id, user_id=user_id, plain_text=refreshed["derivative"]["text"])
+
+
+@router.get("/{book_id}/sections", response_model=BookSectionIndex, summary="Get a book's section index")
+async def get_book_sections(
+    book: dict = Depends(require_ownership(get_books_collection, "book_id")),
+):
+    """
+    Section index of a block-stored book: one entry per top-level heading,
+    with the block range it covers. Books still stored as a single string are
+    converted to blocks on first access.
+    """
+    book = await ensure_blocks(book, datetime.now())
+    return BookSectionIndex(
+        content_version=book.get("content_version") or 0,
+        block_count=len(book.get("block_index") or []),
+        sections=book.get("sections") or [],
+    )
+
+
+@router.get("/{book_id}/content", response_model=BookContentRange, summary="Fetch a range of book sections")
+async def get_book_content_range(
+    section: int = 0,
+    count: int = 1,
+    book: dict = Depends(require_ownership(get_books_collection, "book_id")),
+):
+    """
+    Blocks for ``count`` sections starting at section index ``section``.
+    Only those blocks are loaded, so reading a chapter of a large book costs
+    the chapter, not the book.
+    """
+    if section < 0 or not 1 <= count <= 100:
+        raise HTTPException(status_code=422, detail="section must be >= 0 and count between 1 and 100")
+
+    book = await ensure_blocks(book, datetime.now())
+    sections = (book.get("sections") or [])[section:section + count]
+    blocks = []
+    if sections:
+        start = sections[0]["start"]
+        stop = sections[-1]["start"] + sections[-1]["count"]
+        blocks = await load_blocks(book, start, stop)
+
+    return BookContentRange(
+        content_version=book.get("content_version") or 0,
+        section_start=section,
+        sections=sections,
+        blocks=blocks,
+        content_root=book.get("content_root") or {},
+    )
+
+
+@router.patch("/{book_id}/blocks", response_model=BlockPatchResponse, summary="Patch individual book blocks")
+async def patch_book_blocks(
+    book_id: str,
+    body: BlockPatchRequest,
+    background_tasks: BackgroundTasks,
+    book: dict = Depends(require_ownership(get_books_collection, "book_id")),
+    current_user: dict = Depends(get_firebase_user),
+):
+    """
+    Update, insert or delete individual blocks. Writes only the blocks named
+    in ``ops`` plus the book's index. Pass ``base_version`` (from a previous
+    read) to get 409 instead of applying ops on top of someone else's edit.
+    """
+    now = datetime.now()
+    book = await ensure_blocks(book, now)
+    result = await patch_blocks(book, [op.model_dump() for op in body.ops], body.base_version, now)
+    await activity.record(current_user.get("user_id"), book_id=str(book["_id"]))
+    background_tasks.add_task(_refresh_book_derivatives, str(book["_id"]), current_user["uid"])
+    return BlockPatchResponse(**result)
 
 
 @router.post("/import", summary="Import a book from file (PDF, DOCX, TXT)")
@@ -251,19 +361,32 @@ async def import_book_from_file(
     """
     Import a book from an uploaded file.
 
-    - **preview=true**: Returns extraction preview with quality metrics for validation
+    - **preview=true**: Returns extraction preview with quality metrics for validation,
+      extracting only the first `PREVIEW_PAGE_LIMIT` pages
     - **preview=false**: Creates and saves the book with all pages
 
     Preserves formatting, multi-column layouts, and provides quality metrics.
+    Extraction runs in the shared process pool, large PDFs split into page
+    ranges across workers.
     """
-    from app.utils.file_import import process_uploaded_file
-
-    # Read file content
-    file_content = await file.read()
-    filename = file.filename
-
-    # Extract pages from file
-    extracted_pages = process_uploaded_file(filename, file_content)
+    from app.utils.file_import import extract_pages
+
+    filename = file.filename or "upload"
+
+    # Stream the upload to disk; extraction runs in the process pool against
+    # the path, so the bytes are never copied into each worker task.
+    suffix = "." + filename.rsplit(".", 1)[-1] if "." in filename else ""
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        file_size = 0
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            tmp.write(chunk)
+            file_size += len(chunk)
+        tmp.flush()
+
+        # Extract pages from file (preview only extracts the first few pages)
+        extracted_pages, source_page_count = await extract_pages(
+            filename, tmp.name, max_pages=PREVIEW_PAGE_LIMIT if preview else None
+        )
 
     if not extracted_pages:
         raise HTTPException(
@@ -297,7 +420,8 @@ async def import_book_from_file(
         return {
             "preview": True,
             "title": book_title,
-            "total_pages": len(extracted_pages),
+            "total_pages": source_page_count,
+            "pages_sampled": len(extracted_pages),
             "metadata": metadata,
             "info": info_msg,
             "warnings": warnings,
@@ -308,7 +432,7 @@ async def import_book_from_file(
                     if "." in filename
                     else "Unknown"
                 ),
-                "size": len(file_content),  # File size in bytes
+                "size": file_size,  # File size in bytes
             },
             "sample_pages": [
                 {
@@ -323,7 +447,7 @@ async def import_book_from_file(
                     "has_columns": p.get("has_columns", False),
                     "quality_score": p.get("quality_score", 0),
                 }
-                for p in extracted_pages  # ALL pages for preview
+                for p in extracted_pages  # First PREVIEW_PAGE_LIMIT pages
             ],
             "quality_summary": {
                 "total_words": metadata.get("total_words", 0),
@@ -335,22 +459,27 @@ async def import_book_from_file(
 
     # SAVE MODE: Create the book with full_content
     # Convert extracted pages to clean JSON format (Content-First)
-    from app.utils.html_to_lexical import html_to_lexical_json
-    import json
-    
+    from app.utils.html_to_lexical import html_to_full_content
+    from app.utils.process_pool import run_in_process
+
     # Combine all pages into single HTML
     combined_html = "\n".join([p.get("content", "") for p in extracted_pages])
-    
-    # Convert HTML to Lexical JSON
+
+    # Upload embedded images and swap their data: URIs for URLs before they
+    # reach full_content. On failure the images stay inline.
+    from app.utils.book_images import externalize_inline_images
     try:
-        lexical_json = html_to_lexical_json(combined_html)
-        full_content = json.dumps(lexical_json)
-        logger.info(f"Converted import to JSON format: {len(lexical_json['root']['children'])} blocks")
+        combined_html, image_stats = await externalize_inline_images(
+            combined_html, current_user.get("user_id")
+        )
+        if image_stats.found:
+            logger.info(f"Book import images: {image_stats}")
     except Exception as e:
-        logger.warning(f"HTML conversion failed, using simple fallback: {e}")
-        from app.utils.html_to_lexical import simple_html_to_lexical
-        lexical_json = simple_html_to_lexical(combined_html)
-        full_content = json.dumps(lexical_json)
+        logger.error(f"Book import image upload skipped: {e}")
+
+    # Convert HTML to Lexical JSON off the event loop
+    full_content = await run_in_process(html_to_full_content, combined_html)
+    logger.info(f"Converted import to JSON format: {len(full_content)} chars")
 
     new_book = Book(
         title=book_title,
@@ -368,6 +497,8 @@ async def import_book_from_file(
     book_dict = new_book.model_dump(by_alias=True, exclude={'id'})
     result = await books_collection.insert_one(book_dict)
     book_id = str(result.inserted_id)
+    # Imports are not limited, but they count towards the plan's book usage.
+    await quota.track(current_user.get("user_id"), "books")
 
     # Return the book info
     return {
@@ -424,7 +555,10 @@ async def ai_expand_text(
 
     client = get_langfuse_client()
     model_name = TIER_MODEL_NAMES.get(tier, TIER_MODEL_NAMES["free"])
-    trace_metadata = {"feature": "book_expand", "tier": tier, "user_id": user_id, "model": model_name}
+    trace_metadata = {
+        "feature": "book_expand", "tier": tier, "user_id": user_id, "model": model_name,
+        **prompt_manager.version_metadata("nowry-book-expand"),
+    }
 
     raw_text: str = ""
     last_exc = None
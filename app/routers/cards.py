@@ -47,6 +47,8 @@ from app.config.database import cards_collection, books_collection, decks_collec
 from app.ai_orchestrator.orchestrator import orchestrator
 from app.auth.firebase_auth import get_firebase_user
 from app.auth.dependencies import track_ai_usage, get_subscription_tier
+from app.services import quota
+from app.utils import ids
 from app.utils.logger import get_logger
 
 router = APIRouter(
@@ -67,25 +69,6 @@ STREAM_TIMEOUT_S: float = 120.0
 STREAM_CARD_PACING_S: float = 0.08
 
 
-def _extract_text_from_lexical(lexical_state: dict) -> str:
-    """Recursively walk Lexical JSON state, collecting text node values."""
-    texts: list[str] = []
-
-    def walk(node) -> None:
-        if isinstance(node, list):
-            for child in node:
-                walk(child)
-        elif isinstance(node, dict):
-            if node.get("type") == "text" and "text" in node:
-                texts.append(node["text"])
-            for key in ("children", "root"):
-                if key in node:
-                    walk(node[key])
-
-    walk(lexical_state)
-    return " ".join(texts)
-
-
 def get_cards_collection() -> Collection:
     return cards_collection
 
@@ -312,6 +295,7 @@ async def create_card(
     card_dict["user_id"] = current_user.get("user_id")
     
     result = await cards_collection.insert_one(card_dict)
+    await quota.track(card_dict["user_id"], quota.card_quota_key(card_dict.get("card_type")))
     logger.info(f"Card created with ID: {result.inserted_id}")
     return {**card_dict, "id": str(result.inserted_id)}
 
@@ -337,18 +321,11 @@ async def generate_cards_from_book(
     if not book or book.get("user_id") != user_id:
         raise HTTPException(status_code=404, detail="Book not found.")
 
-    raw_content: str = book.get("full_content", "")
-    try:
-        lexical_state = json.loads(raw_content)
-        plain_text = _extract_text_from_lexical(lexical_state)
-    except (json.JSONDecodeError, KeyError):
-        plain_text = raw_content
-
-    if len(plain_text) > MAX_BOOK_TEXT_CHARS:
-        logger_cards.warning(
-            f"[generate_cards_from_book] Book text truncated {len(plain_text)} → {MAX_BOOK_TEXT_CHARS}"
-        )
-        plain_text = plain_text[:MAX_BOOK_TEXT_CHARS]
+    from app.utils.book_text import load_book_text
+    derivative = await load_book_text(book, max_chars=MAX_BOOK_TEXT_CHARS)
+    plain_text: str = derivative["text"]
+    if derivative.get("truncated"):
+        logger_cards.warning(f"[generate_cards_from_book] Book text truncated to {MAX_BOOK_TEXT_CHARS}")
 
     if not plain_text.strip():
         raise HTTPException(status_code=400, detail="Book has no text content to analyze.")
@@ -368,7 +345,10 @@ async def generate_cards_from_book(
 
     client = get_langfuse_client()
     model_name = TIER_MODEL_NAMES.get(tier, TIER_MODEL_NAMES["free"])
-    trace_metadata = {"feature": "book_cards", "tier": tier, "user_id": user_id, "model": model_name}
+    trace_metadata = {
+        "feature": "book_cards", "tier": tier, "user_id": user_id, "model": model_name,
+        **prompt_manager.version_metadata("nowry-book-cards"),
+    }
 
     # Retry only on transient errors; fail fast on quota exhaustion.
     # Backoff: attempt 1 → immediate, attempt 2 → ~1 s, attempt 3 → ~2 s (with jitter).
@@ -473,12 +453,11 @@ async def analyze_deck(
     if not deck:
         raise HTTPException(status_code=404, detail="Deck not found.")
 
-    # Load all cards in batches of 25 — use $or for ObjectId/string deck_id mismatch
+    # Load all cards in batches of 25 (deck_id in both forms until cards are normalized)
     BATCH_SIZE = 25
     skip = 0
     all_cards: list[dict] = []
-    deck_or = [{"deck_id": deck_oid}, {"deck_id": str(deck_oid)}]
-    base_query = {"user_id": user_id, "deleted_at": None, "$or": deck_or}
+    base_query = {"user_id": user_id, "deleted_at": None, "deck_id": ids.ref_value("cards", "deck_id", deck_oid)}
 
     while True:
         batch = await cards_collection.find(base_query).skip(skip).to_list(length=BATCH_SIZE)
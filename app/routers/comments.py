@@ -64,6 +64,7 @@ def _to_response(doc: dict) -> CommentResponse:
         anchor=doc["anchor"],
         body=doc["body"],
         resolved=doc.get("resolved", False),
+        orphaned=doc.get("orphaned", False),
         created_at=doc["created_at"],
         updated_at=doc["updated_at"],
     )
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import math
+import os
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from datetime import datetime, timedelta, timezone
 from typing import List, Literal, Optional
@@ -13,6 +14,7 @@ from app.auth.firebase_auth import get_firebase_user, optional_auth
 from app.auth.dependencies import require_ownership, require_public_or_ownership
 from app.config.database import cards_collection, decks_collection
 from app.models.Deck import Deck, DeckWithStats
+from app.services import cascade, quota
 from app.models.deck_settings import (
     DeckSettingsUpdate,
     DeckSettingsResponse,
@@ -28,8 +30,18 @@ from app.models.deck_config import (
     PaceMode,
     resolve_deck_budget,
 )
+from app.utils import ids
 from app.utils.logger import get_logger
 
+#: Rollout switch for clients that still read ``deck.cards``. Decks no longer
+#: store that array (see app/migrations/drop_deck_card_arrays.py); while this
+#: is "1" single-deck responses still carry the card ids, read from the
+#: cards.deck_id index. Set DECK_CARD_IDS_IN_RESPONSE=0 once no client needs them.
+_CARD_IDS_IN_RESPONSE = os.getenv("DECK_CARD_IDS_IN_RESPONSE", "1") == "1"
+
+#: Upper bound on the ids listed by ``_with_card_ids`` (SEC-03 bounded reads).
+_MAX_CARD_IDS = 20_000
+
 router = APIRouter(
     prefix="/decks",
     tags=["decks"],
@@ -43,6 +55,18 @@ def get_decks_collection() -> Collection:
     return decks_collection
 
 
+async def _with_card_ids(deck: dict) -> dict:
+    """Replace any legacy ``cards`` array with ids from the cards.deck_id index, if enabled."""
+    deck.pop("cards", None)
+    if _CARD_IDS_IN_RESPONSE:
+        cards = await cards_collection.find(
+            {"deck_id": ids.ref_value("cards", "deck_id", deck["_id"]), "deleted_at": None},
+            {"_id": 1},
+        ).to_list(length=_MAX_CARD_IDS)
+        deck["cards"] = [str(card["_id"]) for card in cards]
+    return deck
+
+
 @router.post(
     "",
     summary="Create a new deck",
@@ -60,7 +84,7 @@ async def create_deck(
     deck.created_at = datetime.now(timezone.utc)
     deck.updated_at = datetime.now(timezone.utc)
 
-    deck_dict = deck.model_dump(by_alias=True, exclude={"id"})
+    deck_dict = deck.model_dump(by_alias=True, exclude={"id", "cards"})
     result = await collection.insert_one(deck_dict)
 
     if not result.inserted_id:
@@ -72,8 +96,6 @@ async def create_deck(
     created_deck["_id"] = str(created_deck["_id"])
     if created_deck.get("user_id"):
         created_deck["user_id"] = str(created_deck["user_id"])
-    if created_deck.get("cards"):
-        created_deck["cards"] = [str(c) for c in created_deck["cards"]]
 
     return created_deck
 
@@ -106,7 +128,8 @@ async def list_decks(
         # exact match is sufficient — no legacy fallback needed.
         base_filter["deck_type"] = type
 
-    cursor = collection.find(base_filter)
+    # The legacy card id array is never needed here — counts come from cards.deck_id
+    cursor = collection.find(base_filter, {"cards": 0})
     decks = await cursor.to_list(length=100)
 
     now_dt = datetime.now(timezone.utc).replace(tzinfo=None)
@@ -115,8 +138,6 @@ async def list_decks(
         d["_id"] = str(d["_id"])
         if d.get("user_id"):
             d["user_id"] = str(d["user_id"])
-        if d.get("cards"):
-            d["cards"] = [str(c) for c in d["cards"]]
         
         # Calculate real-time counts
         deck_id_str = d["_id"]
@@ -132,8 +153,8 @@ async def list_decks(
 
         try:
             deck_oid = ObjectId(deck_id_str)
-            # $in matches both ObjectId and string-stored deck_ids (mixed legacy data)
-            deck_filter = {"deck_id": {"$in": [deck_oid, deck_id_str]}}
+            # Both deck_id forms until cards are normalized (app/utils/ids.py)
+            deck_filter = {"deck_id": ids.ref_value("cards", "deck_id", deck_oid)}
 
             total_count = await cards_collection.count_documents(
                 {**deck_filter, "deleted_at": None}
@@ -235,10 +256,8 @@ async def get_deck(
     deck["_id"] = str(deck["_id"])
     if deck.get("user_id"):
         deck["user_id"] = str(deck["user_id"])
-    if deck.get("cards"):
-        deck["cards"] = [str(c) for c in deck["cards"]]
 
-    return deck
+    return await _with_card_ids(deck)
 
 
 @router.get("/{id}/cards", summary="Get cards for a deck")
@@ -286,7 +305,8 @@ async def update_deck(
 
     # Do not allow updating internal or immutable fields.
     # forked_from is permanently set at fork time and must never be overwritten.
-    for field in ["_id", "id", "user_id", "created_at", "forked_from"]:
+    # cards is no longer stored on the deck; cards.deck_id is the only link.
+    for field in ["_id", "id", "user_id", "created_at", "forked_from", "cards"]:
         updates.pop(field, None)
 
     try:
@@ -299,51 +319,42 @@ async def update_deck(
     updated_deck["_id"] = str(updated_deck["_id"])
     if updated_deck.get("user_id"):
         updated_deck["user_id"] = str(updated_deck["user_id"])
-    if updated_deck.get("cards"):
-        updated_deck["cards"] = [str(c) for c in updated_deck["cards"]]
 
-    return updated_deck
+    return await _with_card_ids(updated_deck)
 
 
 @router.delete("/{id}", summary="Delete a deck", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_deck(
-    collection: Collection = Depends(get_decks_collection),
     existing_deck: dict = Depends(require_ownership(get_decks_collection, "id")),
 ):
-    from bson import ObjectId
-    user_id = existing_deck.get("user_id")
-
-    now = datetime.now(timezone.utc)
-    
-    soft_delete_update = {
-        "$set": {
-            "deleted_at": now,
-            "deleted_by": user_id,
-            "is_public": False,  # Auto-unpublish
-            "updated_at": now
-        }
-    }
-    
-    # 1. Soft delete the deck
-    await collection.update_one(
-        {"_id": ObjectId(existing_deck["_id"])},
-        soft_delete_update
-    )
-    
-    # 2. CASCADE: Soft delete all cards in this deck
-    from app.config.database import cards_collection
-    deck_oid = ObjectId(existing_deck["_id"])
-    await cards_collection.update_many(
-        {
-            "$or": [
-                {"deck_id": deck_oid},
-                {"deck_id": str(deck_oid)}
-            ],
-            "deleted_at": None
-        },
-        soft_delete_update
+    # The deck and every card in it (deck_id stored as ObjectId or string),
+    # both auto-unpublished.
+    await cascade.soft_delete(
+        "decks", {"_id": ObjectId(existing_deck["_id"])},
+        via=cascade.root_key("decks", existing_deck["_id"]),
+        user_id=existing_deck.get("user_id"),
     )
+    # The cascade took cards of any type with it; recount the card quotas.
+    await quota.recount(existing_deck.get("user_id"), quota.CARD_KEYS)
+
+    return None
 
+
+@router.post("/{id}/restore", summary="Restore a deleted deck", status_code=status.HTTP_204_NO_CONTENT)
+async def restore_deck(
+    id: str,
+    current_user: dict = Depends(get_firebase_user),
+):
+    """Undo DELETE /decks/{id} within the 30-day retention window, cards included."""
+    if not ObjectId.is_valid(id):
+        raise HTTPException(status_code=404, detail="Deck not found")
+    restored = await cascade.restore(
+        "decks", {"_id": ObjectId(id), "user_id": current_user.get("user_id")},
+        via=cascade.root_key("decks", id),
+    )
+    if not restored.get("decks"):
+        raise HTTPException(status_code=404, detail="Deck not found")
+    await quota.recount(current_user.get("user_id"), quota.CARD_KEYS)
     return None
 
 
@@ -383,7 +394,7 @@ async def _compute_daily_counts(
     today_end: datetime,
 ) -> tuple[int, int, int, bool]:
     """Return (new_cards_today, reviews_today, total_today, budget_reached)."""
-    deck_filter = {"deck_id": {"$in": [deck_oid, str(deck_oid)]}, "deleted_at": None}
+    deck_filter = {"deck_id": ids.ref_value("cards", "deck_id", deck_oid), "deleted_at": None}
 
     # Unseen = no last_reviewed entry
     raw_unseen: int = await cards_collection.count_documents(
@@ -445,7 +456,7 @@ async def update_deck_config(
         {"$set": {"config": config_doc, "updated_at": datetime.now(timezone.utc)}},
     )
 
-    deck_filter = {"deck_id": {"$in": [deck_oid, str(deck_oid)]}, "deleted_at": None}
+    deck_filter = {"deck_id": ids.ref_value("cards", "deck_id", deck_oid), "deleted_at": None}
 
     total_cards: int = await cards_collection.count_documents(deck_filter)
     introduced_count: int = await cards_collection.count_documents(
@@ -1,16 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
-from typing import List, Optional
-from datetime import datetime, timezone
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncGenerator, Dict, List, Literal, Optional
+from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel
 from bson import ObjectId
-import zipfile
-import sqlite3
-import tempfile
+import asyncio
 import os
-import re
+import shutil
+import tempfile
+import time
+import uuid
 
 from app.auth.firebase_auth import get_firebase_user
-from app.config.database import decks_collection, cards_collection, users_collection
+from app.config.database import (
+    decks_collection,
+    cards_collection,
+    apkg_imports_collection,
+    apkg_import_cards_collection,
+    card_reviews_collection,
+)
+from app.models.card_stream import SSE_HEARTBEAT, sse_event
+from app.services import quota
+from app.utils.apkg_parser import media_kind, parse_apkg_file
+from app.utils.process_pool import run_in_process
+from app.utils.storage import get_storage_backend
 from app.utils.logger import get_logger
 
 router = APIRouter(
@@ -25,13 +38,58 @@ MAX_FILE_SIZE_MB = 50
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
 PREVIEW_CARD_LIMIT = 5
 
+# Uploads are copied to disk in chunks of this size — the package is never
+# held in memory as a whole.
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Staged/imported cards are written with one insert_many per batch.
+IMPORT_BATCH_SIZE = 1000
+
+# Parallel media uploads per import job.
+MEDIA_UPLOAD_CONCURRENCY = 4
+
+# SSE progress stream (GET /import/apkg/jobs/{import_id}/events)
+PROGRESS_POLL_INTERVAL_S: float = 1.0
+PROGRESS_STREAM_TIMEOUT_S: float = 600.0
+
+ImportJobState = Literal[
+    "uploaded",
+    "parsing",
+    "uploading_media",
+    "staging",
+    "ready",
+    "importing",
+    "completed",
+    "failed",
+]
+
+# States after which the job will not change again without a client action.
+_SETTLED_STATES = {"ready", "completed", "failed"}
+# States in which a worker (the background pipeline or a confirm request) owns the job.
+_ACTIVE_STATES = {"uploaded", "parsing", "uploading_media", "staging", "importing"}
+
+# While a worker owns the job it touches ``updated_at`` every
+# HEARTBEAT_INTERVAL; an active job whose heartbeat is older than STALE_AFTER
+# (its worker died with the process) is marked failed.
+HEARTBEAT_INTERVAL = timedelta(seconds=30)
+STALE_AFTER = timedelta(minutes=5)
+_STALE_ERROR = "Import was interrupted. Please upload the file again."
+
 
 # ── Pydantic Schemas ──────────────────────────────────────────────────────────
 
+class ParsedMedia(BaseModel):
+    name: str
+    kind: Literal["image", "audio"]
+    side: Literal["front", "back"]
+    url: Optional[str] = None
+
+
 class ParsedCard(BaseModel):
     front: str
     back: str
     tags: List[str] = []
+    media: List[ParsedMedia] = []
 
 
 class ParsedDeckPreview(BaseModel):
@@ -48,202 +106,659 @@ class ImportConfirmPayload(BaseModel):
     cards: List[ParsedCard]
 
 
+class ImportProgress(BaseModel):
+    stage: str
+    done: int = 0
+    total: int = 0
+
+
+class ImportJobStatus(BaseModel):
+    import_id: str
+    status: ImportJobState
+    progress: ImportProgress
+    suggested_name: Optional[str] = None
+    card_count: int = 0
+    media_count: int = 0
+    scheduled_card_count: int = 0  # cards carrying Anki review state
+    review_count: int = 0          # Anki revlog entries to be imported
+    cards_allowed: Optional[int] = None  # remaining quota once ready (-1 = unlimited)
+    preview_cards: List[ParsedCard] = []
+    deck_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class ImportJobConfirmPayload(BaseModel):
+    deck_name: str
+    description: Optional[str] = None
+    # Keep Anki's schedule + review history. False imports every card as new.
+    import_scheduling: bool = True
+
+
+class ImportConfirmResponse(BaseModel):
+    deck_id: str
+    deck_name: str
+    cards_imported: int
+    reviews_imported: int = 0
+
+
 # ── Helpers ───────────────────────────────────────────────────────────────────
 
-def _strip_html(text: str) -> str:
-    """Remove HTML tags and decode common entities."""
-    text = re.sub(r"<[^>]+>", "", text)
-    text = text.replace("&nbsp;", " ").replace("&amp;", "&")
-    text = text.replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"')
-    return text.strip()
+# Strong references to in-flight job tasks so they are not garbage-collected
+# mid-run (asyncio only keeps weak references to tasks).
+_background_jobs: set = set()
+
+
+async def _run_parser(apkg_path: str, work_dir: str) -> Dict[str, Any]:
+    """Parse the package in a worker process. Raises ValueError on format errors."""
+    return await run_in_process(parse_apkg_file, apkg_path, work_dir)
+
+
+async def _save_upload(file: UploadFile, path: str) -> int:
+    """Stream the upload to ``path`` chunk by chunk, enforcing the size limit."""
+    size = 0
+    with open(path, "wb") as out:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_FILE_SIZE_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"File exceeds the {MAX_FILE_SIZE_MB} MB limit.",
+                )
+            out.write(chunk)
+    return size
+
+
+def _validate_extension(file: UploadFile) -> None:
+    if not (file.filename or "").lower().endswith(".apkg"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only .apkg files are supported.",
+        )
+
+
+async def _get_remaining_quota(user_id: str) -> int:
+    """Return remaining flashcard quota (from the usage counter). -1 means unlimited."""
+    return await quota.remaining(user_id, "flashcards")
+
+
+async def _reserve_import_quota(user_id: str, card_count: int) -> None:
+    """Claim ``card_count`` flashcard slots in one conditional $inc, or 403."""
+    if await quota.try_reserve(user_id, "flashcards", card_count):
+        return
+    cards_allowed = await _get_remaining_quota(user_id)
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail=f"Importing {card_count} cards would exceed your plan limit. You have {cards_allowed} slots remaining.",
+    )
+
+
+def _new_deck_doc(user_id: str, deck_name: str, description: Optional[str], total_cards: int, now: datetime) -> dict:
+    return {
+        "user_id": user_id,
+        "name": deck_name.strip(),
+        "description": description or "",
+        "deck_type": "flashcard",
+        "total_cards": total_cards,
+        "status": "new",
+        "tags": [],
+        "is_public": False,
+        "voice_settings": {
+            "front": {"voice_name": None, "rate": 1.0, "pitch": 1.0},
+            "back": {"voice_name": None, "rate": 1.0, "pitch": 1.0},
+        },
+        "created_at": now,
+        "updated_at": now,
+        "deleted_at": None,
+    }
 
 
-def _parse_apkg(file_bytes: bytes, filename: str) -> tuple[str, List[ParsedCard]]:
+def _new_card_doc(
+    user_id: str, deck_id: ObjectId, card: dict, now: datetime, import_scheduling: bool = False
+) -> dict:
     """
-    Parse an .apkg file, returning (suggested_deck_name, list_of_cards).
-    Raises ValueError on any format error.
+    Build a flashcard document from a parsed/staged card.
+
+    Cards start at SM-2 defaults unless ``import_scheduling`` is set and the
+    card carries Anki scheduling, in which case its ease/interval/repetitions
+    and review dates are kept so the card is due when Anki would have shown it.
     """
-    with tempfile.TemporaryDirectory() as tmp:
-        apkg_path = os.path.join(tmp, "deck.apkg")
-        with open(apkg_path, "wb") as f:
-            f.write(file_bytes)
-
-        # Validate zip structure
-        if not zipfile.is_zipfile(apkg_path):
-            raise ValueError("File is not a valid .apkg (not a zip archive).")
-
-        with zipfile.ZipFile(apkg_path, "r") as z:
-            names = z.namelist()
-
-            # Pick database — prefer anki21
-            db_name = None
-            for candidate in ["collection.anki21", "collection.anki2"]:
-                if candidate in names:
-                    db_name = candidate
-                    break
-
-            if not db_name:
-                raise ValueError("No Anki collection database found inside the .apkg file.")
-
-            # --- Zip Bomb Mitigation ---
-            info = z.getinfo(db_name)
-            # Limit the uncompressed SQLite DB to 150MB
-            if info.file_size > 150 * 1024 * 1024:
-                raise ValueError("Database file is dangerously large. Import aborted.")
-            # ---------------------------
-
-            z.extract(db_name, tmp)
-
-        db_path = os.path.join(tmp, db_name)
-        conn = sqlite3.connect(db_path)
-        cur = conn.cursor()
-
-        # -- Deck name from col table -----------------------------------------
-        suggested_name = "Imported Deck"
-        try:
-            import json as _json
-            cur.execute("SELECT decks FROM col LIMIT 1")
-            row = cur.fetchone()
-            if row:
-                decks_json = _json.loads(row[0])
-                # Anki stores decks as {id: {name: ...}}. Skip the default deck (id=1).
-                non_default = [
-                    v["name"]
-                    for k, v in decks_json.items()
-                    if k != "1" and isinstance(v, dict) and "name" in v
-                ]
-                if non_default:
-                    # Use top-level name (strip "::" hierarchy if present)
-                    suggested_name = non_default[0].split("::")[-1].strip()
-        except Exception:
-            pass  # Fall back to default name
-
-        # -- Cards from notes table -------------------------------------------
-        try:
-            cur.execute("SELECT flds, tags FROM notes")
-            rows = cur.fetchall()
-        except sqlite3.OperationalError:
-            raise ValueError("Could not read cards from the Anki database. The file may be corrupt.")
+    doc = {
+        "user_id": user_id,
+        "deck_id": deck_id,
+        "title": card["front"],
+        "content": card["back"],
+        "card_type": "flashcard",
+        "tags": card.get("tags") or [],
+        "ease_factor": 2.5,
+        "interval": 1,
+        "repetitions": 0,
+        "last_reviewed": None,
+        "next_review": None,
+        "created_at": now,
+        "updated_at": now,
+        "deleted_at": None,
+    }
+    media = [m for m in card.get("media") or [] if m.get("url")]
+    if media:
+        doc["media"] = media
+    schedule = card.get("scheduling")
+    if import_scheduling and schedule:
+        for field in ("ease_factor", "interval", "repetitions", "last_reviewed", "next_review"):
+            doc[field] = schedule[field]
+    return doc
+
+
+async def _insert_card_batch(deck_id: ObjectId, card_docs: List[dict]) -> List[ObjectId]:
+    """Insert one batch of cards (linked to the deck by their deck_id). Returns the new ids."""
+    if not card_docs:
+        return []
+    result = await cards_collection.insert_many(card_docs, ordered=False)
+    return list(result.inserted_ids)
+
+
+async def _insert_review_history(
+    user_id: str, deck_id: ObjectId, card_ids: List[ObjectId], staged: List[dict]
+) -> int:
+    """Bulk-load the Anki review log for one batch of freshly inserted cards."""
+    reviews = [
+        {
+            **review,
+            "user_id": user_id,
+            "card_id": card_id,
+            "deck_id": deck_id,
+            "source": "anki_import",
+        }
+        for card_id, card in zip(card_ids, staged)
+        for review in (card.get("scheduling") or {}).get("reviews", [])
+    ]
+    for start in range(0, len(reviews), IMPORT_BATCH_SIZE):
+        await card_reviews_collection.insert_many(reviews[start:start + IMPORT_BATCH_SIZE], ordered=False)
+    return len(reviews)
 
-        conn.close()
 
-        # Known compatibility shims Anki embeds when the format is too new
-        COMPAT_MESSAGES = {
-            "Please update to the latest Anki version, then import the .colpkg/.apkg file again.",
-            "Please update to the latest Anki version.",
-        }
+async def _update_job(import_id: str, **fields: Any) -> None:
+    fields["updated_at"] = datetime.now(timezone.utc)
+    await apkg_imports_collection.update_one({"import_id": import_id}, {"$set": fields})
+
+
+def _start_heartbeat(import_id: str) -> asyncio.Task:
+    """Touch the job every HEARTBEAT_INTERVAL until the returned task is cancelled."""
+    async def beat() -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL.total_seconds())
+            try:
+                await _update_job(import_id)
+            except Exception as e:
+                logger.warning(f"[apkg:{import_id}] Heartbeat failed: {e}")
+
+    return asyncio.create_task(beat())
+
 
-        cards: List[ParsedCard] = []
-        compat_notes_found = 0
-        for flds, tags in rows:
-            # Anki fields are \x1f separated
-            raw_fields = flds.split("\x1f")
-            
-            # Clean all fields
-            cleaned_fields = [_strip_html(f) for f in raw_fields]
-            
-            # Front is usually the first field (Expression/Kanji)
-            front = cleaned_fields[0] if len(cleaned_fields) > 0 else ""
-            
-            # Back: Join all other non-empty fields (Reading + Meaning + Examples)
-            other_fields = [f for f in cleaned_fields[1:] if f.strip()]
-            back = "\n\n".join(other_fields) if other_fields else ""
-
-            # Skip completely empty cards
-            if not front and not back:
-                continue
-
-            # Skip Anki compatibility-shim notes (newer format warning)
-            if front.strip() in COMPAT_MESSAGES:
-                compat_notes_found += 1
-                continue
-
-            # Clean and split tags (Anki stores them inside spaces " tag1 tag2 ")
-            tag_list = [t.strip() for t in (tags or "").strip().split() if t.strip()]
-            cards.append(ParsedCard(front=front, back=back, tags=tag_list))
-
-        if not cards:
-            if compat_notes_found > 0:
-                raise ValueError(
-                    "This .apkg was exported with a newer version of Anki (23.10+) that uses a "
-                    "format our parser does not yet support. To import it, please re-export "
-                    "from Anki using File → Export → 'Anki Deck Package (.apkg)' with the "
-                    "'Support older Anki versions' option enabled."
+async def _fail_stale_jobs(user_id: str, now: datetime) -> None:
+    """
+    Mark the user's active jobs with a stale heartbeat failed. A confirm that
+    died mid-import hands back the quota it reserved for the cards it never
+    inserted and leaves its deck with the cards that made it in.
+    """
+    while True:
+        job = await apkg_imports_collection.find_one_and_update(
+            {
+                "user_id": user_id,
+                "status": {"$in": list(_ACTIVE_STATES)},
+                "updated_at": {"$lt": now - STALE_AFTER},
+            },
+            {"$set": {
+                "status": "failed",
+                "error": _STALE_ERROR,
+                "progress": {"stage": "failed"},
+                "updated_at": now,
+            }},
+        )
+        if not job:
+            return
+        logger.warning(f"[apkg:{job['import_id']}] Marked failed: no heartbeat since {job['updated_at']}")
+        if job["status"] == "importing":
+            imported = (job.get("progress") or {}).get("done", 0)
+            await quota.release(user_id, "flashcards", job.get("card_count", 0) - imported)
+            if job.get("deck_id"):
+                await decks_collection.update_one(
+                    {"_id": ObjectId(job["deck_id"])}, {"$set": {"total_cards": imported}}
                 )
-            raise ValueError("No cards found in the .apkg file.")
 
-        return suggested_name, cards
 
+async def _expire_if_stale(job: dict, now: datetime) -> dict:
+    """Return ``job``, marked failed first when it is active with a stale heartbeat."""
+    heartbeat = job.get("updated_at")
+    if job["status"] not in _ACTIVE_STATES or heartbeat is None:
+        return job
+    if heartbeat.tzinfo is None:
+        heartbeat = heartbeat.replace(tzinfo=timezone.utc)
+    if heartbeat < now - STALE_AFTER:
+        await _fail_stale_jobs(job["user_id"], now)
+        job.update(status="failed", error=_STALE_ERROR, progress={"stage": "failed"}, updated_at=now)
+    return job
+
+
+async def _get_owned_job(import_id: str, user_id: str) -> dict:
+    job = await apkg_imports_collection.find_one({"import_id": import_id, "user_id": user_id})
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import not found.")
+    return await _expire_if_stale(job, datetime.now(timezone.utc))
+
+
+def _job_status(job: dict, cards_allowed: Optional[int] = None) -> ImportJobStatus:
+    return ImportJobStatus(
+        import_id=job["import_id"],
+        status=job["status"],
+        progress=ImportProgress(**(job.get("progress") or {"stage": job["status"]})),
+        suggested_name=job.get("suggested_name"),
+        card_count=job.get("card_count", 0),
+        media_count=job.get("media_count", 0),
+        scheduled_card_count=job.get("scheduled_card_count", 0),
+        review_count=job.get("review_count", 0),
+        cards_allowed=cards_allowed,
+        preview_cards=[ParsedCard(**c) for c in job.get("preview_cards") or []],
+        deck_id=job.get("deck_id"),
+        error=job.get("error"),
+    )
 
-async def _get_remaining_quota(user_id: str) -> int:
-    """Return remaining flashcard quota. -1 means unlimited."""
-    try:
-        from app.config.subscription_plans import SUBSCRIPTION_PLANS, SubscriptionTier
-        user_data = await users_collection.find_one({"_id": ObjectId(user_id)})
-        if not user_data:
-            return 0
 
-        subscription_data = user_data.get("subscription", {"tier": "free"})
-        tier_key = subscription_data.get("tier", "free")
-        plan = SUBSCRIPTION_PLANS.get(tier_key, SUBSCRIPTION_PLANS[SubscriptionTier.FREE])
-        limit = plan["limits"].get("flashcards", 0)
+async def _upload_media(import_id: str, user_id: str, media_files: Dict[str, str]) -> Dict[str, str]:
+    """
+    Upload extracted Anki media through the storage backend.
 
-        if limit == -1:
-            return -1
+    Returns ``{original_filename: url}`` for every file that uploaded. A failed
+    upload is logged and skipped — the card keeps its text either way.
+    """
+    if not media_files:
+        return {}
+    try:
+        storage = get_storage_backend(os.getenv("STORAGE_BACKEND", "cloudinary"))
+    except Exception as e:
+        logger.error(f"[apkg:{import_id}] Storage backend unavailable, skipping media: {e}")
+        return {}
+
+    folder = f"nowry/{user_id}/anki/{import_id}"
+    semaphore = asyncio.Semaphore(MEDIA_UPLOAD_CONCURRENCY)
+    total = len(media_files)
+
+    async def upload_one(name: str, path: str) -> tuple:
+        async with semaphore:
+            content = await asyncio.to_thread(_read_bytes, path)
+            if media_kind(name) == "audio":
+                # Cloudinary serves audio through its "video" resource type.
+                upload_video = getattr(storage, "upload_video", None)
+                if upload_video is None:
+                    return name, None
+                result = await upload_video(content, folder=folder)
+            else:
+                result = await storage.upload(file_content=content, filename=name, folder=folder)
+            return name, result.get("secure_url") or result.get("url")
+
+    urls: Dict[str, str] = {}
+    done = 0
+    for pending in asyncio.as_completed([upload_one(n, p) for n, p in media_files.items()]):
+        try:
+            name, url = await pending
+            if url:
+                urls[name] = url
+        except Exception as e:
+            logger.warning(f"[apkg:{import_id}] Media upload failed: {e}")
+        done += 1
+        if done % 25 == 0 or done == total:
+            await _update_job(import_id, progress={"stage": "uploading_media", "done": done, "total": total})
+    return urls
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def _stage_cards(import_id: str, cards: List[dict], media_urls: Dict[str, str], now: datetime) -> None:
+    """Persist parsed cards under the import id, one insert_many per batch."""
+    total = len(cards)
+    for start in range(0, total, IMPORT_BATCH_SIZE):
+        batch = []
+        for seq, card in enumerate(cards[start:start + IMPORT_BATCH_SIZE], start=start):
+            media = [
+                {**m, "url": media_urls[m["name"]]}
+                for m in card.get("media") or []
+                if m["name"] in media_urls
+            ]
+            batch.append({
+                "import_id": import_id,
+                "seq": seq,
+                "front": card["front"],
+                "back": card["back"],
+                "tags": card["tags"],
+                "media": media,
+                "scheduling": card.get("scheduling"),
+                "created_at": now,
+            })
+        await apkg_import_cards_collection.insert_many(batch, ordered=False)
+        done = min(start + IMPORT_BATCH_SIZE, total)
+        await _update_job(import_id, progress={"stage": "staging", "done": done, "total": total})
+
+
+async def _run_import_job(import_id: str, user_id: str, apkg_path: str, work_dir: str) -> None:
+    """Background pipeline: parse → upload media → stage cards → ready."""
+    heartbeat = _start_heartbeat(import_id)
+    try:
+        await _update_job(import_id, status="parsing", progress={"stage": "parsing"})
+        parsed = await _run_parser(apkg_path, work_dir)
+        cards: List[dict] = parsed["cards"]
+        media_files: Dict[str, str] = parsed["media_files"]
+
+        await _update_job(
+            import_id,
+            status="uploading_media",
+            suggested_name=parsed["suggested_name"],
+            card_count=len(cards),
+            scheduled_card_count=sum(1 for c in cards if c.get("scheduling")),
+            review_count=parsed.get("review_count", 0),
+            progress={"stage": "uploading_media", "done": 0, "total": len(media_files)},
+        )
+        media_urls = await _upload_media(import_id, user_id, media_files)
 
-        current_count = await cards_collection.count_documents({"user_id": user_id})
-        return max(0, limit - current_count)
-    except Exception:
-        return -1  # Default to unlimited on error
+        await _update_job(
+            import_id,
+            status="staging",
+            media_count=len(media_urls),
+            progress={"stage": "staging", "done": 0, "total": len(cards)},
+        )
+        await _stage_cards(import_id, cards, media_urls, datetime.now(timezone.utc))
+
+        preview = [
+            ParsedCard(
+                front=c["front"],
+                back=c["back"],
+                tags=c["tags"],
+                media=[{**m, "url": media_urls.get(m["name"])} for m in c["media"]],
+            ).model_dump()
+            for c in cards[:PREVIEW_CARD_LIMIT]
+        ]
+        await _update_job(
+            import_id,
+            status="ready",
+            preview_cards=preview,
+            progress={"stage": "ready", "done": len(cards), "total": len(cards)},
+        )
+        logger.info(f"[apkg:{import_id}] Ready: {len(cards)} cards, {len(media_urls)} media files")
+    except ValueError as e:
+        await _update_job(import_id, status="failed", error=str(e), progress={"stage": "failed"})
+    except Exception as e:
+        logger.error(f"[apkg:{import_id}] Import job failed: {e}", exc_info=True)
+        await _update_job(
+            import_id,
+            status="failed",
+            error="Failed to parse the .apkg file.",
+            progress={"stage": "failed"},
+        )
+    finally:
+        heartbeat.cancel()
+        shutil.rmtree(work_dir, ignore_errors=True)
 
 
 # ── Endpoints ─────────────────────────────────────────────────────────────────
 
 @router.post(
-    "/apkg",
-    summary="Parse an Anki .apkg file and return a preview",
-    response_model=ParsedDeckPreview,
+    "/apkg/jobs",
+    summary="Upload an Anki .apkg file and start a background import job",
+    response_model=ImportJobStatus,
+    status_code=status.HTTP_202_ACCEPTED,
 )
-async def parse_apkg(
+async def start_apkg_import(
     file: UploadFile = File(...),
     user: dict = Depends(get_firebase_user),
 ):
     """
-    Step 1: Upload and parse an .apkg file.
-    Returns a preview with the first few cards and metadata.
-    No database writes happen at this step.
+    Step 1: Stream the upload to disk and queue it for parsing.
+    Parsing, media upload and card staging happen in the background; poll
+    `GET /import/apkg/jobs/{import_id}` or subscribe to `/events` for progress.
     """
     user_id = user.get("user_id")
-    logger.info(f"User {user_id} uploading .apkg: {file.filename}")
+    logger.info(f"User {user_id} starting .apkg import job: {file.filename}")
+    _validate_extension(file)
+
+    work_dir = tempfile.mkdtemp(prefix="apkg_")
+    apkg_path = os.path.join(work_dir, "deck.apkg")
+    try:
+        await _save_upload(file, apkg_path)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+    import_id = uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+    await _fail_stale_jobs(user_id, now)
+    job = {
+        "import_id": import_id,
+        "user_id": user_id,
+        "filename": file.filename,
+        "status": "uploaded",
+        "progress": {"stage": "uploaded"},
+        "card_count": 0,
+        "media_count": 0,
+        "created_at": now,
+        "updated_at": now,
+    }
+    await apkg_imports_collection.insert_one(job)
+
+    task = asyncio.create_task(_run_import_job(import_id, user_id, apkg_path, work_dir))
+    _background_jobs.add(task)
+    task.add_done_callback(_background_jobs.discard)
+
+    return _job_status(job)
+
+
+@router.get(
+    "/apkg/jobs/{import_id}",
+    summary="Get the progress (and, once ready, the preview) of an import job",
+    response_model=ImportJobStatus,
+)
+async def get_apkg_import(
+    import_id: str,
+    user: dict = Depends(get_firebase_user),
+):
+    user_id = user.get("user_id")
+    job = await _get_owned_job(import_id, user_id)
+    cards_allowed = await _get_remaining_quota(user_id) if job["status"] == "ready" else None
+    return _job_status(job, cards_allowed)
+
+
+@router.get(
+    "/apkg/jobs/{import_id}/events",
+    summary="Stream import job progress as Server-Sent Events",
+)
+async def stream_apkg_import(
+    import_id: str,
+    user: dict = Depends(get_firebase_user),
+) -> StreamingResponse:
+    """
+    Emits a `progress` event (ImportJobStatus payload) whenever the job changes,
+    and closes after the job settles (`ready`, `completed` or `failed`). A job
+    whose worker stopped heartbeating settles as `failed`.
+    Ownership is checked before streaming, so a foreign id is a plain 404.
+    """
+    user_id = user.get("user_id")
+    await _get_owned_job(import_id, user_id)
+
+    async def event_generator() -> AsyncGenerator[str, None]:
+        start = time.monotonic()
+        last_seen = None
+        try:
+            while time.monotonic() - start < PROGRESS_STREAM_TIMEOUT_S:
+                job = await apkg_imports_collection.find_one(
+                    {"import_id": import_id, "user_id": user_id},
+                    {"preview_cards": 0},
+                )
+                if not job:
+                    return
+                job = await _expire_if_stale(job, datetime.now(timezone.utc))
+                marker = (job["status"], job.get("updated_at"))
+                if marker != last_seen:
+                    last_seen = marker
+                    yield sse_event("progress", _job_status(job))
+                    if job["status"] in _SETTLED_STATES:
+                        return
+                else:
+                    yield SSE_HEARTBEAT
+                await asyncio.sleep(PROGRESS_POLL_INTERVAL_S)
+        except asyncio.CancelledError:
+            logger.info(f"[apkg:{import_id}] Progress stream client disconnected")
+            raise
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    # Validate extension
-    if not (file.filename or "").lower().endswith(".apkg"):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Only .apkg files are supported.",
-        )
 
-    # Read and validate size
-    file_bytes = await file.read()
-    if len(file_bytes) > MAX_FILE_SIZE_BYTES:
+@router.post(
+    "/apkg/jobs/{import_id}/confirm",
+    summary="Create the deck from a ready import job",
+    response_model=ImportConfirmResponse,
+    status_code=status.HTTP_201_CREATED,
+)
+async def confirm_apkg_import(
+    import_id: str,
+    payload: ImportJobConfirmPayload,
+    user: dict = Depends(get_firebase_user),
+):
+    """
+    Step 2: Create the deck and move the staged cards into it in
+    `IMPORT_BATCH_SIZE` insert_many batches. The cards never round-trip
+    through the client. With `import_scheduling` (the default), Anki's
+    schedule is kept on each card and its review log is bulk-loaded into
+    `card_reviews`, so a mature deck is immediately schedulable.
+    """
+    user_id = user.get("user_id")
+    job = await _get_owned_job(import_id, user_id)
+    if job["status"] != "ready":
         raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"File exceeds the {MAX_FILE_SIZE_MB} MB limit.",
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Import is not ready to confirm (status: {job['status']}).",
         )
 
-    # Parse
+    card_count = job.get("card_count", 0)
+    await _reserve_import_quota(user_id, card_count)
+
+    # Claim the job atomically so a double-submit cannot import twice.
+    claimed = await apkg_imports_collection.find_one_and_update(
+        {"import_id": import_id, "user_id": user_id, "status": "ready"},
+        {"$set": {
+            "status": "importing",
+            "progress": {"stage": "importing", "done": 0, "total": card_count},
+            "updated_at": datetime.now(timezone.utc),
+        }},
+    )
+    if not claimed:
+        await quota.release(user_id, "flashcards", card_count)
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Import is already being confirmed.")
+
+    now = datetime.now(timezone.utc)
+    deck_result = await decks_collection.insert_one(
+        _new_deck_doc(user_id, payload.deck_name, payload.description, card_count, now)
+    )
+    deck_id = deck_result.inserted_id
+    await _update_job(import_id, deck_id=str(deck_id))
+
+    imported = 0
+    reviews_imported = 0
+    heartbeat = _start_heartbeat(import_id)
     try:
-        suggested_name, all_cards = _parse_apkg(file_bytes, file.filename or "deck.apkg")
-    except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        last_seq = -1
+        while True:
+            staged = await (
+                apkg_import_cards_collection.find({"import_id": import_id, "seq": {"$gt": last_seq}})
+                .sort("seq", 1)
+                .to_list(length=IMPORT_BATCH_SIZE)
+            )
+            if not staged:
+                break
+            last_seq = staged[-1]["seq"]
+            card_ids = await _insert_card_batch(
+                deck_id,
+                [_new_card_doc(user_id, deck_id, card, now, payload.import_scheduling) for card in staged],
+            )
+            imported += len(card_ids)
+            if payload.import_scheduling:
+                reviews_imported += await _insert_review_history(user_id, deck_id, card_ids, staged)
+            await _update_job(import_id, progress={"stage": "importing", "done": imported, "total": card_count})
+            if len(staged) < IMPORT_BATCH_SIZE:
+                break
     except Exception as e:
-        logger.error(f"Unexpected parse error: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to parse the .apkg file.")
+        logger.error(f"[apkg:{import_id}] Confirm failed after {imported} cards: {e}", exc_info=True)
+        await quota.release(user_id, "flashcards", card_count - imported)
+        await decks_collection.update_one({"_id": deck_id}, {"$set": {"total_cards": imported}})
+        await _update_job(import_id, status="failed", deck_id=str(deck_id), error="Import was interrupted.")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Import was interrupted.")
+    finally:
+        heartbeat.cancel()
+
+    await quota.release(user_id, "flashcards", card_count - imported)
+    await decks_collection.update_one({"_id": deck_id}, {"$set": {"total_cards": imported}})
+    await _update_job(
+        import_id,
+        status="completed",
+        deck_id=str(deck_id),
+        progress={"stage": "completed", "done": imported, "total": card_count},
+    )
+    await apkg_import_cards_collection.delete_many({"import_id": import_id})
+
+    logger.info(
+        f"Successfully imported deck '{payload.deck_name}' with {imported} cards "
+        f"and {reviews_imported} reviews for user {user_id}"
+    )
+    return ImportConfirmResponse(
+        deck_id=str(deck_id),
+        deck_name=payload.deck_name,
+        cards_imported=imported,
+        reviews_imported=reviews_imported,
+    )
+
+
+@router.post(
+    "/apkg",
+    summary="Parse an Anki .apkg file and return a preview",
+    response_model=ParsedDeckPreview,
+    deprecated=True,
+)
+async def parse_apkg(
+    file: UploadFile = File(...),
+    user: dict = Depends(get_firebase_user),
+):
+    """
+    Legacy step 1: Upload and parse an .apkg file in one request.
+    Returns a preview with the first few cards and metadata.
+    No database writes happen at this step. Superseded by `POST /import/apkg/jobs`.
+    """
+    user_id = user.get("user_id")
+    logger.info(f"User {user_id} uploading .apkg: {file.filename}")
+    _validate_extension(file)
 
+    with tempfile.TemporaryDirectory(prefix="apkg_") as work_dir:
+        apkg_path = os.path.join(work_dir, "deck.apkg")
+        await _save_upload(file, apkg_path)
+        try:
+            parsed = await _run_parser(apkg_path, work_dir)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        except Exception as e:
+            logger.error(f"Unexpected parse error: {e}", exc_info=True)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to parse the .apkg file.")
+
+    # Media is only uploaded by the job flow; the legacy preview is text-only.
+    all_cards = [ParsedCard(front=c["front"], back=c["back"], tags=c["tags"]) for c in parsed["cards"]]
     cards_allowed = await _get_remaining_quota(user_id)
 
     return ParsedDeckPreview(
-        suggested_name=suggested_name,
+        suggested_name=parsed["suggested_name"],
         card_count=len(all_cards),
         cards_allowed=cards_allowed,
         preview_cards=all_cards[:PREVIEW_CARD_LIMIT],
@@ -255,14 +770,17 @@ async def parse_apkg(
     "/apkg/confirm",
     summary="Confirm and write imported Anki deck + cards to the database",
     status_code=status.HTTP_201_CREATED,
+    response_model=ImportConfirmResponse,
+    deprecated=True,
 )
 async def confirm_import(
     payload: ImportConfirmPayload,
     user: dict = Depends(get_firebase_user),
 ):
     """
-    Step 2: Confirm the import after the user has reviewed the preview.
+    Legacy step 2: Confirm the import after the user has reviewed the preview.
     Creates the deck and bulk-inserts all cards with SM-2 defaults.
+    Superseded by `POST /import/apkg/jobs/{import_id}/confirm`.
     """
     user_id = user.get("user_id")
     logger.info(f"User {user_id} confirming import of deck '{payload.deck_name}' with {len(payload.cards)} cards")
@@ -270,73 +788,29 @@ async def confirm_import(
     if not payload.cards:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No cards to import.")
 
-    # Quota check (single check against total import count)
-    cards_allowed = await _get_remaining_quota(user_id)
-    if cards_allowed != -1 and len(payload.cards) > cards_allowed:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Importing {len(payload.cards)} cards would exceed your plan limit. You have {cards_allowed} slots remaining.",
-        )
+    # Quota check and claim for the whole import in one conditional $inc
+    await _reserve_import_quota(user_id, len(payload.cards))
 
     now = datetime.now(timezone.utc)
 
     # 1. Create the deck
-    deck_doc = {
-        "user_id": user_id,
-        "name": payload.deck_name.strip(),
-        "description": payload.description or "",
-        "deck_type": "flashcard",
-        "total_cards": len(payload.cards),
-        "status": "new",
-        "tags": [],
-        "cards": [],
-        "is_public": False,
-        "voice_settings": {
-            "front": {"voice_name": None, "rate": 1.0, "pitch": 1.0},
-            "back": {"voice_name": None, "rate": 1.0, "pitch": 1.0},
-        },
-        "created_at": now,
-        "updated_at": now,
-        "deleted_at": None,
-    }
-
-    deck_result = await decks_collection.insert_one(deck_doc)
+    deck_result = await decks_collection.insert_one(
+        _new_deck_doc(user_id, payload.deck_name, payload.description, len(payload.cards), now)
+    )
     deck_id = deck_result.inserted_id
 
-    # 2. Bulk-insert cards with SM-2 defaults
-    card_docs = [
-        {
-            "user_id": user_id,
-            "deck_id": deck_id,
-            "title": card.front,
-            "content": card.back,
-            "card_type": "flashcard",
-            "tags": card.tags,
-            "ease_factor": 2.5,
-            "interval": 1,
-            "repetitions": 0,
-            "last_reviewed": None,
-            "next_review": None,
-            "created_at": now,
-            "updated_at": now,
-            "deleted_at": None,
-        }
-        for card in payload.cards
-    ]
-
-    cards_result = await cards_collection.insert_many(card_docs)
-    card_ids = cards_result.inserted_ids
+    # 2. Bulk-insert cards with SM-2 defaults, one insert_many per batch
+    imported = 0
+    for start in range(0, len(payload.cards), IMPORT_BATCH_SIZE):
+        batch = payload.cards[start:start + IMPORT_BATCH_SIZE]
+        imported += len(await _insert_card_batch(
+            deck_id, [_new_card_doc(user_id, deck_id, card.model_dump(), now) for card in batch]
+        ))
 
-    # 3. Update deck with card references and correct total count
-    await decks_collection.update_one(
-        {"_id": deck_id},
-        {"$set": {"cards": card_ids, "total_cards": len(card_ids)}},
-    )
+    # 3. Correct total count (and give back any slots not used)
+    await quota.release(user_id, "flashcards", len(payload.cards) - imported)
+    await decks_collection.update_one({"_id": deck_id}, {"$set": {"total_cards": imported}})
 
-    logger.info(f"Successfully imported deck '{payload.deck_name}' with {len(card_ids)} cards for user {user_id}")
+    logger.info(f"Successfully imported deck '{payload.deck_name}' with {imported} cards for user {user_id}")
 
-    return {
-        "deck_id": str(deck_id),
-        "deck_name": payload.deck_name,
-        "cards_imported": len(card_ids),
-    }
+    return ImportConfirmResponse(deck_id=str(deck_id), deck_name=payload.deck_name, cards_imported=imported)
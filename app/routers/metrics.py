@@ -0,0 +1,24 @@
+"""
+Operational metrics — GET /admin/metrics (admin only).
+
+Reports this worker's in-process counters and latency histograms
+(app/utils/metrics.py) plus the derived rates operators look at.
+"""
+from fastapi import APIRouter, Depends
+
+from app.auth.dependencies import require_admin
+from app.utils import metrics
+
+router = APIRouter(prefix="/admin/metrics", tags=["metrics"])
+
+
+@router.get("")
+async def get_metrics(current_user: dict = Depends(require_admin)) -> dict:
+    return {
+        "counters": metrics.snapshot(),
+        "rates": {
+            "quiz_prefetch_hit_rate": metrics.ratio("quiz_prefetch_hits", "quiz_prefetch_misses"),
+            "quiz_bank_hit_rate": metrics.ratio("quiz_bank_hits", "quiz_bank_misses"),
+        },
+        "histograms": metrics.histograms(),
+    }
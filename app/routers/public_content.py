@@ -24,6 +24,7 @@ from app.services.public_content_service import (
 )
 from app.auth.firebase_auth import get_current_user, optional_auth
 from app.config.database import cards_collection, decks_collection
+from app.utils import ids
 
 router = APIRouter(prefix="/public", tags=["Public Content"])
 
@@ -441,10 +442,10 @@ async def get_public_deck_cards(
     if not deck:
         raise HTTPException(status_code=404, detail="Deck not found or not public")
 
-    # Fetch cards — tolerate ObjectId or string deck_id (mixed legacy data)
+    # Fetch cards — deck_id in both forms until cards are normalized
     raw_cards = await cards_collection.find(
         {
-            "deck_id": {"$in": [deck_oid, deck_id]},
+            "deck_id": ids.ref_value("cards", "deck_id", deck_oid),
             "deleted_at": None,
         }
     ).to_list(length=limit)
@@ -9,6 +9,7 @@ Endpoints:
 
 from __future__ import annotations
 
+import asyncio
 import json
 import os
 import random
@@ -36,6 +37,8 @@ from app.models.quiz import (
     SubmitAnswerRequest,
     SubmitAnswerResponse,
 )
+from app.services import activity
+from app.utils import ids, metrics, question_bank
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -50,6 +53,27 @@ router = APIRouter(
 
 _GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
 
+# Part of every question-bank key (app/utils/question_bank.py). Bump it whenever
+# the question prompt in _generate_question_text changes so banked questions
+# written by the old prompt stop being served.
+QUESTION_PROMPT_VERSION = "q1"
+
+# Returned when generation fails; never stored in the question bank.
+_FALLBACK_QUESTIONS = frozenset({
+    "What can you tell me about this card?",
+    "What is the definition of this term?",
+})
+
+# Questions generated ahead of the student, stored on the session under
+# prefetched_questions.<card index>. A window of this many upcoming cards is
+# kept filled in the background after /start and after every advance.
+QUIZ_PREFETCH_AHEAD: int = int(os.getenv("QUIZ_PREFETCH_AHEAD", "3"))
+
+# Strong references to fire-and-forget prefetch tasks so they are not
+# garbage-collected mid-flight.
+_prefetch_tasks: set[asyncio.Task] = set()
+_inflight_questions: dict[tuple[str, int], asyncio.Task] = {}
+
 
 def _get_groq_client() -> Groq:
     """Return a configured Groq client. Raises RuntimeError if key missing."""
@@ -90,6 +114,18 @@ def _extract_card_fields(card: dict) -> dict:
     return fields
 
 
+def _question_type_pool(fields: dict) -> list[tuple[str, int]]:
+    """(question type, weight) pairs available for a card's fields."""
+    pool: list[tuple[str, int]] = [
+        ("definition", 4),
+        ("open_recall", 3),
+    ]
+    if "definition" in fields:
+        pool.append(("contextual", 2))
+        pool.append(("fill_in", 1))
+    return pool
+
+
 def _select_question_type(
     fields: dict,
     deck_card_count: int,
@@ -103,17 +139,7 @@ def _select_question_type(
     - contextual (weight 2): when definition field exists — use it in a sentence
     - fill_in (weight 1): when definition field exists — complete the sentence
     """
-    has_definition = "definition" in fields
-
-    pool: list[tuple[str, int]] = [
-        ("definition", 4),
-        ("open_recall", 3),
-    ]
-    if has_definition:
-        pool.append(("contextual", 2))
-        pool.append(("fill_in", 1))
-
-    types, weights = zip(*pool)
+    types, weights = zip(*_question_type_pool(fields))
     selected: str = random.choices(list(types), weights=list(weights), k=1)[0]
     return selected  # type: ignore[return-value]
 
@@ -129,7 +155,8 @@ async def _generate_question_text(
         return "What can you tell me about this card?"
     fields_json = json.dumps(fields, ensure_ascii=False, default=str)
     try:
-        completion = client.chat.completions.create(
+        completion = await asyncio.to_thread(
+            client.chat.completions.create,
             model=_GROQ_MODEL,
             max_tokens=256,
             messages=[
@@ -158,6 +185,42 @@ async def _generate_question_text(
         return "What can you tell me about this card?"
 
 
+async def _fill_bank(fields: dict, question_type: str, client: Groq) -> str:
+    """Generate one question and add it to the bank (unless it is a fallback)."""
+    text = await _generate_question_text(fields, question_type, client)
+    if text not in _FALLBACK_QUESTIONS:
+        try:
+            await question_bank.add_variant(fields, question_type, QUESTION_PROMPT_VERSION, text)
+        except Exception as exc:
+            logger.warning(f"[quiz] Question bank write failed: {exc}")
+    return text
+
+
+async def _banked_question_text(fields: dict, question_type: str, client: Groq) -> str:
+    """
+    Serve a question for this card content from the cross-user bank, calling
+    the LLM only when the bank has nothing yet. A hit on an entry that still
+    has room for more phrasings tops it up in the background.
+    """
+    if not fields:
+        return await _generate_question_text(fields, question_type, client)
+    try:
+        entry = await question_bank.get_entry(fields, question_type, QUESTION_PROMPT_VERSION)
+    except Exception as exc:
+        logger.warning(f"[quiz] Question bank lookup failed: {exc}")
+        return await _generate_question_text(fields, question_type, client)
+
+    banked = question_bank.sample_variant(entry)
+    if banked is not None:
+        metrics.incr("quiz_bank_hits")
+        if len(entry.get("variants") or []) < question_bank.BANK_VARIANTS:
+            _track(asyncio.create_task(_fill_bank(fields, question_type, client)))
+        return banked
+
+    metrics.incr("quiz_bank_misses")
+    return await _fill_bank(fields, question_type, client)
+
+
 async def _build_question(
     card: dict,
     card_index: int,
@@ -174,7 +237,7 @@ async def _build_question(
         deck_card_count=total_deck_cards,
     )
 
-    question_text = await _generate_question_text(fields, question_type, client)
+    question_text = await _banked_question_text(fields, question_type, client)
 
     return QuizQuestion(
         card_id=card_id,
@@ -185,6 +248,129 @@ async def _build_question(
     )
 
 
+def _question_doc(question: QuizQuestion) -> dict:
+    """The stored form of a question (current_question / prefetched_questions)."""
+    return {
+        "card_id": question.card_id,
+        "question_type": question.question_type,
+        "question_text": question.question_text,
+    }
+
+
+async def _generate_and_store(
+    session_id: str,
+    card_ids: list[str],
+    index: int,
+    client: Groq,
+) -> QuizQuestion | None:
+    """
+    Generate the question for ``card_ids[index]`` and store it under
+    prefetched_questions.<index>. An entry that is already stored is never
+    overwritten, so concurrent generators agree on one question per card.
+    """
+    try:
+        card_oid = ObjectId(card_ids[index])
+    except Exception:
+        return None
+    card = await cards_collection.find_one({"_id": card_oid, "deleted_at": None})
+    if not card:
+        return None
+
+    question = await _build_question(
+        card=card,
+        card_index=index,
+        total_deck_cards=len(card_ids),
+        client=client,
+    )
+    await quiz_sessions_collection.update_one(
+        {"session_id": session_id, f"prefetched_questions.{index}": {"$exists": False}},
+        {"$set": {f"prefetched_questions.{index}": _question_doc(question)}},
+    )
+    return question
+
+
+def _track(task: asyncio.Task) -> asyncio.Task:
+    """Keep a fire-and-forget task alive and log (rather than lose) its failure."""
+    _prefetch_tasks.add(task)
+
+    def _done(t: asyncio.Task) -> None:
+        _prefetch_tasks.discard(t)
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning(f"[quiz] Background question task failed: {t.exception()}")
+
+    task.add_done_callback(_done)
+    return task
+
+
+def _generation_task(
+    session_id: str,
+    card_ids: list[str],
+    index: int,
+    client: Groq,
+) -> asyncio.Task:
+    """
+    The single in-flight generation for (session, card index). The prefetcher
+    and an on-demand miss share it instead of paying for two LLM calls.
+    """
+    key = (session_id, index)
+    task = _inflight_questions.get(key)
+    if task is None:
+        task = _track(asyncio.create_task(_generate_and_store(session_id, card_ids, index, client)))
+        _inflight_questions[key] = task
+        task.add_done_callback(lambda _t, key=key: _inflight_questions.pop(key, None))
+    return task
+
+
+async def _prefetch_questions(
+    session_id: str,
+    card_ids: list[str],
+    start: int,
+    client: Groq,
+) -> None:
+    """Fill the prefetch window ``[start, start + QUIZ_PREFETCH_AHEAD)`` in parallel."""
+    stored = await quiz_sessions_collection.find_one(
+        {"session_id": session_id}, {"prefetched_questions": 1}
+    )
+    ready = set((stored or {}).get("prefetched_questions") or {})
+    indices = [
+        i for i in range(start, min(start + QUIZ_PREFETCH_AHEAD, len(card_ids)))
+        if str(i) not in ready
+    ]
+    if indices:
+        await asyncio.gather(
+            *(_generation_task(session_id, card_ids, i, client) for i in indices),
+            return_exceptions=True,
+        )
+
+
+def _schedule_prefetch(session_id: str, card_ids: list[str], start: int, client: Groq) -> None:
+    if QUIZ_PREFETCH_AHEAD > 0 and start < len(card_ids):
+        _track(asyncio.create_task(_prefetch_questions(session_id, card_ids, start, client)))
+
+
+async def _next_question(
+    session_id: str,
+    card_ids: list[str],
+    index: int,
+    client: Groq,
+) -> tuple[QuizQuestion | None, bool]:
+    """
+    Return ``(question, prefetch_hit)`` for ``card_ids[index]``: the prefetched
+    question when one is stored, otherwise generated on demand (cold session,
+    or the student outran the prefetcher — then the in-flight prefetch is
+    awaited rather than duplicated).
+    """
+    stored = await quiz_sessions_collection.find_one(
+        {"session_id": session_id},
+        {f"prefetched_questions.{index}": 1},
+    )
+    prefetched = ((stored or {}).get("prefetched_questions") or {}).get(str(index))
+    if prefetched:
+        return QuizQuestion(**prefetched, card_index=index), True
+    question = await asyncio.shield(_generation_task(session_id, card_ids, index, client))
+    return question, False
+
+
 async def _evaluate_answer(
     card: dict,
     question_text: str,
@@ -255,7 +441,8 @@ Respond ONLY with raw JSON (no markdown):
     parsed: dict | None = None
     for attempt in range(2):
         try:
-            completion = client.chat.completions.create(
+            completion = await asyncio.to_thread(
+                client.chat.completions.create,
                 model=_GROQ_MODEL,
                 max_tokens=1024,
                 temperature=0.6,
@@ -377,7 +564,7 @@ async def list_quizzable_decks(
             continue
 
         deck_filter = {
-            "deck_id": {"$in": [deck_oid, deck_id_str]},
+            "deck_id": ids.ref_value("cards", "deck_id", deck_oid),
             "deleted_at": None,
         }
 
@@ -444,7 +631,7 @@ async def start_quiz_session(
         raise HTTPException(status_code=404, detail="Deck not found")
 
     deck_filter = {
-        "deck_id": {"$in": [deck_oid, body.deck_id]},
+        "deck_id": ids.ref_value("cards", "deck_id", deck_oid),
         "user_id": user_id,
         "deleted_at": None,
     }
@@ -504,15 +691,16 @@ async def start_quiz_session(
         "results": [],
         "created_at": now,
         "status": "active",
-        "current_question": {
-            "card_id": first_question.card_id,
-            "question_type": first_question.question_type,
-            "question_text": first_question.question_text,
-        },
+        "current_question": _question_doc(first_question),
+        "prefetched_questions": {},
+        "prefetch_stats": {"hits": 0, "misses": 0},
     }
     await quiz_sessions_collection.insert_one(session_doc)
     logger.info(f"[quiz] Session started: user={user_id}, deck={body.deck_id}, cards={len(cards)}")
 
+    # Generate the next few questions while the student reads the first one.
+    _schedule_prefetch(session_id, card_ids, 1, client)
+
     return StartQuizResponse(
         session_id=session_id,
         total_cards=len(cards),
@@ -764,6 +952,7 @@ async def _write_study_session(
     }
     try:
         await study_sessions_collection.insert_one(doc)
+        await activity.record(user_id, sessions=1, study_seconds=duration_seconds)
         logger.info(
             f"[study_sessions] Logged: user={user_id}, type={session_type}, "
             f"score={score_percentage}%, cards={total_cards}, duration={duration_seconds}s"
@@ -1014,6 +1203,18 @@ async def submit_quiz_answer(
     server_question_text: str = stored_question.get("question_text") or body.question_text
     server_question_type: str = stored_question.get("question_type") or body.question_type
 
+    current_index: int = session.get("current_index", 0)
+    card_ids: list[str] = session.get("card_ids", [])
+
+    # Fetch the next question while the answer is evaluated. It is only used
+    # if the student advances; otherwise the generation still lands in
+    # prefetched_questions and serves the next attempt.
+    next_task: asyncio.Task | None = None
+    if current_index + 1 < len(card_ids):
+        next_task = _track(asyncio.create_task(
+            _next_question(body.session_id, card_ids, current_index + 1, client)
+        ))
+
     # Skip path — bypass LLM, mark incorrect, reveal answer, advance immediately.
     if body.skip:
         eval_result = {
@@ -1067,9 +1268,7 @@ async def submit_quiz_answer(
         "evaluation": evaluation,
         "score_delta": score_delta,
     }
-    current_index: int = session.get("current_index", 0)
     new_index: int = current_index + (1 if should_advance else 0)
-    card_ids: list[str] = session.get("card_ids", [])
     is_complete: bool = should_advance and (new_index >= len(card_ids))
 
     if should_advance:
@@ -1093,32 +1292,20 @@ async def submit_quiz_answer(
         # Retry scenario — the frontend keeps the current question active.
         # next_question and summary both remain None.
         pass
-    elif not is_complete:
-        next_card_id: str = card_ids[new_index]
-        try:
-            next_card_oid = ObjectId(next_card_id)
-        except Exception:
-            raise HTTPException(status_code=500, detail="Corrupted session card reference")
-
-        next_card = await cards_collection.find_one(
-            {"_id": next_card_oid, "deleted_at": None}
-        )
-        if next_card:
-            next_question = await _build_question(
-                card=next_card,
-                card_index=new_index,
-                total_deck_cards=len(card_ids),
-                client=client,
-            )
+    elif not is_complete and next_task is not None:
+        next_question, prefetch_hit = await next_task
+        if next_question:
+            stat = "hits" if prefetch_hit else "misses"
+            metrics.incr(f"quiz_prefetch_{stat}")
             # Persist new question server-side so next /answer call uses the real text
             await quiz_sessions_collection.update_one(
                 {"session_id": body.session_id},
-                {"$set": {"current_question": {
-                    "card_id": next_question.card_id,
-                    "question_type": next_question.question_type,
-                    "question_text": next_question.question_text,
-                }}},
+                {
+                    "$set": {"current_question": _question_doc(next_question)},
+                    "$inc": {f"prefetch_stats.{stat}": 1},
+                },
             )
+            _schedule_prefetch(body.session_id, card_ids, new_index + 1, client)
     else:
         # Compute summary — collect all results from updated session
         all_results: list[dict] = session.get("results", []) + [result_entry]
@@ -58,6 +58,7 @@ from app.models.quiz import (
     AIQuizStartRequest,
     AIQuizStartResponse,
 )
+from app.utils import ids
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -148,7 +149,10 @@ async def _generate_questions(
 
     client = get_langfuse_client()
     model_name = TIER_MODEL_NAMES.get(tier, TIER_MODEL_NAMES["free"])
-    trace_metadata = {"feature": feature, "tier": tier, "user_id": user_id, "model": model_name}
+    trace_metadata = {
+        "feature": feature, "tier": tier, "user_id": user_id, "model": model_name,
+        **prompt_manager.version_metadata("nowry-quiz-intent"),
+    }
 
     lang_name: str = _LANGUAGE_NAMES.get(language.split("-")[0].lower(), "English")
 
@@ -433,30 +437,6 @@ async def start_ai_quiz_session(
     )
 
 
-# ---------------------------------------------------------------------------
-# Lexical JSON text extraction helper
-# ---------------------------------------------------------------------------
-
-
-def _extract_text_from_lexical_quiz(lexical_state: dict) -> str:
-    """Recursively walk Lexical JSON state, collecting text node values."""
-    texts: list[str] = []
-
-    def walk(node) -> None:
-        if isinstance(node, list):
-            for child in node:
-                walk(child)
-        elif isinstance(node, dict):
-            if node.get("type") == "text" and "text" in node:
-                texts.append(node["text"])
-            for key in ("children", "root"):
-                if key in node:
-                    walk(node[key])
-
-    walk(lexical_state)
-    return " ".join(texts)
-
-
 # ---------------------------------------------------------------------------
 # Quiz question normalisation
 # ---------------------------------------------------------------------------
@@ -582,17 +562,12 @@ async def generate_quiz_from_book(
     if not book or book.get("user_id") != user_id:
         raise HTTPException(status_code=404, detail="Book not found.")
 
-    raw_content: str = book.get("full_content", "")
-    try:
-        lexical_state = json.loads(raw_content)
-        plain_text = _extract_text_from_lexical_quiz(lexical_state)
-    except (json.JSONDecodeError, KeyError):
-        plain_text = raw_content
-
+    from app.utils.book_text import load_book_text
     _MAX_BOOK_CHARS = 50_000
-    if len(plain_text) > _MAX_BOOK_CHARS:
-        logger.warning(f"[generate_quiz_from_book] Book truncated {len(plain_text)} → {_MAX_BOOK_CHARS}")
-        plain_text = plain_text[:_MAX_BOOK_CHARS]
+    derivative = await load_book_text(book, max_chars=_MAX_BOOK_CHARS)
+    plain_text: str = derivative["text"]
+    if derivative.get("truncated"):
+        logger.warning(f"[generate_quiz_from_book] Book truncated to {_MAX_BOOK_CHARS}")
 
     if not plain_text.strip():
         raise HTTPException(status_code=400, detail="Book has no text content to analyze.")
@@ -612,7 +587,10 @@ async def generate_quiz_from_book(
 
     client = get_langfuse_client()
     model_name = TIER_MODEL_NAMES.get(tier, TIER_MODEL_NAMES["free"])
-    trace_metadata = {"feature": "quiz_from_book", "tier": tier, "user_id": user_id, "model": model_name}
+    trace_metadata = {
+        "feature": "quiz_from_book", "tier": tier, "user_id": user_id, "model": model_name,
+        **prompt_manager.version_metadata("nowry-quiz-from-book"),
+    }
 
     raw_text: str = ""
     for attempt in range(1, 3):
@@ -720,10 +698,9 @@ async def analyze_deck_for_quiz(
     if not deck:
         raise HTTPException(status_code=404, detail="Deck not found.")
 
-    # Load all cards in batches of 25 — use $or for ObjectId/string deck_id mismatch
-    # (same pattern as POST /card/analyze-deck in cards.py — CARD-03)
-    deck_or = [{"deck_id": deck_oid}, {"deck_id": str(deck_oid)}]
-    base_query = {"user_id": user_id, "deleted_at": None, "$or": deck_or}
+    # Load all cards in batches of 25 (same pattern as POST /card/analyze-deck
+    # in cards.py — CARD-03)
+    base_query = {"user_id": user_id, "deleted_at": None, "deck_id": ids.ref_value("cards", "deck_id", deck_oid)}
 
     all_cards: list = []
     skip = 0
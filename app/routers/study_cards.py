@@ -1,13 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from typing import List, Optional
+from typing import Any, List, Optional
 from datetime import datetime, timedelta, timezone
 from bson import ObjectId
 from pymongo.collection import Collection
 from app.models.StudyCard import StudyCard
 from app.models.deck_config import resolve_deck_budget
 from app.config.database import cards_collection, decks_collection, books_collection
+from app.utils import ids
 from app.utils.logger import get_logger
 from app.auth.firebase_auth import get_firebase_user
+from app.services import activity, quota
 
 from app.auth.dependencies import require_ownership
 
@@ -50,7 +52,7 @@ async def _verify_deck_ownership(deck_id: str, user_id: str):
 async def _select_session_cards(
     collection: Collection,
     user_id: str,
-    deck_or: list,
+    deck_match: Any,
     new_cap: int,
     review_cap: int,
     now_dt: datetime,
@@ -69,8 +71,10 @@ async def _select_session_cards(
 
     Review cards keep the simple "due now, capped by remaining daily budget"
     behaviour — they are intrinsically deterministic by `next_review`.
+
+    `deck_match` is the `deck_id` filter value (see app/utils/ids.py).
     """
-    base_match = {"user_id": user_id, "deleted_at": None, "$or": deck_or}
+    base_match = {"user_id": user_id, "deleted_at": None, "deck_id": deck_match}
 
     # 1. Calculate how many NEW cards were studied today to adjust the remaining budget
     new_studied_today = await collection.count_documents({
@@ -100,13 +104,11 @@ async def _select_session_cards(
             "user_id": user_id,
             "deleted_at": None,
             "last_reviewed": None,
-            "$and": [
-                {"$or": deck_or},
-                {"$or": [
-                    {"introduced_at": None},
-                    {"introduced_at": {"$exists": False}},
-                    {"introduced_at": {"$lt": today_start}},
-                ]},
+            "deck_id": deck_match,
+            "$or": [
+                {"introduced_at": None},
+                {"introduced_at": {"$exists": False}},
+                {"introduced_at": {"$lt": today_start}},
             ],
         }
         fresh_cards = await collection.find(fresh_query).sort("created_at", 1).limit(slots_to_fill).to_list(length=slots_to_fill)
@@ -162,45 +164,10 @@ async def create_study_card(
     user_id = user.get("user_id")
 
     # --- Subscription Limit Check ---
-    from app.config.database import users_collection
-    from app.config.subscription_plans import SUBSCRIPTION_PLANS, SubscriptionTier
-
-    # Get user subscription
-    user_data = await users_collection.find_one({"_id": ObjectId(user_id)})
-    if not user_data:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    subscription_data = user_data.get("subscription", {"tier": "free"})
-    tier_key = subscription_data.get("tier", "free")
-    plan = SUBSCRIPTION_PLANS.get(tier_key, SUBSCRIPTION_PLANS[SubscriptionTier.FREE])
-
-    # Determine card type and applicable limit
-    limit_key = "flashcards"  # default
-    query_type = {"$in": [None, "basic", "flashcard", "studycard"]}
-
-    if card.card_type == "quiz":
-        limit_key = "quiz_questions"
-        query_type = "quiz"
-    elif card.card_type == "visual":
-        limit_key = "visual_diagrams"
-        query_type = "visual"
-
-    limit_value = plan["limits"].get(limit_key, 0)
-
-    # Check limit if not unlimited (-1)
-    if limit_value != -1:
-        # Count only cards of this type
-        current_count = await collection.count_documents(
-            {"user_id": user_id, "card_type": query_type}
-        )
-
-        if current_count >= limit_value:
-            # Format readable name
-            feature_name = limit_key.replace("_", " ").title()
-            raise HTTPException(
-                status_code=403,
-                detail=f"{feature_name} limit reached for {plan['name']} plan. Upgrade to create more.",
-            )
+    # One conditional $inc on the user's usage counter checks the plan limit
+    # and claims the slot atomically (app/services/quota.py).
+    quota_key = quota.card_quota_key(card.card_type)
+    await quota.reserve(user_id, quota_key)
     # --------------------------------
 
     logger.info(f"User {user_id} creating study card: {card.title}")
@@ -212,7 +179,11 @@ async def create_study_card(
     card.repetitions = 0
 
     card_dict = card.model_dump(by_alias=True, exclude={"id"})
-    result = await collection.insert_one(card_dict)
+    try:
+        result = await collection.insert_one(card_dict)
+    except Exception:
+        await quota.release(user_id, quota_key)
+        raise
     card_id = result.inserted_id
 
     # Sync with Deck if deck_id is provided
@@ -220,7 +191,7 @@ async def create_study_card(
         await _verify_deck_ownership(card.deck_id, user_id)
         await d_collection.update_one(
             {"_id": ObjectId(card.deck_id)},
-            {"$inc": {"total_cards": 1}, "$push": {"cards": card_id}},
+            {"$inc": {"total_cards": 1}},
         )
 
     created_card = await collection.find_one({"_id": card_id})
@@ -248,89 +219,19 @@ async def get_statistics(
         user_id = current_user.get("user_id")
         logger.info(f"Fetching statistics for user {user_id}")
 
-        # Weekly progress + streak are computed server-side via an aggregation
-        # instead of pulling up to 2000 raw card docs into a Python loop
-        # (PERF-01 / D-01 finding #1). $match is copied VERBATIM from the
-        # replaced .find() filter (user_id, deleted_at, last_reviewed) as the
-        # pipeline's FIRST stage — the sole BOLA enforcement point for this
-        # aggregation (T-33-01). $group buckets by (day, type) so weekly
-        # buckets and the streak can both be derived from pre-grouped counts.
-        # No `timezone` param on $dateToString — the Motor client stores
-        # naive-UTC datetimes (no tz_aware), so the default UTC formatting
-        # matches the day boundaries already used throughout this file
-        # (A2 spot-check: a review at 2026-07-30T00:00:00 UTC groups into
-        # "2026-07-30", the same calendar day datetime.now(utc).replace(tzinfo=None)
-        # would bucket it into).
+        # Weekly progress, books touched per day and the streak all come from
+        # the per-user daily activity rollups (app/services/activity.py): at
+        # most 90 small documents, instead of grouping every card's
+        # overwritten last_reviewed and loading up to 500 full books just to
+        # bucket their updated_at. Scoped by user_id inside get_days.
         from datetime import datetime, timedelta, timezone
 
-        ninety_days_ago = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=90)
-        weekly_pipeline = [
-            {"$match": {
-                "user_id": user_id,
-                "deleted_at": None,
-                "last_reviewed": {"$gte": ninety_days_ago},
-            }},
-            {"$group": {
-                "_id": {
-                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$last_reviewed"}},
-                    "type": {"$ifNull": ["$card_type", "flashcard"]},
-                },
-                "count": {"$sum": 1},
-            }},
-        ]
-        # Bounded: 90 days * at most 3 card types per day.
-        grouped_counts = await collection.aggregate(weekly_pipeline).to_list(length=700)
-
-        day_type_totals: dict = {}
-        for row in grouped_counts:
-            day = row["_id"]["day"]
-            card_type = row["_id"]["type"]
-            day_type_totals.setdefault(day, {})[card_type] = row.get("count", 0)
-
-        # books_collection is a per-user own-book fetch (bounded, cheap at
-        # current scale) — left unchanged, only hoisted to a module-level
-        # import so it is patchable in tests.
-        all_books = await books_collection.find({"user_id": user_id, "deleted_at": None}).to_list(length=500)
-
-        # Calculate weekly progress (last 7 days) - separated by type
+        rollups = await activity.get_days(user_id, 90)
         today = datetime.now(timezone.utc).replace(tzinfo=None).replace(hour=0, minute=0, second=0, microsecond=0)
-        weekly_data = []
-
-        for i in range(6, -1, -1):  # Last 7 days (6 days ago to today)
-            day_start = today - timedelta(days=i)
-            day_end = day_start + timedelta(days=1)
-            date_str = day_start.strftime("%Y-%m-%d")
-            type_counts = day_type_totals.get(date_str, {})
-
-            flashcards_count = type_counts.get("flashcard", 0)
-            quizzes_count = type_counts.get("quiz", 0)
-            visual_count = type_counts.get("visual", 0)
-
-            # Count books accessed/updated on this day
-            books_count = sum(
-                1
-                for book in all_books
-                if book.get("updated_at") and day_start <= book["updated_at"] < day_end
-            )
-
-            total_count = flashcards_count + quizzes_count + visual_count
-
-            weekly_data.append(
-                {
-                    "day": day_start.strftime("%A")[:3],  # Mon, Tue, etc.
-                    "date": date_str,
-                    "cards": total_count,  # Keep for backwards compatibility
-                    "flashcards": flashcards_count,
-                    "quizzes": quizzes_count,
-                    "visual": visual_count,
-                    "books": books_count,
-                }
-            )
+        weekly_data = activity.weekly(rollups, today.date())
 
         # Recent performance stays its OWN small bounded query (needs record
-        # fields the grouped counts don't carry: title/ease_factor/type) —
-        # not folded into the $group above (RESEARCH.md recommends against
-        # over-engineering a single giant $facet).
+        # fields the rollups don't carry: title/ease_factor/type).
         recent_cards = await collection.find(
             {
                 "user_id": user_id,
@@ -362,11 +263,13 @@ async def get_statistics(
                 }
             )
 
-        # Add recent book activity
-        recent_books = [book for book in all_books if book.get("updated_at")]
-        recent_books.sort(key=lambda x: x.get("updated_at", datetime.min), reverse=True)
+        # Add recent book activity — the 3 latest edits, titles only.
+        recent_books = await books_collection.find(
+            {"user_id": user_id, "deleted_at": None, "updated_at": {"$ne": None}},
+            {"title": 1, "updated_at": 1},
+        ).sort("updated_at", -1).limit(3).to_list(length=3)
 
-        for book in recent_books[:3]:  # Add top 3 recent books
+        for book in recent_books:
             recent_performance.insert(
                 0,
                 {
@@ -407,19 +310,8 @@ async def get_statistics(
         })
 
         # Current streak (consecutive days ending today with >=1 review),
-        # derived from the same grouped day/type counts computed above
-        # instead of re-scanning raw docs. Naturally bounded to the same
-        # 90-day window as the aggregation's $match (last_reviewed >=
-        # ninety_days_ago), matching the prior Python-loop's implicit cap.
-        reviewed_days = set(day_type_totals.keys())
-        streak = 0
-        check_date = today
-        while True:
-            if check_date.strftime("%Y-%m-%d") in reviewed_days:
-                streak += 1
-                check_date -= timedelta(days=1)
-            else:
-                break
+        # bounded to the same 90 days of rollups read above.
+        streak = activity.streak(activity.active_days(rollups), today.date())
 
         # last_session_struggle: front of the card most recently reviewed
         # yesterday or today AND with repetitions <= 1 (wrong answer resets
@@ -477,10 +369,7 @@ async def get_card_tags(
     active_decks = await decks_collection.find(
         {"user_id": user_id, "deleted_at": None}, {"_id": 1}
     ).to_list(length=500)
-    active_deck_ids = []
-    for d in active_decks:
-        active_deck_ids.append(d["_id"])
-        active_deck_ids.append(str(d["_id"]))
+    active_deck_ids = ids.ref_values("cards", "deck_id", [d["_id"] for d in active_decks])
 
     pipeline = [
         {"$match": {
@@ -533,12 +422,11 @@ async def get_daily_review_cards(
     for deck in active_decks:
         new_cap, review_cap = _get_deck_budget(deck)
         deck_oid = deck["_id"]
-        deck_or = [{"deck_id": deck_oid}, {"deck_id": str(deck_oid)}]
 
         new_raw, review_raw = await _select_session_cards(
             collection=collection,
             user_id=user_id,
-            deck_or=deck_or,
+            deck_match=ids.ref_value("cards", "deck_id", deck_oid),
             new_cap=new_cap,
             review_cap=review_cap,
             now_dt=now_dt,
@@ -591,14 +479,9 @@ async def list_study_cards(
 
     if deck_id is not None:
         # Direct deck filter — skip the active-decks query entirely
-        try:
-            deck_oid = ObjectId(deck_id)
-            deck_filter: list = [deck_oid, deck_id]
-        except Exception:
-            deck_filter = [deck_id]
-        query["$or"] = [{"deck_id": v} for v in deck_filter]
+        query["deck_id"] = ids.ref_value("cards", "deck_id", deck_id)
     else:
-        # Collect active deck IDs (both ObjectId and string forms) to exclude orphans
+        # Collect active deck IDs (both forms until cards are normalized) to exclude orphans
         # perf(33): 500-deck cap — bounds this user's OWN active-deck list (one
         # doc per deck), not a per-deck card fan-out; a single user's deck count
         # stays far below 500 at this app's current scale. Retained as-is, not
@@ -607,10 +490,7 @@ async def list_study_cards(
         active_decks = await decks_collection.find(
             {"user_id": user_id, "deleted_at": None}, {"_id": 1}
         ).to_list(length=500)
-        active_deck_ids: list = []
-        for d in active_decks:
-            active_deck_ids.append(d["_id"])
-            active_deck_ids.append(str(d["_id"]))
+        active_deck_ids = ids.ref_values("cards", "deck_id", [d["_id"] for d in active_decks])
         query["$or"] = [
             {"deck_id": None},
             {"deck_id": {"$exists": False}},
@@ -655,14 +535,10 @@ async def list_study_cards(
         now_dt = datetime.now(timezone.utc).replace(tzinfo=None)
         today_start = now_dt.replace(hour=0, minute=0, second=0, microsecond=0)
 
-        deck_obj_id = ObjectId(deck_id) if (deck_id and ObjectId.is_valid(deck_id)) else None
-        deck_or = [{"deck_id": deck_obj_id}]
-        if deck_id:
-            deck_or.append({"deck_id": deck_id})
         new_cards_raw, review_cards_raw = await _select_session_cards(
             collection=collection,
             user_id=user_id,
-            deck_or=deck_or,
+            deck_match=ids.ref_value("cards", "deck_id", deck_id),
             new_cap=new_cap,
             review_cap=review_cap,
             now_dt=now_dt,
@@ -724,7 +600,7 @@ async def update_study_card(
             await _verify_deck_ownership(old_deck_id, existing_card.get("user_id"))
             await d_collection.update_one(
                 {"_id": ObjectId(old_deck_id)},
-                {"$inc": {"total_cards": -1}, "$pull": {"cards": ObjectId(id)}},
+                {"$inc": {"total_cards": -1}},
             )
         # Add to new deck
         if new_deck_id:
@@ -732,7 +608,7 @@ async def update_study_card(
             updates["deck_id"] = ObjectId(new_deck_id)
             await d_collection.update_one(
                 {"_id": ObjectId(new_deck_id)},
-                {"$inc": {"total_cards": 1}, "$push": {"cards": ObjectId(id)}},
+                {"$inc": {"total_cards": 1}},
             )
         else:
             updates["deck_id"] = None
@@ -774,7 +650,7 @@ async def delete_study_card(
         await _verify_deck_ownership(deck_id, existing_card.get("user_id"))
         await d_collection.update_one(
             {"_id": ObjectId(deck_id)},
-            {"$inc": {"total_cards": -1}, "$pull": {"cards": ObjectId(id)}},
+            {"$inc": {"total_cards": -1}},
         )
 
     now = datetime.now(timezone.utc)
@@ -786,10 +662,12 @@ async def delete_study_card(
             "updated_at": now,
         }
     }
-    await collection.update_one(
-        {"_id": ObjectId(existing_card["_id"])},
+    result = await collection.update_one(
+        {"_id": ObjectId(existing_card["_id"]), "deleted_at": None},
         soft_delete_update,
     )
+    if result.modified_count:
+        await quota.release(user_id, quota.card_quota_key(existing_card.get("card_type")))
     return None
 
 
@@ -853,12 +731,14 @@ async def review_card(
             },
         )
 
+        user_id = user.get("user_id")
+        await activity.record(user_id, card_type=card.get("card_type"), reviews=1)
+
         # Award XP for reviewing a card — genuinely fire-and-forget: the SM-2
         # update above already committed, so a grant_xp failure must never
         # turn an already-persisted review into a client-facing 500 (which
         # would cause the frontend's retry queue to resubmit and re-apply
         # the same grade a second time — see 32-REVIEW.md CR-01).
-        user_id = user.get("user_id")
         try:
             await grant_xp(user_id, 2)
         except Exception as xp_err:
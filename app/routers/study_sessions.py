@@ -19,6 +19,7 @@ from fastapi import APIRouter, Depends, Query
 
 from app.auth.firebase_auth import get_firebase_user
 from app.config.database import study_sessions_collection
+from app.services import activity
 from app.models.study_sessions import LogSessionRequest, StudySessionRecord, StudySessionsResponse
 from app.utils.logger import get_logger
 
@@ -89,6 +90,7 @@ async def log_study_session(
     }
 
     await study_sessions_collection.insert_one(doc)
+    await activity.record(user_id, sessions=1, study_seconds=duration_seconds)
     logger.info(
         f"[study_sessions] SRS logged: user={user_id}, deck={body.deck_name!r}, "
         f"cards={total}, score={score_percentage}%, duration={duration_seconds}s"
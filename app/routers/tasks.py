@@ -4,6 +4,8 @@ from datetime import datetime, timezone
 from bson import ObjectId
 from pymongo.collection import Collection
 from app.models.Task import Task
+from app.models.batch_mutations import BatchMutationRequest
+from app.services import batch_mutations
 from app.config.database import db
 from app.utils.logger import get_logger
 from app.auth.firebase_auth import get_firebase_user
@@ -75,6 +77,34 @@ async def list_tasks(
     return tasks
 
 
+@router.patch("/batch", summary="Update many tasks", response_model=List[Task])
+async def batch_update_tasks(
+    payload: BatchMutationRequest,
+    user: dict = Depends(get_firebase_user),
+):
+    """Bulk check-offs and edits in one round-trip; returns the updated tasks in request order."""
+    user_id = user.get("user_id")
+    logger.info(f"User {user_id} batch-updating {len(payload.operations)} tasks")
+
+    result = await batch_mutations.apply_batch("tasks", user_id, payload.operations)
+
+    # Same XP as PATCH /tasks/{id}: 50 per task completed for the first time
+    just_completed = sum(
+        1 for before, after in zip(result.previous, result.documents)
+        if not before.get("is_completed", False) and after.get("is_completed")
+    )
+    if just_completed:
+        from app.routers.agent import grant_xp
+        await grant_xp(user_id, 50 * just_completed)
+
+    for task in result.documents:
+        task["_id"] = str(task["_id"])
+        if task.get("user_id"):
+            task["user_id"] = str(task["user_id"])
+
+    return result.documents
+
+
 @router.get("/{id}", summary="Get a task by ID", response_model=Task)
 async def get_task(
     id: str,
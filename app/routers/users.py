@@ -4,13 +4,14 @@ Handles user profile management, settings, and preferences
 """
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
+from fastapi.responses import StreamingResponse
+from gridfs.errors import NoFile
 from pymongo.collection import Collection
 from bson import ObjectId
 from bson.errors import InvalidId
 from datetime import datetime, timedelta, timezone
-from typing import Literal, Optional, List
+from typing import AsyncIterator, Literal, Optional, List
 import bcrypt
 import base64
 import secrets
@@ -43,20 +44,20 @@ from app.models.common import (
     TwoFactorEnableResponse,
     AccountDeleteResponse,
     DataExportResponse,
+    DataExportJobResponse,
 )
 from app.config.database import (
     users_collection,
     study_cards_collection,
-    study_sessions_collection,
     books_collection,
+    book_texts_collection,
+    activity_days_collection,
     decks_collection,
-    tasks_collection,
-    annual_plans_collection,
-    focus_areas_collection,
-    goals_collection,
     blackboards_collection,
 )
 from app.auth.firebase_auth import get_firebase_user
+from app.core.limiter import limiter
+from app.services import activity, cascade, data_export
 
 router = APIRouter(
     prefix="/users",
@@ -346,27 +347,10 @@ async def get_user_stats(user_id: str) -> dict:
             study_cards_collection.count_documents({"user_id": user_oid, "card_type": "visual"})
         )
 
-        # Calculate study streak efficiently via a user-scoped aggregation that
-        # returns already-distinct reviewed dates (avoids streaming one
-        # document per reviewed card over an async-for cursor iteration).
-        one_year_ago = datetime.now(timezone.utc) - timedelta(days=365)
-        streak_pipeline = [
-            {"$match": {"user_id": user_oid, "last_reviewed": {"$gt": one_year_ago}}},
-            {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$last_reviewed"}}}},
-        ]
-        distinct_dates = await study_cards_collection.aggregate(streak_pipeline).to_list(length=366)
-
-        # Collect unique dates locally
-        reviewed_dates = {datetime.strptime(d["_id"], "%Y-%m-%d").date() for d in distinct_dates}
-
-        # Calculate streak
-        today = datetime.now(timezone.utc).date()
-        streak = 0
-        check_date = today
-        
-        while check_date in reviewed_dates:
-            streak += 1
-            check_date -= timedelta(days=1)
+        # Study streak from the daily activity rollups: at most a year of
+        # small per-day documents instead of grouping every reviewed card.
+        rollups = await activity.get_days(user_id, 366)
+        streak = activity.streak(activity.active_days(rollups))
 
         # Fetch ai_usage_count from user's subscription subdoc
         user_doc = await users_collection.find_one(
@@ -999,12 +983,6 @@ async def delete_account(current_user: dict = Depends(get_firebase_user)):
     credentials are revoked. Firebase deletion failure is caught and logged
     (MongoDB is source of truth).
     """
-    from app.config.database import (
-        priorities_collection,
-        activities_collection,
-        daily_routines_collection,
-    )
-
     user_id = current_user.get("user_id")
     firebase_uid: str = current_user.get("firebase_uid", "")
     now = datetime.now(timezone.utc)
@@ -1043,106 +1021,17 @@ async def delete_account(current_user: dict = Depends(get_firebase_user)):
     if user_update.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # 2. Cascade soft delete to all user content
-    soft_delete_update = {
-        "$set": {
-            "deleted_at": now,
-            "deleted_by": user_id,
-            "is_public": False,  # Auto-unpublish
-            "updated_at": now
-        }
-    }
-    
-    # Books (and their public metadata)
-    await books_collection.update_many(
-        {"user_id": user_id, "deleted_at": None},
-        soft_delete_update
-    )
-    
-    # Decks (and auto-unpublish)
-    await decks_collection.update_many(
-        {"user_id": user_id, "deleted_at": None},
-        soft_delete_update
-    )
-    
-    # Study Cards
-    await study_cards_collection.update_many(
-        {"user_id": user_id, "deleted_at": None},
-        soft_delete_update
-    )
-
-    # Study Sessions (performance history)
-    await study_sessions_collection.update_many(
-        {"user_id": user_id, "deleted_at": None},
-        {"$set": {"deleted_at": now, "deleted_by": user_id, "updated_at": now}}
-    )
-
-    # Annual Plans
-    plans_cursor = annual_plans_collection.find({"user_id": user_id, "deleted_at": None})
-    plans = await plans_cursor.to_list(length=100)
-    plan_ids = [str(p["_id"]) for p in plans]
-    
-    await annual_plans_collection.update_many(
-        {"user_id": user_id, "deleted_at": None},
-        soft_delete_update
-    )
-    
-    if plan_ids:
-        # Focus Areas
-        areas_cursor = focus_areas_collection.find({"annual_plan_id": {"$in": plan_ids}, "deleted_at": None})
-        areas = await areas_cursor.to_list(length=300)
-        area_ids = [str(a["_id"]) for a in areas]
-        
-        await focus_areas_collection.update_many(
-            {"annual_plan_id": {"$in": plan_ids}, "deleted_at": None},
-            soft_delete_update
-        )
-        
-        if area_ids:
-            # Goals
-            goals_cursor = goals_collection.find({"focus_area_id": {"$in": area_ids}, "deleted_at": None})
-            goals = await goals_cursor.to_list(length=1000)
-            goal_ids = [str(g["_id"]) for g in goals]
-            
-            await goals_collection.update_many(
-                {"focus_area_id": {"$in": area_ids}, "deleted_at": None},
-                soft_delete_update
-            )
-            
-            # Priorities
-            await priorities_collection.update_many(
-                {"focus_area_id": {"$in": area_ids}, "deleted_at": None},
-                soft_delete_update
-            )
-            
-            if goal_ids:
-                # Activities
-                await activities_collection.update_many(
-                    {"goal_id": {"$in": goal_ids}, "deleted_at": None},
-                    soft_delete_update
-                )
-    
-    # Tasks
-    await tasks_collection.update_many(
-        {"user_id": user_id, "deleted_at": None},
-        soft_delete_update
-    )
-
-    # Daily Routines
-    await daily_routines_collection.update_many(
-        {"user_id": user_id, "deleted_at": None},
-        soft_delete_update
-    )
-
-    # Blackboards — owned boards are soft-deleted; the deleted user is also
-    # pulled from every OTHER board's collaborators array so no stale reference
-    # lingers on someone else's shared board. Blackboard has no is_public field,
-    # so soft_delete_update is deliberately not reused here.
-    await blackboards_collection.update_many(
-        {"owner_user_id": user_id, "deleted_at": None},
-        {"$set": {"deleted_at": now, "deleted_by": user_id, "updated_at": now}}
-    )
-
+    # 2. Cascade soft delete to all user content: books (and their blocks),
+    # decks and cards (auto-unpublished), study sessions, annual plans down to
+    # activities, tasks, daily routines and owned blackboards. Everything is
+    # stamped with this deletion so signing back in restores exactly this set.
+    await cascade.soft_delete_account(user_id, now=now)
+    await book_texts_collection.delete_many({"user_id": user_id})
+    await activity_days_collection.delete_many({"user_id": user_id})
+    await data_export.delete_user_exports(user_id)
+
+    # The deleted user is also pulled from every OTHER board's collaborators
+    # array so no stale reference lingers on someone else's shared board.
     await blackboards_collection.update_many(
         {"collaborators": user_id},
         {"$pull": {"collaborators": user_id}, "$set": {"updated_at": now}}
@@ -1283,107 +1172,128 @@ async def update_pet_preferences(
 
 
 # ---------------------------------------------------------------------------
-# Data export helper
+# GDPR export endpoints
 # ---------------------------------------------------------------------------
 
-def _serialize_doc(doc: dict) -> dict:
-    """Convert a MongoDB document to a JSON-serializable dict.
+_EXPORT_MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "zip": "application/zip",
+}
 
-    Handles ObjectId → str, datetime → ISO string, and nested structures.
-    """
-    result = {}
-    for key, value in doc.items():
-        if type(value).__name__ == "ObjectId":
-            result[key] = str(value)
-        elif hasattr(value, "isoformat"):  # datetime / date
-            result[key] = value.isoformat()
-        elif isinstance(value, dict):
-            result[key] = _serialize_doc(value)
-        elif isinstance(value, list):
-            result[key] = [
-                _serialize_doc(v) if isinstance(v, dict)
-                else str(v) if type(v).__name__ == "ObjectId"
-                else v
-                for v in value
-            ]
-        else:
-            result[key] = value
-    return result
 
-
-# ---------------------------------------------------------------------------
-# GDPR export endpoint
-# ---------------------------------------------------------------------------
-
-@router.get("/export", summary="Export all user data as JSON download")
+@router.get("/export", summary="Export all user data as a streamed download")
 async def export_user_data(
+    export_format: Literal["json", "ndjson", "zip"] = Query("json", alias="format"),
     current_user: dict = Depends(get_firebase_user),
-) -> None:
+) -> StreamingResponse:
     """
-    Export all user content as a downloadable JSON file.
+    Export all user content as a downloadable file.
 
     Includes: books, decks, cards, tasks, annual plans, goals.
     Does NOT include session history or quiz records (out of scope per D-13).
     All queries filter deleted_at=None (export only active content).
-    Queries run in parallel via asyncio.gather for fast response times.
+
+    Collections are streamed through batched cursors, so memory stays flat
+    however large the account is. ``format=json`` (default) is the legacy
+    single document; ``ndjson`` is one record per line; ``zip`` holds one
+    NDJSON file per collection plus a manifest. For very large accounts use
+    POST /users/export/jobs instead.
     """
     user_id: str = current_user.get("user_id")
     user_email: str = current_user.get("email", "")
+    now = datetime.now(timezone.utc)
+
+    streams = {
+        "json": data_export.stream_json,
+        "ndjson": data_export.stream_ndjson,
+        "zip": data_export.stream_zip,
+    }
+    filename = data_export.export_filename(now, export_format)
+    return StreamingResponse(
+        streams[export_format](user_id, user_email, now),
+        media_type=_EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
-    # Parallel fetch from 5 directly user_id-indexed collections
-    books_coro = books_collection.find(
-        {"user_id": user_id, "deleted_at": None}
-    ).to_list(length=10000)
 
-    decks_coro = decks_collection.find(
-        {"user_id": user_id, "deleted_at": None}
-    ).to_list(length=10000)
+def _export_job_response(job: dict) -> DataExportJobResponse:
+    return DataExportJobResponse(
+        export_id=job["export_id"],
+        status=job["status"],
+        created_at=job["created_at"].isoformat(),
+        size_bytes=job.get("size_bytes"),
+        record_counts=job.get("record_counts") or {},
+        download_url=(
+            f"/users/export/jobs/{job['export_id']}/download" if job["status"] == "ready" else None
+        ),
+        error=job.get("error"),
+    )
 
-    cards_coro = study_cards_collection.find(
-        {"user_id": user_id, "deleted_at": None}
-    ).to_list(length=50000)
 
-    tasks_coro = tasks_collection.find(
-        {"user_id": user_id, "deleted_at": None}
-    ).to_list(length=10000)
+async def _get_owned_export_job(export_id: str, user_id: str) -> dict:
+    job = await data_export.get_export_job(export_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
 
-    plans_coro = annual_plans_collection.find(
-        {"user_id": user_id, "deleted_at": None}
-    ).to_list(length=100)
 
-    books, decks, cards, tasks, plans = await asyncio.gather(
-        books_coro, decks_coro, cards_coro, tasks_coro, plans_coro
+@router.post(
+    "/export/jobs",
+    response_model=DataExportJobResponse,
+    status_code=202,
+    summary="Build a ZIP export in the background",
+)
+@limiter.limit("5/minute")
+async def create_export_job(
+    request: Request,
+    current_user: dict = Depends(get_firebase_user),
+):
+    """
+    Poll GET /users/export/jobs/{export_id}; download once ``status`` is ready (kept 24 h).
+    While an export is running, this returns that job rather than starting another.
+    """
+    job = await data_export.start_export_job(
+        current_user.get("user_id"), current_user.get("email", ""),
     )
+    return _export_job_response(job)
 
-    # Goals are linked via focus_areas (not directly by user_id)
-    # Fetch focus areas for this user's plans, then goals for those focus areas
-    goals: list = []
-    if plans:
-        plan_ids = [str(p["_id"]) for p in plans]
-        focus_areas = await focus_areas_collection.find(
-            {"annual_plan_id": {"$in": plan_ids}, "deleted_at": None}
-        ).to_list(length=1000)
-        if focus_areas:
-            focus_area_ids = [str(fa["_id"]) for fa in focus_areas]
-            goals = await goals_collection.find(
-                {"focus_area_id": {"$in": focus_area_ids}, "deleted_at": None}
-            ).to_list(length=5000)
 
-    now = datetime.now(timezone.utc)
-    filename = f"nowry_export_{now.strftime('%Y%m%d_%H%M%S')}.json"
-
-    export_data = {
-        "exported_at": now.isoformat(),
-        "user_email": user_email,
-        "books": [_serialize_doc(d) for d in books],
-        "decks": [_serialize_doc(d) for d in decks],
-        "cards": [_serialize_doc(d) for d in cards],
-        "tasks": [_serialize_doc(d) for d in tasks],
-        "annual_plans": [_serialize_doc(d) for d in plans],
-        "goals": [_serialize_doc(d) for d in goals],
-    }
+@router.get(
+    "/export/jobs/{export_id}",
+    response_model=DataExportJobResponse,
+    summary="Get the status of a background export",
+)
+async def get_export_job(
+    export_id: str,
+    current_user: dict = Depends(get_firebase_user),
+):
+    job = await _get_owned_export_job(export_id, current_user.get("user_id"))
+    return _export_job_response(job)
 
-    return JSONResponse(
-        content=export_data,
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+
+@router.get("/export/jobs/{export_id}/download", summary="Download a finished background export")
+async def download_export_job(
+    export_id: str,
+    current_user: dict = Depends(get_firebase_user),
+) -> StreamingResponse:
+    job = await _get_owned_export_job(export_id, current_user.get("user_id"))
+    if job["status"] != "ready":
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    try:
+        artifact = await data_export.open_artifact(job)
+    except NoFile:
+        raise HTTPException(status_code=410, detail="Export has expired")
+
+    async def chunks() -> AsyncIterator[bytes]:
+        while chunk := await artifact.readchunk():
+            yield chunk
+
+    return StreamingResponse(
+        chunks(),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{job["filename"]}"',
+            "Content-Length": str(artifact.length),
+        },
     )
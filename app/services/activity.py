@@ -0,0 +1,154 @@
+"""
+Per-user daily activity rollups for streaks, heatmaps and weekly charts.
+
+Each (user, UTC day) has one ``activity_days`` document, keyed
+``"<user_id>:<YYYY-MM-DD>"``:
+
+    {
+        "user_id": str, "day": "2026-10-19",
+        "reviews": {"flashcard": 12, "quiz": 3, "visual": 0},
+        "reviews_total": 15,
+        "book_ids": ["..."],        # distinct books saved that day
+        "book_saves": 4,
+        "sessions": 2, "study_seconds": 1260,
+    }
+
+Writers upsert with ``$inc`` (plus ``$addToSet`` for books), so recording an
+event is one small write and reading a year of history is at most 366
+documents, however many cards the user has. Unlike ``last_reviewed`` on a
+card, which is overwritten on every review, the history is never lost.
+
+Recording is best effort. A failed rollup write is logged and never fails
+the review, save or session log that triggered it.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from app.config.database import activity_days_collection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CARD_TYPES = ("flashcard", "quiz", "visual")
+
+#: Fields a chart or streak needs — book_ids is only read as a count.
+_PROJECTION = {"_id": 0, "day": 1, "reviews": 1, "reviews_total": 1, "book_ids": 1,
+               "book_saves": 1, "sessions": 1, "study_seconds": 1}
+
+
+def day_key(moment: Optional[datetime] = None) -> str:
+    """UTC calendar day of ``moment`` (now when None) as ``YYYY-MM-DD``.
+
+    Naive datetimes are taken as UTC, matching how Motor returns them.
+    """
+    moment = moment or datetime.now(timezone.utc)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.strftime("%Y-%m-%d")
+
+
+async def record(
+    user_id: str,
+    *,
+    card_type: Optional[str] = None,
+    reviews: int = 0,
+    book_id: Optional[str] = None,
+    sessions: int = 0,
+    study_seconds: int = 0,
+    at: Optional[datetime] = None,
+) -> None:
+    """Add one event's counts to the user's rollup for the day of ``at`` (default now)."""
+    if not user_id:
+        return
+    day = day_key(at)
+    increments: Dict[str, int] = {}
+    if reviews:
+        kind = card_type if card_type in CARD_TYPES else "flashcard"
+        increments[f"reviews.{kind}"] = reviews
+        increments["reviews_total"] = reviews
+    if book_id:
+        increments["book_saves"] = 1
+    if sessions:
+        increments["sessions"] = sessions
+    if study_seconds > 0:
+        increments["study_seconds"] = int(study_seconds)
+    if not increments:
+        return
+
+    update: Dict[str, Any] = {
+        "$inc": increments,
+        "$set": {"updated_at": datetime.now(timezone.utc)},
+        "$setOnInsert": {"user_id": str(user_id), "day": day},
+    }
+    if book_id:
+        update["$addToSet"] = {"book_ids": str(book_id)}
+
+    selector = {"_id": f"{user_id}:{day}"}
+    try:
+        try:
+            await activity_days_collection.update_one(selector, update, upsert=True)
+        except DuplicateKeyError:
+            # Two first-writes of the day raced on the upsert; the document exists now.
+            await activity_days_collection.update_one(selector, update)
+    except Exception as exc:
+        logger.warning(f"[activity] Rollup write failed for user {user_id} on {day}: {exc}")
+
+
+async def get_days(user_id: str, days: int) -> Dict[str, dict]:
+    """The user's rollups for the last ``days`` UTC days (today included), keyed by day."""
+    since = day_key(datetime.now(timezone.utc) - timedelta(days=days - 1))
+    docs = await activity_days_collection.find(
+        {"user_id": str(user_id), "day": {"$gte": since}}, _PROJECTION,
+    ).sort("day", -1).to_list(length=days)
+    return {doc["day"]: doc for doc in docs}
+
+
+def active_days(rollups: Dict[str, dict]) -> set:
+    """Days with at least one review — what a study streak counts."""
+    return {day for day, doc in rollups.items() if doc.get("reviews_total", 0) > 0}
+
+
+def streak(days: Iterable[str], today: Optional[date] = None) -> int:
+    """Consecutive days ending today that appear in ``days``."""
+    present = set(days)
+    check = today or datetime.now(timezone.utc).date()
+    count = 0
+    while check.strftime("%Y-%m-%d") in present:
+        count += 1
+        check -= timedelta(days=1)
+    return count
+
+
+def weekly(rollups: Dict[str, dict], today: Optional[date] = None) -> List[dict]:
+    """Seven entries, six days ago through today, in the weekly_progress shape."""
+    today = today or datetime.now(timezone.utc).date()
+    entries = []
+    for offset in range(6, -1, -1):
+        day = today - timedelta(days=offset)
+        doc = rollups.get(day.strftime("%Y-%m-%d")) or {}
+        reviews = doc.get("reviews") or {}
+        entries.append({
+            "day": day.strftime("%A")[:3],  # Mon, Tue, etc.
+            "date": day.strftime("%Y-%m-%d"),
+            "cards": doc.get("reviews_total", 0),  # Keep for backwards compatibility
+            "flashcards": reviews.get("flashcard", 0),
+            "quizzes": reviews.get("quiz", 0),
+            "visual": reviews.get("visual", 0),
+            "books": len(doc.get("book_ids") or []),
+            "minutes": doc.get("study_seconds", 0) // 60,
+        })
+    return entries
+
+
+__all__ = [
+    "active_days",
+    "day_key",
+    "get_days",
+    "record",
+    "streak",
+    "weekly",
+]
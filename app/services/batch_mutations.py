@@ -0,0 +1,192 @@
+"""
+Batch mutations for priorities, goals, activities and tasks.
+
+Drag-and-drop reorders and bulk check-offs used to cost one request — and
+one or two ``update_one`` calls — per item. ``apply_batch`` takes every
+change for one entity in a single request:
+
+  1. validates the whole batch up front: known fields only, values of the
+     model's type, no duplicate ids, referenced milestones exist;
+  2. loads the documents with one ``$in`` find and checks ownership once
+     for all of them (``planning_scope.resolve_owners``);
+  3. applies every change with one ``bulk_write``;
+  4. re-reads the documents with one ``$in`` find and returns them in
+     request order, so the client renders the new versions directly.
+
+Nothing is written unless the whole batch validates. Side effects of the
+single-item endpoints carry over: completing a priority stamps
+``completed_at`` and a goal's status change (un)archives its linked
+priorities, in one extra ``bulk_write``.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pymongo import UpdateMany, UpdateOne
+
+from app.config.database import db
+from app.models.Activity import Activity
+from app.models.Goal import Goal, Milestone
+from app.models.Priority import Priority
+from app.models.Task import Task
+from app.models.batch_mutations import BatchMutation
+from app.services import planning_scope
+from app.utils import ids
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class BatchEntity:
+    """A collection that accepts batch mutations and the fields they may set."""
+
+    collection: str
+    model: Type[BaseModel]
+    fields: FrozenSet[str]
+
+
+ENTITIES: Dict[str, BatchEntity] = {
+    "priorities": BatchEntity("priorities", Priority, frozenset({
+        "title", "description", "deadline", "order", "is_active", "is_completed",
+        "linked_entity_id", "linked_entity_type",
+    })),
+    "goals": BatchEntity("goals", Goal, frozenset({
+        "title", "description", "image_url", "target_date", "progress", "status",
+        "parent_id", "quarter", "year", "type",
+    })),
+    "activities": BatchEntity("activities", Activity, frozenset({
+        "title", "description", "frequency", "days_of_week", "time_of_day",
+        "duration_minutes", "is_active", "streak", "last_completed_date",
+    })),
+    "tasks": BatchEntity("tasks", Task, frozenset({
+        "title", "description", "is_completed", "priority", "deadline", "tags", "category",
+    })),
+}
+
+#: Fields a milestone patch may set.
+MILESTONE_FIELDS = frozenset({"title", "due_date", "completed", "is_key_result"})
+
+
+@dataclass
+class BatchResult:
+    """Documents before and after the batch, both in request order."""
+
+    documents: List[dict]
+    previous: List[dict]
+
+
+@lru_cache(maxsize=None)
+def _adapter(annotation: Any) -> TypeAdapter:
+    return TypeAdapter(annotation)
+
+
+def _validated(model: Type[BaseModel], name: str, value: Any, label: str) -> Any:
+    annotation = model.model_fields[name].annotation
+    # Same rule as update_priority: no bool("false") == True coercion (WR-01).
+    if annotation is bool and not isinstance(value, bool):
+        raise HTTPException(status_code=422, detail=f"{label}{name} must be a boolean")
+    try:
+        return _adapter(annotation).validate_python(value)
+    except ValidationError:
+        raise HTTPException(status_code=422, detail=f"Invalid value for {label}{name}")
+
+
+def _check_shape(entity: BatchEntity, operations: List[BatchMutation]) -> None:
+    requested = [op.id for op in operations]
+    if len(set(requested)) != len(requested):
+        raise HTTPException(status_code=422, detail="operations must not contain duplicate ids")
+    for op in operations:
+        unknown = sorted(set(op.changes) - entity.fields)
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Fields not allowed in a batch: {', '.join(unknown)}")
+        if op.milestones and entity.collection != "goals":
+            raise HTTPException(status_code=422, detail="milestones can only be changed on goals")
+        for patch in op.milestones.values():
+            unknown = sorted(set(patch) - MILESTONE_FIELDS)
+            if unknown:
+                raise HTTPException(status_code=422, detail=f"Milestone fields not allowed: {', '.join(unknown)}")
+
+
+def _update_for(entity: BatchEntity, op: BatchMutation, doc: dict, now: datetime) -> UpdateOne:
+    fields: Dict[str, Any] = {
+        name: _validated(entity.model, name, value, "") for name, value in op.changes.items()
+    }
+    if entity.collection == "priorities" and "is_completed" in fields:
+        fields["completed_at"] = now if fields["is_completed"] else None
+
+    existing = {m.get("id") for m in doc.get("milestones") or []}
+    array_filters = []
+    for index, (milestone_id, patch) in enumerate(op.milestones.items()):
+        if milestone_id not in existing:
+            raise HTTPException(status_code=404, detail=f"Milestone not found: {milestone_id}")
+        for name, value in patch.items():
+            fields[f"milestones.$[m{index}].{name}"] = _validated(Milestone, name, value, "milestone ")
+        array_filters.append({f"m{index}.id": milestone_id})
+
+    fields["updated_at"] = now
+    return UpdateOne({"_id": doc["_id"]}, {"$set": fields}, array_filters=array_filters or None)
+
+
+def _linked_priority_updates(operations: List[BatchMutation], now: datetime) -> list:
+    """(Un)archive priorities linked to goals whose status changed, as update_goal does."""
+    completed = [op.id for op in operations if op.changes.get("status") == "completed"]
+    reopened = [op.id for op in operations if "status" in op.changes and op.changes["status"] != "completed"]
+    updates = []
+    for goal_ids, is_completed in ((completed, True), (reopened, False)):
+        if goal_ids:
+            updates.append(UpdateMany(
+                {"linked_entity_id": {"$in": goal_ids}, "linked_entity_type": "goal"},
+                {"$set": {"is_completed": is_completed, "completed_at": now if is_completed else None, "updated_at": now}},
+            ))
+    return updates
+
+
+async def apply_batch(
+    entity_name: str,
+    user_id: str,
+    operations: List[BatchMutation],
+    now: Optional[datetime] = None,
+) -> BatchResult:
+    """Validate, authorize and apply ``operations`` to ``entity_name`` in one bulk_write."""
+    entity = ENTITIES[entity_name]
+    now = now or datetime.now(timezone.utc)
+    _check_shape(entity, operations)
+
+    target = db[entity.collection]
+    requested = [op.id for op in operations]
+    docs = await target.find(
+        {"_id": {"$in": ids.id_values(entity.collection, requested)}, "deleted_at": None}
+    ).to_list(length=len(requested))
+    by_id = {str(doc["_id"]): doc for doc in docs}
+    missing = [doc_id for doc_id in requested if doc_id not in by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Not found: {', '.join(missing)}")
+
+    owners = await planning_scope.resolve_owners(entity.collection, docs)
+    if any(owners.get(doc_id) != str(user_id) for doc_id in requested):
+        raise HTTPException(status_code=403, detail="Not authorized to modify one or more items")
+
+    # Build every update before writing so a bad value anywhere writes nothing.
+    updates = [_update_for(entity, op, by_id[op.id], now) for op in operations]
+    await target.bulk_write(updates, ordered=False)
+    if entity.collection == "goals":
+        linked = _linked_priority_updates(operations, now)
+        if linked:
+            await db["priorities"].bulk_write(linked, ordered=False)
+
+    refreshed = await target.find({"_id": {"$in": [doc["_id"] for doc in docs]}}).to_list(length=len(requested))
+    after = {str(doc["_id"]): doc for doc in refreshed}
+    logger.info(f"[batch] {entity.collection}: {len(updates)} updated for user {user_id}")
+    return BatchResult(
+        documents=[after[doc_id] for doc_id in requested],
+        previous=[by_id[doc_id] for doc_id in requested],
+    )
+
+
+__all__ = ["ENTITIES", "BatchEntity", "BatchResult", "MILESTONE_FIELDS", "apply_batch"]
@@ -0,0 +1,303 @@
+"""
+Realtime blackboard sync (WebSocket /blackboards/{board_id}/ws).
+
+Each API worker keeps a ``BoardRoom`` per open board:
+- the sockets connected to it
+- the board's nodes/edges in memory
+- the ops not yet written back
+
+Flow:
+- Ops from a socket are compacted (app/utils/blackboard_ops.py), applied to
+  the room and broadcast to the other sockets straight away.
+- They are also published to the other workers, which apply and broadcast
+  them to their own sockets.
+- Mongo sees one compacted patch per room every ``SNAPSHOT_SECONDS``, and a
+  final one when the last socket leaves, instead of a write per keystroke.
+
+Cross-worker fan-out is pluggable:
+- ``MongoChangeStreamPubSub`` (default) inserts events into
+  ``blackboard_events`` and tails them with a change stream. A stream that
+  breaks (stepdown, network) is reopened with backoff from its resume token.
+  Only a deployment without change streams (standalone mongod) falls back to
+  local delivery.
+- ``LocalPubSub`` delivers in-process, for tests and single-worker runs.
+
+REST writes publish too: PATCH its ops, PUT and DELETE (clear) a ``reload``.
+Open rooms stay current with them. A clear's reload drops the rooms' unsaved
+ops instead of writing them back onto the emptied board.
+
+Ordering is per worker. Two workers applying concurrent edits to the SAME
+node can disagree until the next reload. The flushed patches still merge per
+object in Mongo, so nothing is lost wholesale. Route a board's sockets to one
+worker (sticky sessions) if strict ordering matters.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import OperationFailure
+
+from app.config.database import blackboard_events_collection, blackboards_collection
+from app.utils import blackboard_ops
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Seconds between write-backs of a room's pending ops.
+SNAPSHOT_SECONDS: float = float(os.getenv("BLACKBOARD_SNAPSHOT_SECONDS", "5"))
+
+#: Seconds before reopening a broken change stream, doubling up to the max.
+WATCH_RETRY_SECONDS: float = 1.0
+WATCH_RETRY_MAX_SECONDS: float = 30.0
+
+#: Server errors meaning this deployment has no change streams at all
+#: (standalone mongod, or a server too old to know $changeStream).
+_UNSUPPORTED_CODES = frozenset({40573, 40324})
+
+#: Server errors meaning the resume token can no longer be used.
+_RESUME_LOST_CODES = frozenset({280, 286})
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+class LocalPubSub:
+    """In-process fan-out: every published event goes straight to the handler."""
+
+    def __init__(self) -> None:
+        self._handler: Optional[EventHandler] = None
+
+    async def start(self, handler: EventHandler) -> None:
+        self._handler = handler
+
+    async def publish(self, event: dict) -> None:
+        if self._handler is not None:
+            await self._handler(event)
+
+    async def stop(self) -> None:
+        self._handler = None
+
+
+class MongoChangeStreamPubSub:
+    """Fan-out across workers through inserts into ``blackboard_events``."""
+
+    def __init__(self) -> None:
+        self._handler: Optional[EventHandler] = None
+        self._task: Optional[asyncio.Task] = None
+        self._available = True
+
+    async def start(self, handler: EventHandler) -> None:
+        self._handler = handler
+        self._task = asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        resume_token = None
+        delay = WATCH_RETRY_SECONDS
+        while True:
+            try:
+                async with blackboard_events_collection.watch(
+                    [{"$match": {"operationType": "insert"}}], resume_after=resume_token,
+                ) as stream:
+                    delay = WATCH_RETRY_SECONDS
+                    async for change in stream:
+                        resume_token = change["_id"]
+                        try:
+                            await self._handler(change["fullDocument"])
+                        except Exception as exc:
+                            logger.warning(f"[blackboard_sync] Event handler failed: {exc}")
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as exc:
+                if exc.code in _UNSUPPORTED_CODES:
+                    # Change streams need a replica set. Keep serving this
+                    # worker's rooms rather than silently dropping events.
+                    self._available = False
+                    logger.warning(f"[blackboard_sync] Change streams unsupported, using local fan-out: {exc}")
+                    return
+                if exc.code in _RESUME_LOST_CODES:
+                    resume_token = None
+                logger.warning(f"[blackboard_sync] Change stream failed, reopening in {delay:.0f}s: {exc}")
+            except Exception as exc:
+                logger.warning(f"[blackboard_sync] Change stream failed, reopening in {delay:.0f}s: {exc}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WATCH_RETRY_MAX_SECONDS)
+
+    async def publish(self, event: dict) -> None:
+        if not self._available:
+            await self._handler(event)
+            return
+        await blackboard_events_collection.insert_one({**event, "created_at": datetime.now(timezone.utc)})
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+
+def _make_pubsub():
+    return LocalPubSub() if os.getenv("BLACKBOARD_PUBSUB", "mongo") == "local" else MongoChangeStreamPubSub()
+
+
+class BoardRoom:
+    def __init__(self, board: dict) -> None:
+        self.board_key = str(board["_id"])
+        self.object_id = board["_id"]
+        self.nodes: List[dict] = list(board.get("nodes") or [])
+        self.edges: List[dict] = list(board.get("edges") or [])
+        self.seq = 0
+        self.sockets: Dict[object, str] = {}
+        self.pending: List[dict] = []
+        self.lock = asyncio.Lock()
+
+    def snapshot_message(self) -> dict:
+        return {"type": "snapshot", "nodes": self.nodes, "edges": self.edges, "seq": self.seq}
+
+    def presence_message(self) -> dict:
+        return {"type": "presence", "users": sorted(set(self.sockets.values()))}
+
+    def apply(self, ops: List[dict]) -> None:
+        self.nodes, self.edges = blackboard_ops.apply_ops(self.nodes, self.edges, ops)
+        self.seq += 1
+
+    async def broadcast(self, message: dict, exclude: object = None) -> None:
+        dead = []
+        for socket in list(self.sockets):
+            if socket is exclude:
+                continue
+            try:
+                await socket.send_json(message)
+            except Exception:
+                dead.append(socket)
+        for socket in dead:
+            self.sockets.pop(socket, None)
+
+
+class BoardSyncHub:
+    """All rooms on this worker, their write-back loop and the pub/sub link."""
+
+    def __init__(self, pubsub=None) -> None:
+        self.worker_id = uuid.uuid4().hex
+        self.rooms: Dict[str, BoardRoom] = {}
+        self.pubsub = pubsub or _make_pubsub()
+        self._started = False
+        self._snapshot_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        await self.pubsub.start(self.on_event)
+        self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+    async def stop(self) -> None:
+        """Write back every room and stop background work (app shutdown)."""
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        for room in list(self.rooms.values()):
+            await self.flush(room)
+        await self.pubsub.stop()
+        self._started = False
+
+    async def join(self, board: dict, socket, user_id: str) -> BoardRoom:
+        await self.start()
+        key = str(board["_id"])
+        room = self.rooms.get(key)
+        if room is None:
+            room = self.rooms[key] = BoardRoom(board)
+        room.sockets[socket] = user_id
+        await socket.send_json(room.snapshot_message())
+        await room.broadcast(room.presence_message())
+        return room
+
+    async def leave(self, room: BoardRoom, socket) -> None:
+        room.sockets.pop(socket, None)
+        if room.sockets:
+            await room.broadcast(room.presence_message())
+            return
+        await self.flush(room)
+        # A socket may have joined while the flush was awaiting.
+        if not room.sockets and self.rooms.get(room.board_key) is room:
+            del self.rooms[room.board_key]
+
+    async def submit(self, room: BoardRoom, raw_ops: List[dict], user_id: str, sender) -> None:
+        """Apply a client's ops locally, echo them to the room, fan out to other workers."""
+        ops = blackboard_ops.compact_ops(raw_ops)
+        async with room.lock:
+            room.apply(ops)
+            room.pending.extend(raw_ops)
+            message = {"type": "ops", "ops": ops, "user_id": user_id, "seq": room.seq}
+        await room.broadcast(message, exclude=sender)
+        await sender.send_json({"type": "ack", "seq": room.seq})
+        await self.publish({"board_id": room.board_key, "kind": "ops", "ops": ops,
+                            "user_id": user_id, "origin": self.worker_id})
+
+    async def publish(self, event: dict) -> None:
+        try:
+            await self.pubsub.publish(event)
+        except Exception as exc:
+            logger.warning(f"[blackboard_sync] Publish failed for board {event.get('board_id')}: {exc}")
+
+    async def on_event(self, event: dict) -> None:
+        """Events from other workers or from REST writes."""
+        if event.get("origin") == self.worker_id:
+            return
+        room = self.rooms.get(str(event.get("board_id")))
+        if room is None:
+            return
+        if event.get("kind") == "reload":
+            if event.get("discard_pending"):
+                async with room.lock:
+                    room.pending = []
+            else:
+                await self.flush(room)
+            board = await blackboards_collection.find_one({"_id": room.object_id}, {"nodes": 1, "edges": 1})
+            async with room.lock:
+                room.nodes = list((board or {}).get("nodes") or [])
+                room.edges = list((board or {}).get("edges") or [])
+                room.seq += 1
+            await room.broadcast(room.snapshot_message())
+            return
+        async with room.lock:
+            room.apply(event.get("ops") or [])
+            message = {"type": "ops", "ops": event.get("ops") or [], "user_id": event.get("user_id"), "seq": room.seq}
+        await room.broadcast(message)
+
+    async def flush(self, room: BoardRoom) -> None:
+        """Write a room's pending ops back to ``blackboards`` as one compacted patch."""
+        async with room.lock:
+            raw_ops, room.pending = room.pending, []
+        if not raw_ops:
+            return
+        ops = blackboard_ops.compact_ops(raw_ops)
+        now = datetime.now(timezone.utc)
+        try:
+            result = await blackboards_collection.find_one_and_update(
+                {"_id": room.object_id, "deleted_at": None},
+                blackboard_ops.patch_pipeline(ops, now),
+                projection={"version": 1},
+                return_document=True,
+            )
+        except Exception as exc:
+            logger.warning(f"[blackboard_sync] Snapshot of board {room.board_key} failed: {exc}")
+            async with room.lock:
+                room.pending[:0] = raw_ops
+            return
+        if result is not None:
+            await blackboard_ops.record(str(result["_id"]), result["version"], "realtime", ops, now)
+
+    async def _snapshot_loop(self) -> None:
+        while True:
+            await asyncio.sleep(SNAPSHOT_SECONDS)
+            for room in list(self.rooms.values()):
+                await self.flush(room)
+
+
+hub = BoardSyncHub()
@@ -0,0 +1,195 @@
+"""
+Declarative soft-delete cascade over the collections, and its inverse.
+
+``CASCADE_GRAPH`` lists, per collection, the child collections whose documents
+point at it and the field holding that reference:
+
+    annual_plans ─┬─ focus_areas.annual_plan_id ─┬─ goals.focus_area_id ── activities.goal_id
+                  └─ priorities.annual_plan_id   └─ priorities.focus_area_id
+    decks ─────── cards.deck_id
+    books ─────── book_blocks.book_id
+
+References are matched in every stored form until their collection is
+normalized (``app/utils/ids.py``).
+
+``soft_delete`` walks the graph from a root filter in batches of ids with
+``$in`` — no ``to_list`` caps, so large accounts leave no orphans. Each batch
+is handled children-first and the parents are marked last, so a run that
+dies half way leaves its roots live and simply re-running it finishes the
+job; already-deleted documents are skipped, which makes reruns idempotent.
+
+Every document deleted by one cascade is stamped ``deleted_via`` with the
+root's key (``"annual_plans:<id>"``, ``"users:<id>"``). ``restore`` walks the
+same graph matching that stamp, so undeleting a plan brings back exactly
+what the plan's deletion took — not a goal the user had deleted on its own
+the week before. Restore does not re-publish anything ``soft_delete`` set
+private.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config.database import db
+from app.utils import ids
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Parent ids handled per round (one find, one update per child edge, one update).
+BATCH_SIZE: int = 500
+
+
+@dataclass(frozen=True)
+class Edge:
+    """Documents in ``child`` whose ``field`` holds a parent's id."""
+
+    child: str
+    field: str
+
+
+CASCADE_GRAPH: Dict[str, Tuple[Edge, ...]] = {
+    "annual_plans": (Edge("focus_areas", "annual_plan_id"), Edge("priorities", "annual_plan_id")),
+    "focus_areas": (Edge("goals", "focus_area_id"), Edge("priorities", "focus_area_id")),
+    "goals": (Edge("activities", "goal_id"),),
+    "decks": (Edge("cards", "deck_id"),),
+    "books": (Edge("book_blocks", "book_id"),),
+}
+
+#: Collections whose documents can be public; deleting one also unpublishes it.
+UNPUBLISH_ON_DELETE = frozenset({"books", "decks", "cards"})
+
+#: Top-level collections of an account and the field naming their owner.
+ACCOUNT_ROOTS: Tuple[Tuple[str, str], ...] = (
+    ("books", "user_id"),
+    ("decks", "user_id"),
+    ("cards", "user_id"),
+    ("study_sessions", "user_id"),
+    ("annual_plans", "user_id"),
+    ("tasks", "user_id"),
+    ("daily_routines", "user_id"),
+    ("blackboards", "owner_user_id"),
+)
+
+
+def root_key(collection: str, doc_id: Any) -> str:
+    """The ``deleted_via`` stamp for a cascade rooted at one document."""
+    return f"{collection}:{doc_id}"
+
+
+def _reference_values(edge: Edge, parent_ids: List[Any]) -> List[Any]:
+    if edge.field in ids.CANONICAL_REFERENCES.get(edge.child, {}):
+        return ids.ref_values(edge.child, edge.field, parent_ids)
+    # Other references are stored as the parent id's string form.
+    return [str(i) for i in parent_ids]
+
+
+def _delete_update(collection: str, via: str, user_id: Optional[str], now: datetime) -> dict:
+    fields: Dict[str, Any] = {"deleted_at": now, "deleted_by": user_id, "deleted_via": via, "updated_at": now}
+    if collection in UNPUBLISH_ON_DELETE:
+        fields["is_public"] = False
+    return {"$set": fields}
+
+
+async def _walk(
+    collection: str,
+    match: dict,
+    select: dict,
+    update_for: Callable[[str], dict],
+    counts: Dict[str, int],
+) -> None:
+    """Apply one cascade step to the documents of ``collection`` matching ``match``.
+
+    ``select`` makes a document eligible (live for delete, stamped for
+    restore); ``update_for(collection)`` builds the update to apply.
+    """
+    target = db[collection]
+    selector = {**match, **select}
+    update = update_for(collection)
+    edges = CASCADE_GRAPH.get(collection, ())
+
+    if not edges:
+        result = await target.update_many(selector, update)
+        counts[collection] = counts.get(collection, 0) + result.modified_count
+        return
+
+    # Updated documents stop matching ``selector``, so each round picks up the
+    # next batch and the loop ends once nothing eligible is left.
+    while True:
+        batch = [doc["_id"] for doc in await target.find(selector, {"_id": 1}).limit(BATCH_SIZE).to_list(BATCH_SIZE)]
+        if not batch:
+            return
+        for edge in edges:
+            await _walk(edge.child, {edge.field: {"$in": _reference_values(edge, batch)}}, select, update_for, counts)
+        result = await target.update_many({"_id": {"$in": batch}, **select}, update)
+        counts[collection] = counts.get(collection, 0) + result.modified_count
+        if result.modified_count == 0:
+            # Nothing changed under us, so the same batch would come back forever.
+            logger.warning(f"[cascade] {collection}: batch of {len(batch)} matched but was not updated; stopping")
+            return
+
+
+async def soft_delete(
+    collection: str,
+    match: dict,
+    *,
+    via: str,
+    user_id: Optional[str] = None,
+    now: Optional[datetime] = None,
+) -> Dict[str, int]:
+    """
+    Soft-delete the live documents of ``collection`` matching ``match`` and
+    everything below them in the graph. Returns modified counts per collection.
+    """
+    now = now or datetime.now(timezone.utc)
+    counts: Dict[str, int] = {}
+    await _walk(
+        collection, match, {"deleted_at": None},
+        lambda name: _delete_update(name, via, user_id, now), counts,
+    )
+    return counts
+
+
+async def restore(collection: str, match: dict, *, via: str, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Undo ``soft_delete`` for the documents it stamped ``via``, in the same graph."""
+    update = {
+        "$set": {"deleted_at": None, "deleted_by": None, "updated_at": now or datetime.now(timezone.utc)},
+        "$unset": {"deleted_via": ""},
+    }
+    counts: Dict[str, int] = {}
+    await _walk(collection, match, {"deleted_via": via}, lambda _name: update, counts)
+    return counts
+
+
+async def soft_delete_account(user_id: str, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Soft-delete everything the user owns, stamped ``users:<user_id>``."""
+    now = now or datetime.now(timezone.utc)
+    via = root_key("users", user_id)
+    counts: Dict[str, int] = {}
+    for collection, owner_field in ACCOUNT_ROOTS:
+        for name, modified in (await soft_delete(collection, {owner_field: user_id}, via=via, user_id=user_id, now=now)).items():
+            counts[name] = counts.get(name, 0) + modified
+    return counts
+
+
+async def restore_account(user_id: str) -> Dict[str, int]:
+    """Bring back what ``soft_delete_account`` removed, if the TTL hasn't purged it."""
+    via = root_key("users", user_id)
+    counts: Dict[str, int] = {}
+    for collection, owner_field in ACCOUNT_ROOTS:
+        for name, modified in (await restore(collection, {owner_field: user_id}, via=via)).items():
+            counts[name] = counts.get(name, 0) + modified
+    return counts
+
+
+__all__ = [
+    "ACCOUNT_ROOTS",
+    "CASCADE_GRAPH",
+    "Edge",
+    "restore",
+    "restore_account",
+    "root_key",
+    "soft_delete",
+    "soft_delete_account",
+]
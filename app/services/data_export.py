@@ -0,0 +1,410 @@
+"""
+Streaming user data export (GDPR) — JSON, NDJSON or ZIP of NDJSON files.
+
+Every exported collection is read through a batched cursor and written out as
+it arrives, so a worker holds one batch (and one output chunk) at a time
+rather than the whole account:
+
+    books → decks → cards → tasks → annual_plans → goals
+
+Three encodings share that single pass:
+
+- ``stream_json``   the legacy document, ``{"exported_at", "user_email",
+  "books": [...], ...}``, produced incrementally so existing clients parse
+  the same bytes.
+- ``stream_ndjson`` a header line, then one ``{"collection", "document"}``
+  line per record.
+- ``stream_zip``    one ``<collection>.ndjson`` file per collection plus a
+  ``manifest.json`` with record counts. The archive is written in zipfile's
+  unseekable mode (data descriptors, ZIP64), so it never has to be buffered
+  or rewound.
+
+Very large accounts can run the ZIP as a background job instead of holding an
+HTTP response open: ``start_export_job`` writes the archive to GridFS, where
+any worker can serve it until the job and artifact expire after 24 h. A user
+has at most one running job; asking again returns it. The running worker
+touches the job every ``HEARTBEAT_INTERVAL``, and a job whose heartbeat is
+older than ``STALE_AFTER`` (its worker died) is marked failed.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import uuid
+import zipfile
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from app.config.database import (
+    annual_plans_collection,
+    books_collection,
+    decks_collection,
+    export_files_bucket,
+    export_jobs_collection,
+    focus_areas_collection,
+    goals_collection,
+    study_cards_collection,
+    tasks_collection,
+)
+from app.services import planning_scope
+from app.utils.book_content import with_full_content
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Cursor batch size for small documents (cards, tasks, plans, goals).
+BATCH_SIZE: int = 500
+
+#: Books carry their whole content, so they are fetched a few at a time.
+BOOK_BATCH_SIZE: int = 20
+
+#: Output is flushed to the client once this many bytes are buffered.
+CHUNK_BYTES: int = 64 * 1024
+
+#: Background exports (job document and GridFS artifact) live this long.
+ARTIFACT_TTL = timedelta(hours=24)
+
+#: A running job's worker refreshes ``updated_at`` this often.
+HEARTBEAT_INTERVAL = timedelta(seconds=30)
+
+#: A running job not refreshed for this long has lost its worker.
+STALE_AFTER = timedelta(minutes=5)
+
+_STALE_ERROR = "Export was interrupted. Please try again."
+
+# Strong references to in-flight export tasks so they are not garbage-collected
+# mid-run (asyncio only keeps weak references to tasks).
+_background_jobs: set = set()
+
+Section = Tuple[str, Callable[[], AsyncIterator[dict]]]
+
+
+def serialize_doc(doc: dict) -> dict:
+    """Convert a MongoDB document to a JSON-serializable dict.
+
+    Handles ObjectId → str, datetime → ISO string, and nested structures.
+    """
+    result = {}
+    for key, value in doc.items():
+        if type(value).__name__ == "ObjectId":
+            result[key] = str(value)
+        elif hasattr(value, "isoformat"):  # datetime / date
+            result[key] = value.isoformat()
+        elif isinstance(value, dict):
+            result[key] = serialize_doc(value)
+        elif isinstance(value, list):
+            result[key] = [
+                serialize_doc(v) if isinstance(v, dict)
+                else str(v) if type(v).__name__ == "ObjectId"
+                else v
+                for v in value
+            ]
+        else:
+            result[key] = value
+    return result
+
+
+def _dumps(value: Any) -> str:
+    # Same encoding as Starlette's JSONResponse; default=str covers stray BSON types.
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def export_sections(user_id: str) -> List[Section]:
+    """
+    The exported collections in order, each as a factory for an async iterator
+    of serialized documents. Sections must be consumed in order: goals are
+    found through the plans read by the annual_plans section.
+    """
+    owned = {"user_id": user_id, "deleted_at": None}
+    plan_ids: List[str] = []
+
+    def _owned(collection, batch_size: int = BATCH_SIZE) -> Callable[[], AsyncIterator[dict]]:
+        async def documents() -> AsyncIterator[dict]:
+            async for doc in collection.find(owned).batch_size(batch_size):
+                yield serialize_doc(doc)
+        return documents
+
+    async def books() -> AsyncIterator[dict]:
+        # Block-stored books export their content as a full_content string.
+        async for book in books_collection.find(owned).batch_size(BOOK_BATCH_SIZE):
+            yield serialize_doc(await with_full_content(book))
+
+    async def annual_plans() -> AsyncIterator[dict]:
+        async for plan in annual_plans_collection.find(owned).batch_size(BATCH_SIZE):
+            plan_ids.append(str(plan["_id"]))
+            yield serialize_doc(plan)
+
+    async def goals() -> AsyncIterator[dict]:
+        if planning_scope.owner_stamped():
+            async for goal in goals_collection.find(
+                {"user_id": user_id, "deleted_at": None}
+            ).batch_size(BATCH_SIZE):
+                yield serialize_doc(goal)
+            return
+        # Legacy goals may lack user_id, so reach them via their focus areas.
+        if not plan_ids:
+            return
+        focus_area_ids = [
+            str(fa["_id"])
+            async for fa in focus_areas_collection.find(
+                {"annual_plan_id": {"$in": plan_ids}, "deleted_at": None}, {"_id": 1}
+            )
+        ]
+        if not focus_area_ids:
+            return
+        async for goal in goals_collection.find(
+            {"focus_area_id": {"$in": focus_area_ids}, "deleted_at": None}
+        ).batch_size(BATCH_SIZE):
+            yield serialize_doc(goal)
+
+    return [
+        ("books", books),
+        ("decks", _owned(decks_collection)),
+        ("cards", _owned(study_cards_collection)),
+        ("tasks", _owned(tasks_collection)),
+        ("annual_plans", annual_plans),
+        ("goals", goals),
+    ]
+
+
+async def stream_json(user_id: str, user_email: str, exported_at: datetime) -> AsyncIterator[bytes]:
+    """The legacy single-document export, emitted chunk by chunk."""
+    parts: List[str] = [
+        '{"exported_at":', _dumps(exported_at.isoformat()),
+        ',"user_email":', _dumps(user_email),
+    ]
+    size = 0
+    for name, documents in export_sections(user_id):
+        parts.append(f',"{name}":[')
+        separator = ""
+        async for doc in documents():
+            line = separator + _dumps(doc)
+            parts.append(line)
+            size += len(line)
+            separator = ","
+            if size >= CHUNK_BYTES:
+                yield "".join(parts).encode("utf-8")
+                parts, size = [], 0
+        parts.append("]")
+    parts.append("}")
+    yield "".join(parts).encode("utf-8")
+
+
+async def stream_ndjson(user_id: str, user_email: str, exported_at: datetime) -> AsyncIterator[bytes]:
+    """A header line, then one ``{"collection", "document"}`` line per record."""
+    parts = [_dumps({"exported_at": exported_at.isoformat(), "user_email": user_email}) + "\n"]
+    size = 0
+    for name, documents in export_sections(user_id):
+        async for doc in documents():
+            line = _dumps({"collection": name, "document": doc}) + "\n"
+            parts.append(line)
+            size += len(line)
+            if size >= CHUNK_BYTES:
+                yield "".join(parts).encode("utf-8")
+                parts, size = [], 0
+    yield "".join(parts).encode("utf-8")
+
+
+class _ChunkSink:
+    """Write-only file object: zipfile appends bytes, the generator drains them.
+
+    No ``seek``/``tell``, so ZipFile switches to streaming mode.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+async def stream_zip(
+    user_id: str,
+    user_email: str,
+    exported_at: datetime,
+    counts: Optional[Dict[str, int]] = None,
+) -> AsyncIterator[bytes]:
+    """
+    A ZIP with ``<collection>.ndjson`` per collection and a trailing
+    ``manifest.json``. ``counts`` (when given) is filled with per-collection
+    record counts as the export runs.
+    """
+    counts = {} if counts is None else counts
+    sink = _ChunkSink()
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED)
+    for name, documents in export_sections(user_id):
+        counts[name] = 0
+        with archive.open(f"{name}.ndjson", "w", force_zip64=True) as member:
+            parts, size = [], 0
+            async for doc in documents():
+                line = _dumps(doc) + "\n"
+                parts.append(line)
+                size += len(line)
+                counts[name] += 1
+                if size >= CHUNK_BYTES:
+                    # Deflate off the event loop; members are written one at a time.
+                    await asyncio.to_thread(member.write, "".join(parts).encode("utf-8"))
+                    parts, size = [], 0
+                    yield sink.drain()
+            if parts:
+                await asyncio.to_thread(member.write, "".join(parts).encode("utf-8"))
+        yield sink.drain()
+
+    manifest = {
+        "exported_at": exported_at.isoformat(),
+        "user_email": user_email,
+        "format": "ndjson",
+        "record_counts": counts,
+    }
+    archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+    archive.close()
+    yield sink.drain()
+
+
+def export_filename(exported_at: datetime, extension: str) -> str:
+    return f"nowry_export_{exported_at.strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+# ---------------------------------------------------------------------------
+# Background export jobs
+# ---------------------------------------------------------------------------
+
+async def _update_job(export_id: str, **fields: Any) -> None:
+    fields["updated_at"] = datetime.now(timezone.utc)
+    await export_jobs_collection.update_one({"export_id": export_id}, {"$set": fields})
+
+
+async def _sweep_expired_artifacts() -> int:
+    """Delete archives older than ARTIFACT_TTL; their job documents expire by TTL."""
+    cutoff = datetime.now(timezone.utc) - ARTIFACT_TTL
+    removed = 0
+    async for grid_out in export_files_bucket.find({"uploadDate": {"$lt": cutoff}}):
+        await export_files_bucket.delete(grid_out._id)
+        removed += 1
+    return removed
+
+
+async def _run_export_job(export_id: str, user_id: str, user_email: str, exported_at: datetime) -> None:
+    try:
+        await _sweep_expired_artifacts()
+        counts: Dict[str, int] = {}
+        filename = export_filename(exported_at, "zip")
+        upload = export_files_bucket.open_upload_stream(
+            filename, metadata={"user_id": user_id, "export_id": export_id},
+        )
+        size = 0
+        heartbeat = datetime.now(timezone.utc)
+        try:
+            async for chunk in stream_zip(user_id, user_email, exported_at, counts):
+                if chunk:
+                    await upload.write(chunk)
+                    size += len(chunk)
+                if datetime.now(timezone.utc) - heartbeat >= HEARTBEAT_INTERVAL:
+                    heartbeat = datetime.now(timezone.utc)
+                    await _update_job(export_id)
+            await upload.close()
+        except BaseException:
+            await upload.abort()
+            raise
+        await _update_job(
+            export_id, status="ready", file_id=upload._id, filename=filename,
+            size_bytes=size, record_counts=counts,
+        )
+        logger.info(f"[export:{export_id}] Ready: {size} bytes, {sum(counts.values())} records")
+    except asyncio.CancelledError:
+        await _update_job(export_id, status="failed", error="Export was interrupted.")
+        raise
+    except Exception as exc:
+        logger.error(f"[export:{export_id}] Failed: {exc}", exc_info=True)
+        await _update_job(export_id, status="failed", error="Export failed. Please try again.")
+
+
+async def _fail_stale_jobs(user_id: str, now: datetime) -> None:
+    await export_jobs_collection.update_many(
+        {"user_id": user_id, "status": "running", "updated_at": {"$lt": now - STALE_AFTER}},
+        {"$set": {"status": "failed", "error": _STALE_ERROR, "updated_at": now}},
+    )
+
+
+async def start_export_job(user_id: str, user_email: str) -> dict:
+    """
+    Create a job document and build the ZIP in the background. Returns the
+    user's running job instead when there is one.
+    """
+    now = datetime.now(timezone.utc)
+    await _fail_stale_jobs(user_id, now)
+    running = await export_jobs_collection.find_one({"user_id": user_id, "status": "running"})
+    if running:
+        return running
+
+    job = {
+        "export_id": uuid.uuid4().hex,
+        "user_id": user_id,
+        "status": "running",
+        "format": "zip",
+        "created_at": now,
+        "updated_at": now,
+    }
+    try:
+        await export_jobs_collection.insert_one(job)
+    except DuplicateKeyError:
+        # A concurrent request started one first (export_jobs_one_running).
+        running = await export_jobs_collection.find_one({"user_id": user_id, "status": "running"})
+        if running:
+            return running
+        raise
+
+    task = asyncio.create_task(_run_export_job(job["export_id"], user_id, user_email, now))
+    _background_jobs.add(task)
+    task.add_done_callback(_background_jobs.discard)
+    return job
+
+
+async def get_export_job(export_id: str, user_id: str) -> Optional[dict]:
+    job = await export_jobs_collection.find_one({"export_id": export_id, "user_id": user_id})
+    if not job or job["status"] != "running":
+        return job
+    now = datetime.now(timezone.utc)
+    heartbeat = job["updated_at"]
+    if heartbeat.tzinfo is None:
+        heartbeat = heartbeat.replace(tzinfo=timezone.utc)
+    if heartbeat < now - STALE_AFTER:
+        await _fail_stale_jobs(user_id, now)
+        job.update(status="failed", error=_STALE_ERROR, updated_at=now)
+    return job
+
+
+async def open_artifact(job: dict):
+    """GridFS download stream for a ready job. Raises gridfs.errors.NoFile once swept."""
+    return await export_files_bucket.open_download_stream(job["file_id"])
+
+
+async def delete_user_exports(user_id: str) -> None:
+    """Remove a user's export jobs and archives (account deletion)."""
+    async for grid_out in export_files_bucket.find({"metadata.user_id": user_id}):
+        await export_files_bucket.delete(grid_out._id)
+    await export_jobs_collection.delete_many({"user_id": user_id})
+
+
+__all__ = [
+    "delete_user_exports",
+    "export_filename",
+    "export_sections",
+    "get_export_job",
+    "open_artifact",
+    "serialize_doc",
+    "start_export_job",
+    "stream_json",
+    "stream_ndjson",
+    "stream_zip",
+]
@@ -0,0 +1,367 @@
+"""
+Background RSS refresher for GET /news/{language}/{category}.
+
+The old path had several problems:
+- a per-worker dict cache that grew without bound
+- a new httpx client per request
+- feedparser running on the event loop
+- a stampede on every expiry, repeated on each gunicorn worker
+
+Now feeds live in ``news_feeds``, one document per feed URL. Each holds the
+normalized articles plus the feed's ETag / Last-Modified. A refresh loop on
+each worker re-fetches feeds older than ``REFRESH_INTERVAL`` with
+conditional GETs, so an unchanged feed costs a 304. Fetches use one pooled
+client and parse in a thread.
+
+A short lease on the document (``refreshing_until``) means only one worker
+fetches a given feed at a time.
+
+Requests are served from the store with stale-while-revalidate semantics:
+- a stale feed is returned as-is and a background refresh is kicked off
+- only a feed that has never been fetched makes the request wait
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import feedparser
+import httpx
+from pymongo.errors import DuplicateKeyError
+
+from app.config.database import news_feeds_collection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+REFRESH_INTERVAL = timedelta(minutes=int(os.getenv("NEWS_CACHE", 5)))
+#: How long a worker may hold a feed's refresh lease before others retry.
+LEASE = timedelta(seconds=60)
+MAX_ARTICLES = 15
+FETCH_CONCURRENCY = 4
+#: How long a request for a never-fetched feed waits on another worker's fetch.
+COLD_WAIT_SECONDS = 10.0
+
+# RSS feeds by language and category
+NEWS_FEEDS = {
+    "en": {
+        "general": "https://feeds.bbci.co.uk/news/rss.xml",
+        "technology": "https://feeds.bbci.co.uk/news/technology/rss.xml",
+        "science": "https://feeds.bbci.co.uk/news/science_and_environment/rss.xml",
+        "business": "https://feeds.bbci.co.uk/news/business/rss.xml",
+        "health": "https://feeds.bbci.co.uk/news/health/rss.xml",
+        "entertainment": "https://feeds.bbci.co.uk/news/entertainment_and_arts/rss.xml",
+        "politics": "https://feeds.bbci.co.uk/news/politics/rss.xml",
+    },
+    "es": {
+        "general": "https://news.google.com/rss?hl=es&gl=ES&ceid=ES:es",
+        "technology": "https://news.google.com/rss/search?q=tecnolog%C3%ADa&hl=es&gl=ES&ceid=ES:es",
+        "science": "https://news.google.com/rss/search?q=ciencia&hl=es&gl=ES&ceid=ES:es",
+        "business": "https://news.google.com/rss/search?q=econom%C3%ADa&hl=es&gl=ES&ceid=ES:es",
+        "entertainment": "https://news.google.com/rss/search?q=cultura&hl=es&gl=ES&ceid=ES:es",
+        "politics": "https://news.google.com/rss/search?q=pol%C3%ADtica&hl=es&gl=ES&ceid=ES:es",
+    },
+    "fr": {
+        "general": "https://news.google.com/rss?hl=fr&gl=FR&ceid=FR:fr",
+        "technology": "https://news.google.com/rss/search?q=technologie&hl=fr&gl=FR&ceid=FR:fr",
+        "science": "https://news.google.com/rss/search?q=science&hl=fr&gl=FR&ceid=FR:fr",
+        "business": "https://news.google.com/rss/search?q=%C3%A9conomie&hl=fr&gl=FR&ceid=FR:fr",
+        "entertainment": "https://news.google.com/rss/search?q=culture&hl=fr&gl=FR&ceid=FR:fr",
+        "politics": "https://news.google.com/rss/search?q=politique&hl=fr&gl=FR&ceid=FR:fr",
+    },
+    "de": {
+        "general": "https://news.google.com/rss?hl=de&gl=DE&ceid=DE:de",
+        "technology": "https://news.google.com/rss/search?q=technologie&hl=de&gl=DE&ceid=DE:de",
+        "science": "https://news.google.com/rss/search?q=wissenschaft&hl=de&gl=DE&ceid=DE:de",
+        "business": "https://news.google.com/rss/search?q=wirtschaft&hl=de&gl=DE&ceid=DE:de",
+        "entertainment": "https://news.google.com/rss/search?q=kultur&hl=de&gl=DE&ceid=DE:de",
+        "politics": "https://news.google.com/rss/search?q=politik&hl=de&gl=DE&ceid=DE:de",
+    },
+}
+
+# Picsum seeds for placeholder images, per category
+_PLACEHOLDER_SEEDS = {
+    "general": 100,
+    "technology": 200,
+    "science": 300,
+    "business": 400,
+    "health": 500,
+    "entertainment": 600,
+    "politics": 700,
+}
+
+_client: Optional[httpx.AsyncClient] = None
+_background: set[asyncio.Task] = set()
+_refresher_task: Optional[asyncio.Task] = None
+
+
+def extract_image_from_html(html: str) -> Optional[str]:
+    """Extract image URL from HTML content"""
+    if not html:
+        return None
+
+    # Try to find img tag
+    match = re.search(r'<img[^>]+src="([^">]+)"', html)
+    if match:
+        return match.group(1)
+
+    return None
+
+
+def strip_html(html: str) -> str:
+    """Remove HTML tags from text"""
+    if not html:
+        return ""
+    return re.sub("<[^<]+?>", "", html)
+
+
+def resolve_feed(language: str, category: str) -> tuple[str, str, Optional[str]]:
+    """(language, category, url) after the same fallbacks the endpoint always used."""
+    if language not in NEWS_FEEDS:
+        language = "en"
+    lang_feeds = NEWS_FEEDS[language]
+    if category not in lang_feeds:
+        category = "general"
+    return language, category, lang_feeds.get(category)
+
+
+def feed_key(url: str) -> str:
+    # Keyed by URL so changing a feed's URL starts a fresh document.
+    return hashlib.md5(url.encode(), usedforsecurity=False).hexdigest()
+
+
+def _entry_image(entry, category: str) -> str:
+    # Try media content
+    if getattr(entry, "media_content", None):
+        image_url = entry.media_content[0].get("url")
+        if image_url:
+            return image_url
+
+    # Try media thumbnail
+    if getattr(entry, "media_thumbnail", None):
+        image_url = entry.media_thumbnail[0].get("url")
+        if image_url:
+            return image_url
+
+    # Try enclosure
+    for enclosure in getattr(entry, "enclosures", None) or []:
+        if enclosure.get("type", "").startswith("image"):
+            return enclosure.get("href")
+
+    # Try content:encoded
+    for content in getattr(entry, "content", None) or []:
+        if content.get("type") == "text/html":
+            image_url = extract_image_from_html(content.get("value", ""))
+            if image_url:
+                return image_url
+
+    # Try extracting from description/summary
+    image_url = extract_image_from_html(getattr(entry, "description", "")) or extract_image_from_html(
+        getattr(entry, "summary", "")
+    )
+    if image_url:
+        return image_url
+
+    # Placeholder: category seed plus a per-article offset, stable across refreshes
+    url_hash = hashlib.md5(entry.link.encode(), usedforsecurity=False).hexdigest()
+    unique_id = _PLACEHOLDER_SEEDS.get(category, 100) + int(url_hash[:4], 16) % 100
+    return f"https://picsum.photos/seed/{unique_id}/800/450"
+
+
+def parse_feed(content: bytes, category: str) -> list[dict]:
+    """Parse raw RSS into the article shape the app renders. CPU-bound: run in a thread."""
+    feed = feedparser.parse(content)
+    articles = []
+    for entry in feed.entries[:MAX_ARTICLES]:
+        # Include article if it has title and link
+        if not (hasattr(entry, "title") and hasattr(entry, "link")):
+            continue
+        # Clean up description (remove HTML and Google News clutter)
+        raw_desc = getattr(entry, "summary", "") or getattr(entry, "description", "")
+        description = strip_html(raw_desc)[:200].replace("View full coverage", "").strip()
+        articles.append(
+            {
+                "title": entry.title,
+                "description": description or "Click to read more...",
+                "urlToImage": _entry_image(entry, category),
+                "url": entry.link,
+                "publishedAt": getattr(entry, "published", None),
+            }
+        )
+    return articles
+
+
+def get_client() -> httpx.AsyncClient:
+    """One pooled client per worker (keep-alive across feeds and refreshes)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=10.0,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=FETCH_CONCURRENCY * 2, max_keepalive_connections=FETCH_CONCURRENCY),
+        )
+    return _client
+
+
+async def _claim(key: str, url: str, language: str, category: str, force: bool) -> Optional[dict]:
+    """
+    Take the refresh lease for a feed. Returns the previous document (for its
+    validators) or None when another worker holds the lease, or the feed is
+    still fresh and ``force`` is off.
+    """
+    now = datetime.now(timezone.utc)
+    conditions = [{"$or": [{"refreshing_until": None}, {"refreshing_until": {"$lte": now}}]}]
+    if not force:
+        conditions.append({"$or": [{"fetched_at": None}, {"fetched_at": {"$lte": now - REFRESH_INTERVAL}}]})
+    try:
+        previous = await news_feeds_collection.find_one_and_update(
+            {"_id": key, "$and": conditions},
+            {
+                "$set": {"refreshing_until": now + LEASE},
+                "$setOnInsert": {"url": url, "language": language, "category": category, "articles": []},
+            },
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The document exists but did not match: leased or fresh.
+        return None
+    return previous or {}
+
+
+async def refresh_feed(language: str, category: str, force: bool = False) -> bool:
+    """Conditionally re-fetch one feed into the store. Returns True if this call fetched."""
+    language, category, url = resolve_feed(language, category)
+    if not url:
+        return False
+    key = feed_key(url)
+    previous = await _claim(key, url, language, category, force)
+    if previous is None:
+        return False
+
+    headers = {}
+    if previous.get("etag"):
+        headers["If-None-Match"] = previous["etag"]
+    if previous.get("last_modified"):
+        headers["If-Modified-Since"] = previous["last_modified"]
+
+    now = datetime.now(timezone.utc)
+    update: dict = {"refreshing_until": None}
+    try:
+        response = await get_client().get(url, headers=headers)
+        if response.status_code == 304:
+            update["fetched_at"] = now
+        else:
+            response.raise_for_status()
+            articles = await asyncio.to_thread(parse_feed, response.content, category)
+            update.update(
+                articles=articles,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                fetched_at=now,
+                changed_at=now,
+            )
+        update["last_error"] = None
+    except Exception as exc:
+        logger.warning(f"[news] Refresh failed for {language}/{category}: {exc}")
+        update["last_error"] = str(exc)[:300]
+    await news_feeds_collection.update_one({"_id": key}, {"$set": update})
+    return "fetched_at" in update
+
+
+def _refresh_in_background(language: str, category: str) -> None:
+    task = asyncio.create_task(refresh_feed(language, category))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def get_articles(language: str, category: str) -> Optional[dict]:
+    """
+    Serve a feed from the store: {"articles", "feed_url", "stale", "fetched_at"}.
+    Stale feeds are returned immediately while a refresh runs in the background.
+    Returns None when the feed has never been fetched and the wait for the
+    first fetch failed.
+    """
+    language, category, url = resolve_feed(language, category)
+    if not url:
+        return None
+    key = feed_key(url)
+    doc = await news_feeds_collection.find_one({"_id": key})
+
+    if not doc or not doc.get("fetched_at"):
+        # Cold feed: fetch now, or wait for the worker that is already fetching.
+        await refresh_feed(language, category)
+        deadline = asyncio.get_running_loop().time() + COLD_WAIT_SECONDS
+        doc = await news_feeds_collection.find_one({"_id": key})
+        while (not doc or not doc.get("fetched_at")) and asyncio.get_running_loop().time() < deadline:
+            if doc and doc.get("last_error") and not doc.get("refreshing_until"):
+                break
+            await asyncio.sleep(0.25)
+            doc = await news_feeds_collection.find_one({"_id": key})
+        if not doc or not doc.get("fetched_at"):
+            return None
+        return {"articles": doc["articles"], "feed_url": url, "stale": False, "fetched_at": doc["fetched_at"]}
+
+    fetched_at = doc["fetched_at"]
+    if fetched_at.tzinfo is None:
+        fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+    stale = datetime.now(timezone.utc) - fetched_at >= REFRESH_INTERVAL
+    if stale:
+        _refresh_in_background(language, category)
+    return {"articles": doc.get("articles") or [], "feed_url": url, "stale": stale, "fetched_at": doc["fetched_at"]}
+
+
+async def refresh_all() -> int:
+    """Refresh every configured feed that is due. Returns how many were fetched."""
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+    async def _one(language: str, category: str) -> bool:
+        async with semaphore:
+            return await refresh_feed(language, category)
+
+    results = await asyncio.gather(
+        *(_one(lang, cat) for lang, feeds in NEWS_FEEDS.items() for cat in feeds),
+        return_exceptions=True,
+    )
+    return sum(1 for r in results if r is True)
+
+
+async def _refresh_loop() -> None:
+    while True:
+        try:
+            await refresh_all()
+        except Exception as exc:
+            logger.warning(f"[news] Refresh cycle failed: {exc}")
+        await asyncio.sleep(REFRESH_INTERVAL.total_seconds())
+
+
+def start_refresher() -> None:
+    """Start the periodic refresh loop (app startup). NEWS_REFRESHER=0 disables it."""
+    global _refresher_task
+    if os.getenv("NEWS_REFRESHER", "1") == "0" or _refresher_task is not None:
+        return
+    _refresher_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop_refresher() -> None:
+    """Stop the loop and close the pooled client (app shutdown)."""
+    global _refresher_task, _client
+    if _refresher_task is not None:
+        _refresher_task.cancel()
+        try:
+            await _refresher_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _refresher_task = None
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def clear() -> int:
+    """Drop every stored feed; the next request or refresh cycle refetches."""
+    result = await news_feeds_collection.delete_many({})
+    return result.deleted_count
@@ -0,0 +1,104 @@
+"""
+Owner stamp on annual-planning children and the switch to user-scoped reads.
+
+Focus areas, priorities, goals and activities used to carry only their parent
+id, so proving ownership meant walking up to the plan (up to three
+``find_one`` calls for a goal) and loading a plan's data meant fanning out
+level by level. New documents are now stamped with the owner's ``user_id``
+at write time, and ``app/migrations/backfill_planning_owner.py`` stamps the
+old ones.
+
+Ownership checks read the stamp from the document itself and only walk the
+parent chain for a document that has none. Once the backfill finishes it
+records that in ``schema_meta`` (``_id: "planning_owner"``); workers read
+the flag at startup via ``load_state()``, and from then on plan reads are
+also scoped by ``user_id`` and user-wide reads (the data export) use plain
+``user_id`` lookups instead of parent-id fan-outs. Before that, an unstamped
+document would be missing from a ``user_id`` query, so those reads keep the
+parent-id form.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+from app.config.database import db, schema_meta_collection
+from app.utils import ids
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Collections stamped with their owner's ``user_id`` below annual_plans.
+PLANNING_CHILDREN: tuple = ("focus_areas", "priorities", "goals", "activities")
+
+#: Parent collection and the child field referencing it, per planning child.
+PARENTS: Dict[str, tuple] = {
+    "focus_areas": ("annual_plans", "annual_plan_id"),
+    "priorities": ("annual_plans", "annual_plan_id"),
+    "goals": ("focus_areas", "focus_area_id"),
+    "activities": ("goals", "goal_id"),
+}
+
+#: schema_meta document written when every child carries its owner.
+META_ID = "planning_owner"
+
+_stamped: bool = False
+
+
+def owner_stamped() -> bool:
+    """True once every planning child is known to carry ``user_id``."""
+    return _stamped
+
+
+async def load_state() -> bool:
+    """Read the backfill flag. Errors keep the parent-id reads."""
+    global _stamped
+    try:
+        doc = await schema_meta_collection.find_one({"_id": META_ID}, {"complete": 1})
+    except Exception as exc:
+        logger.warning(f"[planning] Could not load owner backfill state: {exc}")
+        return _stamped
+    _stamped = bool((doc or {}).get("complete"))
+    if _stamped:
+        logger.info("[planning] Plan-wide reads use user_id lookups")
+    return _stamped
+
+
+async def mark_stamped() -> None:
+    await schema_meta_collection.update_one(
+        {"_id": META_ID}, {"$set": {"complete": True}}, upsert=True,
+    )
+
+
+async def resolve_owners(collection: str, docs: List[dict]) -> Dict[str, Optional[str]]:
+    """
+    Owner of each document in ``docs``, keyed by ``str(_id)``.
+
+    Stamped documents answer for themselves; unstamped ones are resolved
+    through their parents with one ``$in`` query per level, however many
+    documents are asked about. None means no owner could be found.
+    """
+    owners: Dict[str, Optional[str]] = {}
+    waiting: Dict[str, List[str]] = {}
+    parent, field = PARENTS.get(collection, (None, None))
+    for doc in docs:
+        key = str(doc["_id"])
+        if doc.get("user_id") is not None:
+            owners[key] = str(doc["user_id"])
+        elif parent and doc.get(field) is not None:
+            waiting.setdefault(str(doc[field]), []).append(key)
+        else:
+            owners[key] = None
+
+    if waiting:
+        projection = {"user_id": 1, **({PARENTS[parent][1]: 1} if parent in PARENTS else {})}
+        parents = await db[parent].find(
+            {"_id": {"$in": ids.id_values(parent, waiting)}}, projection
+        ).to_list(length=None)
+        parent_owners = await resolve_owners(parent, parents)
+        for parent_id, keys in waiting.items():
+            for key in keys:
+                owners[key] = parent_owners.get(parent_id)
+    return owners
+
+
+__all__ = ["PARENTS", "PLANNING_CHILDREN", "load_state", "mark_stamped", "owner_stamped", "resolve_owners"]
@@ -34,6 +34,8 @@ from app.models.User import (
     normalize_onboarding_state,
     onboarding_activation_update,
 )
+from app.utils import ids
+from app.utils.book_content import with_full_content
 
 #: Hard ceiling on any browse page, enforced in the service so no caller can
 #: request an unbounded read even if it bypasses the router's Query bound.
@@ -481,7 +483,8 @@ class PublicContentService:
 
         # Paginate
         skip = (page - 1) * page_size
-        items = await collection.find(query).sort(
+        # Browse cards never need a deck's legacy card id array
+        items = await collection.find(query, {"cards": 0} if content_type == "deck" else None).sort(
             _browse_sort_fields(sort_by)
         ).skip(skip).limit(page_size).to_list(page_size)
 
@@ -701,6 +704,9 @@ class PublicContentService:
             })
             user_liked = existing_like is not None
 
+        if content_type == "book":
+            content = await with_full_content(content)
+
         serialized = _strip_stored_curation(self._serialize_doc(content))
         serialized["user_liked"] = user_liked
         return serialized
@@ -1088,7 +1094,7 @@ class PublicContentService:
 
         if content_type == "deck":
             await self.db["cards"].delete_many({
-                "deck_id": {"$in": [str(forked_oid), forked_oid]},
+                "deck_id": ids.ref_value("cards", "deck_id", forked_oid),
                 "user_id": owner,
             })
         await collection.delete_one({"_id": forked_oid, "user_id": owner})
@@ -1136,6 +1142,10 @@ class PublicContentService:
 
         forked_content = dict(original)
         forked_content.pop("_id")
+        if content_type == "book":
+            # The copy starts as a single full_content string; it is split
+            # into its own blocks on its first save.
+            forked_content = await with_full_content(forked_content)
         forked_content["user_id"] = forking_user_id
         forked_content["is_public"] = False
         forked_content["published_at"] = None
@@ -1154,9 +1164,10 @@ class PublicContentService:
             "author_id": str(original_user_id) if original_user_id else None,
         }
 
-        # For decks, reset card refs — they are repopulated after the card copy
+        # For decks, reset the card count (set after the card copy) and drop any
+        # legacy card id array — cards reach their deck through cards.deck_id
         if content_type == "deck":
-            forked_content["cards"] = []
+            forked_content.pop("cards", None)
             forked_content["total_cards"] = 0
 
         result = await collection.insert_one(forked_content)
@@ -1206,7 +1217,7 @@ class PublicContentService:
         original_oid = original["_id"]
         forking_user_id = record["forked_by_user_id"]
         original_cards = await self.db["cards"].find(
-            {"deck_id": {"$in": [original_oid, str(original_oid)]}}
+            {"deck_id": ids.ref_value("cards", "deck_id", original_oid)}
         ).to_list(length=MAX_FORK_CARDS)
 
         if not original_cards:
@@ -1217,7 +1228,7 @@ class PublicContentService:
         for card in original_cards:
             new_card = dict(card)
             new_card.pop("_id")
-            new_card["deck_id"] = str(forked_oid)
+            new_card["deck_id"] = ids.canonical_ref("cards", "deck_id", forked_oid)
             new_card["user_id"] = forking_user_id
             new_card["created_at"] = now
             new_card["updated_at"] = now
@@ -1234,10 +1245,7 @@ class PublicContentService:
 
         await collection.update_one(
             {"_id": forked_oid},
-            {"$set": {
-                "total_cards": len(new_cards),
-                "cards": [str(oid) for oid in insert_result.inserted_ids],
-            }},
+            {"$set": {"total_cards": len(insert_result.inserted_ids)}},
         )
 
     async def _complete_fork_claim(
@@ -0,0 +1,316 @@
+"""
+Per-user usage counters for the plan limits in ``SUBSCRIPTION_PLANS``.
+
+Creating a card or a book used to run ``count_documents`` over the user's
+documents before every insert — an index scan that grows with the account,
+racy (two concurrent creates could both pass at ``limit - 1``), and in the
+APKG import it failed open on any error.
+
+Live counts now sit on the user document under ``usage``
+(``usage.flashcards``, ``usage.quiz_questions``, ``usage.visual_diagrams``,
+``usage.books``). ``reserve`` admits a create with one conditional ``$inc``:
+the filter holds one branch per tier with that tier's limit, so the check
+and the increment are a single atomic round-trip with no prior read. Deletes
+``release`` their slot; creates that are not limited still ``track`` theirs.
+
+A counter that does not exist yet is seeded from one ``count_documents`` the
+first time it is needed. Soft-deleted documents do not count. Anything that
+moves documents in bulk without touching the counters (deck cascades,
+account restores, a failed write between insert and ``$inc``) is corrected
+by ``reconcile``: ``recount`` fixes one user right away, and a background
+loop recounts every user each ``RECONCILE_INTERVAL``, writing only counters
+that drifted and only if they did not move in the meantime.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from app.config.database import books_collection, cards_collection, schema_meta_collection, users_collection
+from app.config.subscription_plans import SUBSCRIPTION_PLANS, SubscriptionTier
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Card-backed counters, keyed like ``SUBSCRIPTION_PLANS[...]["limits"]``.
+CARD_KEYS: tuple = ("flashcards", "quiz_questions", "visual_diagrams")
+#: Every counter kept under ``users.usage``.
+QUOTA_KEYS: tuple = CARD_KEYS + ("books",)
+
+#: How often the background loop recounts every user.
+RECONCILE_INTERVAL = timedelta(hours=float(os.getenv("QUOTA_RECONCILE_HOURS", 6)))
+#: How long one worker may hold the reconcile lease before another retries.
+LEASE = timedelta(minutes=30)
+#: Users recounted per round.
+BATCH_SIZE: int = 500
+
+_LEASE_ID = "quota_reconcile"
+#: Card types counted against something other than ``flashcards``.
+_CARD_TYPE_KEYS: Dict[str, str] = {"quiz": "quiz_questions", "visual": "visual_diagrams"}
+_reconciler_task: Optional[asyncio.Task] = None
+
+
+def card_quota_key(card_type: Optional[str]) -> str:
+    """The counter a card of ``card_type`` counts against."""
+    return _CARD_TYPE_KEYS.get(card_type, "flashcards")
+
+
+def _field(key: str) -> str:
+    return f"usage.{key}"
+
+
+def _live_filter(user_id: str, key: str) -> dict:
+    """Documents counted by ``key`` — the same rule ``reconcile`` applies."""
+    if key == "books":
+        return {"user_id": user_id, "deleted_at": None}
+    card_types = {
+        "flashcards": {"$nin": ["quiz", "visual"]},
+        "quiz_questions": "quiz",
+        "visual_diagrams": "visual",
+    }[key]
+    return {"user_id": user_id, "card_type": card_types, "deleted_at": None}
+
+
+def _admit_filter(user_id: str, key: str, amount: int) -> dict:
+    """Match the user only if ``amount`` more fits under their tier's limit."""
+    field = _field(key)
+    paid = [tier.value for tier in SubscriptionTier if tier != SubscriptionTier.FREE]
+    branches = []
+    for tier, plan in SUBSCRIPTION_PLANS.items():
+        # Unknown or missing tiers fall back to Free, as everywhere else.
+        tier_match = {"$nin": paid} if tier == SubscriptionTier.FREE else tier.value
+        limit = plan["limits"].get(key, 0)
+        room = {"$exists": True} if limit == -1 else {"$lte": limit - amount}
+        branches.append({"subscription.tier": tier_match, field: room})
+    return {"_id": ObjectId(user_id), "$or": branches}
+
+
+def _plan_for(user: dict) -> dict:
+    tier_key = (user.get("subscription") or {}).get("tier", "free")
+    return SUBSCRIPTION_PLANS.get(tier_key, SUBSCRIPTION_PLANS[SubscriptionTier.FREE])
+
+
+async def _seed(user_id: str, key: str) -> None:
+    """Create a missing counter from the user's current documents."""
+    collection = books_collection if key == "books" else cards_collection
+    count = await collection.count_documents(_live_filter(user_id, key))
+    await users_collection.update_one(
+        {"_id": ObjectId(user_id), _field(key): {"$exists": False}},
+        {"$set": {_field(key): count}},
+    )
+
+
+async def _load(user_id: str, key: str) -> dict:
+    """The user's tier and counters, seeding ``key`` first if needed."""
+    user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"subscription.tier": 1, "usage": 1})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if key not in (user.get("usage") or {}):
+        await _seed(user_id, key)
+        user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"subscription.tier": 1, "usage": 1})
+    return user
+
+
+async def try_reserve(user_id: str, key: str, amount: int = 1) -> bool:
+    """Count ``amount`` new documents against ``key`` if they fit. False if not."""
+    admit = _admit_filter(user_id, key, amount)
+    result = await users_collection.update_one(admit, {"$inc": {_field(key): amount}})
+    if result.modified_count:
+        return True
+    # No match: the limit is reached, or the counter does not exist yet.
+    user = await users_collection.find_one({"_id": ObjectId(user_id)}, {_field(key): 1})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if key in (user.get("usage") or {}):
+        return False
+    await _seed(user_id, key)
+    result = await users_collection.update_one(admit, {"$inc": {_field(key): amount}})
+    return bool(result.modified_count)
+
+
+async def reserve(user_id: str, key: str, amount: int = 1) -> None:
+    """``try_reserve``, raising 403 with the plan's upgrade message when full."""
+    if await try_reserve(user_id, key, amount):
+        return
+    user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"subscription.tier": 1})
+    plan = _plan_for(user or {})
+    if key == "books":
+        detail = f"Book limit reached for {plan['name']} plan. Upgrade to create more books."
+    else:
+        feature_name = key.replace("_", " ").title()
+        detail = f"{feature_name} limit reached for {plan['name']} plan. Upgrade to create more."
+    raise HTTPException(status_code=403, detail=detail)
+
+
+async def release(user_id: str, key: Optional[str], amount: int = 1) -> None:
+    """Give back ``amount`` slots (a delete, or a reserved create that failed)."""
+    if not key or amount <= 0:
+        return
+    await users_collection.update_one(
+        {"_id": ObjectId(user_id), _field(key): {"$gte": amount}},
+        {"$inc": {_field(key): -amount}},
+    )
+
+
+async def track(user_id: str, key: Optional[str], amount: int = 1) -> None:
+    """Count documents created without a limit check. Unseeded counters are left to seeding."""
+    if not key or amount <= 0:
+        return
+    await users_collection.update_one(
+        {"_id": ObjectId(user_id), _field(key): {"$exists": True}},
+        {"$inc": {_field(key): amount}},
+    )
+
+
+async def remaining(user_id: str, key: str) -> int:
+    """Slots left under ``key`` for the user's plan. -1 means unlimited."""
+    user = await _load(user_id, key)
+    limit = _plan_for(user)["limits"].get(key, 0)
+    if limit == -1:
+        return -1
+    return max(0, limit - (user.get("usage") or {}).get(key, 0))
+
+
+async def _counts(user_ids: List[str]) -> Dict[str, Dict[str, int]]:
+    """
+    Live counts per user for every key, from two aggregations. Cards are
+    grouped by counter rather than by raw ``card_type``, so each result holds
+    at most one row per user and key.
+    """
+    counts = {user_id: {key: 0 for key in QUOTA_KEYS} for user_id in user_ids}
+    card_key = {"$switch": {
+        "branches": [
+            {"case": {"$eq": ["$card_type", card_type]}, "then": key}
+            for card_type, key in _CARD_TYPE_KEYS.items()
+        ],
+        "default": "flashcards",
+    }}
+    card_groups = await cards_collection.aggregate([
+        {"$match": {"user_id": {"$in": user_ids}, "deleted_at": None}},
+        {"$group": {"_id": {"user_id": "$user_id", "key": card_key}, "n": {"$sum": 1}}},
+    ]).to_list(length=len(user_ids) * len(QUOTA_KEYS))
+    for group in card_groups:
+        counts[group["_id"]["user_id"]][group["_id"]["key"]] += group["n"]
+    book_groups = await books_collection.aggregate([
+        {"$match": {"user_id": {"$in": user_ids}, "deleted_at": None}},
+        {"$group": {"_id": "$user_id", "n": {"$sum": 1}}},
+    ]).to_list(length=len(user_ids))
+    for group in book_groups:
+        counts[group["_id"]]["books"] = group["n"]
+    return counts
+
+
+def _corrections(users: List[dict], counts: Dict[str, Dict[str, int]], keys: Iterable[str]) -> List[UpdateOne]:
+    """One compare-and-set per drifted counter, so a concurrent $inc is never overwritten."""
+    updates = []
+    for user in users:
+        stored = user.get("usage") or {}
+        for key in keys:
+            actual = counts[str(user["_id"])][key]
+            if stored.get(key) != actual:
+                updates.append(UpdateOne(
+                    {"_id": user["_id"], _field(key): stored.get(key)},
+                    {"$set": {_field(key): actual}},
+                ))
+    return updates
+
+
+async def recount(user_id: str, keys: Iterable[str] = QUOTA_KEYS) -> int:
+    """Reconcile one user's counters now. Returns how many were corrected."""
+    user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"usage": 1})
+    if not user:
+        return 0
+    updates = _corrections([user], await _counts([user_id]), keys)
+    if updates:
+        await users_collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+async def reconcile(apply_changes: bool = True) -> Dict[str, int]:
+    """Recount every user in batches. Returns users seen and counters (to be) corrected."""
+    seen = 0
+    corrected = 0
+    batch: List[dict] = []
+
+    async def flush() -> int:
+        updates = _corrections(batch, await _counts([str(u["_id"]) for u in batch]), QUOTA_KEYS)
+        if updates and apply_changes:
+            await users_collection.bulk_write(updates, ordered=False)
+        return len(updates)
+
+    cursor = users_collection.find({}, {"usage": 1}).batch_size(BATCH_SIZE)
+    async for user in cursor:
+        seen += 1
+        batch.append(user)
+        if len(batch) >= BATCH_SIZE:
+            corrected += await flush()
+            batch = []
+    if batch:
+        corrected += await flush()
+    return {"users": seen, "corrected": corrected}
+
+
+async def _claim_lease() -> bool:
+    """Only one worker reconciles per interval."""
+    now = datetime.now(timezone.utc)
+    result = await schema_meta_collection.update_one(
+        {"_id": _LEASE_ID, "$or": [{"next_run_at": {"$lte": now}}, {"next_run_at": {"$exists": False}}]},
+        {"$set": {"next_run_at": now + LEASE}},
+    )
+    if result.modified_count:
+        return True
+    existing = await schema_meta_collection.find_one({"_id": _LEASE_ID}, {"_id": 1})
+    if existing:
+        return False
+    try:
+        await schema_meta_collection.insert_one({"_id": _LEASE_ID, "next_run_at": now + LEASE})
+    except Exception:
+        return False
+    return True
+
+
+async def _reconcile_loop() -> None:
+    while True:
+        try:
+            if await _claim_lease():
+                report = await reconcile()
+                await schema_meta_collection.update_one(
+                    {"_id": _LEASE_ID},
+                    {"$set": {"next_run_at": datetime.now(timezone.utc) + RECONCILE_INTERVAL, "last_report": report}},
+                )
+                logger.info(f"[quota] Reconciled usage counters: {report}")
+        except Exception as exc:
+            logger.warning(f"[quota] Reconcile cycle failed: {exc}")
+        await asyncio.sleep(LEASE.total_seconds())
+
+
+def start_reconciler() -> None:
+    """Start the periodic reconcile loop (app startup). QUOTA_RECONCILER=0 disables it."""
+    global _reconciler_task
+    if os.getenv("QUOTA_RECONCILER", "1") == "0" or _reconciler_task is not None:
+        return
+    _reconciler_task = asyncio.create_task(_reconcile_loop())
+
+
+async def stop_reconciler() -> None:
+    """Stop the loop (app shutdown)."""
+    global _reconciler_task
+    if _reconciler_task is not None:
+        _reconciler_task.cancel()
+        try:
+            await _reconciler_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _reconciler_task = None
+
+
+__all__ = [
+    "CARD_KEYS", "QUOTA_KEYS", "card_quota_key", "recount", "reconcile", "release",
+    "remaining", "reserve", "start_reconciler", "stop_reconciler", "track", "try_reserve",
+]
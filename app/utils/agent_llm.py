@@ -2,10 +2,13 @@ import os
 import re
 import json
 import asyncio
-from typing import List, Dict, Any, Optional
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Dict, Any, Optional
 from datetime import datetime
 import google.generativeai as genai
 from groq import Groq
+from app.utils import metrics
 from app.utils.logger import get_logger
 from app.config.subscription_plans import AGENT_MODELS
 
@@ -27,6 +30,94 @@ class ToolCallRejectedError(Exception):
         super().__init__(f"{tool_name}: {reason}")
 
 
+@dataclass
+class ChatStreamEvent:
+    """One step of a streamed turn (see ``AgentLLM.chat_stream``).
+
+    ``token``: reply text as the provider produces it (raw — markers and
+    function-call artifacts are not removed yet). ``tool``: a tool call
+    ``started``, ``finished`` or was ``rejected``. ``reply``: always last, the
+    cleaned final text — exactly what ``chat()`` would have returned.
+    """
+
+    type: str
+    text: str = ""
+    tool: Optional[str] = None
+    status: Optional[str] = None
+
+
+#: Shown when a Groq reply held nothing but a text-form function call.
+_EMPTY_ARTIFACT_REPLY = "I wasn't able to retrieve that information right now. Please try again."
+
+#: Tool rounds per turn before the model's last answer is returned as-is.
+MAX_TOOL_ROUNDS = 5
+
+#: Seconds the tool calls of one model response may run (concurrently) in total.
+TOOL_TURN_TIMEOUT_S = float(os.getenv("AGENT_TOOL_TURN_TIMEOUT_S", 20))
+
+
+def _tool_names(tools: Optional[List[Any]]) -> frozenset:
+    """Names of the functions declared in Gemini Tool protos."""
+    return frozenset(
+        decl.name for tool in tools or [] for decl in getattr(tool, "function_declarations", [])
+    )
+
+
+async def _timed_dispatch(tool_dispatcher, fn_name: str, fn_args: dict, user_id: str, known: frozenset) -> str:
+    start = time.monotonic()
+    try:
+        return await tool_dispatcher(fn_name, fn_args, user_id)
+    finally:
+        # The name comes from the model: one histogram per declared tool, and
+        # every hallucinated name shares one.
+        metric = f"agent_tool_{fn_name}_ms" if fn_name in known else "agent_tool_unknown_ms"
+        metrics.observe(metric, (time.monotonic() - start) * 1000)
+
+
+async def _run_tool_calls(tool_dispatcher, calls: List[tuple], user_id: str, known: frozenset) -> list:
+    """
+    Dispatch the (name, args) tool calls of one model response concurrently.
+    ``known`` holds the declared tool names (see ``_tool_names``).
+
+    Returns one entry per call, in the order given: the result string, or the
+    exception the call raised (ToolCallRejectedError included), so one failing
+    tool never takes the others down. Calls still running after
+    TOOL_TURN_TIMEOUT_S are cancelled and come back as asyncio.TimeoutError.
+    """
+    return await asyncio.gather(
+        *(
+            asyncio.wait_for(_timed_dispatch(tool_dispatcher, fn_name, fn_args, user_id, known), TOOL_TURN_TIMEOUT_S)
+            for fn_name, fn_args in calls
+        ),
+        return_exceptions=True,
+    )
+
+
+def _tool_failure(fn_name: str, exc: BaseException) -> str:
+    """The tool result the model sees for a call that raised or timed out."""
+    if isinstance(exc, asyncio.TimeoutError):
+        logger.warning(f"[Tool] {fn_name} timed out after {TOOL_TURN_TIMEOUT_S:.0f}s")
+        return json.dumps({"error": f"Tool execution timed out after {TOOL_TURN_TIMEOUT_S:.0f}s"})
+    logger.error(f"[Tool] {fn_name} failed: {exc!r}")
+    return json.dumps({"error": f"Tool execution failed: {exc}"})
+
+
+def _tool_status(result: Any) -> str:
+    """The ChatStreamEvent status for one entry of ``_run_tool_calls``."""
+    return "rejected" if isinstance(result, ToolCallRejectedError) else "finished"
+
+
+async def _iterate_in_thread(iterable) -> AsyncIterator[Any]:
+    """Drain a blocking SDK stream one chunk at a time off the event loop."""
+    iterator = iter(iterable)
+    done = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+
 class AgentLLM:
     """
     Unified LLM interface for the Study Buddy.
@@ -136,7 +227,27 @@ class AgentLLM:
         else:
             return await self._chat_groq(message, history, system_prompt, tools, tool_dispatcher, user_id, tier=tier)
 
-    async def _chat_gemini(self, message, history, system_prompt, tools, tool_dispatcher, user_id, tier: str = None):
+    async def chat_stream(
+        self,
+        message: str,
+        history: List[Dict[str, str]],
+        system_prompt: str,
+        tools: Optional[Any] = None,
+        tool_dispatcher: Optional[callable] = None,
+        user_id: str = None,
+        tier: str = None,
+    ) -> AsyncIterator[ChatStreamEvent]:
+        """``chat()``, streamed: yields tokens and tool progress, then the ``reply``."""
+        provider = self._get_provider()
+
+        if provider == "gemini":
+            stream = self._stream_gemini(message, history, system_prompt, tools, tool_dispatcher, user_id, tier=tier)
+        else:
+            stream = self._stream_groq(message, history, system_prompt, tools, tool_dispatcher, user_id, tier=tier)
+        async for event in stream:
+            yield event
+
+    def _gemini_session(self, history, system_prompt, tools, tier: str = None):
         # Resolve model based on tier — falls back to gemini-flash-latest for unknown/None tiers
         model_name = AGENT_MODELS.get(tier, "models/gemini-flash-latest") if tier else "models/gemini-flash-latest"
         model = genai.GenerativeModel(
@@ -152,54 +263,103 @@ class AgentLLM:
             if role == "assistant": role = "model"
             gemini_history.append({"role": role, "parts": [msg["content"]]})
             
-        chat_session = model.start_chat(history=gemini_history)
+        return model.start_chat(history=gemini_history)
+
+    @staticmethod
+    def _gemini_function_calls(response) -> list:
+        fn_calls = []
+        for candidate in response.candidates:
+            for part in candidate.content.parts:
+                if part.function_call.name:
+                    fn_calls.append(part.function_call)
+        return fn_calls
+
+    async def _gemini_tool_responses(self, fn_calls, tools, tool_dispatcher, user_id) -> tuple:
+        """Run one response's function calls concurrently; returns (raw results, Parts in call order)."""
+        calls = [(fn_call.name, dict(fn_call.args)) for fn_call in fn_calls]
+        for fn_name, fn_args in calls:
+            logger.info(f"[Gemini Tool] Calling {fn_name} with {fn_args}")
+        results = await _run_tool_calls(tool_dispatcher, calls, user_id, _tool_names(tools))
+
+        parts = []
+        for (fn_name, _), result in zip(calls, results):
+            if isinstance(result, ToolCallRejectedError):
+                logger.warning(
+                    "[Gemini] Server-side gate rejected tool '%s' (%s) — "
+                    "instructing the model to answer directly.",
+                    fn_name, result.reason,
+                )
+                result_str = json.dumps({
+                    "error": (
+                        f"Tool call rejected: {result.reason} "
+                        "Do not call this tool again this turn. Answer the "
+                        "user's message directly with text instead."
+                    )
+                })
+            elif isinstance(result, BaseException):
+                result_str = _tool_failure(fn_name, result)
+            else:
+                result_str = result
+            parts.append(genai.protos.Part(
+                function_response=genai.protos.FunctionResponse(
+                    name=fn_name, response={"result": result_str}
+                )
+            ))
+        return results, parts
+
+    async def _chat_gemini(self, message, history, system_prompt, tools, tool_dispatcher, user_id, tier: str = None):
+        chat_session = self._gemini_session(history, system_prompt, tools, tier=tier)
         response = chat_session.send_message(message)
         
         # Function calling loop
-        MAX_ROUNDS = 5
         rounds = 0
-        while tools and rounds < MAX_ROUNDS:
-            fn_calls = []
-            for candidate in response.candidates:
-                for part in candidate.content.parts:
-                    if part.function_call.name:
-                        fn_calls.append(part.function_call)
-            
+        while tools and rounds < MAX_TOOL_ROUNDS:
+            fn_calls = self._gemini_function_calls(response)
             if not fn_calls: break
             
-            tool_results = []
-            for fn_call in fn_calls:
-                fn_name = fn_call.name
-                fn_args = dict(fn_call.args)
-                logger.info(f"[Gemini Tool] Calling {fn_name} with {fn_args}")
-                try:
-                    result_str = await tool_dispatcher(fn_name, fn_args, user_id)
-                except ToolCallRejectedError as rej:
-                    logger.warning(
-                        "[Gemini] Server-side gate rejected tool '%s' (%s) — "
-                        "instructing the model to answer directly.",
-                        fn_name, rej.reason,
-                    )
-                    result_str = json.dumps({
-                        "error": (
-                            f"Tool call rejected: {rej.reason} "
-                            "Do not call this tool again this turn. Answer the "
-                            "user's message directly with text instead."
-                        )
-                    })
-                tool_results.append(
-                    genai.protos.Part(
-                        function_response=genai.protos.FunctionResponse(
-                            name=fn_name, response={"result": result_str}
-                        )
-                    )
-                )
+            _, tool_results = await self._gemini_tool_responses(fn_calls, tools, tool_dispatcher, user_id)
             
             response = chat_session.send_message(tool_results)
             rounds += 1
             
         return response.text
 
+    @staticmethod
+    def _gemini_chunk_text(chunk) -> str:
+        # chunk.text raises on a chunk that only carries a function call.
+        texts = []
+        for candidate in chunk.candidates:
+            for part in candidate.content.parts:
+                if getattr(part, "text", ""):
+                    texts.append(part.text)
+        return "".join(texts)
+
+    async def _stream_gemini(self, message, history, system_prompt, tools, tool_dispatcher, user_id, tier: str = None):
+        chat_session = self._gemini_session(history, system_prompt, tools, tier=tier)
+        response = await asyncio.to_thread(chat_session.send_message, message, stream=True)
+
+        rounds = 0
+        while True:
+            async for chunk in _iterate_in_thread(response):
+                text = self._gemini_chunk_text(chunk)
+                if text:
+                    yield ChatStreamEvent("token", text=text)
+
+            fn_calls = self._gemini_function_calls(response) if tools and rounds < MAX_TOOL_ROUNDS else []
+            if not fn_calls:
+                break
+
+            for fn_call in fn_calls:
+                yield ChatStreamEvent("tool", tool=fn_call.name, status="started")
+            results, tool_results = await self._gemini_tool_responses(fn_calls, tools, tool_dispatcher, user_id)
+            for fn_call, result in zip(fn_calls, results):
+                yield ChatStreamEvent("tool", tool=fn_call.name, status=_tool_status(result))
+
+            response = await asyncio.to_thread(chat_session.send_message, tool_results, stream=True)
+            rounds += 1
+
+        yield ChatStreamEvent("reply", text=response.text)
+
     async def intent_yes_no(self, instruction: str, user_message: str) -> Optional[bool]:
         """Tiny, cheap YES/NO classification of a single user message.
 
@@ -278,9 +438,8 @@ class AgentLLM:
         cleaned = re.sub(r'<function=\w+>[^<]*$', '', cleaned)
         return cleaned.strip()
 
-    async def _chat_groq(self, message, history, system_prompt, tools, tool_dispatcher, user_id, tier: str = None):
-        openai_tools = self._convert_tools_to_openai(tools)
-
+    @staticmethod
+    def _groq_messages(message, history, system_prompt) -> list:
         # For Groq/OpenAI models, we append a strict tool-calling formatting directive
         # to ensure they don't hallucinate conversational text inside the arguments JSON.
         strict_tools_directive = (
@@ -298,11 +457,62 @@ class AgentLLM:
             messages.append({"role": role, "content": msg["content"]})
         # Current message
         messages.append({"role": "user", "content": message})
-        
-        MAX_ROUNDS = 5
+        return messages
+
+    def _clean_groq_reply(self, content: Optional[str]) -> str:
+        """Strip text-form function calls from a final Groq reply (see _chat_groq)."""
+        sanitized_content = self._strip_function_calls(content)
+        if content and sanitized_content != content:
+            logger.warning(
+                "[Groq] XML-format function call artifact detected and stripped. "
+                "Tool name may have been: %s",
+                re.findall(r'<function=(\w+)', content),
+            )
+            # A message that contained only a function-call artifact has no
+            # useful text content to continue with.
+            return sanitized_content or _EMPTY_ARTIFACT_REPLY
+        return sanitized_content
+
+    @staticmethod
+    async def _groq_tool_results(calls: List[tuple], tools, tool_dispatcher, user_id) -> list:
+        """Run one response's (id, name, args) tool calls concurrently, results in call order."""
+        for _, fn_name, fn_args in calls:
+            logger.info(f"[Groq Tool] Calling {fn_name} with {fn_args}")
+        return await _run_tool_calls(
+            tool_dispatcher, [(fn_name, fn_args) for _, fn_name, fn_args in calls], user_id, _tool_names(tools)
+        )
+
+    @staticmethod
+    def _groq_rejected_tool(calls: List[tuple], results: list) -> Optional[str]:
+        for (_, fn_name, _), result in zip(calls, results):
+            if isinstance(result, ToolCallRejectedError):
+                logger.warning(
+                    "[Groq] Server-side gate rejected tool '%s' (%s) — "
+                    "re-running the turn without that tool.",
+                    fn_name, result.reason,
+                )
+                return fn_name
+        return None
+
+    @staticmethod
+    def _groq_tool_messages(calls: List[tuple], results: list) -> list:
+        return [
+            {
+                "tool_call_id": call_id,
+                "role": "tool",
+                "name": fn_name,
+                "content": _tool_failure(fn_name, result) if isinstance(result, BaseException) else result,
+            }
+            for (call_id, fn_name, _), result in zip(calls, results)
+        ]
+
+    async def _chat_groq(self, message, history, system_prompt, tools, tool_dispatcher, user_id, tier: str = None):
+        openai_tools = self._convert_tools_to_openai(tools)
+        messages = self._groq_messages(message, history, system_prompt)
+
         rounds = 0
         
-        while rounds < MAX_ROUNDS:
+        while rounds < MAX_TOOL_ROUNDS:
             try:
                 # Groq completion
                 completion_kwargs = {
@@ -357,19 +567,8 @@ class AgentLLM:
             #   <function=name>...</function>   ← paired
             #   <function=name>{...       ← truncated/unclosed
             if response_message.content and not response_message.tool_calls:
-                sanitized_content = self._strip_function_calls(response_message.content)
-                if sanitized_content != response_message.content:
-                    logger.warning(
-                        "[Groq] XML-format function call artifact detected and stripped. "
-                        "Tool name may have been: %s",
-                        re.findall(r'<function=(\w+)', response_message.content),
-                    )
-                    # Return immediately — a message that contained only a function-call
-                    # artifact has no useful text content to continue with, and we must
-                    # not append the dirty content to history.
-                    return sanitized_content if sanitized_content else (
-                        "I wasn't able to retrieve that information right now. Please try again."
-                    )
+                # Return immediately — we must not append the dirty content to history.
+                return self._clean_groq_reply(response_message.content)
 
             assistant_msg_index = len(messages)
             messages.append(response_message)
@@ -378,29 +577,13 @@ class AgentLLM:
                 return self._strip_function_calls(response_message.content)
 
             # Handle tool calls
-            rejected_tool: Optional[str] = None
-            for tool_call in response_message.tool_calls:
-                fn_name = tool_call.function.name
-                fn_args = json.loads(tool_call.function.arguments)
-
-                logger.info(f"[Groq Tool] Calling {fn_name} with {fn_args}")
-                try:
-                    result_str = await tool_dispatcher(fn_name, fn_args, user_id)
-                except ToolCallRejectedError as rej:
-                    rejected_tool = fn_name
-                    logger.warning(
-                        "[Groq] Server-side gate rejected tool '%s' (%s) — "
-                        "re-running the turn without that tool.",
-                        fn_name, rej.reason,
-                    )
-                    break
-
-                messages.append({
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "name": fn_name,
-                    "content": result_str,
-                })
+            calls = [
+                (tool_call.id, tool_call.function.name, json.loads(tool_call.function.arguments))
+                for tool_call in response_message.tool_calls
+            ]
+            results = await self._groq_tool_results(calls, tools, tool_dispatcher, user_id)
+            messages.extend(self._groq_tool_messages(calls, results))
+            rejected_tool = self._groq_rejected_tool(calls, results)
 
             if rejected_tool is not None:
                 # Discard the vetoed assistant tool-call message (and any tool
@@ -421,4 +604,91 @@ class AgentLLM:
             response_message.content or "I processed the tools but couldn't generate a final response."
         )
 
+    def _groq_stream(self, messages, openai_tools):
+        completion_kwargs = {
+            "model": self.groq_model,
+            "messages": messages,
+            "stream": True,
+        }
+        if openai_tools:
+            completion_kwargs["tools"] = openai_tools
+            completion_kwargs["tool_choice"] = "auto"
+        return self.groq_client.chat.completions.create(**completion_kwargs)
+
+    async def _stream_groq(self, message, history, system_prompt, tools, tool_dispatcher, user_id, tier: str = None):
+        openai_tools = self._convert_tools_to_openai(tools)
+        messages = self._groq_messages(message, history, system_prompt)
+
+        content = ""
+        rounds = 0
+        while rounds < MAX_TOOL_ROUNDS:
+            content = ""
+            # Tool-call deltas arrive in fragments, keyed by their index.
+            streamed_calls: Dict[int, Dict[str, str]] = {}
+            try:
+                stream = await asyncio.to_thread(self._groq_stream, messages, openai_tools)
+                async for chunk in _iterate_in_thread(stream):
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        content += delta.content
+                        yield ChatStreamEvent("token", text=delta.content)
+                    for fragment in delta.tool_calls or []:
+                        call = streamed_calls.setdefault(fragment.index, {"id": "", "name": "", "arguments": ""})
+                        if fragment.id:
+                            call["id"] = fragment.id
+                        if fragment.function and fragment.function.name:
+                            call["name"] += fragment.function.name
+                        if fragment.function and fragment.function.arguments:
+                            call["arguments"] += fragment.function.arguments
+            except Exception as e:
+                # Same degradation as _chat_groq — only possible while nothing
+                # has been streamed for this round yet.
+                if openai_tools and not content and self._is_tool_use_failed(e):
+                    logger.error(
+                        "[Groq] tool_use_failed — model emitted a malformed tool call; "
+                        "retrying this turn without tools. Original error: %s", e,
+                    )
+                    openai_tools = None
+                    continue
+                logger.error(f"Groq API Error: {e}")
+                raise e
+
+            if not streamed_calls:
+                yield ChatStreamEvent("reply", text=self._clean_groq_reply(content))
+                return
+
+            assistant_msg_index = len(messages)
+            tool_calls = [streamed_calls[index] for index in sorted(streamed_calls)]
+            messages.append({
+                "role": "assistant",
+                "content": self._strip_function_calls(content) or None,
+                "tool_calls": [
+                    {"id": c["id"], "type": "function", "function": {"name": c["name"], "arguments": c["arguments"]}}
+                    for c in tool_calls
+                ],
+            })
+
+            calls = [(c["id"], c["name"], json.loads(c["arguments"] or "{}")) for c in tool_calls]
+            for _, fn_name, _ in calls:
+                yield ChatStreamEvent("tool", tool=fn_name, status="started")
+            results = await self._groq_tool_results(calls, tools, tool_dispatcher, user_id)
+            for (_, fn_name, _), result in zip(calls, results):
+                yield ChatStreamEvent("tool", tool=fn_name, status=_tool_status(result))
+            messages.extend(self._groq_tool_messages(calls, results))
+            rejected_tool = self._groq_rejected_tool(calls, results)
+
+            if rejected_tool is not None:
+                del messages[assistant_msg_index:]
+                openai_tools = [
+                    t for t in (openai_tools or [])
+                    if t["function"]["name"] != rejected_tool
+                ] or None
+            rounds += 1
+
+        yield ChatStreamEvent("reply", text=self._strip_function_calls(
+            content or "I processed the tools but couldn't generate a final response."
+        ))
+
 agent_llm = AgentLLM()
@@ -12,8 +12,6 @@ The functions here are registered as Gemini Tools and called autonomously by
 the model when it decides they are relevant to the user's question.
 """
 
-import json
-import re
 from datetime import datetime, timezone
 from bson import ObjectId
 
@@ -25,55 +23,10 @@ from app.config.database import (
     goals_collection,
     annual_plans_collection,
 )
-
-
-# ---------------------------------------------------------------------------
-# Text utilities
-# ---------------------------------------------------------------------------
-
-def _lexical_to_plaintext(lexical_json_str: str, max_chars: int = 4000) -> str:
-    """
-    Convert a Lexical JSON string (rich text editor format) into plain text
-    suitable for LLM consumption. Strips all structural metadata and returns
-    only the textual content, capped at max_chars to control token usage.
-    """
-    if not lexical_json_str:
-        return ""
-
-    try:
-        data = json.loads(lexical_json_str)
-    except (json.JSONDecodeError, TypeError):
-        # If it's already plain text or broken JSON, just truncate it
-        return str(lexical_json_str)[:max_chars]
-
-    texts: list[str] = []
-
-    def _walk(node: dict) -> None:
-        if not isinstance(node, dict):
-            return
-        node_type = node.get("type")
-        # Extract text from text nodes
-        if node_type == "text":
-            text = node.get("text", "").strip()
-            if text:
-                texts.append(text)
-        # Add paragraph breaks for block-level nodes
-        elif node_type in ("paragraph", "heading", "quote"):
-            for child in node.get("children", []):
-                _walk(child)
-            texts.append("\n")
-        else:
-            for child in node.get("children", []):
-                _walk(child)
-
-    root = data.get("root", data)
-    _walk(root)
-
-    plaintext = " ".join(texts)
-    # Collapse multiple whitespace/newlines
-    plaintext = re.sub(r"\n{3,}", "\n\n", plaintext)
-    plaintext = re.sub(r" {2,}", " ", plaintext)
-    return plaintext[:max_chars].strip()
+from app.utils import ids
+from app.utils.book_content import CONTENT_PROJECTION
+from app.utils.book_search import hybrid_search
+from app.utils.book_text import load_book_text
 
 
 # ---------------------------------------------------------------------------
@@ -93,12 +46,8 @@ async def get_study_summary(user_id: str) -> dict:
         {"user_id": user_id, "deleted_at": None}, {"_id": 1, "name": 1}
     ).to_list(length=200)
 
-    deck_ids = []
-    deck_names = []
-    for d in active_decks:
-        deck_ids.append(d["_id"])
-        deck_ids.append(str(d["_id"]))
-        deck_names.append(d.get("name", "Unnamed Deck"))
+    deck_ids = ids.ref_values("cards", "deck_id", [d["_id"] for d in active_decks])
+    deck_names = [d.get("name", "Unnamed Deck") for d in active_decks]
 
     base_filter = {
         "user_id": user_id,
@@ -126,7 +75,7 @@ async def get_study_summary(user_id: str) -> dict:
     deck_summaries = []
     for d in active_decks:
         oid = d["_id"]
-        deck_filter = {"deck_id": {"$in": [oid, str(oid)]}, "deleted_at": None}
+        deck_filter = {"deck_id": ids.ref_value("cards", "deck_id", oid), "deleted_at": None}
         due = await cards_collection.count_documents(
             {**deck_filter, "last_reviewed": {"$ne": None}, "next_review": {"$lte": now}}
         )
@@ -169,7 +118,7 @@ async def list_decks(user_id: str) -> list[dict]:
     result = []
     for d in decks:
         oid = d["_id"]
-        deck_filter = {"deck_id": {"$in": [oid, str(oid)]}, "deleted_at": None}
+        deck_filter = {"deck_id": ids.ref_value("cards", "deck_id", oid), "deleted_at": None}
         total = await cards_collection.count_documents(deck_filter)
         reviewed = await cards_collection.count_documents(
             {**deck_filter, "last_reviewed": {"$ne": None}}
@@ -221,7 +170,7 @@ async def get_deck_content(user_id: str, deck_id: str) -> dict:
         return {"error": "Deck not found or not accessible"}
 
     cards = await cards_collection.find(
-        {"deck_id": {"$in": [deck_oid, deck_id]}, "deleted_at": None},
+        {"deck_id": ids.ref_value("cards", "deck_id", deck_oid), "deleted_at": None},
         {"title": 1, "content": 1, "tags": 1, "ease_factor": 1, "last_reviewed": 1}
     ).limit(20).to_list(length=20)
 
@@ -273,8 +222,9 @@ async def list_books(user_id: str) -> list[dict]:
 async def read_book_section(user_id: str, book_id: str, query: str = "") -> dict:
     """
     Fetches a section of a book's content as plain text. If a query is
-    provided, it attempts to find the most relevant paragraph (simple
-    keyword match). Always capped at 4,000 characters for token safety.
+    provided, returns the most relevant passages from anywhere in the book
+    (BM25 over the whole text, fused with vector hits when indexed).
+    Always capped at 4,000 characters for token safety.
     Validates ownership before returning any content.
     """
     try:
@@ -284,32 +234,20 @@ async def read_book_section(user_id: str, book_id: str, query: str = "") -> dict
 
     book = await books_collection.find_one(
         {"_id": book_oid, "user_id": user_id, "deleted_at": None},
-        {"title": 1, "author": 1, "full_content": 1}
+        CONTENT_PROJECTION,
     )
     if not book:
         return {"error": "Book not found or not accessible"}
 
-    plaintext = _lexical_to_plaintext(book.get("full_content", ""), max_chars=8000)
+    head = await load_book_text(book, max_chars=4000)
+    excerpt = head["text"]
+    if query and head.get("truncated"):
+        passages = await hybrid_search(book, user_id, query)
+        excerpt = "\n\n".join(passages)[:4000] or excerpt
 
-    if not plaintext:
+    if not excerpt:
         return {"title": book.get("title"), "content": "No readable content found in this book."}
 
-    # If a query is given, try to find a relevant paragraph
-    excerpt = plaintext
-    if query and len(plaintext) > 4000:
-        query_terms = query.lower().split()
-        paragraphs = [p.strip() for p in plaintext.split("\n") if p.strip()]
-        scored = []
-        for p in paragraphs:
-            p_lower = p.lower()
-            score = sum(1 for term in query_terms if term in p_lower)
-            scored.append((score, p))
-        # Sort by relevance and take the top paragraphs
-        scored.sort(key=lambda x: x[0], reverse=True)
-        excerpt = "\n\n".join(p for _, p in scored[:8])[:4000]
-    else:
-        excerpt = plaintext[:4000]
-
     return {
         "title": book.get("title"),
         "author": book.get("author"),
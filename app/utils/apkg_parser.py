@@ -0,0 +1,410 @@
+"""
+Pure, process-safe parsing of Anki ``.apkg`` packages.
+
+Everything here is synchronous and touches only the local filesystem (zip +
+SQLite), so ``parse_apkg_file`` can run in a worker process via
+``ProcessPoolExecutor`` without dragging the FastAPI app, Motor client or any
+other event-loop state across the process boundary. Results are plain
+``dict``/``list`` values so they pickle cheaply back to the caller.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+import zipfile
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+# Limit the uncompressed SQLite DB to 150MB (zip bomb mitigation).
+MAX_DB_BYTES: int = 150 * 1024 * 1024
+
+# Media bounds — a deck may reference thousands of files; anything past these
+# limits is skipped rather than extracted.
+MAX_MEDIA_FILES: int = 2000
+MAX_MEDIA_FILE_BYTES: int = 10 * 1024 * 1024
+MAX_MEDIA_TOTAL_BYTES: int = 200 * 1024 * 1024
+
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp", "svg", "bmp"}
+AUDIO_EXTENSIONS = {"mp3", "ogg", "wav", "m4a", "flac", "opus"}
+
+# Review history kept per card — the most recent entries win.
+MAX_REVIEWS_PER_CARD: int = 500
+
+# SM-2 ease factor bounds enforced by the StudyCard model.
+MIN_EASE_FACTOR: float = 1.3
+MAX_EASE_FACTOR: float = 2.5
+
+# Anki card.type / revlog.type codes
+ANKI_CARD_NEW = 0
+ANKI_CARD_REVIEW = 2
+ANKI_QUEUE_LEARNING = 1
+
+_ANKI_EASE_TO_GRADE = {1: "again", 2: "hard", 3: "good", 4: "easy"}
+_ANKI_REVLOG_TYPES = {0: "learn", 1: "review", 2: "relearn", 3: "cram"}
+
+# Known compatibility shims Anki embeds when the format is too new
+COMPAT_MESSAGES = {
+    "Please update to the latest Anki version, then import the .colpkg/.apkg file again.",
+    "Please update to the latest Anki version.",
+}
+
+_IMG_SRC_RE = re.compile(r"""<img[^>]*?\bsrc\s*=\s*["']?([^"'>\s]+)""", re.IGNORECASE)
+_SOUND_RE = re.compile(r"\[sound:([^\]]+)\]")
+
+
+def strip_html(text: str) -> str:
+    """Remove HTML tags, Anki ``[sound:...]`` markers and decode common entities."""
+    text = _SOUND_RE.sub("", text)
+    text = re.sub(r"<[^>]+>", "", text)
+    text = text.replace("&nbsp;", " ").replace("&amp;", "&")
+    text = text.replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"')
+    return text.strip()
+
+
+def media_kind(filename: str) -> str | None:
+    """Classify a media filename as ``"image"``/``"audio"``, or ``None`` if unsupported."""
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    if ext in AUDIO_EXTENSIONS:
+        return "audio"
+    return None
+
+
+def _field_media(raw_field: str) -> list[str]:
+    """Return the media filenames referenced by one raw Anki field, in order."""
+    names = _IMG_SRC_RE.findall(raw_field) + _SOUND_RE.findall(raw_field)
+    return [n for n in dict.fromkeys(names) if media_kind(n)]
+
+
+def _suggested_deck_name(cur: sqlite3.Cursor) -> str:
+    suggested_name = "Imported Deck"
+    try:
+        cur.execute("SELECT decks FROM col LIMIT 1")
+        row = cur.fetchone()
+        if row:
+            decks_json = json.loads(row[0])
+            # Anki stores decks as {id: {name: ...}}. Skip the default deck (id=1).
+            non_default = [
+                v["name"]
+                for k, v in decks_json.items()
+                if k != "1" and isinstance(v, dict) and "name" in v
+            ]
+            if non_default:
+                # Use top-level name (strip "::" hierarchy if present)
+                suggested_name = non_default[0].split("::")[-1].strip()
+    except Exception:
+        pass  # Fall back to default name
+    return suggested_name
+
+
+def _collection_created(cur: sqlite3.Cursor) -> datetime | None:
+    """Return ``col.crt`` — the day zero that review-card ``due`` values count from."""
+    try:
+        cur.execute("SELECT crt FROM col LIMIT 1")
+        row = cur.fetchone()
+    except sqlite3.OperationalError:
+        return None
+    if not row or not row[0]:
+        return None
+    return datetime.fromtimestamp(row[0], tz=timezone.utc)
+
+
+def _read_scheduling(cur: sqlite3.Cursor) -> dict[int, dict[str, Any]]:
+    """
+    Read Anki's ``cards`` and ``revlog`` tables, keyed by note id.
+
+    A note can own several cards (one per template); the importer creates one
+    card per note, so the lowest-``ord`` card — the one whose front is the
+    note's first field — supplies the schedule. Packages exported without
+    scheduling simply yield an empty map.
+    """
+    try:
+        cur.execute(
+            "SELECT id, nid, type, queue, due, ivl, factor, reps FROM cards ORDER BY nid, ord"
+        )
+        card_rows = cur.fetchall()
+    except sqlite3.OperationalError:
+        return {}
+
+    primary: dict[int, tuple] = {}
+    for row in card_rows:
+        primary.setdefault(row[1], row)
+    if not primary:
+        return {}
+
+    card_to_note = {row[0]: nid for nid, row in primary.items()}
+    history: dict[int, list[dict[str, Any]]] = {}
+    try:
+        cur.execute("SELECT id, cid, ease, ivl, lastIvl, factor, time, type FROM revlog ORDER BY cid, id")
+        for rev_id, cid, ease, ivl, last_ivl, factor, time_ms, rev_type in cur:
+            nid = card_to_note.get(cid)
+            if nid is None:
+                continue
+            history.setdefault(nid, []).append({
+                "reviewed_at": datetime.fromtimestamp(rev_id / 1000, tz=timezone.utc),
+                "grade": _ANKI_EASE_TO_GRADE.get(ease, "again"),
+                "interval": _interval_days(ivl),
+                "last_interval": _interval_days(last_ivl),
+                "ease_factor": _ease_factor(factor),
+                "time_ms": time_ms,
+                "review_type": _ANKI_REVLOG_TYPES.get(rev_type, "review"),
+            })
+    except sqlite3.OperationalError:
+        pass
+
+    crt = _collection_created(cur)
+    now = datetime.now(timezone.utc)
+    scheduling: dict[int, dict[str, Any]] = {}
+    for nid, (_, _, card_type, queue, due, ivl, factor, reps) in primary.items():
+        reviews = history.get(nid, [])[-MAX_REVIEWS_PER_CARD:]
+        if card_type == ANKI_CARD_NEW or reps == 0:
+            continue
+        interval = _interval_days(ivl)
+        next_review = _next_review(card_type, queue, due, crt, now)
+        # A studied card must never look "new" (last_reviewed None) to the
+        # session picker, so estimate the last review when the log is missing.
+        last_reviewed = (
+            reviews[-1]["reviewed_at"]
+            if reviews
+            else min(now, next_review - timedelta(days=interval))
+        )
+        scheduling[nid] = {
+            "ease_factor": _ease_factor(factor),
+            "interval": interval,
+            "repetitions": _sm2_repetitions(card_type, reps, reviews),
+            "last_reviewed": last_reviewed,
+            "next_review": next_review,
+            "reviews": reviews,
+        }
+    return scheduling
+
+
+def _interval_days(ivl: int | None) -> int:
+    """Anki stores review intervals in days and learning steps as negative seconds."""
+    return ivl if ivl and ivl > 0 else 1
+
+
+def _ease_factor(factor: int | None) -> float:
+    """Anki ease is per-mille (2500 = 2.5); clamp onto the SM-2 range we store."""
+    if not factor:
+        return MAX_EASE_FACTOR
+    return round(max(MIN_EASE_FACTOR, min(MAX_EASE_FACTOR, factor / 1000)), 2)
+
+
+def _sm2_repetitions(card_type: int, reps: int, reviews: list[dict[str, Any]]) -> int:
+    """
+    SM-2 ``repetitions`` is the run of consecutive successful reviews, not
+    Anki's lifetime ``reps``. Derive it from the tail of the review log; a
+    graduated review card is at least 2 so its next interval grows by the
+    ease factor instead of restarting at 1 → 6 days.
+    """
+    if reviews:
+        streak = 0
+        for review in reversed(reviews):
+            if review["grade"] == "again":
+                break
+            streak += 1
+    else:
+        streak = reps
+    if card_type == ANKI_CARD_REVIEW:
+        return max(2, streak)
+    return 0
+
+
+def _next_review(
+    card_type: int, queue: int, due: int, crt: datetime | None, now: datetime
+) -> datetime:
+    """
+    Convert Anki's ``due`` to a timestamp.
+
+    Learning cards (queue 1) store an epoch timestamp; review and day-learning
+    cards store a day number relative to the collection's creation. Without a
+    creation date, or for anything else (suspended, relearning), the card is
+    simply due now so it lands in the next review session.
+    """
+    if queue == ANKI_QUEUE_LEARNING and due > 0:
+        return datetime.fromtimestamp(due, tz=timezone.utc)
+    if card_type == ANKI_CARD_REVIEW and crt is not None and due > 0:
+        return crt + timedelta(days=due)
+    return now
+
+
+def _extract_media(
+    z: zipfile.ZipFile, names: set[str], referenced: set[str], media_dir: str
+) -> dict[str, str]:
+    """
+    Extract the referenced media files into ``media_dir``.
+
+    Anki stores media as numbered zip members (``"0"``, ``"1"`` …) plus a
+    ``media`` JSON map of ``{member: original_filename}``. Only files actually
+    referenced by a note are extracted, within the module's size bounds.
+
+    Returns ``{original_filename: extracted_path}``.
+    """
+    if "media" not in names or not referenced:
+        return {}
+    try:
+        media_map: dict[str, str] = json.loads(z.read("media").decode("utf-8") or "{}")
+    except (ValueError, UnicodeDecodeError):
+        # anki21b packages store a zstd/protobuf media map — not supported.
+        return {}
+
+    os.makedirs(media_dir, exist_ok=True)
+    extracted: dict[str, str] = {}
+    total_bytes = 0
+    for member, original in media_map.items():
+        if original not in referenced or member not in names:
+            continue
+        if len(extracted) >= MAX_MEDIA_FILES:
+            break
+        info = z.getinfo(member)
+        if info.file_size > MAX_MEDIA_FILE_BYTES:
+            continue
+        if total_bytes + info.file_size > MAX_MEDIA_TOTAL_BYTES:
+            break
+        total_bytes += info.file_size
+        # Never trust the archive's filename for the on-disk path.
+        target = os.path.join(media_dir, f"{len(extracted)}_{os.path.basename(member)}")
+        with z.open(member) as src, open(target, "wb") as dst:
+            dst.write(src.read())
+        extracted[original] = target
+    return extracted
+
+
+def parse_apkg_file(apkg_path: str, work_dir: str) -> dict[str, Any]:
+    """
+    Parse an ``.apkg`` file already on disk.
+
+    The collection database and any referenced media are extracted under
+    ``work_dir``; the caller owns (and removes) that directory.
+
+    Returns::
+
+        {
+            "suggested_name": str,
+            "cards": [{"front", "back", "tags", "media": [{"name", "kind", "side"}],
+                       "scheduling": {...} | None}],
+            "media_files": {original_filename: extracted_path},
+            "review_count": int,
+        }
+
+    ``scheduling`` (present only for cards Anki has already studied) carries
+    the SM-2 fields (``ease_factor``, ``interval``, ``repetitions``,
+    ``last_reviewed``, ``next_review``) plus the card's ``reviews`` history.
+
+    Raises ValueError on any format error.
+    """
+    # Validate zip structure
+    if not zipfile.is_zipfile(apkg_path):
+        raise ValueError("File is not a valid .apkg (not a zip archive).")
+
+    with zipfile.ZipFile(apkg_path, "r") as z:
+        names = set(z.namelist())
+
+        # Pick database — prefer anki21
+        db_name = None
+        for candidate in ["collection.anki21", "collection.anki2"]:
+            if candidate in names:
+                db_name = candidate
+                break
+
+        if not db_name:
+            raise ValueError("No Anki collection database found inside the .apkg file.")
+
+        # --- Zip Bomb Mitigation ---
+        if z.getinfo(db_name).file_size > MAX_DB_BYTES:
+            raise ValueError("Database file is dangerously large. Import aborted.")
+        # ---------------------------
+
+        z.extract(db_name, work_dir)
+        db_path = os.path.join(work_dir, db_name)
+
+        conn = sqlite3.connect(db_path)
+        try:
+            cur = conn.cursor()
+            suggested_name = _suggested_deck_name(cur)
+
+            # -- Cards from notes table ---------------------------------------
+            try:
+                cur.execute("SELECT id, flds, tags FROM notes")
+                rows = cur.fetchall()
+            except sqlite3.OperationalError:
+                raise ValueError("Could not read cards from the Anki database. The file may be corrupt.")
+
+            # -- Schedule + review history from cards/revlog ------------------
+            scheduling = _read_scheduling(cur)
+        finally:
+            conn.close()
+
+        cards: list[dict[str, Any]] = []
+        referenced: set[str] = set()
+        compat_notes_found = 0
+        review_count = 0
+        for note_id, flds, tags in rows:
+            # Anki fields are \x1f separated
+            raw_fields = flds.split("\x1f")
+
+            # Clean all fields
+            cleaned_fields = [strip_html(f) for f in raw_fields]
+
+            # Front is usually the first field (Expression/Kanji)
+            front = cleaned_fields[0] if len(cleaned_fields) > 0 else ""
+
+            # Back: Join all other non-empty fields (Reading + Meaning + Examples)
+            other_fields = [f for f in cleaned_fields[1:] if f.strip()]
+            back = "\n\n".join(other_fields) if other_fields else ""
+
+            media: list[dict[str, str]] = []
+            for index, raw in enumerate(raw_fields):
+                for name in _field_media(raw):
+                    media.append({
+                        "name": name,
+                        "kind": media_kind(name),
+                        "side": "front" if index == 0 else "back",
+                    })
+
+            # Skip completely empty cards (media-only notes are kept)
+            if not front and not back and not media:
+                continue
+
+            # Skip Anki compatibility-shim notes (newer format warning)
+            if front.strip() in COMPAT_MESSAGES:
+                compat_notes_found += 1
+                continue
+
+            referenced.update(m["name"] for m in media)
+
+            # Clean and split tags (Anki stores them inside spaces " tag1 tag2 ")
+            tag_list = [t.strip() for t in (tags or "").strip().split() if t.strip()]
+            schedule = scheduling.get(note_id)
+            if schedule:
+                review_count += len(schedule["reviews"])
+            cards.append({
+                "front": front,
+                "back": back,
+                "tags": tag_list,
+                "media": media,
+                "scheduling": schedule,
+            })
+
+        if not cards:
+            if compat_notes_found > 0:
+                raise ValueError(
+                    "This .apkg was exported with a newer version of Anki (23.10+) that uses a "
+                    "format our parser does not yet support. To import it, please re-export "
+                    "from Anki using File → Export → 'Anki Deck Package (.apkg)' with the "
+                    "'Support older Anki versions' option enabled."
+                )
+            raise ValueError("No cards found in the .apkg file.")
+
+        media_files = _extract_media(z, names, referenced, os.path.join(work_dir, "media"))
+
+    return {
+        "suggested_name": suggested_name,
+        "cards": cards,
+        "media_files": media_files,
+        "review_count": review_count,
+    }
@@ -0,0 +1,273 @@
+"""
+Op-based blackboard saves (PATCH /blackboards/{board_id}).
+
+Autosave used to PUT the whole ``nodes``/``edges`` arrays on every keystroke,
+and two collaborators overwrote each other. Clients now send ops:
+
+    add_node / move_node / update_node / delete_node
+    add_edge / update_edge / delete_edge
+
+``compact_ops`` folds a batch down to at most one effect per node or edge:
+consecutive moves keep the last position, updates merge, edits to something
+deleted later in the batch are dropped, and adds absorb later edits. The
+result is applied in ONE atomic ``find_one_and_update`` built from an
+aggregation-pipeline update (``patch_pipeline``). The request and the oplog
+entry scale with the edit, not the board.
+
+Every write bumps the board's ``version``. PATCH requires ``If-Match: "<version>"``.
+Each applied patch is logged as one ``blackboard_op_log`` document keyed by
+board and version (``record``) — never on the board, which stays the size of
+its content. The log keeps the last ``OP_LOG_LIMIT`` versions per board and
+entries expire after a week. A stale patch is rebased onto the current
+version when every patch it missed is still logged and none of them touched
+the same nodes or edges (``can_rebase``). Otherwise it gets 409. Writes that
+must not be rebased across (a whole-board replace, a clear) log nothing, and
+the gap they leave is enough.
+User-supplied values are wrapped in ``$literal`` so strings that start with
+``$`` are never evaluated as field paths.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from app.config.database import blackboard_op_log_collection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Patches remembered per board for rebasing and for GET /{board_id}/ops.
+OP_LOG_LIMIT: int = 200
+
+#: Boards written before the log moved out carry a legacy ``op_log`` array;
+#: every board write drops it.
+_DROP_LEGACY_LOG: dict = {"$unset": "op_log"}
+
+_KINDS = {"node": "nodes", "edge": "edges"}
+
+
+def _kind(op_name: str) -> str:
+    return op_name.rsplit("_", 1)[1]
+
+
+def _merge_patch(target: Dict[str, Any], patch: Dict[str, Any]) -> None:
+    """Fold ``patch`` into ``target``: ``data`` merges one level, other keys replace."""
+    for key, value in patch.items():
+        if key == "data" and isinstance(value, dict):
+            target["data"] = {**(target.get("data") or {}), **value}
+        else:
+            target[key] = value
+
+
+def compact_ops(ops: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Fold a batch into normalized ops, one per touched object, in first-touch order:
+    ``{"op": "add"|"patch"|"delete", "kind": "node"|"edge", "id": ..., "value": ...}``.
+    A deleted node also carries ``cascade: True`` so edges attached to it go too.
+    """
+    folded: Dict[tuple, Dict[str, Any]] = {}
+    for op in ops:
+        name, object_id = op["op"], op["id"]
+        kind = _kind(name)
+        key = (kind, object_id)
+        current = folded.get(key)
+        value = op.get("value") or {}
+
+        if name.startswith("add_"):
+            folded[key] = {"op": "add", "kind": kind, "id": object_id, "value": {**value, "id": object_id}}
+        elif name.startswith("delete_"):
+            folded[key] = {"op": "delete", "kind": kind, "id": object_id}
+            if kind == "node":
+                folded[key]["cascade"] = True
+                # Edges added earlier in this batch would dangle once appended.
+                for other_key, other in list(folded.items()):
+                    if other["op"] == "add" and other["kind"] == "edge" and object_id in (
+                        other["value"].get("source"), other["value"].get("target")
+                    ):
+                        del folded[other_key]
+        else:
+            patch = {"position": value} if name == "move_node" else dict(value)
+            patch.pop("id", None)
+            if current is None:
+                folded[key] = {"op": "patch", "kind": kind, "id": object_id, "value": {}}
+                current = folded[key]
+            elif current["op"] == "delete":
+                continue
+            _merge_patch(current["value"], patch)
+    return list(folded.values())
+
+
+def touched_ids(ops: Iterable[Dict[str, Any]]) -> List[str]:
+    return sorted({f"{op['kind']}:{op['id']}" for op in ops})
+
+
+def can_rebase(entries: Optional[list], base_version: int, current_version: int, ids: Iterable[str]) -> bool:
+    """
+    True when every patch between ``base_version`` and ``current_version`` is
+    still in the log and none of them touched any of ``ids``.
+    """
+    missed = {entry.get("v"): entry for entry in (entries or []) if entry.get("v", 0) > base_version}
+    if any(v not in missed for v in range(base_version + 1, current_version + 1)):
+        return False
+    mine: Set[str] = set(ids)
+    return not any(mine.intersection(entry.get("ids") or []) for entry in missed.values())
+
+
+def apply_ops(nodes: List[dict], edges: List[dict], ops: List[Dict[str, Any]]) -> tuple[List[dict], List[dict]]:
+    """
+    In-memory twin of ``patch_pipeline`` (used by realtime rooms). Returns new
+    lists with the same result the pipeline would store.
+    """
+    drop = {kind: {op["id"] for op in ops if op["kind"] == kind and op["op"] in ("add", "delete")} for kind in _KINDS}
+    cascade = {op["id"] for op in ops if op.get("cascade")}
+    patches = {(op["kind"], op["id"]): op["value"] for op in ops if op["op"] == "patch"}
+
+    def _patched(kind: str, item: dict) -> dict:
+        patch = patches.get((kind, item.get("id")))
+        if patch is None:
+            return item
+        item = {**item, **{k: v for k, v in patch.items() if k != "data"}}
+        if "data" in patch:
+            item["data"] = {**(item.get("data") or {}), **patch["data"]}
+        return item
+
+    new_nodes = [_patched("node", n) for n in nodes if n.get("id") not in drop["node"]]
+    new_edges = [
+        _patched("edge", e) for e in edges
+        if e.get("id") not in drop["edge"] and e.get("source") not in cascade and e.get("target") not in cascade
+    ]
+    for op in ops:
+        if op["op"] == "add":
+            (new_nodes if op["kind"] == "node" else new_edges).append(dict(op["value"]))
+    return new_nodes, new_edges
+
+
+def _lit(value: Any) -> dict:
+    return {"$literal": value}
+
+
+def _not_in(path: str, values: list) -> dict:
+    return {"$not": [{"$in": [path, _lit(values)]}]}
+
+
+def _bump_version(now: datetime) -> dict:
+    return {
+        "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+        "updated_at": _lit(now),
+    }
+
+
+def patch_pipeline(ops: List[Dict[str, Any]], now: datetime) -> List[dict]:
+    """Aggregation-pipeline update applying compacted ``ops`` in one atomic write."""
+    drop = {kind: [op["id"] for op in ops if op["kind"] == kind and op["op"] in ("add", "delete")] for kind in _KINDS}
+    cascade = [op["id"] for op in ops if op.get("cascade")]
+
+    stages: List[dict] = [{
+        "$set": {
+            "nodes": {"$filter": {
+                "input": {"$ifNull": ["$nodes", []]},
+                "as": "n",
+                "cond": _not_in("$$n.id", drop["node"]),
+            }},
+            "edges": {"$filter": {
+                "input": {"$ifNull": ["$edges", []]},
+                "as": "e",
+                "cond": {"$and": [
+                    _not_in("$$e.id", drop["edge"]),
+                    _not_in("$$e.source", cascade),
+                    _not_in("$$e.target", cascade),
+                ]},
+            }},
+        }
+    }]
+
+    patched: Dict[str, dict] = {}
+    for kind, field in _KINDS.items():
+        branches = []
+        for op in ops:
+            if op["kind"] != kind or op["op"] != "patch":
+                continue
+            fields = {k: v for k, v in op["value"].items() if k != "data"}
+            merged: list = ["$$item", _lit(fields)]
+            if "data" in op["value"]:
+                merged.append({"data": {"$mergeObjects": [{"$ifNull": ["$$item.data", {}]}, _lit(op["value"]["data"])]}})
+            branches.append({"case": {"$eq": ["$$item.id", _lit(op["id"])]}, "then": {"$mergeObjects": merged}})
+        if branches:
+            patched[field] = {"$map": {
+                "input": f"${field}",
+                "as": "item",
+                "in": {"$switch": {"branches": branches, "default": "$$item"}},
+            }}
+    if patched:
+        stages.append({"$set": patched})
+
+    added = {field: [op["value"] for op in ops if op["kind"] == kind and op["op"] == "add"] for kind, field in _KINDS.items()}
+    stages.append({"$set": {
+        **{field: {"$concatArrays": [f"${field}", _lit(values)]} for field, values in added.items() if values},
+        **_bump_version(now),
+    }})
+    stages.append(_DROP_LEGACY_LOG)
+    return stages
+
+
+def replace_pipeline(fields: Dict[str, Any], now: datetime) -> List[dict]:
+    """Pipeline for the whole-board PUT. It bumps ``version`` like a patch does."""
+    return [
+        {"$set": {**{k: _lit(v) for k, v in fields.items()}, **_bump_version(now)}},
+        _DROP_LEGACY_LOG,
+    ]
+
+
+async def record(
+    board_id: str, version: int, user_id: Optional[str], ops: List[Dict[str, Any]], now: datetime
+) -> None:
+    """
+    Log the patch that produced ``version`` and trim the board's log to
+    ``OP_LOG_LIMIT``. Best effort: a missing entry only means patches based
+    on an older version get 409 instead of being rebased.
+    """
+    try:
+        await blackboard_op_log_collection.insert_one({
+            "board_id": board_id,
+            "v": version,
+            "user_id": user_id,
+            "ids": touched_ids(ops),
+            "ops": ops,
+            "created_at": now,
+        })
+        if version > OP_LOG_LIMIT:
+            await blackboard_op_log_collection.delete_many(
+                {"board_id": board_id, "v": {"$lte": version - OP_LOG_LIMIT}}
+            )
+    except Exception as exc:
+        logger.warning(f"[blackboard_ops] Logging version {version} of board {board_id} failed: {exc}")
+
+
+async def entries_since(board_id: str, since: int, until: int) -> List[dict]:
+    """Logged patches with ``since < v <= until``, oldest first."""
+    if until <= since:
+        return []
+    return await blackboard_op_log_collection.find(
+        {"board_id": board_id, "v": {"$gt": since, "$lte": until}},
+        {"_id": 0, "board_id": 0, "created_at": 0},
+    ).sort("v", 1).to_list(length=OP_LOG_LIMIT)
+
+
+def parse_if_match(header: Optional[str]) -> Optional[int]:
+    """
+    ``"7"``, ``W/"7"`` or ``7`` -> 7. ``*`` -> -1, meaning "whatever is current".
+    Returns None when the header is missing or malformed.
+    """
+    if header is None:
+        return None
+    value = header.strip()
+    if value == "*":
+        return -1
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    return int(value) if value.isdigit() else None
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
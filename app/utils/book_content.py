@@ -0,0 +1,451 @@
+"""
+Block storage for book content.
+
+``Book.full_content`` used to be one Lexical JSON string that every save
+rewrote and every reader ``json.loads``-ed in full. Books are now stored as
+one ``book_blocks`` document per top-level Lexical node, with the ordering and
+a section index kept on the book:
+
+    books:        content_format = "blocks"
+                  content_root   = root attributes (direction, format, ...)
+                  block_index    = [{"id": <block _id>, "hash": <node hash>}, ...]
+                  sections       = [{"title", "start", "count"}, ...]
+                  content_version
+    book_blocks:  {_id, book_id, user_id, node, hash, updated_at}
+
+A section starts at each top-level heading (content before the first heading
+is an untitled section). Readers fetch a range of sections; writers patch
+individual blocks. Both touch only the blocks involved.
+
+Blocks are copy-on-write: new or changed nodes are inserted under fresh ids,
+the index is committed only after those writes succeed, and the blocks it
+no longer references are deleted last. An index a reader holds therefore
+always points at blocks that exist with the content it expects.
+
+Compatibility: books that were never re-saved keep a plain ``full_content``
+string, and ``load_full_content`` / ``with_full_content`` rebuild the string
+for block-stored books, so every existing reader keeps working. A
+``full_content`` save is diffed against the stored block hashes and only the
+changed blocks are written.
+
+Non-Lexical content (legacy HTML books) is kept as a plain string.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import InsertOne
+
+from app.config.database import book_blocks_collection, books_collection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+BLOCKS_FORMAT = "blocks"
+
+#: Book fields owned by block storage — never returned to clients as-is.
+BLOCK_FIELDS = ("content_format", "content_root", "block_index", "sections", "content_version")
+
+#: Projection for readers that need the book's text (plus title/author).
+CONTENT_PROJECTION: Dict[str, int] = {
+    "title": 1,
+    "author": 1,
+    "user_id": 1,
+    "full_content": 1,
+    "content_format": 1,
+    "content_root": 1,
+    "block_index": 1,
+    "content_version": 1,
+    "text_version": 1,
+}
+
+_ROOT_DEFAULTS: Dict[str, Any] = {
+    "direction": "ltr",
+    "format": "",
+    "indent": 0,
+    "type": "root",
+    "version": 1,
+}
+
+
+def _book_id_filter(book_id: Any) -> Any:
+    book_id = str(book_id)
+    return ObjectId(book_id) if ObjectId.is_valid(book_id) else book_id
+
+
+def block_hash(node: dict) -> str:
+    """Stable hash of one Lexical node, used to diff saves."""
+    encoded = json.dumps(node, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_lexical_blocks(full_content: Optional[str]) -> Optional[Tuple[dict, List[dict]]]:
+    """
+    Split a serialized Lexical state into (root attributes, top-level nodes).
+    Returns ``None`` for anything that is not a Lexical document.
+    """
+    if not full_content:
+        return None
+    try:
+        data = json.loads(full_content)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    root = data.get("root") if isinstance(data, dict) else None
+    if not isinstance(root, dict) or not isinstance(root.get("children"), list):
+        return None
+    attrs = {k: v for k, v in root.items() if k != "children"}
+    return attrs, [n for n in root["children"] if isinstance(n, dict)]
+
+
+def _node_text(node: dict) -> str:
+    if node.get("type") == "text":
+        return node.get("text", "")
+    return "".join(_node_text(c) for c in node.get("children", []) if isinstance(c, dict))
+
+
+def build_sections(nodes: List[dict]) -> List[Dict[str, Any]]:
+    """Section index: a new section starts at every top-level heading."""
+    sections: List[Dict[str, Any]] = []
+    for position, node in enumerate(nodes):
+        if node.get("type") == "heading" or not sections:
+            title = _node_text(node).strip()[:200] if node.get("type") == "heading" else None
+            sections.append({"title": title, "start": position, "count": 0})
+        sections[-1]["count"] += 1
+    return sections
+
+
+def _serialize(root_attrs: Optional[dict], nodes: List[dict]) -> str:
+    root = dict(_ROOT_DEFAULTS)
+    root.update(root_attrs or {})
+    root["children"] = nodes
+    return json.dumps({"root": root})
+
+
+async def load_blocks(book: dict, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Return ``[{"id", "node"}]`` for block positions ``[start, stop)`` in order."""
+    entries = (book.get("block_index") or [])[start:stop]
+    if not entries:
+        return []
+    ids = [ObjectId(e["id"]) for e in entries]
+    found: Dict[str, dict] = {}
+    async for doc in book_blocks_collection.find({"_id": {"$in": ids}}, {"node": 1}):
+        found[str(doc["_id"])] = doc["node"]
+    # A block missing here was removed by an edit that committed between the
+    # index read and this fetch — skip it rather than fail the read.
+    return [{"id": e["id"], "node": found[e["id"]]} for e in entries if e["id"] in found]
+
+
+async def iter_block_batches(book: dict, batch_size: int = 200) -> AsyncIterator[List[dict]]:
+    """Yield the book's nodes in document order, ``batch_size`` blocks at a time."""
+    total = len(book.get("block_index") or [])
+    for start in range(0, total, batch_size):
+        blocks = await load_blocks(book, start, start + batch_size)
+        yield [b["node"] for b in blocks]
+
+
+def serialize_nodes(root_attrs: Optional[dict], nodes: List[dict]) -> str:
+    """Wrap top-level nodes back into a Lexical JSON string."""
+    return _serialize(root_attrs, nodes)
+
+
+async def load_full_content(book: dict) -> str:
+    """The book's content as a Lexical JSON string, whichever way it is stored."""
+    if book.get("content_format") != BLOCKS_FORMAT:
+        return book.get("full_content") or ""
+    blocks = await load_blocks(book)
+    return _serialize(book.get("content_root"), [b["node"] for b in blocks])
+
+
+async def with_full_content(book: dict) -> dict:
+    """Compatibility view: fill ``full_content`` and drop the block fields."""
+    if book.get("content_format") == BLOCKS_FORMAT:
+        book["full_content"] = await load_full_content(book)
+    for field in BLOCK_FIELDS:
+        book.pop(field, None)
+    book.pop("text_version", None)
+    return book
+
+
+def _version_filter(book: dict) -> Dict[str, Any]:
+    version = book.get("content_version") or 0
+    return {
+        "_id": _book_id_filter(book["_id"]),
+        # Books saved before block storage have no content_version yet.
+        "content_version": {"$in": [0, None]} if version == 0 else version,
+    }
+
+
+async def _commit_index(
+    book: dict,
+    set_fields: Dict[str, Any],
+    unset_fields: Optional[Dict[str, str]] = None,
+) -> int:
+    """
+    Swap in the new index, guarded on ``content_version``. This is the commit
+    point: a concurrent save that read the same version gets 409 and its
+    blocks are never referenced.
+    """
+    update: Dict[str, Any] = {"$set": set_fields, "$inc": {"content_version": 1}}
+    if unset_fields:
+        update["$unset"] = unset_fields
+    result = await books_collection.update_one(_version_filter(book), update)
+    if result.matched_count == 0:
+        raise HTTPException(
+            status_code=409,
+            detail="Book content changed since it was loaded; reload and retry",
+        )
+    return (book.get("content_version") or 0) + 1
+
+
+def _new_block(book: dict, node: dict, digest: str, now: datetime) -> Tuple[str, InsertOne]:
+    oid = ObjectId()
+    return str(oid), InsertOne({
+        "_id": oid,
+        "book_id": str(book["_id"]),
+        "user_id": book.get("user_id"),
+        "node": node,
+        "hash": digest,
+        "updated_at": now,
+    })
+
+
+async def _write_and_commit(
+    book: dict,
+    inserts: List[InsertOne],
+    superseded: List[ObjectId],
+    set_fields: Dict[str, Any],
+    unset_fields: Optional[Dict[str, str]] = None,
+) -> int:
+    """
+    Write the new blocks, commit the index that references them, then delete
+    the blocks it replaced. If the write or the commit fails, the new blocks
+    are removed again and the stored book is unchanged.
+    """
+    book_id = str(book["_id"])
+    written = [op._doc["_id"] for op in inserts]
+    try:
+        if inserts:
+            await book_blocks_collection.bulk_write(inserts, ordered=False)
+        version = await _commit_index(book, set_fields, unset_fields)
+    except BaseException:
+        if written:
+            await book_blocks_collection.delete_many({"_id": {"$in": written}, "book_id": book_id})
+        raise
+    if superseded:
+        await book_blocks_collection.delete_many({"_id": {"$in": superseded}, "book_id": book_id})
+    return version
+
+
+async def save_full_content(
+    book: dict,
+    full_content: str,
+    now: datetime,
+    extra_fields: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    Store a whole-document save, writing only the blocks that changed.
+
+    The new top-level nodes are diffed against the stored block hashes: equal
+    runs keep their blocks untouched, every other node is written as a new
+    block, and blocks no longer in the document are deleted after the commit.
+    ``extra_fields`` are other book fields set in the same update. Returns
+    the new content version.
+    """
+    book_id = str(book["_id"])
+    extra_fields = dict(extra_fields or {})
+    parsed = parse_lexical_blocks(full_content)
+
+    if parsed is None:
+        # Not Lexical (legacy HTML) — keep it as a plain string.
+        version = await _commit_index(
+            book,
+            {**extra_fields, "full_content": full_content},
+            {field: "" for field in BLOCK_FIELDS if field != "content_version"},
+        )
+        if book.get("content_format") == BLOCKS_FORMAT:
+            await book_blocks_collection.delete_many({"book_id": book_id})
+        return version
+
+    root_attrs, nodes = parsed
+    old_index: List[Dict[str, str]] = (
+        book.get("block_index") or [] if book.get("content_format") == BLOCKS_FORMAT else []
+    )
+    new_hashes = [block_hash(n) for n in nodes]
+
+    inserts: List[InsertOne] = []
+    new_index: List[Dict[str, str]] = []
+    superseded: List[ObjectId] = []
+    matcher = SequenceMatcher(None, [e["hash"] for e in old_index], new_hashes, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            new_index.extend(old_index[i1:i2])
+            continue
+        for position in range(j1, j2):
+            block_id, insert = _new_block(book, nodes[position], new_hashes[position], now)
+            inserts.append(insert)
+            new_index.append({"id": block_id, "hash": new_hashes[position]})
+        superseded.extend(ObjectId(e["id"]) for e in old_index[i1:i2])
+
+    version = await _write_and_commit(
+        book,
+        inserts,
+        superseded,
+        {
+            **extra_fields,
+            "content_format": BLOCKS_FORMAT,
+            "content_root": root_attrs,
+            "block_index": new_index,
+            "sections": build_sections(nodes),
+        },
+        {"full_content": ""},
+    )
+    logger.info(
+        f"Book {book_id} saved as blocks: {len(new_index)} blocks, "
+        f"{len(inserts)} written, {len(superseded)} removed"
+    )
+    return version
+
+
+async def ensure_blocks(book: dict, now: datetime) -> dict:
+    """
+    Convert a book still stored as a single string to blocks, in place.
+    Raises 422 when its content is not Lexical and cannot be split.
+    """
+    if book.get("content_format") == BLOCKS_FORMAT:
+        return book
+    full_content = book.get("full_content") or _serialize(None, [])
+    if parse_lexical_blocks(full_content) is None:
+        raise HTTPException(status_code=422, detail="Book content is not in block format")
+    await save_full_content(book, full_content, now)
+    fresh = await books_collection.find_one({"_id": _book_id_filter(book["_id"])})
+    fresh["_id"] = str(fresh["_id"])
+    return fresh
+
+
+async def patch_blocks(
+    book: dict,
+    ops: List[Dict[str, Any]],
+    base_version: Optional[int],
+    now: datetime,
+) -> Dict[str, Any]:
+    """
+    Apply block operations to a block-stored book.
+
+    ops: ``{"op": "update", "id", "node"}``, ``{"op": "insert", "after", "node"}``
+    (``after=None`` inserts at the start) and ``{"op": "delete", "id"}``,
+    applied in order. ``base_version`` (when given) must match the stored
+    ``content_version``. An updated block is stored under a new id; later ops
+    in the same patch may still name it by its old one. Returns the new
+    version, the ids of inserted blocks, the new id of each updated block
+    (``replaced_ids``, old -> new) and the refreshed section index.
+    """
+    current = book.get("content_version") or 0
+    if base_version is not None and base_version != current:
+        raise HTTPException(
+            status_code=409,
+            detail="Book content changed since it was loaded; reload and retry",
+        )
+
+    index: List[Dict[str, str]] = list(book.get("block_index") or [])
+    stored_ids = {e["id"] for e in index}
+    positions = {e["id"]: i for i, e in enumerate(index)}
+    inserts: Dict[str, InsertOne] = {}
+    inserted: List[str] = []
+    replaced: Dict[str, str] = {}  # stored block id -> id of its new version
+    touched: Dict[str, dict] = {}  # block id -> new node (for the section index)
+
+    def position_of(block_id: str) -> int:
+        block_id = replaced.get(block_id, block_id)
+        if block_id not in positions:
+            raise HTTPException(status_code=404, detail=f"Block {block_id} not found")
+        return positions[block_id]
+
+    for op in ops:
+        kind = op.get("op")
+        if kind == "update":
+            position = position_of(op["id"])
+            current_id = index[position]["id"]
+            digest = block_hash(op["node"])
+            block_id, insert = _new_block(book, op["node"], digest, now)
+            inserts[block_id] = insert
+            index[position] = {"id": block_id, "hash": digest}
+            touched.pop(current_id, None)
+            touched[block_id] = op["node"]
+            # The block's previous version may itself be new in this patch.
+            inserts.pop(current_id, None)
+            if current_id in inserted:
+                inserted[inserted.index(current_id)] = block_id
+            elif current_id in stored_ids:
+                replaced[current_id] = block_id
+            else:
+                original = next(old for old, new in replaced.items() if new == current_id)
+                replaced[original] = block_id
+        elif kind == "insert":
+            position = 0 if op.get("after") is None else position_of(op["after"]) + 1
+            digest = block_hash(op["node"])
+            block_id, insert = _new_block(book, op["node"], digest, now)
+            inserts[block_id] = insert
+            index.insert(position, {"id": block_id, "hash": digest})
+            touched[block_id] = op["node"]
+            inserted.append(block_id)
+        elif kind == "delete":
+            position = position_of(op["id"])
+            removed_id = index.pop(position)["id"]
+            touched.pop(removed_id, None)
+            inserts.pop(removed_id, None)
+            if removed_id in inserted:
+                inserted.remove(removed_id)
+            replaced = {old: new for old, new in replaced.items() if new != removed_id}
+        else:
+            raise HTTPException(status_code=422, detail=f"Unknown block op: {kind}")
+        positions = {e["id"]: i for i, e in enumerate(index)}
+
+    live_ids = {e["id"] for e in index}
+    superseded = [ObjectId(block_id) for block_id in stored_ids - live_ids]
+    sections = await _rebuild_sections(book, index, touched)
+    version = await _write_and_commit(
+        book,
+        list(inserts.values()),
+        superseded,
+        {"block_index": index, "sections": sections, "updated_at": now},
+    )
+    return {
+        "content_version": version,
+        "inserted_ids": inserted,
+        "replaced_ids": replaced,
+        "sections": sections,
+    }
+
+
+async def _rebuild_sections(
+    book: dict, index: List[Dict[str, str]], touched: Dict[str, dict]
+) -> List[Dict[str, Any]]:
+    """
+    Recompute the section index after a patch. Only headings matter, so the
+    known heading blocks come from the old index and the patched nodes — the
+    rest of the document is never loaded.
+    """
+    old_index = book.get("block_index") or []
+    headings: Dict[str, Optional[str]] = {}
+    for section in book.get("sections") or []:
+        start = section.get("start", 0)
+        if section.get("title") is not None and start < len(old_index):
+            headings[old_index[start]["id"]] = section["title"]
+    for block_id, node in touched.items():
+        if node.get("type") == "heading":
+            headings[block_id] = _node_text(node).strip()[:200]
+        else:
+            headings.pop(block_id, None)
+
+    sections: List[Dict[str, Any]] = []
+    for position, entry in enumerate(index):
+        if entry["id"] in headings or not sections:
+            sections.append({"title": headings.get(entry["id"]), "start": position, "count": 0})
+        sections[-1]["count"] += 1
+    return sections
@@ -0,0 +1,180 @@
+"""
+Move images embedded as base64 ``data:`` URIs out of book content and into the
+storage backend.
+
+The PDF importer renders every image as an inline ``data:`` URI, and editor
+pastes can do the same. Left in ``Book.full_content`` they inflate the document
+toward Mongo's 16 MB limit and are dragged through memory by every read, edit
+and reindex. ``externalize_inline_images`` uploads each distinct image once and
+rewrites the text to point at its URL.
+
+Images are deduplicated by SHA-256 of the decoded bytes, per user, through
+``book_images_collection``: the same logo on 300 pages, or the same figure in
+two books, is uploaded once. The content hash is also the storage public_id, so
+a lost race between two imports overwrites nothing.
+
+Works on any text — the importer's HTML or serialized Lexical JSON — because
+base64 never contains characters that JSON escapes.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import re
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from app.config.database import book_images_collection
+from app.utils.logger import get_logger
+from app.utils.storage import StorageBackend, get_storage_backend
+
+logger = get_logger(__name__)
+
+#: Parallel uploads per call.
+IMAGE_UPLOAD_CONCURRENCY = 4
+
+#: Images larger than this stay inline rather than being uploaded.
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+DATA_URI_RE = re.compile(r"data:image/(?P<ext>[A-Za-z0-9.+-]+);base64,(?P<data>[A-Za-z0-9+/]+={0,2})")
+
+
+class ExternalizeStats:
+    """Counters for one ``externalize_inline_images`` call."""
+
+    def __init__(self) -> None:
+        self.found: int = 0          # distinct data URIs in the text
+        self.uploaded: int = 0       # newly uploaded to storage
+        self.reused: int = 0         # already stored for this user
+        self.failed: int = 0         # left inline (decode/upload error or too large)
+        self.bytes_removed: int = 0  # characters of base64 replaced by URLs
+
+    def __repr__(self) -> str:
+        return (
+            f"ExternalizeStats(found={self.found}, uploaded={self.uploaded}, "
+            f"reused={self.reused}, failed={self.failed}, bytes_removed={self.bytes_removed})"
+        )
+
+
+def has_inline_images(text: Optional[str]) -> bool:
+    """Cheap pre-check so callers can skip the regex pass for most documents."""
+    return bool(text) and "data:image/" in text
+
+
+def _decode(data: str) -> Optional[bytes]:
+    try:
+        return base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+async def _store_image(
+    storage: StorageBackend, user_id: str, digest: str, ext: str, content: bytes
+) -> str:
+    """Upload one image and record it; returns the URL to use."""
+    result = await storage.upload(
+        file_content=content,
+        filename=f"{digest}.{ext}",
+        folder=f"nowry/{user_id}/books/images",
+        public_id=digest,
+        overwrite=False,
+    )
+    url = result.get("secure_url") or result.get("url")
+    if not url:
+        raise RuntimeError("storage backend returned no URL")
+    try:
+        await book_images_collection.insert_one({
+            "user_id": user_id,
+            "sha256": digest,
+            "url": url,
+            "public_id": result.get("public_id"),
+            "format": result.get("format") or ext,
+            "bytes": len(content),
+            "created_at": datetime.now(timezone.utc),
+        })
+    except DuplicateKeyError:
+        # A concurrent import stored the same image first — use its record.
+        existing = await book_images_collection.find_one(
+            {"user_id": user_id, "sha256": digest}, {"url": 1}
+        )
+        if existing:
+            url = existing["url"]
+    return url
+
+
+async def externalize_inline_images(
+    text: str,
+    user_id: str,
+    storage: Optional[StorageBackend] = None,
+) -> Tuple[str, ExternalizeStats]:
+    """
+    Replace every ``data:image/...;base64,`` URI in ``text`` with a storage URL.
+
+    An image that cannot be decoded or uploaded is left inline — the content
+    stays intact and a later run (e.g. the migration) can retry it.
+    """
+    stats = ExternalizeStats()
+    if not has_inline_images(text):
+        return text, stats
+
+    uris: Dict[str, Tuple[str, str]] = {}  # data URI -> (ext, base64 payload)
+    for match in DATA_URI_RE.finditer(text):
+        uris.setdefault(match.group(0), (match.group("ext").lower(), match.group("data")))
+    stats.found = len(uris)
+
+    images: Dict[str, Tuple[str, bytes]] = {}  # sha256 -> (ext, bytes)
+    uri_digest: Dict[str, str] = {}
+    for uri, (ext, data) in uris.items():
+        content = _decode(data)
+        if not content or len(content) > MAX_IMAGE_BYTES:
+            stats.failed += 1
+            continue
+        digest = hashlib.sha256(content).hexdigest()
+        uri_digest[uri] = digest
+        images.setdefault(digest, (ext, content))
+
+    if not images:
+        return text, stats
+
+    digest_url: Dict[str, str] = {}
+    async for doc in book_images_collection.find(
+        {"user_id": user_id, "sha256": {"$in": list(images)}}, {"sha256": 1, "url": 1}
+    ):
+        digest_url[doc["sha256"]] = doc["url"]
+    stats.reused = len(digest_url)
+
+    missing = [d for d in images if d not in digest_url]
+    if missing:
+        if storage is None:
+            storage = get_storage_backend(os.getenv("STORAGE_BACKEND", "cloudinary"))
+        semaphore = asyncio.Semaphore(IMAGE_UPLOAD_CONCURRENCY)
+
+        async def upload_one(digest: str) -> Tuple[str, Optional[str]]:
+            ext, content = images[digest]
+            async with semaphore:
+                try:
+                    return digest, await _store_image(storage, user_id, digest, ext, content)
+                except Exception as e:
+                    logger.warning(f"Book image upload failed for user {user_id} ({digest[:12]}): {e}")
+                    return digest, None
+
+        for digest, url in await asyncio.gather(*(upload_one(d) for d in missing)):
+            if url:
+                digest_url[digest] = url
+                stats.uploaded += 1
+
+    stats.failed += sum(1 for uri, digest in uri_digest.items() if digest not in digest_url)
+
+    def replace(match: "re.Match[str]") -> str:
+        url = digest_url.get(uri_digest.get(match.group(0), ""))
+        if url is None:
+            return match.group(0)
+        stats.bytes_removed += len(match.group(0)) - len(url)
+        return url
+
+    return DATA_URI_RE.sub(replace, text), stats
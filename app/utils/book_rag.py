@@ -25,7 +25,7 @@ from __future__ import annotations
 
 import logging
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 from app.config.database import book_chunks_collection
 from app.utils.embeddings import chunk_text, embed_query, embed_texts, extract_plain_text
@@ -33,14 +33,20 @@ from app.utils.embeddings import chunk_text, embed_query, embed_texts, extract_p
 logger = logging.getLogger(__name__)
 
 
-async def index_book(book_id: str, user_id: str, raw_content: str) -> None:
+async def index_book(
+    book_id: str,
+    user_id: str,
+    raw_content: str = "",
+    plain_text: Optional[str] = None,
+) -> None:
     """
     Chunk + embed a book's content and upsert into book_chunks collection.
     Called in the background after every book save — non-blocking.
+    Pass ``plain_text`` (the stored text derivative) to skip re-extraction.
     All exceptions are caught internally so the background task never raises.
     """
     try:
-        plain = extract_plain_text(raw_content)
+        plain = plain_text if plain_text is not None else extract_plain_text(raw_content)
         if not plain.strip():
             logger.info("[book_rag] Book %s has no text — skipping index", book_id)
             return
@@ -83,23 +89,21 @@ async def index_book(book_id: str, user_id: str, raw_content: str) -> None:
         # Non-fatal — book save already succeeded; RAG will not have latest content
 
 
-async def retrieve_book_context(
+async def retrieve_book_chunks(
     book_id: str,
     user_id: str,
     query: str,
     top_k: int = 4,
-) -> Optional[str]:
+) -> List[Dict[str, Any]]:
     """
-    Embed the query and retrieve the top-k most relevant chunks from the book.
-
-    Returns a formatted string ready to inject into the system prompt, or None if
-    no chunks are indexed yet or Atlas Vector Search is unavailable.
-    All exceptions are caught so the chat endpoint always works even when RAG fails.
+    Embed the query and return the top-k chunks as ``[{"text", "chunk_index"}]``,
+    best first. Returns [] when nothing is indexed or vector search is
+    unavailable — never raises.
     """
     try:
         query_vector = embed_query(query)
         if not query_vector:
-            return None
+            return []
 
         pipeline = [
             {
@@ -122,16 +126,30 @@ async def retrieve_book_context(
         ]
 
         cursor = book_chunks_collection.aggregate(pipeline)
-        chunks = await cursor.to_list(length=top_k)
-
-        if not chunks:
-            return None
-
-        # Sort by chunk_index to preserve reading order
-        chunks.sort(key=lambda c: c.get("chunk_index", 0))
-        combined = "\n\n---\n\n".join(c["text"] for c in chunks)
-        return combined
+        return await cursor.to_list(length=top_k)
 
     except Exception as exc:
         logger.warning("[book_rag] Retrieval failed for book %s: %s", book_id, exc)
+        return []
+
+
+async def retrieve_book_context(
+    book_id: str,
+    user_id: str,
+    query: str,
+    top_k: int = 4,
+) -> Optional[str]:
+    """
+    Embed the query and retrieve the top-k most relevant chunks from the book.
+
+    Returns a formatted string ready to inject into the system prompt, or None if
+    no chunks are indexed yet or Atlas Vector Search is unavailable.
+    All exceptions are caught so the chat endpoint always works even when RAG fails.
+    """
+    chunks = await retrieve_book_chunks(book_id, user_id, query, top_k)
+    if not chunks:
         return None
+
+    # Sort by chunk_index to preserve reading order
+    chunks.sort(key=lambda c: c.get("chunk_index", 0))
+    return "\n\n---\n\n".join(c["text"] for c in chunks)
@@ -0,0 +1,189 @@
+"""
+Lexical full-book retrieval for the agent's ``read_book_section`` tool.
+
+Each book gets an in-memory inverted index over its plain-text derivative
+(app/utils/book_text.py), split into passages of about ``PASSAGE_CHARS``
+characters along block boundaries. Passages are ranked with BM25.
+
+Indexes are built after every content save, from the derivative that save
+just stored. They are kept in a per-worker LRU keyed by book id and
+validated against the book's ``content_version``, so a hit never touches
+Mongo. On a miss (cold worker, evicted, stale) the index is rebuilt from
+``load_book_text``.
+
+``hybrid_search`` fuses the BM25 ranking with the vector hits from
+``book_rag.retrieve_book_chunks`` by reciprocal rank fusion, when vector
+search is available.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import re
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.utils.book_text import load_book_text
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Target passage size; a single block longer than this is its own passage.
+PASSAGE_CHARS = 800
+
+#: Books whose index is kept in memory per worker.
+CACHE_SIZE: int = int(os.getenv("BOOK_INDEX_CACHE_SIZE", "64"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+#: Reciprocal rank fusion constant (standard value from the RRF paper).
+RRF_K = 60
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1 or t.isdigit()]
+
+
+def split_passages(derivative: Dict[str, Any], passage_chars: int = PASSAGE_CHARS) -> List[Dict[str, Any]]:
+    """Group consecutive blocks into passages of about ``passage_chars``."""
+    text = derivative.get("text") or ""
+    passages: List[Dict[str, Any]] = []
+    start = end = None
+    for block in derivative.get("blocks") or []:
+        if start is not None and block["end"] - start > passage_chars:
+            passages.append({"start": start, "end": end})
+            start = None
+        if start is None:
+            start = block["start"]
+        end = block["end"]
+    if start is not None:
+        passages.append({"start": start, "end": end})
+    if not passages and text:
+        passages.append({"start": 0, "end": len(text)})
+    for passage in passages:
+        passage["text"] = text[passage["start"]:passage["end"]].strip()
+    return [p for p in passages if p["text"]]
+
+
+class BookIndex:
+    """BM25 inverted index over one book's passages."""
+
+    def __init__(self, passages: List[Dict[str, Any]], content_version: int = 0) -> None:
+        self.passages = passages
+        self.content_version = content_version
+        self.postings: Dict[str, List[tuple]] = {}
+        self.lengths: List[int] = []
+        for position, passage in enumerate(passages):
+            counts = Counter(tokenize(passage["text"]))
+            self.lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self.postings.setdefault(term, []).append((position, frequency))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    @classmethod
+    def from_derivative(cls, derivative: Dict[str, Any], content_version: int = 0) -> "BookIndex":
+        return cls(split_passages(derivative), content_version)
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Passages ranked by BM25, best first, each with its ``score``."""
+        count = len(self.passages)
+        if not count:
+            return []
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[position] / (self.average_length or 1))
+                scores[position] = scores.get(position, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return [{**self.passages[position], "score": score} for position, score in ranked]
+
+
+class IndexCache:
+    """LRU of ``BookIndex`` by book id, capped at ``max_books`` entries."""
+
+    def __init__(self, max_books: int = CACHE_SIZE) -> None:
+        self.max_books = max_books
+        self._entries: "OrderedDict[str, BookIndex]" = OrderedDict()
+
+    def get(self, book_id: str, content_version: int) -> Optional[BookIndex]:
+        index = self._entries.get(book_id)
+        if index is None or index.content_version != content_version:
+            return None
+        self._entries.move_to_end(book_id)
+        return index
+
+    def put(self, book_id: str, index: BookIndex) -> None:
+        self._entries[book_id] = index
+        self._entries.move_to_end(book_id)
+        while len(self._entries) > self.max_books:
+            self._entries.popitem(last=False)
+
+    def discard(self, book_id: str) -> None:
+        self._entries.pop(book_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+cache = IndexCache()
+
+
+async def index_derivative(book_id: str, derivative: Dict[str, Any], content_version: int) -> BookIndex:
+    """Build (off the event loop) and cache the index for a freshly stored derivative."""
+    index = await asyncio.to_thread(BookIndex.from_derivative, derivative, content_version)
+    cache.put(str(book_id), index)
+    logger.info(f"[book_search] Indexed book {book_id} v{content_version}: {len(index.passages)} passages")
+    return index
+
+
+async def get_index(book: dict) -> BookIndex:
+    """The book's index; ``book`` needs ``CONTENT_PROJECTION``."""
+    book_id = str(book["_id"])
+    version = book.get("content_version") or 0
+    index = cache.get(book_id, version)
+    if index is None:
+        index = await index_derivative(book_id, await load_book_text(book), version)
+    return index
+
+
+def fuse(rankings: List[List[str]], top_k: int) -> List[str]:
+    """Reciprocal rank fusion of several ranked lists of passage texts."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, text in enumerate(ranking):
+            scores[text] = scores.get(text, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(scores, key=lambda text: -scores[text])[:top_k]
+
+
+async def hybrid_search(book: dict, user_id: str, query: str, top_k: int = 6) -> List[str]:
+    """Top passages for ``query`` from BM25, fused with vector hits when available."""
+    from app.utils.book_rag import retrieve_book_chunks
+
+    lexical = [hit["text"] for hit in (await get_index(book)).search(query, top_k * 2)]
+    vector = [chunk["text"] for chunk in await retrieve_book_chunks(str(book["_id"]), user_id, query, top_k)]
+    if not vector:
+        return lexical[:top_k]
+    # A vector chunk that repeats a lexical passage counts as a vote for it.
+    vector = [next((p for p in lexical if chunk in p or p in chunk), chunk) for chunk in vector]
+    return fuse([lexical, vector], top_k)
+
+
+__all__ = [
+    "BookIndex",
+    "IndexCache",
+    "cache",
+    "fuse",
+    "get_index",
+    "hybrid_search",
+    "index_derivative",
+    "split_passages",
+    "tokenize",
+]
@@ -0,0 +1,262 @@
+"""
+Plain-text derivative of book content.
+
+Plain text used to be re-extracted from the Lexical JSON on every AI call by
+five separate recursive walkers, each with its own joining and truncation
+rules. It is now extracted once per save by one iterative extractor and
+stored in ``book_texts``:
+
+    book_texts:  {_id: <book _id>, user_id, content_version, extractor_version,
+                  content_hash, text, chars,
+                  blocks:  [{"start", "end", "type", "id"}, ...],   # one per top-level node
+                  outline: [{"title", "level", "block", "offset"}, ...]}
+    books:       text_version = "<extractor_version>:<content_version>"
+
+Top-level blocks are joined with a blank line (``\\n\\n``). ``blocks`` maps
+each block to its character range in ``text``. For block-stored books it
+also carries the block id. ``outline`` lists headings with their offsets.
+
+The book's ``text_version`` marks which save the stored derivative belongs to.
+``load_book_text`` serves the stored copy when the marker matches the
+book's current ``content_version``. Otherwise it extracts on the spot,
+streaming block-stored books batch by batch and stopping at ``max_chars``.
+``refresh_book_text`` runs after each save to bring the stored copy
+forward.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from app.config.database import book_texts_collection, books_collection
+from app.utils.book_content import (
+    BLOCKS_FORMAT,
+    CONTENT_PROJECTION,
+    _book_id_filter,
+    iter_block_batches,
+    parse_lexical_blocks,
+)
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Bump when extraction rules change; every stored derivative goes stale.
+TEXT_VERSION = 1
+
+BLOCK_SEPARATOR = "\n\n"
+
+# Nested block-level nodes (inside lists, quotes, tables) start a new line.
+_NESTED_BLOCKS = frozenset({"paragraph", "heading", "quote", "listitem", "list", "code", "tablerow", "tablecell"})
+_HEADING_TAG = re.compile(r"^h([1-6])$")
+_HTML_TAG = re.compile(r"<[^>]+>")
+_BLANK_RUNS = re.compile(r"\n{3,}")
+
+
+def node_text(node: dict) -> str:
+    """Text of one Lexical node and its descendants (iterative, no recursion)."""
+    parts: List[str] = []
+    stack: List[Any] = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+            continue
+        if not isinstance(item, dict):
+            continue
+        node_type = item.get("type")
+        if isinstance(item.get("text"), str):
+            parts.append(item["text"])
+        elif node_type == "linebreak":
+            parts.append("\n")
+        elif node_type == "tab":
+            parts.append("\t")
+        children = item.get("children") or []
+        for position in range(len(children) - 1, -1, -1):
+            child = children[position]
+            stack.append(child)
+            if position and isinstance(child, dict) and child.get("type") in _NESTED_BLOCKS:
+                stack.append("\n")
+    return "".join(parts)
+
+
+def _heading_level(node: dict) -> Optional[int]:
+    if node.get("type") != "heading":
+        return None
+    match = _HEADING_TAG.match(str(node.get("tag") or ""))
+    return int(match.group(1)) if match else 1
+
+
+class TextBuilder:
+    """Accumulates the derivative block by block; stops once ``max_chars`` is reached."""
+
+    def __init__(self, max_chars: Optional[int] = None) -> None:
+        self.max_chars = max_chars
+        self._parts: List[str] = []
+        self._offset = 0
+        self.blocks: List[Dict[str, Any]] = []
+        self.outline: List[Dict[str, Any]] = []
+
+    @property
+    def full(self) -> bool:
+        return self.max_chars is not None and self._offset >= self.max_chars
+
+    def add_text(self, text: str, block_type: str = "paragraph", block_id: Optional[str] = None,
+                 level: Optional[int] = None) -> None:
+        text = _BLANK_RUNS.sub("\n\n", text.strip())
+        start = self._offset + (len(BLOCK_SEPARATOR) if self._parts else 0)
+        self._parts.append(text)
+        self._offset = start + len(text)
+        self.blocks.append({"start": start, "end": self._offset, "type": block_type, "id": block_id})
+        if level is not None and text:
+            self.outline.append({"title": text[:200], "level": level, "block": len(self.blocks) - 1, "offset": start})
+
+    def add_node(self, node: dict, block_id: Optional[str] = None) -> None:
+        self.add_text(node_text(node), node.get("type") or "paragraph", block_id, _heading_level(node))
+
+    def add_nodes(self, nodes: List[dict], block_ids: Optional[List[str]] = None) -> None:
+        for position, node in enumerate(nodes):
+            if self.full:
+                return
+            self.add_node(node, block_ids[position] if block_ids else None)
+
+    def result(self) -> Dict[str, Any]:
+        text = BLOCK_SEPARATOR.join(self._parts)
+        truncated = self.max_chars is not None and len(text) > self.max_chars
+        if truncated:
+            text = text[: self.max_chars]
+        return {
+            "text": text,
+            "chars": len(text),
+            "blocks": self.blocks,
+            "outline": self.outline,
+            "content_hash": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+            "truncated": truncated,
+        }
+
+
+def extract_text(full_content: Optional[str], max_chars: Optional[int] = None) -> Dict[str, Any]:
+    """Derivative of a serialized document (Lexical JSON, or legacy HTML/plain text)."""
+    builder = TextBuilder(max_chars)
+    parsed = parse_lexical_blocks(full_content)
+    if parsed is None:
+        if full_content:
+            builder.add_text(_HTML_TAG.sub(" ", full_content))
+    else:
+        builder.add_nodes(parsed[1])
+    return builder.result()
+
+
+def plain_text(full_content: Optional[str], max_chars: Optional[int] = None) -> str:
+    return extract_text(full_content, max_chars)["text"]
+
+
+def _marker(book: dict) -> str:
+    return f"{TEXT_VERSION}:{book.get('content_version') or 0}"
+
+
+async def compute_book_text(book: dict, max_chars: Optional[int] = None) -> Dict[str, Any]:
+    """Extract the derivative from the book's current content."""
+    if book.get("content_format") != BLOCKS_FORMAT:
+        return await asyncio.to_thread(extract_text, book.get("full_content") or "", max_chars)
+
+    builder = TextBuilder(max_chars)
+    position = 0
+    async for nodes in iter_block_batches(book):
+        ids = [e["id"] for e in (book.get("block_index") or [])[position:position + len(nodes)]]
+        position += len(nodes)
+        await asyncio.to_thread(builder.add_nodes, nodes, ids)
+        if builder.full:
+            break
+    return builder.result()
+
+
+async def load_book_text(book: dict, max_chars: Optional[int] = None) -> Dict[str, Any]:
+    """
+    The book's plain-text derivative: the stored copy when it matches the
+    book's current content, otherwise extracted now (not stored — the
+    post-save refresh owns writes). ``book`` needs ``CONTENT_PROJECTION``.
+    """
+    if book.get("text_version") == _marker(book):
+        stored = await book_texts_collection.find_one({"_id": _book_id_filter(book["_id"])})
+        if stored and stored.get("content_version") == (book.get("content_version") or 0):
+            if max_chars is not None and stored["chars"] > max_chars:
+                stored["text"] = stored["text"][:max_chars]
+                stored["truncated"] = True
+            return stored
+    return await compute_book_text(book, max_chars)
+
+
+async def refresh_book_text(book_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Rebuild and store the derivative for the book's current content, then
+    mark the book. Returns ``{"derivative", "previous", "content_version", "changed"}``:
+    ``previous`` is the replaced derivative's text and blocks (None if there
+    was none), ``changed`` is False when the text is identical to it.
+    Returns None if the book is gone.
+    """
+    book = await books_collection.find_one(
+        {"_id": _book_id_filter(book_id), "deleted_at": None}, CONTENT_PROJECTION,
+    )
+    if not book:
+        return None
+    version = book.get("content_version") or 0
+    derivative = await compute_book_text(book)
+    document = {
+        **{k: v for k, v in derivative.items() if k != "truncated"},
+        "user_id": book.get("user_id"),
+        "content_version": version,
+        "extractor_version": TEXT_VERSION,
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+    try:
+        previous = await book_texts_collection.find_one_and_replace(
+            {"_id": book["_id"], "content_version": {"$lte": version}},
+            document,
+            projection={"content_hash": 1, "text": 1, "blocks": 1},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # A newer save already stored its derivative.
+        logger.info(f"[book_text] Skipped stale refresh of book {book_id} at version {version}")
+        return {"derivative": derivative, "previous": None, "content_version": version, "changed": True}
+
+    await books_collection.update_one(
+        {"_id": book["_id"], "content_version": {"$in": [0, None]} if version == 0 else version},
+        {"$set": {"text_version": _marker(book)}},
+    )
+    changed = not previous or previous.get("content_hash") != derivative["content_hash"]
+    return {"derivative": derivative, "previous": previous, "content_version": version, "changed": changed}
+
+
+def block_at(derivative: Dict[str, Any], offset: int) -> Optional[int]:
+    """Index of the block whose text range contains ``offset``."""
+    blocks = derivative.get("blocks") or []
+    low, high = 0, len(blocks) - 1
+    while low <= high:
+        mid = (low + high) // 2
+        if offset < blocks[mid]["start"]:
+            high = mid - 1
+        elif offset > blocks[mid]["end"]:
+            low = mid + 1
+        else:
+            return mid
+    return None
+
+
+__all__ = [
+    "TEXT_VERSION",
+    "TextBuilder",
+    "block_at",
+    "compute_book_text",
+    "extract_text",
+    "load_book_text",
+    "node_text",
+    "plain_text",
+    "refresh_book_text",
+]
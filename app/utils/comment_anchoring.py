@@ -0,0 +1,313 @@
+"""
+Server-side re-anchoring of book comments after a content save.
+
+A comment's anchor records its quote, up to 40 characters of context on each
+side, and character offsets into the book's plain-text derivative
+(app/utils/book_text.py). When a save changes the text, one pass re-anchors
+every comment on the book:
+
+1. The old and new texts are diffed line by line. An anchor that falls
+   entirely inside an unchanged run is shifted by that run's offset delta,
+   with no text search at all. This covers most comments on most edits.
+2. The rest are located by fuzzy search. First comes an exact search for
+   the quote, ranked by how well its context matches and how close it is to
+   the expected position. Failing that, bitap (approximate matching with up
+   to 25% errors) runs around the expected position, and the candidate is
+   verified against the whole quote. Bitap is pure Python, so it only scans
+   the whole text of short books, and one pass scans at most
+   ``FUZZY_BUDGET_CHARS`` in total; anchors it has no budget left for are
+   treated as unplaceable.
+3. Anchors that cannot be placed are marked ``orphaned``. A comment that is
+   already orphaned is searched for again only when the edit touched the
+   text around its last known position; otherwise it stays as it is.
+
+The diff and the searches are CPU-bound, so they run in a worker thread. All
+changes are written with one ``bulk_write``. The pass covers the first
+``MAX_COMMENTS`` live comments of every user on the book: anchors describe
+the text, not the reader. It never touches a comment's body or resolved state.
+"""
+from __future__ import annotations
+
+import asyncio
+from bisect import bisect_right
+from datetime import datetime, timezone
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from app.config.database import comments_collection
+from app.utils.book_text import block_at
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CONTEXT_CHARS = 40
+#: CommentAnchor.quote max_length.
+MAX_QUOTE = 1000
+#: Bitap pattern length (one machine word of state per error level).
+BITAP_PATTERN = 32
+#: Characters searched on each side of the expected position.
+SEARCH_WINDOW = 2000
+#: Texts up to this long are also searched whole when the window misses.
+FULL_SEARCH_CHARS = 20_000
+#: Characters bitap may scan in one re-anchoring pass (~1 s of CPU).
+FUZZY_BUDGET_CHARS = 300_000
+#: Minimum similarity between the quote and a fuzzy candidate.
+MIN_SIMILARITY = 0.75
+#: Comments re-anchored per save.
+MAX_COMMENTS = 5000
+
+
+def _lines(text: str) -> Tuple[List[str], List[int]]:
+    """Lines (newline kept) and the offset each starts at."""
+    lines = text.splitlines(keepends=True)
+    starts, offset = [], 0
+    for line in lines:
+        starts.append(offset)
+        offset += len(line)
+    return lines, starts
+
+
+def unchanged_runs(old_text: str, new_text: str) -> List[Tuple[int, int, int]]:
+    """``[(old_start, old_end, new_start)]`` for every run of identical lines."""
+    old_lines, old_starts = _lines(old_text)
+    new_lines, new_starts = _lines(new_text)
+    runs = []
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for old_index, new_index, size in matcher.get_matching_blocks():
+        if size:
+            last = old_index + size - 1
+            runs.append((old_starts[old_index], old_starts[last] + len(old_lines[last]), new_starts[new_index]))
+    return runs
+
+
+def changed_regions(
+    runs: List[Tuple[int, int, int]], old_length: int, new_length: int,
+) -> List[Tuple[int, int]]:
+    """
+    ``[(old_start, old_end)]`` between the unchanged runs, where text was
+    removed, replaced or (for an empty range) inserted.
+    """
+    regions = []
+    old_end = new_end = 0
+    for run_start, run_end, new_start in runs:
+        if run_start > old_end or new_start > new_end:
+            regions.append((old_end, run_start))
+        old_end, new_end = run_end, new_start + (run_end - run_start)
+    if old_length > old_end or new_length > new_end:
+        regions.append((old_end, old_length))
+    return regions
+
+
+def _touches(regions: List[Tuple[int, int]], anchor: dict) -> bool:
+    """True when a changed region overlaps the anchor's quote or its context."""
+    low = anchor.get("start_offset", 0) - len(anchor.get("prefix") or "")
+    high = anchor.get("end_offset", 0) + len(anchor.get("suffix") or "")
+    return any(start <= high and end >= low for start, end in regions)
+
+
+def _shift(runs: List[Tuple[int, int, int]], run_starts: List[int], start: int, end: int) -> Tuple[Optional[int], int]:
+    """
+    ``(new_start, expected)``: the shifted start when ``[start, end)`` lies in
+    one unchanged run (else None), and the best guess at where it went.
+    """
+    position = bisect_right(run_starts, start) - 1
+    if position < 0:
+        return None, start
+    old_start, old_end, new_start = runs[position]
+    delta = new_start - old_start
+    if end <= old_end:
+        return start + delta, start + delta
+    return None, start + delta
+
+
+def bitap(text: str, pattern: str, max_errors: int) -> List[Tuple[int, int]]:
+    """
+    ``[(end, errors)]`` for every position where ``pattern`` ends in ``text``
+    with at most ``max_errors`` edits (Wu–Manber shift-and).
+    """
+    length = len(pattern)
+    if not length:
+        return []
+    masks: Dict[str, int] = {}
+    for position, char in enumerate(pattern):
+        masks[char] = masks.get(char, 0) | (1 << position)
+    goal = 1 << (length - 1)
+    full = (1 << length) - 1
+    states = [(1 << k) - 1 for k in range(max_errors + 1)]
+    found = []
+    for index, char in enumerate(text):
+        mask = masks.get(char, 0)
+        previous = states[0]
+        states[0] = ((states[0] << 1) | 1) & mask
+        for k in range(1, max_errors + 1):
+            current = states[k]
+            # match | insertion | substitution | deletion
+            states[k] = ((((current << 1) | 1) & mask) | previous | ((previous | states[k - 1]) << 1) | 1) & full
+            previous = current
+        for k in range(max_errors + 1):
+            if states[k] & goal:
+                found.append((index + 1, k))
+                break
+    return found
+
+
+def _context_score(text: str, start: int, end: int, anchor: dict) -> int:
+    prefix, suffix = anchor.get("prefix") or "", anchor.get("suffix") or ""
+    score = 0
+    if prefix and text[max(0, start - len(prefix)):start] == prefix:
+        score += 1
+    if suffix and text[end:end + len(suffix)] == suffix:
+        score += 1
+    return score
+
+
+class FuzzyBudget:
+    """Characters left for bitap in one pass, shared by its ``locate`` calls."""
+
+    def __init__(self, chars: int = FUZZY_BUDGET_CHARS) -> None:
+        self.remaining = chars
+
+    def spend(self, chars: int) -> bool:
+        if chars > self.remaining:
+            return False
+        self.remaining -= chars
+        return True
+
+
+def locate(
+    text: str, anchor: dict, expected: int, budget: Optional[FuzzyBudget] = None,
+) -> Optional[Tuple[int, int]]:
+    """Best ``(start, end)`` for the anchor's quote in ``text``, or None."""
+    quote = anchor.get("quote") or ""
+    if not quote:
+        return None
+
+    candidates = []
+    position = text.find(quote)
+    while position != -1:
+        candidates.append(position)
+        position = text.find(quote, position + 1)
+    if candidates:
+        best = max(candidates, key=lambda s: (_context_score(text, s, s + len(quote), anchor), -abs(s - expected)))
+        return best, best + len(quote)
+
+    pattern = quote[:BITAP_PATTERN]
+    max_errors = max(1, len(pattern) // 4)
+    windows = [(max(0, expected - SEARCH_WINDOW), min(len(text), expected + SEARCH_WINDOW + len(quote)))]
+    if windows[0] != (0, len(text)) and len(text) <= FULL_SEARCH_CHARS:
+        windows.append((0, len(text)))
+    for low, high in windows:
+        if budget is not None and not budget.spend(high - low):
+            return None
+        hits = bitap(text[low:high], pattern, max_errors)
+        ranked = sorted(hits, key=lambda hit: (hit[1], abs(low + hit[0] - len(pattern) - expected)))
+        for end, _ in ranked[:20]:
+            start = max(0, low + end - len(pattern))
+            for span in (len(quote), len(quote) - max_errors, min(MAX_QUOTE, len(quote) + max_errors)):
+                candidate = text[start:start + span]
+                if SequenceMatcher(None, quote, candidate, autojunk=False).ratio() >= MIN_SIMILARITY:
+                    return start, start + span
+    return None
+
+
+def _context(text: str, start: int, end: int) -> Dict[str, Any]:
+    return {
+        "quote": text[start:end],
+        "prefix": text[max(0, start - CONTEXT_CHARS):start],
+        "suffix": text[end:end + CONTEXT_CHARS],
+        "start_offset": start,
+        "end_offset": end,
+    }
+
+
+def plan_reanchor(
+    old: Optional[Dict[str, Any]],
+    new: Dict[str, Any],
+    comments: List[dict],
+) -> Tuple[List[Tuple[Any, Dict[str, Any]]], List[Any], Dict[str, int]]:
+    """
+    Compute anchor changes for ``comments`` moving from derivative ``old``
+    (None when unknown) to ``new``. Returns ``(moves, orphans, stats)``:
+    ``moves`` are ``(comment_id, anchor)`` pairs, ``orphans`` comment ids.
+    """
+    new_text = new.get("text") or ""
+    diffed = bool(old) and old.get("text") is not None
+    runs = unchanged_runs(old["text"], new_text) if diffed else []
+    run_starts = [run[0] for run in runs]
+    regions = changed_regions(runs, len(old["text"]), len(new_text)) if diffed else []
+    stats = {"kept": 0, "shifted": 0, "fuzzy": 0, "orphaned": 0}
+    budget = FuzzyBudget()
+    moves: List[Tuple[Any, Dict[str, Any]]] = []
+    orphans: List[Any] = []
+
+    for comment in comments:
+        anchor = comment.get("anchor") or {}
+        if comment.get("orphaned") and diffed and not _touches(regions, anchor):
+            stats["orphaned"] += 1
+            continue
+        start, end = anchor.get("start_offset", 0), anchor.get("end_offset", 0)
+        shifted, expected = _shift(runs, run_starts, start, end) if old is not None else (start, start)
+        # Anchors written before the derivative existed may use other offsets:
+        # only trust a position where the quote actually is.
+        if shifted is not None and new_text[shifted:shifted + (end - start)] != anchor.get("quote"):
+            shifted = None
+
+        if shifted is not None:
+            span = (shifted, shifted + (end - start))
+            stats["kept" if shifted == start else "shifted"] += 1
+        else:
+            span = locate(new_text, anchor, expected, budget)
+            if span is None:
+                if not comment.get("orphaned"):
+                    orphans.append(comment["_id"])
+                stats["orphaned"] += 1
+                continue
+            stats["fuzzy"] += 1
+
+        updated = {**anchor, **_context(new_text, *span), "block_index": block_at(new, span[0])}
+        if updated != anchor or comment.get("orphaned"):
+            moves.append((comment["_id"], updated))
+    return moves, orphans, stats
+
+
+async def reanchor_comments(
+    book_id: str,
+    old: Optional[Dict[str, Any]],
+    new: Dict[str, Any],
+) -> Dict[str, int]:
+    """Re-anchor the live comments on the book and persist the changes in one bulk write."""
+    comments = await comments_collection.find(
+        {"resource_type": "book", "resource_id": str(book_id), "deleted_at": None},
+        {"anchor": 1, "orphaned": 1},
+    ).to_list(length=MAX_COMMENTS)
+    if not comments:
+        return {}
+    if len(comments) == MAX_COMMENTS:
+        logger.warning(f"[comment_anchoring] Book {book_id}: only the first {MAX_COMMENTS} comments re-anchored")
+
+    moves, orphans, stats = await asyncio.to_thread(plan_reanchor, old, new, comments)
+    now = datetime.now(timezone.utc)
+    operations = [
+        UpdateOne({"_id": comment_id}, {"$set": {"anchor": anchor, "orphaned": False, "anchored_at": now}})
+        for comment_id, anchor in moves
+    ] + [
+        UpdateOne({"_id": comment_id}, {"$set": {"orphaned": True, "anchored_at": now}})
+        for comment_id in orphans
+    ]
+    if operations:
+        await comments_collection.bulk_write(operations, ordered=False)
+    logger.info(f"[comment_anchoring] Book {book_id}: {stats}")
+    return stats
+
+
+__all__ = [
+    "FuzzyBudget",
+    "bitap",
+    "changed_regions",
+    "locate",
+    "plan_reanchor",
+    "reanchor_comments",
+    "unchanged_runs",
+]
@@ -7,7 +7,6 @@ Uses text-embedding-004 (v1) which produces 768-dim vectors.
 """
 from __future__ import annotations
 
-import json
 import os
 import re
 from typing import List
@@ -38,22 +37,9 @@ def _api_key() -> str:
 
 def extract_plain_text(raw_content: str) -> str:
     """Extract plain text from a Lexical JSON string, or strip HTML as fallback."""
-    if not raw_content:
-        return ""
-    try:
-        parsed = json.loads(raw_content)
-        parts: List[str] = []
-
-        def walk(node: dict) -> None:
-            if isinstance(node.get("text"), str) and node["text"].strip():
-                parts.append(node["text"].strip())
-            for child in node.get("children", []):
-                walk(child)
-
-        walk(parsed.get("root", parsed))
-        return " ".join(parts)
-    except (json.JSONDecodeError, AttributeError):
-        return re.sub(r"<[^>]+>", " ", raw_content).strip()
+    from app.utils.book_text import plain_text
+
+    return plain_text(raw_content)
 
 
 # ---------------------------------------------------------------------------
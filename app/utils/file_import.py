@@ -3,254 +3,340 @@ Enhanced file import utilities for processing PDFs, DOCX, and TXT files
 Preserves formatting by converting to HTML which can be imported into Lexical editor
 """
 
+import asyncio
+import math
 import fitz  # PyMuPDF
 import mammoth
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Optional, Tuple, Union
 import re
 import html
 import base64
 
+from app.utils.process_pool import PROCESS_POOL_WORKERS, run_in_process
 
-def extract_formatted_text_from_pdf(file_content: bytes) -> List[Dict[str, str]]:
+
+#: Pages per worker task when a PDF is split across the process pool. Small
+#: enough that a 300-page book spreads over every core, large enough that
+#: per-task overhead (re-opening the document) stays negligible.
+PDF_MIN_PAGES_PER_TASK = 16
+
+_PDF_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+
+def _open_pdf(source: Union[bytes, str]) -> "fitz.Document":
+    """Open a PDF from raw bytes or a filesystem path."""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def pdf_page_count(source: Union[bytes, str]) -> int:
+    """Return the number of pages without extracting anything."""
+    with _open_pdf(source) as doc:
+        return doc.page_count
+
+
+def _pdf_image_html(doc: "fitz.Document", block: dict, image_cache: Dict[int, str]) -> str:
     """
-    Extract text from PDF preserving formatting AND multi-column layouts
-    Detects academic paper 2-column formats and preserves them
-    Returns HTML content per page with quality metrics
+    Render an image block as an inline ``<img>``.
+
+    ``extract_image`` decodes the whole image, so it is called once per xref
+    and the result reused — the same logo or figure is often repeated on
+    every page. Inline images (xref 0) have no stream to extract and are
+    skipped.
+    """
+    xref = block.get("xref")
+    if not xref:
+        return ""
+    if xref in image_cache:
+        return image_cache[xref]
+
+    extracted = doc.extract_image(xref)  # Use xref for better image extraction
+    image_bytes = (extracted or {}).get("image")
+    custom_html = ""
+    if image_bytes:
+        img_b64 = base64.b64encode(image_bytes).decode("utf-8")
+        ext = extracted.get("ext", "png")
+        # Create a pre-formatted HTML string for this block
+        custom_html = f'<img src="data:image/{ext};base64,{img_b64}" alt="Imported Image" class="pdf-image" style="max-width: 100%; height: auto; display: block; margin: 10px 0;" />'
+    image_cache[xref] = custom_html
+    return custom_html
+
+
+def _extract_pdf_page(doc: "fitz.Document", page: "fitz.Page", page_num: int, image_cache: Dict[int, str]) -> Optional[Dict]:
+    """
+    Extract one page as HTML, preserving multi-column layouts.
+    Returns ``None`` for pages with no renderable content.
+    """
+    # Get page dimensions to detect columns
+    page_width = page.rect.width
+    page_height = page.rect.height
+    mid_point = page_width / 2
+
+    # Extract text blocks with position info. Image pixels are left out of the
+    # text dict (TEXT_PRESERVE_IMAGES would decode every image on the page);
+    # image blocks come from get_image_info instead, carrying the xref so each
+    # image is extracted once in _pdf_image_html.
+    blocks = page.get_text("dict", flags=_PDF_TEXT_FLAGS)["blocks"]
+    blocks.extend(
+        {"type": 1, "bbox": info["bbox"], "xref": info["xref"]}
+        for info in page.get_image_info(xrefs=True)
+    )
+
+    # Separate blocks into left and right columns
+    left_column = []
+    right_column = []
+    full_width_blocks = []
+
+    for block in blocks:
+        # Common block properties
+        bbox = block.get("bbox", [0, 0, 0, 0])
+        block_left = bbox[0]
+        block_right = bbox[2]
+        block_top = bbox[1]
+
+        # Attach position for sorting
+        block["_y_pos"] = block_top
+
+        if block.get("type") == 0:  # Text block
+            # Determine column (logic handled below)
+            pass
+        elif block.get("type") == 1:  # Image block
+            try:
+                custom_html = _pdf_image_html(doc, block, image_cache)
+                if custom_html:
+                    block["custom_html"] = custom_html
+            except Exception as img_err:
+                print(f"Error processing image: {img_err}")
+                continue
+        else:
+            continue  # Skip other types
+
+        # Determine if block is in left column, right column, or full width
+        if block_right < mid_point + 10:  # Left column (tighter margin)
+            left_column.append(block)
+        elif block_left > mid_point - 10:  # Right column
+            right_column.append(block)
+        else:  # Spanning / Center
+            full_width_blocks.append(block)
+
+    # --- INTELLIGENT LAYOUT DETECTION ---
+    # Check if this is actually a 2-column page or just a single column with some short lines
+
+    # Count text length in each section
+    def get_text_len(block_list):
+        length = 0
+        for b in block_list:
+            if b.get("type") == 0:  # Only count text blocks
+                for line in b.get("lines", []):
+                    for span in line.get("spans", []):
+                        length += len(span.get("text", ""))
+        return length
+
+    left_len = get_text_len(left_column)
+    right_len = get_text_len(right_column)
+    spanning_len = get_text_len(full_width_blocks)
+
+    total_len = left_len + right_len + spanning_len
+
+    # Heuristics for 2-Column Mode:
+    # 1. Must have substantial content in BOTH columns (to avoid sidebars/margin notes being treated as 2-col)
+    # 2. Spanning content (titles) shouldn't dominate (> 40% of page usually means generic single col)
+    is_two_column = False
+
+    if total_len > 0:
+        has_two_distinct_cols = (left_len > total_len * 0.1) and (
+            right_len > total_len * 0.1
+        )
+        not_dominated_by_center = spanning_len < total_len * 0.6
+
+        if has_two_distinct_cols and not_dominated_by_center:
+            is_two_column = True
+
+    # If NOT 2-column, merge everything back to linear layout (Single Column)
+    if not is_two_column:
+        full_width_blocks = full_width_blocks + left_column + right_column
+        # Sort by vertical position (top to bottom)
+        full_width_blocks.sort(key=lambda b: b.get("bbox", [0, 0, 0, 0])[1])
+        left_column = []
+        right_column = []
+
+    # Sort blocks by vertical position within each column
+    left_column.sort(key=lambda b: b.get("_y_pos", 0))
+    right_column.sort(key=lambda b: b.get("_y_pos", 0))
+    full_width_blocks.sort(key=lambda b: b.get("_y_pos", 0))
+
+    # Format blocks to HTML
+    def format_blocks_to_html(blocks_list, column_class=""):
+        html_parts = []
+
+        for block in blocks_list:
+            # Handle Image Blocks
+            if block.get("type") == 1 and block.get("custom_html"):
+                html_parts.append(block["custom_html"])
+                continue
+
+            # Handle Text Blocks
+            block_html = []
+            for line in block.get("lines", []):
+                line_html = []
+                for span in line.get("spans", []):
+                    text = span.get("text", "").strip()
+                    if not text:
+                        continue
+
+                    size = span.get("size", 12)
+                    flags = span.get("flags", 0)
+                    formatted_text = html.escape(text)
+
+                    # Bold (flag 16)
+                    if flags & 16:
+                        formatted_text = f"<strong>{formatted_text}</strong>"
+
+                    # Italic (flag 2)
+                    if flags & 2:
+                        formatted_text = f"<em>{formatted_text}</em>"
+
+                    # Heading detection - Adjusted thresholds
+                    if size > 24:
+                        formatted_text = f"<h1>{formatted_text}</h1>"
+                    elif size > 18:
+                        formatted_text = f"<h2>{formatted_text}</h2>"
+                    elif size > 14:
+                        formatted_text = f"<h3>{formatted_text}</h3>"
+
+                    line_html.append(formatted_text)
+
+                if line_html:
+                    block_html.append(" ".join(line_html))
+
+            if block_html:
+                html_parts.append("<p>" + " ".join(block_html) + "</p>")
+
+        return "".join(html_parts)
+
+    # Build page HTML preserving column structure
+    page_html = ""
+
+    # Full-width content first (titles, abstracts)
+    if full_width_blocks:
+        page_html += format_blocks_to_html(full_width_blocks)
+
+    # If we have two columns, preserve them
+    if left_column and right_column:
+        page_html += '<div style="display: grid; grid-template-columns: 1fr 1fr; gap: 20px;">'
+        page_html += f'<div class="column-left">{format_blocks_to_html(left_column)}</div>'
+        page_html += f'<div class="column-right">{format_blocks_to_html(right_column)}</div>'
+        page_html += "</div>"
+    elif left_column:
+        # Only left column (or single column)
+        page_html += format_blocks_to_html(left_column)
+    elif right_column:
+        # Only right column
+        page_html += format_blocks_to_html(right_column)
+
+    # Plain text for quality metrics — rebuilt from the blocks already in hand
+    # rather than a second page.get_text() pass over the page.
+    plain_text = "\n".join(
+        "".join(span.get("text", "") for span in line.get("spans", []))
+        for block in blocks
+        if block.get("type") == 0
+        for line in block.get("lines", [])
+    )
+    char_count = len(plain_text)
+    word_count = len(plain_text.split())
+
+    if not page_html.strip():
+        return None
+    return {
+        "title": f"Página {page_num + 1}",
+        "content": page_html,
+        "page_number": page_num + 1,
+        "format": "html",
+        "has_columns": bool(left_column and right_column),
+        "word_count": word_count,
+        "char_count": char_count,
+        "quality_score": min(
+            100, int((char_count / 2000) * 100)
+        ),  # Rough quality estimate
+    }
+
+
+def extract_pdf_page_range(source: Union[bytes, str], start: int = 0, stop: Optional[int] = None) -> List[Dict]:
+    """
+    Extract pages ``[start, stop)`` of a PDF.
+
+    Module-level and path-friendly so the process pool can run one range per
+    worker without shipping the file bytes to every task. Falls back to plain
+    text (PyPDF2) for the range if PyMuPDF fails.
     """
     try:
-        import io
+        with _open_pdf(source) as doc:
+            stop = doc.page_count if stop is None else min(stop, doc.page_count)
+            image_cache: Dict[int, str] = {}
+            pages = []
+            for page_num in range(start, stop):
+                page = _extract_pdf_page(doc, doc[page_num], page_num, image_cache)
+                if page:
+                    pages.append(page)
+            return pages
+    except Exception as e:
+        print(f"Error extracting PDF with formatting: {str(e)}")
+        return extract_text_from_pdf_fallback(source, start, stop)
 
-        pdf_file = io.BytesIO(file_content)
-        doc = fitz.open(stream=pdf_file, filetype="pdf")
 
-        pages = []
-        total_chars_extracted = 0
-
-        for page_num, page in enumerate(doc):
-            # Get page dimensions to detect columns
-            page_width = page.rect.width
-            page_height = page.rect.height
-            mid_point = page_width / 2
-
-            # Extract text blocks with position info
-            blocks = page.get_text("dict")["blocks"]
-
-            # Separate blocks into left and right columns
-            left_column = []
-            right_column = []
-            full_width_blocks = []
-
-            for block in blocks:
-                # Common block properties
-                bbox = block.get("bbox", [0, 0, 0, 0])
-                block_left = bbox[0]
-                block_right = bbox[2]
-                block_top = bbox[1]
-
-                # Attach position for sorting
-                block["_y_pos"] = block_top
-
-                if block.get("type") == 0:  # Text block
-                    # Determine column (logic handled below)
-                    pass
-                elif block.get("type") == 1:  # Image block
-                    try:
-                        image_bytes = doc.extract_image(block["xref"])[
-                            "image"
-                        ]  # Use xref for better image extraction
-                        if image_bytes:
-                            img_b64 = base64.b64encode(image_bytes).decode("utf-8")
-                            ext = doc.extract_image(block["xref"])[
-                                "ext"
-                            ]  # Get extension from xref
-                            # Create a pre-formatted HTML string for this block
-                            block["custom_html"] = (
-                                f'<img src="data:image/{ext};base64,{img_b64}" alt="Imported Image" class="pdf-image" style="max-width: 100%; height: auto; display: block; margin: 10px 0;" />'
-                            )
-                    except Exception as img_err:
-                        print(f"Error processing image: {img_err}")
-                        continue
-                else:
-                    continue  # Skip other types
-
-                # Determine if block is in left column, right column, or full width
-                if block_right < mid_point + 10:  # Left column (tighter margin)
-                    left_column.append(block)
-                elif block_left > mid_point - 10:  # Right column
-                    right_column.append(block)
-                else:  # Spanning / Center
-                    full_width_blocks.append(block)
-
-            # --- INTELLIGENT LAYOUT DETECTION ---
-            # Check if this is actually a 2-column page or just a single column with some short lines
-
-            # Count text length in each section
-            def get_text_len(block_list):
-                length = 0
-                for b in block_list:
-                    if b.get("type") == 0:  # Only count text blocks
-                        for line in b.get("lines", []):
-                            for span in line.get("spans", []):
-                                length += len(span.get("text", ""))
-                return length
-
-            left_len = get_text_len(left_column)
-            right_len = get_text_len(right_column)
-            spanning_len = get_text_len(full_width_blocks)
-
-            total_len = left_len + right_len + spanning_len
-
-            # Heuristics for 2-Column Mode:
-            # 1. Must have substantial content in BOTH columns (to avoid sidebars/margin notes being treated as 2-col)
-            # 2. Spanning content (titles) shouldn't dominate (> 40% of page usually means generic single col)
-            is_two_column = False
-
-            if total_len > 0:
-                has_two_distinct_cols = (left_len > total_len * 0.1) and (
-                    right_len > total_len * 0.1
-                )
-                not_dominated_by_center = spanning_len < total_len * 0.6
-
-                if has_two_distinct_cols and not_dominated_by_center:
-                    is_two_column = True
-
-            # If NOT 2-column, merge everything back to linear layout (Single Column)
-            if not is_two_column:
-                full_width_blocks = full_width_blocks + left_column + right_column
-                # Sort by vertical position (top to bottom)
-                full_width_blocks.sort(key=lambda b: b.get("bbox", [0, 0, 0, 0])[1])
-                left_column = []
-                right_column = []
-
-            # Sort blocks by vertical position within each column
-            left_column.sort(key=lambda b: b.get("_y_pos", 0))
-            right_column.sort(key=lambda b: b.get("_y_pos", 0))
-            full_width_blocks.sort(key=lambda b: b.get("_y_pos", 0))
-
-            # Format blocks to HTML
-            def format_blocks_to_html(blocks_list, column_class=""):
-                html_parts = []
-
-                for block in blocks_list:
-                    # Handle Image Blocks
-                    if block.get("type") == 1 and block.get("custom_html"):
-                        html_parts.append(block["custom_html"])
-                        continue
+def pdf_extraction_metadata(pages: List[Dict], total_pages: Optional[int] = None) -> Dict:
+    """
+    Validation metadata stored on the first extracted page. ``total_pages`` is
+    the document's page count when ``pages`` is only a leading sample of it;
+    the char/word/column figures always describe ``pages``.
+    """
+    return {
+        "total_pages": len(pages) if total_pages is None else total_pages,
+        "total_chars": sum(p.get("char_count", 0) for p in pages),
+        "total_words": sum(p.get("word_count", 0) for p in pages),
+        "multi_column_pages": sum(
+            1 for p in pages if p.get("has_columns", False)
+        ),
+    }
 
-                    # Handle Text Blocks
-                    block_html = []
-                    for line in block.get("lines", []):
-                        line_html = []
-                        for span in line.get("spans", []):
-                            text = span.get("text", "").strip()
-                            if not text:
-                                continue
-
-                            size = span.get("size", 12)
-                            flags = span.get("flags", 0)
-                            formatted_text = html.escape(text)
-
-                            # Bold (flag 16)
-                            if flags & 16:
-                                formatted_text = f"<strong>{formatted_text}</strong>"
-
-                            # Italic (flag 2)
-                            if flags & 2:
-                                formatted_text = f"<em>{formatted_text}</em>"
-
-                            # Heading detection - Adjusted thresholds
-                            if size > 24:
-                                formatted_text = f"<h1>{formatted_text}</h1>"
-                            elif size > 18:
-                                formatted_text = f"<h2>{formatted_text}</h2>"
-                            elif size > 14:
-                                formatted_text = f"<h3>{formatted_text}</h3>"
-
-                            line_html.append(formatted_text)
-
-                        if line_html:
-                            block_html.append(" ".join(line_html))
-
-                    if block_html:
-                        html_parts.append("<p>" + " ".join(block_html) + "</p>")
-
-                return "".join(html_parts)
-
-            # Build page HTML preserving column structure
-            page_html = ""
-
-            # Full-width content first (titles, abstracts)
-            if full_width_blocks:
-                page_html += format_blocks_to_html(full_width_blocks)
-
-            # If we have two columns, preserve them
-            if left_column and right_column:
-                page_html += '<div style="display: grid; grid-template-columns: 1fr 1fr; gap: 20px;">'
-                page_html += f'<div class="column-left">{format_blocks_to_html(left_column)}</div>'
-                page_html += f'<div class="column-right">{format_blocks_to_html(right_column)}</div>'
-                page_html += "</div>"
-            elif left_column:
-                # Only left column (or single column)
-                page_html += format_blocks_to_html(left_column)
-            elif right_column:
-                # Only right column
-                page_html += format_blocks_to_html(right_column)
-
-            # Extract plain text for quality metrics
-            plain_text = page.get_text()
-            char_count = len(plain_text)
-            word_count = len(plain_text.split())
-            total_chars_extracted += char_count
-
-            if page_html.strip():
-                pages.append(
-                    {
-                        "title": f"Página {page_num + 1}",
-                        "content": page_html,
-                        "page_number": page_num + 1,
-                        "format": "html",
-                        "has_columns": bool(left_column and right_column),
-                        "word_count": word_count,
-                        "char_count": char_count,
-                        "quality_score": min(
-                            100, int((char_count / 2000) * 100)
-                        ),  # Rough quality estimate
-                    }
-                )
 
-        doc.close()
+def extract_formatted_text_from_pdf(file_content: bytes) -> List[Dict[str, str]]:
+    """
+    Extract text from PDF preserving formatting AND multi-column layouts
+    Detects academic paper 2-column formats and preserves them
+    Returns HTML content per page with quality metrics
 
-        # Add validation metadata
-        if pages:
-            pages[0]["extraction_metadata"] = {
-                "total_pages": len(pages),
-                "total_chars": total_chars_extracted,
-                "total_words": sum(p.get("word_count", 0) for p in pages),
-                "multi_column_pages": sum(
-                    1 for p in pages if p.get("has_columns", False)
-                ),
-            }
+    Synchronous, single-process path. The import endpoint uses
+    ``extract_pages`` instead, which spreads page ranges over the process pool.
+    """
+    pages = extract_pdf_page_range(file_content)
 
-        return pages
-    except Exception as e:
-        print(f"Error extracting PDF with formatting: {str(e)}")
-        return extract_text_from_pdf_fallback(file_content)
+    # Add validation metadata
+    if pages:
+        pages[0]["extraction_metadata"] = pdf_extraction_metadata(pages)
 
+    return pages
 
-def extract_text_from_pdf_fallback(file_content: bytes) -> List[Dict[str, str]]:
+
+def extract_text_from_pdf_fallback(
+    file_content: Union[bytes, str], start: int = 0, stop: Optional[int] = None
+) -> List[Dict[str, str]]:
     """
-    Fallback plain text extraction from PDF
+    Fallback plain text extraction from PDF (raw bytes or a path), optionally
+    limited to pages ``[start, stop)``
     """
     try:
         from PyPDF2 import PdfReader
         import io
 
-        pdf_file = io.BytesIO(file_content)
+        pdf_file = io.BytesIO(file_content) if isinstance(file_content, (bytes, bytearray)) else file_content
         reader = PdfReader(pdf_file)
 
         pages = []
-        for i, page in enumerate(reader.pages):
-            text = page.extract_text()
+        stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+        for i in range(start, stop):
+            text = reader.pages[i].extract_text()
             if text.strip():
                 # Convert to simple HTML paragraphs
                 paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
@@ -421,3 +507,72 @@ def process_uploaded_file(filename: str, file_content: bytes) -> List[Dict[str,
         return extract_formatted_text_from_txt(file_content)
     else:
         return []
+
+
+def _process_uploaded_path(filename: str, path: str) -> List[Dict[str, str]]:
+    """``process_uploaded_file`` for a file on disk — the process-pool entry point."""
+    with open(path, "rb") as f:
+        return process_uploaded_file(filename, f.read())
+
+
+def _pdf_page_ranges(page_count: int) -> List[Tuple[int, int]]:
+    """Split ``page_count`` pages into contiguous ranges, roughly two per worker."""
+    per_task = max(PDF_MIN_PAGES_PER_TASK, math.ceil(page_count / (PROCESS_POOL_WORKERS * 2)))
+    return [(start, min(start + per_task, page_count)) for start in range(0, page_count, per_task)]
+
+
+async def iter_pdf_pages(path: str, max_pages: Optional[int] = None) -> AsyncIterator[Dict]:
+    """
+    Yield extracted PDF pages in document order as their ranges complete.
+
+    Every range is submitted to the process pool up front, so the ranges are
+    extracted in parallel while the caller consumes earlier pages. Only the
+    first ``max_pages`` pages are extracted when a limit is given (preview).
+    """
+    page_count = await asyncio.to_thread(pdf_page_count, path)
+    if max_pages is not None:
+        page_count = min(page_count, max_pages)
+
+    tasks = [
+        asyncio.ensure_future(run_in_process(extract_pdf_page_range, path, start, stop))
+        for start, stop in _pdf_page_ranges(page_count)
+    ]
+    try:
+        for task in tasks:
+            for page in await task:
+                yield page
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def extract_pages(
+    filename: str, path: str, max_pages: Optional[int] = None
+) -> Tuple[List[Dict[str, str]], int]:
+    """
+    Extract pages from an uploaded file on disk without blocking the event loop.
+
+    Returns ``(pages, source_page_count)``. For PDFs ``source_page_count`` is
+    the document's real page count even when ``max_pages`` limits extraction;
+    for DOCX/TXT (which have no fixed pagination) it is the number of pages
+    produced before the limit is applied.
+    """
+    file_ext = filename.lower().split(".")[-1]
+
+    if file_ext == "pdf":
+        try:
+            source_page_count = await asyncio.to_thread(pdf_page_count, path)
+        except Exception as e:
+            print(f"Error opening PDF: {str(e)}")
+            pages = await run_in_process(_process_uploaded_path, filename, path)
+            return (pages[:max_pages] if max_pages is not None else pages), len(pages)
+        pages = [page async for page in iter_pdf_pages(path, max_pages)]
+        if pages:
+            pages[0]["extraction_metadata"] = pdf_extraction_metadata(pages, source_page_count)
+        return pages, source_page_count
+
+    pages = await run_in_process(_process_uploaded_path, filename, path)
+    source_page_count = len(pages)
+    if max_pages is not None:
+        pages = pages[:max_pages]
+    return pages, source_page_count
@@ -57,6 +57,8 @@ class HTMLToLexicalConverter(HTMLParser):
         elif tag == 'u':
             if 'underline' not in self.text_format:
                 self.text_format.append('underline')
+        elif tag == 'img':
+            self._append_image(dict(attrs))
         elif tag == 'br':
             # Add line break
             if self.current_paragraph:
@@ -64,6 +66,29 @@ class HTMLToLexicalConverter(HTMLParser):
                     "type": "linebreak"
                 })
     
+    def _append_image(self, attrs):
+        """Add an image node, inline in the current block or wrapped in a paragraph"""
+        src = attrs.get('src')
+        if not src:
+            return
+        image_node = {
+            "type": "image",
+            "src": src,
+            "altText": attrs.get('alt') or "",
+            "width": 0,
+            "height": 0,
+            "maxWidth": 800,
+            "showCaption": False,
+            "version": 1
+        }
+        if self.current_paragraph:
+            self.current_paragraph['children'].append(image_node)
+        else:
+            self.nodes.append({
+                "type": "paragraph",
+                "children": [image_node]
+            })
+
     def handle_endtag(self, tag):
         """Handle closing HTML tags"""
         if tag in ['p', 'div'] or tag.startswith('h'):
@@ -198,3 +223,18 @@ def simple_html_to_lexical(html_content: str) -> dict:
             "version": 1
         }
     }
+
+
+def html_to_full_content(html_content: str) -> str:
+    """
+    Convert imported HTML into a serialized Lexical ``full_content`` string,
+    falling back to the simple converter when the full parser fails.
+
+    Module-level and string-in/string-out so book imports can run the
+    conversion in the process pool.
+    """
+    try:
+        lexical_json = html_to_lexical_json(html_content)
+    except Exception:
+        lexical_json = simple_html_to_lexical(html_content)
+    return json.dumps(lexical_json)
@@ -0,0 +1,132 @@
+"""
+Canonical id types and the read-path switch for normalized collections.
+
+Older documents store the same id in two shapes — a card's ``deck_id`` as an
+ObjectId or its hex string, a plan with a string ``_id`` — so reads match
+both (``{"$in": [oid, str(oid)]}``, ``$or``, or a second ``find_one``). That
+doubles index probes and rules out covered queries.
+
+``app/migrations/normalize_ids.py`` rewrites every reference to one canonical
+type (below) and, once a collection has nothing left to convert, records it
+in ``schema_meta`` (``_id: "id_normalization"``). Workers read that list at
+startup via ``load_normalized()``; from then on ``id_value`` / ``ref_value``
+return a single value for that collection and the query is a plain equality.
+Until then they return the two-form ``$in``, so the switch is safe to ship
+before the migration runs.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, FrozenSet, Iterable
+
+from bson import ObjectId
+
+from app.config.database import schema_meta_collection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+OBJECT_ID = "objectId"
+STRING = "string"
+
+#: Canonical BSON type of each reference field. Cards follow the StudyCard
+#: model (ObjectId); annual-planning models declare their parent ids as str.
+CANONICAL_REFERENCES: Dict[str, Dict[str, str]] = {
+    "cards": {"deck_id": OBJECT_ID},
+    "focus_areas": {"annual_plan_id": STRING},
+    "priorities": {"annual_plan_id": STRING, "focus_area_id": STRING},
+    "goals": {"focus_area_id": STRING},
+    "activities": {"goal_id": STRING},
+}
+
+#: Collections whose ``_id`` is canonically an ObjectId but where legacy
+#: documents were written with the hex string instead.
+OBJECT_ID_KEYS: tuple = ("decks", "annual_plans", "focus_areas", "priorities", "goals", "activities")
+
+#: schema_meta document listing the collections the migration has finished.
+META_ID = "id_normalization"
+
+_normalized: FrozenSet[str] = frozenset()
+
+
+def is_normalized(collection: str) -> bool:
+    return collection in _normalized
+
+
+def _both_forms(value: Any) -> list:
+    text = str(value)
+    return [ObjectId(text), text] if ObjectId.is_valid(text) else [text]
+
+
+def _as_canonical(value: Any, canonical: str) -> Any:
+    text = str(value)
+    if canonical == OBJECT_ID and ObjectId.is_valid(text):
+        return ObjectId(text)
+    return text
+
+
+def id_value(collection: str, value: Any) -> Any:
+    """Filter value for ``{"_id": ...}`` in ``collection``."""
+    if is_normalized(collection):
+        return _as_canonical(value, OBJECT_ID)
+    return {"$in": _both_forms(value)}
+
+
+def id_values(collection: str, values: Iterable[Any]) -> list:
+    """The ``$in`` list matching ``_id`` to any of ``values``."""
+    if is_normalized(collection):
+        return [_as_canonical(v, OBJECT_ID) for v in values]
+    return [form for v in values for form in _both_forms(v)]
+
+
+def ref_value(collection: str, field: str, value: Any) -> Any:
+    """Filter value matching reference ``field`` of ``collection`` to ``value``."""
+    if is_normalized(collection):
+        return _as_canonical(value, CANONICAL_REFERENCES[collection][field])
+    return {"$in": _both_forms(value)}
+
+
+def ref_values(collection: str, field: str, values: Iterable[Any]) -> list:
+    """The ``$in`` list matching ``field`` to any of ``values``."""
+    if is_normalized(collection):
+        canonical = CANONICAL_REFERENCES[collection][field]
+        return [_as_canonical(v, canonical) for v in values]
+    return [form for v in values for form in _both_forms(v)]
+
+
+def canonical_ref(collection: str, field: str, value: Any) -> Any:
+    """The form new writes must store in ``field``."""
+    return _as_canonical(value, CANONICAL_REFERENCES[collection][field])
+
+
+async def load_normalized() -> FrozenSet[str]:
+    """Read the finished-collections list. Errors keep the two-form reads."""
+    global _normalized
+    try:
+        doc = await schema_meta_collection.find_one({"_id": META_ID}, {"collections": 1})
+    except Exception as exc:
+        logger.warning(f"[ids] Could not load id normalization state: {exc}")
+        return _normalized
+    _normalized = frozenset((doc or {}).get("collections") or ())
+    if _normalized:
+        logger.info(f"[ids] Single-form id reads for: {', '.join(sorted(_normalized))}")
+    return _normalized
+
+
+async def mark_normalized(collection: str) -> None:
+    await schema_meta_collection.update_one(
+        {"_id": META_ID}, {"$addToSet": {"collections": collection}}, upsert=True,
+    )
+
+
+__all__ = [
+    "CANONICAL_REFERENCES",
+    "OBJECT_ID_KEYS",
+    "canonical_ref",
+    "id_value",
+    "id_values",
+    "is_normalized",
+    "load_normalized",
+    "mark_normalized",
+    "ref_value",
+    "ref_values",
+]
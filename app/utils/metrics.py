@@ -0,0 +1,77 @@
+"""
+In-process counters for operational metrics.
+
+Deliberately minimal: a name -> value map per API worker, plus fixed-bucket
+latency histograms, read through ``GET /admin/metrics``. Both reset on
+restart and are not aggregated across workers. Anything that must survive a
+restart is also persisted on the owning document (e.g. a quiz session's
+``prefetch_stats``).
+"""
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from typing import Dict
+
+#: Upper bounds (ms) of the histogram buckets; one more bucket catches the rest.
+LATENCY_BUCKETS_MS: tuple = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_histograms: Dict[str, dict] = {}
+
+
+def incr(name: str, value: float = 1) -> None:
+    """Add ``value`` to counter ``name``."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get(name: str) -> float:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def ratio(numerator: str, *others: str) -> float | None:
+    """``numerator / (numerator + others)``, or ``None`` before any event."""
+    with _lock:
+        hits = _counters.get(numerator, 0)
+        total = hits + sum(_counters.get(name, 0) for name in others)
+    return round(hits / total, 4) if total else None
+
+
+def snapshot() -> Dict[str, float]:
+    with _lock:
+        return dict(_counters)
+
+
+def observe(name: str, value_ms: float) -> None:
+    """Record one latency sample in histogram ``name``."""
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = {"buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1), "count": 0, "sum_ms": 0.0}
+        hist["buckets"][bisect_left(LATENCY_BUCKETS_MS, value_ms)] += 1
+        hist["count"] += 1
+        hist["sum_ms"] += value_ms
+
+
+def histograms() -> Dict[str, dict]:
+    """Per histogram: sample ``count``, ``mean_ms`` and the count per bucket (``le_<ms>``)."""
+    labels = [f"le_{bound}" for bound in LATENCY_BUCKETS_MS] + ["le_inf"]
+    with _lock:
+        return {
+            name: {
+                "count": hist["count"],
+                "mean_ms": round(hist["sum_ms"] / hist["count"], 1),
+                "buckets": dict(zip(labels, hist["buckets"])),
+            }
+            for name, hist in _histograms.items()
+        }
+
+
+def reset() -> None:
+    """Clear every counter and histogram (tests)."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -0,0 +1,67 @@
+"""
+Shared worker-process pool for CPU-bound parsing (Anki packages, PDF/DOCX
+extraction, HTML → Lexical conversion).
+
+These jobs are pure Python or C-extension work that holds the GIL, so a thread
+executor would still stall the event loop for every other request on the
+worker. Functions submitted here must be module-level (picklable) and take and
+return plain values.
+
+The pool is created lazily with the ``spawn`` start method: forking a process
+that already runs an asyncio loop, Motor's background threads and the Sentry
+transport is unsafe, and spawned workers import only the modules the submitted
+function needs.
+"""
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Worker processes per API worker. Defaults to the core count, capped at 4 so
+#: several gunicorn workers on one box do not oversubscribe the CPU.
+PROCESS_POOL_WORKERS: int = int(
+    os.getenv("PROCESS_POOL_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Return the shared pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=PROCESS_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def run_in_process(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run ``fn(*args)`` in the shared pool without blocking the event loop."""
+    global _executor
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_process_pool(), fn, *args)
+    except BrokenProcessPool:
+        # A crashed worker poisons the whole pool — drop it so the next call
+        # gets a fresh one instead of failing forever.
+        logger.error("Process pool broke while running %s; recreating on next use.", fn.__name__)
+        _executor = None
+        raise
+
+
+def shutdown_process_pool() -> None:
+    """Release the worker processes (called from app shutdown)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,90 @@
+"""
+Cross-user bank of generated quiz questions.
+
+Forks of the same official deck share identical card content, yet every quiz
+used to pay an LLM call per card. Questions are now stored under a
+content-addressed key — hash(card fields, question type, prompt version) — so
+any user quizzing an identical card reuses them.
+
+Each entry holds up to ``BANK_VARIANTS`` phrasings; a quiz samples one at
+random. Entries fill lazily from live quizzes and ahead of time from the warm
+job (``scripts/warm_question_bank.py``) for curated decks.
+
+Invalidation is by construction: editing a card changes its field hash, so it
+maps to a new key and never sees questions written for the old content.
+Entries nobody reads expire through the ``last_used_at`` TTL index, and
+bumping the prompt version retires the whole bank the same way.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from app.config.database import question_bank_collection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+#: Phrasings kept per (card content, question type, prompt version).
+BANK_VARIANTS: int = 3
+
+
+def fields_hash(fields: dict) -> str:
+    """Stable hash of a card's quiz-relevant fields."""
+    encoded = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def bank_key(fields: dict, question_type: str, prompt_version: str) -> str:
+    return hashlib.sha256(
+        f"{fields_hash(fields)}:{question_type}:{prompt_version}".encode("utf-8")
+    ).hexdigest()
+
+
+async def get_entry(fields: dict, question_type: str, prompt_version: str) -> Optional[dict]:
+    """Return the bank entry (``variants`` list) for this card content, if any."""
+    key = bank_key(fields, question_type, prompt_version)
+    return await question_bank_collection.find_one_and_update(
+        {"_id": key},
+        {"$set": {"last_used_at": datetime.now(timezone.utc)}},
+        projection={"variants": 1},
+    )
+
+
+def sample_variant(entry: Optional[dict]) -> Optional[str]:
+    variants = (entry or {}).get("variants") or []
+    return random.choice(variants) if variants else None
+
+
+async def add_variant(fields: dict, question_type: str, prompt_version: str, text: str) -> bool:
+    """
+    Store one more phrasing, up to ``BANK_VARIANTS``. Returns False when the
+    entry is already full (or already holds this exact text).
+    """
+    key = bank_key(fields, question_type, prompt_version)
+    now = datetime.now(timezone.utc)
+    try:
+        result = await question_bank_collection.update_one(
+            # Matches only while there is room; a full entry falls through to
+            # the upsert, which collides on _id and is reported as "full".
+            {"_id": key, f"variants.{BANK_VARIANTS - 1}": {"$exists": False}},
+            {
+                "$addToSet": {"variants": text},
+                "$set": {"last_used_at": now},
+                "$setOnInsert": {
+                    "fields_hash": fields_hash(fields),
+                    "question_type": question_type,
+                    "prompt_version": prompt_version,
+                    "created_at": now,
+                },
+            },
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return bool(result.upserted_id or result.modified_count)
@@ -0,0 +1,117 @@
+"""
+Benchmark Book Search Script
+
+Measures retrieval quality and latency of read_book_section's lexical search
+on a synthetic book: ``--chapters`` chapters of filler prose, each with one
+paragraph about a distinct topic. For every chapter the benchmark asks a
+question about its topic, then checks whether that paragraph is in the
+returned excerpt.
+
+Compares:
+  - legacy: substring term counting over the first 8,000 characters (the
+    pre-index read_book_section)
+  - bm25:   app/utils/book_search.BookIndex over the whole book
+
+Reports hit@1 / hit@excerpt, index build time, and query p50 / p95.
+
+Usage (run from Nowry-API/):
+    python scripts/benchmark_book_search.py
+    python scripts/benchmark_book_search.py --chapters 200 --filler 20
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Same sys.path shim as scripts/sync_langfuse.py: make `app` importable when
+# run as `python scripts/benchmark_book_search.py` from Nowry-API/.
+_REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+FILLER = (
+    "Spaced repetition schedules each review just before the memory would "
+    "otherwise fade, so the interval between reviews grows with every success. "
+)
+TOPICS = [
+    ("photosynthesis", "chlorophyll", "glucose"), ("volcano", "magma", "eruption"),
+    ("byzantine", "constantinople", "emperor"), ("neuron", "synapse", "dopamine"),
+    ("glacier", "moraine", "erosion"), ("sonnet", "petrarch", "stanza"),
+    ("enzyme", "substrate", "catalysis"), ("tariff", "import", "protectionism"),
+    ("orbit", "kepler", "ellipse"), ("fresco", "pigment", "plaster"),
+    ("mitochondria", "atp", "respiration"), ("monsoon", "rainfall", "humidity"),
+]
+
+
+def build_book(chapters: int, filler: int):
+    nodes, answers = [], []
+    for number in range(chapters):
+        a, b, c = TOPICS[number % len(TOPICS)]
+        tag = f"chapter{number}"
+        fact = f"In {tag}, the {a} section explains how {b} relates to {c}."
+        nodes.append({"type": "heading", "tag": "h2", "children": [{"type": "text", "text": f"Chapter {number}"}]})
+        nodes.append({"type": "paragraph", "children": [{"type": "text", "text": FILLER * filler}]})
+        nodes.append({"type": "paragraph", "children": [{"type": "text", "text": fact}]})
+        answers.append((f"What does {tag} say about {a} and {b}?", fact))
+    return json.dumps({"root": {"type": "root", "children": nodes}}), answers
+
+
+def legacy_excerpt(plaintext: str, query: str) -> list:
+    """The pre-index read_book_section ranking, kept here for comparison."""
+    window = plaintext[:8000]
+    terms = query.lower().split()
+    paragraphs = [p.strip() for p in window.split("\n") if p.strip()]
+    scored = sorted(((sum(t in p.lower() for t in terms), p) for p in paragraphs), key=lambda x: -x[0])
+    return [p for _, p in scored[:8]]
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(label: str, answers: list, search) -> None:
+    hit_first = hit_any = 0
+    timings = []
+    for query, fact in answers:
+        started = time.perf_counter()
+        passages = search(query)
+        timings.append((time.perf_counter() - started) * 1000)
+        excerpt = "\n\n".join(passages)[:4000]
+        hit_first += bool(passages) and fact in passages[0]
+        hit_any += fact in excerpt
+    total = len(answers)
+    print(
+        f"{label:<8} hit@1 {hit_first / total:6.1%}   hit@excerpt {hit_any / total:6.1%}   "
+        f"query p50 {statistics.median(timings):7.2f} ms   p95 {percentile(timings, 0.95):7.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chapters", type=int, default=60)
+    parser.add_argument("--filler", type=int, default=12, help="Filler sentences per chapter")
+    args = parser.parse_args()
+
+    from app.utils.book_search import BookIndex
+    from app.utils.book_text import extract_text
+
+    content, answers = build_book(args.chapters, args.filler)
+
+    started = time.perf_counter()
+    derivative = extract_text(content)
+    extracted = time.perf_counter()
+    index = BookIndex.from_derivative(derivative)
+    built = time.perf_counter()
+
+    print(f"Book: {args.chapters} chapters, {derivative['chars']:,} chars, {len(index.passages)} passages")
+    print(f"Extract {1000 * (extracted - started):.1f} ms, index build {1000 * (built - extracted):.1f} ms\n")
+
+    run("legacy", answers, lambda q: legacy_excerpt(derivative["text"], q))
+    run("bm25", answers, lambda q: [hit["text"] for hit in index.search(q, 6)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark Cold Start Script
+
+Measures how long a fresh worker takes before it can serve traffic:
+
+- import: wall time of ``import app.main`` in a fresh interpreter, plus the
+  slowest top-level packages from ``python -X importtime``.
+- ready: time from entering the FastAPI lifespan to its ``yield`` (index
+  sync, prompt snapshot, background refreshers), i.e. until uvicorn would
+  start accepting requests.
+
+Each run is a new subprocess, so nothing is served from a warm module cache.
+Startup needs MongoDB reachable the same way the app does (MONGO_URI in .env).
+The first run after an index-spec change includes the full index sync; later
+runs skip it through the stored fingerprint, which is the steady state.
+
+Usage (run from Nowry-API/):
+    python scripts/benchmark_cold_start.py
+    python scripts/benchmark_cold_start.py --runs 10 --top 15
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+from pathlib import Path
+
+# Same sys.path shim as scripts/sync_langfuse.py: make `app` importable when
+# run as `python scripts/benchmark_cold_start.py` from Nowry-API/.
+_REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+# Executed in the child interpreter: prints one JSON line with both timings.
+_PROBE = """
+import asyncio, json, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+async def ready():
+    async with app.main.app.router.lifespan_context(app.main.app):
+        return time.perf_counter()
+
+ready_at = asyncio.run(ready())
+print(json.dumps({"import_s": imported - start, "ready_s": ready_at - imported}))
+"""
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def run_probe() -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=_REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(top: int) -> list:
+    """Top-level packages by cumulative import time (microseconds) for ``import app.main``."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=_REPO_ROOT, capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    totals = defaultdict(int)
+    for line in completed.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        # importtime indents nested imports; one leading space marks a top-level import.
+        if match and len(match.group(3)) == 1:
+            totals[match.group(4).split(".")[0]] += int(match.group(2))
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def summarize(label: str, samples: list) -> None:
+    samples_ms = [s * 1000 for s in samples]
+    spread = statistics.stdev(samples_ms) if len(samples_ms) > 1 else 0.0
+    print(f"  {label:<8} median {statistics.median(samples_ms):>8.0f} ms   "
+          f"min {min(samples_ms):>8.0f} ms   max {max(samples_ms):>8.0f} ms   sd {spread:>6.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time (default 5)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list (default 10)")
+    args = parser.parse_args()
+
+    results = [run_probe() for _ in range(args.runs)]
+    print(f"Cold start over {args.runs} fresh interpreters:")
+    summarize("import", [r["import_s"] for r in results])
+    summarize("ready", [r["ready_s"] for r in results])
+    summarize("total", [r["import_s"] + r["ready_s"] for r in results])
+
+    print("\nSlowest top-level imports (cumulative, one run):")
+    for package, micros in slowest_imports(args.top):
+        print(f"  {package:<28} {micros / 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark Id Query Shapes
+
+Compares the plans MongoDB picks for the two-form id reads used before
+``app/migrations/normalize_ids.py`` runs against the single-value equality
+used once a collection is marked normalized:
+
+- cards of a deck:          ``deck_id: {$in: [oid, str]}``   vs  ``deck_id: oid``
+- plan ownership check:     ``_id: {$in: [oid, str]}``       vs  ``_id: oid``
+- goals of a focus area:    ``focus_area_id: {$in: [...]}``  vs  ``focus_area_id: str``
+
+For each shape it runs ``explain`` with ``executionStats`` on real sample ids
+and prints keys examined, documents examined, server time and the winning
+plan's stages, then the median wall time over ``--runs`` executions. Run it
+before and after the migration to record the change. Needs MongoDB reachable
+the same way the app does (MONGO_URI in .env); it only reads.
+
+Usage (run from Nowry-API/):
+    python scripts/benchmark_id_queries.py
+    python scripts/benchmark_id_queries.py --runs 50
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+from bson import ObjectId
+
+# Same sys.path shim as scripts/sync_langfuse.py: make `app` importable when
+# run as `python scripts/benchmark_id_queries.py` from Nowry-API/.
+_REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+
+def _stages(plan: dict) -> str:
+    names = []
+    while plan:
+        names.append(plan.get("stage", "?") + (f"({plan['indexName']})" if "indexName" in plan else ""))
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(names)
+
+
+async def explain(db, collection: str, query: dict, runs: int) -> dict:
+    result = await db.command(
+        {"explain": {"find": collection, "filter": query}, "verbosity": "executionStats"}
+    )
+    stats = result["executionStats"]
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await db[collection].find(query).to_list(None)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "keys": stats["totalKeysExamined"],
+        "docs": stats["totalDocsExamined"],
+        "returned": stats["nReturned"],
+        "server_ms": stats["executionTimeMillis"],
+        "wall_ms": statistics.median(timings),
+        "plan": _stages(result["queryPlanner"]["winningPlan"]),
+    }
+
+
+async def sample_cases(db) -> list:
+    """(label, collection, two-form query, single-value query) on real ids."""
+    cases = []
+    card = await db.cards.find_one({"deleted_at": None, "deck_id": {"$exists": True}}, {"deck_id": 1})
+    if card:
+        deck_id = card["deck_id"]
+        if ObjectId.is_valid(str(deck_id)):
+            oid = ObjectId(str(deck_id))
+            cases.append((
+                "cards by deck", "cards",
+                {"deck_id": {"$in": [oid, str(oid)]}, "deleted_at": None},
+                {"deck_id": oid, "deleted_at": None},
+            ))
+    plan = await db.annual_plans.find_one({"deleted_at": None}, {"user_id": 1})
+    if plan:
+        oid = plan["_id"]
+        cases.append((
+            "plan ownership", "annual_plans",
+            {"_id": {"$in": [oid, str(oid)]}, "user_id": plan.get("user_id")},
+            {"_id": oid, "user_id": plan.get("user_id")},
+        ))
+    goal = await db.goals.find_one({"deleted_at": None}, {"focus_area_id": 1})
+    if goal and goal.get("focus_area_id"):
+        text = str(goal["focus_area_id"])
+        forms = [text] + ([ObjectId(text)] if ObjectId.is_valid(text) else [])
+        cases.append((
+            "goals by area", "goals",
+            {"focus_area_id": {"$in": forms}, "deleted_at": None},
+            {"focus_area_id": text, "deleted_at": None},
+        ))
+    return cases
+
+
+def report(label: str, shape: str, row: dict) -> None:
+    print(
+        f"{label:<16} {shape:<7} keys {row['keys']:>6}  docs {row['docs']:>6}  "
+        f"returned {row['returned']:>6}  server {row['server_ms']:>4} ms  "
+        f"wall p50 {row['wall_ms']:7.2f} ms  {row['plan']}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=20, help="Timed executions per query shape")
+    args = parser.parse_args()
+
+    from app.config.database import db
+    from app.utils import ids
+
+    normalized = await ids.load_normalized()
+    print(f"Normalized collections: {', '.join(sorted(normalized)) or 'none'}\n")
+
+    cases = await sample_cases(db)
+    if not cases:
+        print("No sample documents found; nothing to compare.")
+        return
+    for label, collection, two_form, single in cases:
+        report(label, "$in", await explain(db, collection, two_form, args.runs))
+        report(label, "single", await explain(db, collection, single, args.runs))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+"""
+Benchmark PDF Import Script
+
+Times book import extraction on synthetic PDFs: a 300-page single-column book
+and a 300-page 2-column paper layout. Compares the serial in-process
+extractor (extract_formatted_text_from_pdf, the pre-pool code path) with the
+pooled page-range extraction used by POST /books/import, plus preview mode
+(first PREVIEW_PAGE_LIMIT pages only).
+
+Event-loop stall is measured with a 10 ms ticker running alongside each async
+run: the largest gap between ticks is how long other requests on the worker
+would have waited.
+
+Usage (run from Nowry-API/):
+    python scripts/benchmark_pdf_import.py
+    python scripts/benchmark_pdf_import.py --pages 600 --workers 8
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+# Same sys.path shim as scripts/sync_langfuse.py: make `app` importable when
+# run as `python scripts/benchmark_pdf_import.py` from Nowry-API/.
+_REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+import fitz
+
+PARAGRAPH = (
+    "Spaced repetition schedules each review just before the memory would "
+    "otherwise fade, so the interval between reviews grows with every success. "
+)
+
+
+def build_pdf(path: str, pages: int, two_column: bool) -> None:
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        width = page.rect.width
+        if two_column:
+            page.insert_textbox(fitz.Rect(40, 60, width / 2 - 20, 800), f"Left {number} " + PARAGRAPH * 12)
+            page.insert_textbox(fitz.Rect(width / 2 + 20, 60, width - 40, 800), f"Right {number} " + PARAGRAPH * 12)
+        else:
+            page.insert_textbox(fitz.Rect(40, 60, width - 40, 800), f"Page {number} " + PARAGRAPH * 20)
+    doc.save(path)
+    doc.close()
+
+
+async def _max_loop_stall(coro) -> tuple:
+    """Run ``coro`` while a ticker measures the longest event-loop gap."""
+    stall = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal stall
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            stall = max(stall, now - last - 0.01)
+            last = now
+
+    tick_task = asyncio.create_task(ticker())
+    try:
+        result = await coro
+    finally:
+        done.set()
+        await tick_task
+    return result, stall
+
+
+async def run_case(label: str, path: str, preview_limit: int) -> None:
+    from app.utils.file_import import extract_formatted_text_from_pdf, extract_pages
+
+    with open(path, "rb") as fh:
+        content = fh.read()
+
+    async def serial():
+        await asyncio.sleep(0.015)  # let the ticker start before blocking the loop
+        return extract_formatted_text_from_pdf(content)
+
+    start = time.perf_counter()
+    pages, serial_stall = await _max_loop_stall(serial())
+    serial_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    (pooled_pages, _), pooled_stall = await _max_loop_stall(extract_pages(os.path.basename(path), path))
+    pooled_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    (preview_pages, _), preview_stall = await _max_loop_stall(
+        extract_pages(os.path.basename(path), path, max_pages=preview_limit)
+    )
+    preview_s = time.perf_counter() - start
+
+    assert len(pooled_pages) == len(pages)
+    columns = sum(1 for p in pooled_pages if p.get("has_columns"))
+    print(f"\n{label}: {len(pages)} pages, {columns} detected as multi-column")
+    print(f"  {'mode':<10} {'wall (s)':>10} {'max loop stall (ms)':>22}")
+    print(f"  {'serial':<10} {serial_s:>10.2f} {serial_stall * 1000:>22.0f}")
+    print(f"  {'pooled':<10} {pooled_s:>10.2f} {pooled_stall * 1000:>22.0f}")
+    print(f"  {'preview':<10} {preview_s:>10.2f} {preview_stall * 1000:>22.0f}  ({len(preview_pages)} pages)")
+
+
+async def main_async(args) -> None:
+    from app.utils.process_pool import get_process_pool, shutdown_process_pool, PROCESS_POOL_WORKERS
+
+    print(f"Process pool workers: {PROCESS_POOL_WORKERS}")
+    # Warm the pool so worker start-up is not billed to the first case.
+    await asyncio.get_running_loop().run_in_executor(get_process_pool(), abs, 0)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for label, two_column in (("single-column", False), ("2-column", True)):
+                path = os.path.join(tmp, f"{label}.pdf")
+                build_pdf(path, args.pages, two_column)
+                await run_case(label, path, args.preview_pages)
+    finally:
+        shutdown_process_pool()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300, help="Pages per synthetic PDF (default 300)")
+    parser.add_argument("--preview-pages", type=int, default=10, help="Preview page limit (books.PREVIEW_PAGE_LIMIT)")
+    parser.add_argument("--workers", type=int, default=None, help="Override PROCESS_POOL_WORKERS")
+    args = parser.parse_args()
+    if args.workers:
+        os.environ["PROCESS_POOL_WORKERS"] = str(args.workers)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
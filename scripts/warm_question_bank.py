@@ -0,0 +1,107 @@
+"""
+Warm Question Bank Script
+
+Pre-generates quiz questions for official curated decks so the first quiz on
+any fork of them is served from the question bank (app/utils/question_bank.py)
+without an LLM call. Every card is filled up to BANK_VARIANTS phrasings for
+each question type its fields allow; entries that are already full are
+skipped, so the job is safe to re-run after decks change or the prompt
+version is bumped.
+
+Dry run by default: reports how many questions would be generated.
+
+Usage (run from Nowry-API/):
+    python scripts/warm_question_bank.py
+    python scripts/warm_question_bank.py --apply
+    python scripts/warm_question_bank.py --apply --deck-id <deck id> --concurrency 4
+"""
+import sys
+import asyncio
+import argparse
+from pathlib import Path
+
+# Same sys.path shim as scripts/sync_langfuse.py: make `app` importable when
+# run as `python scripts/warm_question_bank.py` from Nowry-API/.
+_REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+from bson import ObjectId
+
+from app.config.database import cards_collection, decks_collection, question_bank_collection
+from app.config.official_publisher import get_official_publisher_user_id
+from app.models.PublicContent import is_official_deck
+from app.routers import quiz
+from app.utils import question_bank
+
+
+async def curated_decks(deck_id: str | None) -> list[dict]:
+    query = {
+        "is_public": True,
+        "deleted_at": None,
+        "public_metadata.curation.status": "approved",
+    }
+    if deck_id:
+        query["_id"] = ObjectId(deck_id) if len(deck_id) == 24 else deck_id
+    publisher = get_official_publisher_user_id()
+    decks = await decks_collection.find(query).to_list(length=None)
+    return [d for d in decks if is_official_deck(d, publisher)]
+
+
+async def missing_variants(fields: dict, question_type: str) -> int:
+    key = question_bank.bank_key(fields, question_type, quiz.QUESTION_PROMPT_VERSION)
+    entry = await question_bank_collection.find_one({"_id": key}, {"variants": 1})
+    return max(0, question_bank.BANK_VARIANTS - len((entry or {}).get("variants") or []))
+
+
+async def warm_deck(deck: dict, client, apply: bool, semaphore: asyncio.Semaphore) -> tuple[int, int]:
+    """Return (cards seen, questions generated or planned) for one deck."""
+    deck_id = str(deck["_id"])
+    id_variants = [deck_id] + ([ObjectId(deck_id)] if ObjectId.is_valid(deck_id) else [])
+    cards = await cards_collection.find(
+        {"deck_id": {"$in": id_variants}, "deleted_at": None}
+    ).to_list(length=None)
+
+    jobs = []
+    for card in cards:
+        fields = quiz._extract_card_fields(card)
+        if not fields:
+            continue
+        for question_type, _ in quiz._question_type_pool(fields):
+            jobs.extend([(fields, question_type)] * await missing_variants(fields, question_type))
+
+    if apply:
+        async def generate(fields: dict, question_type: str) -> None:
+            async with semaphore:
+                await quiz._fill_bank(fields, question_type, client)
+
+        await asyncio.gather(*(generate(f, t) for f, t in jobs))
+    return len(cards), len(jobs)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Pre-generate quiz questions for curated decks.")
+    parser.add_argument("--apply", action="store_true", help="Generate and store (default: dry run).")
+    parser.add_argument("--deck-id", help="Only warm this deck.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Parallel LLM calls (default 4).")
+    args = parser.parse_args()
+
+    client = quiz._get_groq_client() if args.apply else None
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+
+    decks = await curated_decks(args.deck_id)
+    total_cards = total_questions = 0
+    for deck in decks:
+        cards, questions = await warm_deck(deck, client, args.apply, semaphore)
+        total_cards += cards
+        total_questions += questions
+        print(f"  {deck.get('title', deck['_id'])}: {cards} cards, {questions} questions")
+
+    verb = "Generated" if args.apply else "Would generate"
+    print(f"\n{verb} {total_questions} questions across {len(decks)} decks ({total_cards} cards).")
+    if not args.apply:
+        print("Dry run — re-run with --apply to write.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -11,11 +11,13 @@ AgentLLM._chat_groq must detect this specific failure, retry the turn once
 without tools (plain text answer), and still propagate every other error.
 """
 import asyncio
+from types import SimpleNamespace
 from typing import Any
 from unittest.mock import MagicMock
 
 import pytest
 
+from app.utils import metrics
 from app.utils.agent_llm import AgentLLM, ToolCallRejectedError
 
 
@@ -50,13 +52,16 @@ def _fake_completion(content: str) -> MagicMock:
     return completion
 
 
-def _fake_gemini_tools() -> list:
-    decl = MagicMock()
-    decl.name = "start_quiz"
-    decl.description = "quiz tool"
-    decl.parameters = None
+def _fake_gemini_tools(*names: str) -> list:
+    declarations = []
+    for name in names or ("start_quiz",):
+        decl = MagicMock()
+        decl.name = name
+        decl.description = "quiz tool"
+        decl.parameters = None
+        declarations.append(decl)
     tool = MagicMock()
-    tool.function_declarations = [decl]
+    tool.function_declarations = declarations
     return [tool]
 
 
@@ -174,6 +179,135 @@ def test_rejected_tool_call_reruns_turn_without_tool() -> None:
     assert "行動する" in reply
 
 
+# --------------------------------------------------------------------------- #
+# Tool calls of one response run concurrently, results in call order
+# --------------------------------------------------------------------------- #
+
+def test_tool_calls_run_concurrently_in_order_with_isolated_failure() -> None:
+    metrics.reset()
+    calls: list[dict] = []
+
+    def tool_call(call_id: str, fn_name: str) -> MagicMock:
+        tc = MagicMock()
+        tc.id = call_id
+        tc.function.name = fn_name
+        tc.function.arguments = "{}"
+        return tc
+
+    def create(**kwargs: Any) -> MagicMock:
+        calls.append(kwargs)
+        if len(calls) == 1:
+            completion = _fake_tool_call_completion("list_decks", "{}")
+            completion.choices[0].message.tool_calls = [
+                tool_call("call_1", "list_decks"),
+                tool_call("call_2", "get_study_summary"),
+                tool_call("call_3", "get_annual_plan_context"),
+            ]
+            return completion
+        return _fake_completion("Here is your overview.")
+
+    llm = _make_llm(create)
+    started: list[str] = []
+    all_started = asyncio.Event()
+
+    async def dispatcher(fn_name: str, fn_args: dict, user_id: str) -> str:
+        started.append(fn_name)
+        if len(started) == 3:
+            all_started.set()
+        # Returns only once every call is in flight — a sequential loop would hang.
+        await asyncio.wait_for(all_started.wait(), timeout=1)
+        if fn_name == "get_study_summary":
+            raise RuntimeError("mongo down")
+        if fn_name == "list_decks":
+            await asyncio.sleep(0.01)  # finishes last, still reported first
+        return f'{{"tool": "{fn_name}"}}'
+
+    reply = _run(llm._chat_groq(
+        message="How am I doing?",
+        history=[],
+        system_prompt="sys",
+        # get_annual_plan_context is not declared: the model made it up.
+        tools=_fake_gemini_tools("list_decks", "get_study_summary"),
+        tool_dispatcher=dispatcher,
+        user_id="u1",
+    ))
+
+    assert reply == "Here is your overview."
+    tool_messages = [m for m in calls[1]["messages"] if isinstance(m, dict) and m.get("role") == "tool"]
+    assert [m["tool_call_id"] for m in tool_messages] == ["call_1", "call_2", "call_3"]
+    assert tool_messages[0]["content"] == '{"tool": "list_decks"}'
+    assert "Tool execution failed: mongo down" in tool_messages[1]["content"]
+    assert tool_messages[2]["content"] == '{"tool": "get_annual_plan_context"}'
+    histograms = metrics.histograms()
+    assert histograms["agent_tool_list_decks_ms"]["count"] == 1
+    assert histograms["agent_tool_get_study_summary_ms"]["count"] == 1
+    assert histograms["agent_tool_unknown_ms"]["count"] == 1
+    assert "agent_tool_get_annual_plan_context_ms" not in histograms
+    metrics.reset()
+
+
+# --------------------------------------------------------------------------- #
+# Streaming: tokens and tool progress as they arrive, reply last
+# --------------------------------------------------------------------------- #
+
+def _stream_chunk(content: Any = None, tool_calls: Any = None) -> SimpleNamespace:
+    delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def _tool_fragment(index: int, call_id: Any, name: Any, arguments: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        index=index, id=call_id, function=SimpleNamespace(name=name, arguments=arguments)
+    )
+
+
+def test_stream_groq_yields_tool_progress_then_tokens_and_reply() -> None:
+    calls: list[dict] = []
+
+    def create(**kwargs: Any) -> list:
+        calls.append(kwargs)
+        if len(calls) == 1:
+            # Arguments arrive split over two chunks, as Groq streams them.
+            return [
+                _stream_chunk(tool_calls=[_tool_fragment(0, "call_1", "list_decks", '{"lim')]),
+                _stream_chunk(tool_calls=[_tool_fragment(0, None, None, 'it": 3}')]),
+            ]
+        return [_stream_chunk("You have "), _stream_chunk("3 decks."), SimpleNamespace(choices=[])]
+
+    llm = _make_llm(create)
+    dispatched: list = []
+
+    async def dispatcher(fn_name: str, fn_args: dict, user_id: str) -> str:
+        dispatched.append((fn_name, fn_args))
+        return '{"decks": 3}'
+
+    async def collect() -> list:
+        return [
+            event async for event in llm._stream_groq(
+                message="How many decks do I have?",
+                history=[],
+                system_prompt="sys",
+                tools=_fake_gemini_tools(),
+                tool_dispatcher=dispatcher,
+                user_id="u1",
+            )
+        ]
+
+    events = _run(collect())
+    assert [(e.type, e.tool, e.status) for e in events[:2]] == [
+        ("tool", "list_decks", "started"),
+        ("tool", "list_decks", "finished"),
+    ]
+    assert [e.text for e in events if e.type == "token"] == ["You have ", "3 decks."]
+    assert (events[-1].type, events[-1].text) == ("reply", "You have 3 decks.")
+    assert dispatched == [("list_decks", {"limit": 3})]
+    assert all(c["stream"] is True for c in calls)
+    # The follow-up call carries the assistant tool call and its result.
+    assistant, tool_result = calls[1]["messages"][-2:]
+    assert assistant["tool_calls"][0]["function"] == {"name": "list_decks", "arguments": '{"limit": 3}'}
+    assert tool_result == {"tool_call_id": "call_1", "role": "tool", "name": "list_decks", "content": '{"decks": 3}'}
+
+
 # --------------------------------------------------------------------------- #
 # intent_yes_no — tiny YES/NO classifier used by the quiz gate
 # --------------------------------------------------------------------------- #
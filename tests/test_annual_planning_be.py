@@ -248,14 +248,11 @@ async def test_reorder_success(mock_firebase_user):
 
     pri_ids = [str(ObjectId()), str(ObjectId())]
 
-    mock_update_result = MagicMock()
-    mock_update_result.matched_count = 1
-
     with patch("app.routers.annual_planning.annual_plans_collection") as mock_plans, \
          patch("app.routers.annual_planning.priorities_collection") as mock_pri:
         mock_plans.find_one = AsyncMock(return_value=make_plan())
         mock_pri.count_documents = AsyncMock(return_value=len(pri_ids))
-        mock_pri.update_one = AsyncMock(return_value=mock_update_result)
+        mock_pri.bulk_write = AsyncMock()
 
         result = await reorder_priorities(
             payload=PriorityReorderRequest(
@@ -266,12 +263,12 @@ async def test_reorder_success(mock_firebase_user):
         )
 
     assert result == {"ok": True} or getattr(result, "ok", None) is True
-    assert mock_pri.update_one.call_count == len(pri_ids)
-    # Verify order values: first call sets order=0, second sets order=1
-    first_set  = mock_pri.update_one.call_args_list[0][0][1]["$set"]
-    second_set = mock_pri.update_one.call_args_list[1][0][1]["$set"]
-    assert first_set["order"] == 0
-    assert second_set["order"] == 1
+    # One bulk_write carrying one UpdateOne per priority, in request order
+    mock_pri.bulk_write.assert_awaited_once()
+    operations = mock_pri.bulk_write.call_args[0][0]
+    assert len(operations) == len(pri_ids)
+    assert operations[0]._doc["$set"]["order"] == 0
+    assert operations[1]._doc["$set"]["order"] == 1
 
 
 @pytest.mark.asyncio
@@ -601,3 +598,81 @@ async def test_close_quarter_routine_count(mock_firebase_user):
     saved_doc = mock_qr.insert_one.call_args[0][0]
     assert saved_doc["routines_summary"]["active_days"] == 1
     assert saved_doc["routines_summary"]["total_items_checked"] == 2
+
+
+# ---------------------------------------------------------------------------
+# Owner stamp on planning children — single-hop ownership, user-scoped /full
+# ---------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_stamped_goal_ownership_is_one_lookup():
+    """A goal carrying user_id answers the check itself — no parent walk."""
+    from app.routers.annual_planning import verify_goal_ownership
+    from fastapi import HTTPException
+
+    goal_id = str(ObjectId())
+    with patch("app.routers.annual_planning.goals_collection") as mock_goals, \
+         patch("app.routers.annual_planning.focus_areas_collection") as mock_fas, \
+         patch("app.routers.annual_planning.annual_plans_collection") as mock_plans:
+        mock_goals.find_one = AsyncMock(return_value={"_id": ObjectId(goal_id), "focus_area_id": "fa-1", "user_id": USER_ID})
+        mock_fas.find_one = AsyncMock()
+        mock_plans.find_one = AsyncMock()
+
+        await verify_goal_ownership(goal_id, USER_ID)
+        with pytest.raises(HTTPException) as exc_info:
+            await verify_goal_ownership(goal_id, "someone-else")
+
+    assert exc_info.value.status_code == 403
+    assert mock_goals.find_one.await_count == 2
+    mock_fas.find_one.assert_not_called()
+    mock_plans.find_one.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_create_goal_stamps_caller_as_owner(mock_firebase_user):
+    """The owner comes from the caller, never from the request body."""
+    from app.routers.annual_planning import create_goal
+    from app.models.Goal import Goal
+
+    goal = Goal(focus_area_id="fa-1", title="Run a 10k", user_id="someone-else")
+    with patch("app.routers.annual_planning.goals_collection") as mock_goals, \
+         patch("app.routers.annual_planning.verify_focus_area_ownership", AsyncMock()):
+        mock_goals.insert_one = AsyncMock(return_value=MagicMock(inserted_id=goal.id))
+        mock_goals.find_one = AsyncMock(return_value={})
+
+        await create_goal(goal=goal, current_user=mock_firebase_user)
+
+    assert mock_goals.insert_one.call_args[0][0]["user_id"] == mock_firebase_user["user_id"]
+
+
+@pytest.mark.asyncio
+async def test_plan_tree_scopes_parent_lookups_to_owner_once_stamped():
+    """After the backfill, each level is still an $in on its parents, scoped to the owner."""
+    from app.routers import annual_planning
+
+    area = {"_id": ObjectId(), "annual_plan_id": PLAN_ID}
+    goal = {"_id": ObjectId(), "focus_area_id": str(area["_id"])}
+    activity = {"_id": ObjectId(), "goal_id": str(goal["_id"])}
+
+    def _cursor(docs):
+        return MagicMock(to_list=AsyncMock(return_value=docs))
+
+    with patch.object(annual_planning.planning_scope, "owner_stamped", return_value=True), \
+         patch.object(annual_planning.ids, "is_normalized", return_value=True), \
+         patch("app.routers.annual_planning.focus_areas_collection") as mock_fas, \
+         patch("app.routers.annual_planning.goals_collection") as mock_goals, \
+         patch("app.routers.annual_planning.activities_collection") as mock_acts:
+        mock_fas.find = MagicMock(return_value=_cursor([area]))
+        mock_goals.find = MagicMock(return_value=_cursor([goal]))
+        mock_acts.find = MagicMock(return_value=_cursor([activity]))
+
+        areas, goals, activities = await annual_planning._plan_tree(USER_ID, PLAN_ID)
+
+    assert (areas, goals, activities) == ([area], [goal], [activity])
+    goals_query = mock_goals.find.call_args[0][0]
+    assert goals_query["user_id"] == USER_ID and goals_query["deleted_at"] is None
+    assert len(goals_query["focus_area_id"]["$in"]) == 1
+    assert mock_goals.find.return_value.to_list.call_args.kwargs == {"length": 100}
+    acts_query = mock_acts.find.call_args[0][0]
+    assert acts_query["user_id"] == USER_ID and len(acts_query["goal_id"]["$in"]) == 1
+    assert mock_acts.find.return_value.to_list.call_args.kwargs == {"length": 500}
@@ -0,0 +1,542 @@
+"""
+Job-based Anki .apkg import — POST /import/apkg/jobs and friends.
+
+Covers:
+  1. parse_apkg_file: notes → cards, media references classified per side,
+     only referenced media extracted from the package
+  2. _run_import_job: parse → media upload → staged cards → `ready`, with the
+     uploaded URL attached to the staged card's media entry
+  3. A malformed package settles the job as `failed` with the parser message
+  4. Confirm moves staged cards into a new deck in IMPORT_BATCH_SIZE batches
+     (one insert_many per batch) and settles the job as `completed`
+  5. Confirm on a job that is not `ready` → 409; foreign import id → 404
+  6. Anki cards/revlog → SM-2 fields (due/ivl/factor/reps) and review history,
+     applied on confirm unless `import_scheduling` is false
+  7. A worker heartbeats the job while it runs; an active job whose heartbeat
+     is stale is marked failed, releasing the quota a dead confirm reserved
+
+Collections are in-memory fakes; the parser runs inline instead of in the
+process pool so the test never spawns workers.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import zipfile
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+from unittest.mock import AsyncMock, MagicMock, patch
+
+for mod in ["langfuse", "langfuse.langchain"]:
+    sys.modules.setdefault(mod, MagicMock())
+
+import httpx
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+
+from app.routers import import_apkg
+from app.utils.apkg_parser import parse_apkg_file
+
+USER_ID = "507f1f77bcf86cd799439011"
+
+
+# ---------------------------------------------------------------------------
+# Fixtures / fakes
+# ---------------------------------------------------------------------------
+
+COLLECTION_CREATED = 1_600_000_000  # col.crt, epoch seconds
+
+
+def _build_apkg(
+    path: str,
+    notes: list,
+    media: Optional[dict] = None,
+    cards: Optional[list] = None,
+    revlog: Optional[list] = None,
+) -> str:
+    """Write a minimal legacy-format .apkg (collection.anki2 + media map).
+
+    `notes` are (flds, tags) tuples and get ids 1..n. `cards` rows are
+    (id, nid, ord, type, queue, due, ivl, factor, reps); `revlog` rows are
+    (id_ms, cid, ease, ivl, lastIvl, factor, time, type).
+    """
+    db_path = path + ".db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE col (crt INTEGER, decks TEXT)")
+    conn.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY, flds TEXT, tags TEXT)")
+    conn.execute(
+        "CREATE TABLE cards (id INTEGER, nid INTEGER, ord INTEGER, type INTEGER, "
+        "queue INTEGER, due INTEGER, ivl INTEGER, factor INTEGER, reps INTEGER)"
+    )
+    conn.execute(
+        "CREATE TABLE revlog (id INTEGER, cid INTEGER, ease INTEGER, ivl INTEGER, "
+        "lastIvl INTEGER, factor INTEGER, time INTEGER, type INTEGER)"
+    )
+    conn.execute(
+        "INSERT INTO col VALUES (?, ?)",
+        (COLLECTION_CREATED, json.dumps({"1": {"name": "Default"}, "42": {"name": "Lang::Spanish"}})),
+    )
+    conn.executemany(
+        "INSERT INTO notes VALUES (?, ?, ?)",
+        [(i, flds, tags) for i, (flds, tags) in enumerate(notes, start=1)],
+    )
+    conn.executemany("INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", cards or [])
+    conn.executemany("INSERT INTO revlog VALUES (?, ?, ?, ?, ?, ?, ?, ?)", revlog or [])
+    conn.commit()
+    conn.close()
+
+    media = media or {}
+    with zipfile.ZipFile(path, "w") as z:
+        z.write(db_path, "collection.anki2")
+        z.writestr("media", json.dumps({str(i): name for i, name in enumerate(media)}))
+        for i, content in enumerate(media.values()):
+            z.writestr(str(i), content)
+    os.remove(db_path)
+    return path
+
+
+def _matches(document: dict, query: dict) -> bool:
+    for field, expected in query.items():
+        value = document.get(field)
+        if isinstance(expected, dict) and "$gt" in expected:
+            if value is None or not value > expected["$gt"]:
+                return False
+        elif isinstance(expected, dict) and "$lt" in expected:
+            # Mongo hands back naive UTC datetimes; compare them as UTC.
+            if isinstance(value, datetime) and value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            if value is None or not value < expected["$lt"]:
+                return False
+        elif isinstance(expected, dict) and "$in" in expected:
+            if value not in expected["$in"]:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+class _Cursor:
+    def __init__(self, documents: list):
+        self._documents = documents
+
+    def sort(self, field: str, direction: int = 1):
+        self._documents = sorted(self._documents, key=lambda d: d[field], reverse=direction < 0)
+        return self
+
+    async def to_list(self, length: Optional[int] = None):
+        return [dict(d) for d in self._documents[:length]]
+
+
+class FakeCollection:
+    def __init__(self):
+        self.documents: list = []
+        self.insert_many_calls = 0
+
+    async def insert_one(self, document: dict):
+        document.setdefault("_id", ObjectId())
+        self.documents.append(document)
+        return MagicMock(inserted_id=document["_id"])
+
+    async def insert_many(self, documents: list, ordered: bool = True):
+        self.insert_many_calls += 1
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+            self.documents.append(document)
+        return MagicMock(inserted_ids=[d["_id"] for d in documents])
+
+    async def find_one(self, query: dict, projection: Any = None):
+        for document in self.documents:
+            if _matches(document, query):
+                return dict(document)
+        return None
+
+    def find(self, query: dict, projection: Any = None):
+        return _Cursor([d for d in self.documents if _matches(d, query)])
+
+    async def update_one(self, query: dict, update: dict):
+        for document in self.documents:
+            if _matches(document, query):
+                document.update(update.get("$set", {}))
+                for field, spec in update.get("$push", {}).items():
+                    document.setdefault(field, []).extend(spec["$each"])
+                return MagicMock(matched_count=1)
+        return MagicMock(matched_count=0)
+
+    async def find_one_and_update(self, query: dict, update: dict, **kwargs):
+        for document in self.documents:
+            if _matches(document, query):
+                before = dict(document)
+                document.update(update.get("$set", {}))
+                return before
+        return None
+
+    async def delete_many(self, query: dict):
+        self.documents = [d for d in self.documents if not _matches(d, query)]
+        return MagicMock()
+
+
+@pytest.fixture
+def fakes():
+    collections = {
+        "card_reviews_collection": FakeCollection(),
+        "apkg_imports_collection": FakeCollection(),
+        "apkg_import_cards_collection": FakeCollection(),
+        "decks_collection": FakeCollection(),
+        "cards_collection": FakeCollection(),
+    }
+
+    async def inline_parser(apkg_path: str, work_dir: str):
+        return parse_apkg_file(apkg_path, work_dir)
+
+    patches = [patch.object(import_apkg, name, coll) for name, coll in collections.items()]
+    patches.append(patch.object(import_apkg, "_run_parser", inline_parser))
+    patches.append(patch.object(import_apkg, "_get_remaining_quota", AsyncMock(return_value=-1)))
+    patches.append(patch.object(import_apkg, "quota", MagicMock(
+        try_reserve=AsyncMock(return_value=True), release=AsyncMock(),
+    )))
+    for p in patches:
+        p.start()
+    yield collections
+    for p in patches:
+        p.stop()
+
+
+def _storage_stub():
+    storage = MagicMock()
+    storage.upload = AsyncMock(return_value={"secure_url": "https://cdn.example/cat.png"})
+    return storage
+
+
+async def _seed_job(fakes: dict, import_id: str = "job1", **overrides) -> dict:
+    job = {
+        "import_id": import_id,
+        "user_id": USER_ID,
+        "status": "uploaded",
+        "progress": {"stage": "uploaded"},
+        "card_count": 0,
+        "media_count": 0,
+    }
+    job.update(overrides)
+    await fakes["apkg_imports_collection"].insert_one(job)
+    return job
+
+
+# ---------------------------------------------------------------------------
+# Parser
+# ---------------------------------------------------------------------------
+
+def test_parse_apkg_file_extracts_cards_and_referenced_media(tmp_path):
+    apkg = _build_apkg(
+        str(tmp_path / "deck.apkg"),
+        [
+            ('gato<img src="cat.png">', " animals "),
+            ("perro\x1fdog[sound:dog.mp3]", ""),
+        ],
+        media={"cat.png": b"PNG", "dog.mp3": b"MP3", "unused.jpg": b"JPG"},
+    )
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+
+    parsed = parse_apkg_file(apkg, str(work_dir))
+
+    assert parsed["suggested_name"] == "Spanish"
+    assert [c["front"] for c in parsed["cards"]] == ["gato", "perro"]
+    assert parsed["cards"][1]["back"] == "dog"
+    assert parsed["cards"][0]["tags"] == ["animals"]
+    assert parsed["cards"][0]["media"] == [{"name": "cat.png", "kind": "image", "side": "front"}]
+    assert parsed["cards"][1]["media"] == [{"name": "dog.mp3", "kind": "audio", "side": "back"}]
+    assert set(parsed["media_files"]) == {"cat.png", "dog.mp3"}
+    with open(parsed["media_files"]["cat.png"], "rb") as f:
+        assert f.read() == b"PNG"
+
+
+def test_parse_apkg_file_rejects_non_zip(tmp_path):
+    bogus = tmp_path / "deck.apkg"
+    bogus.write_bytes(b"not a zip")
+    with pytest.raises(ValueError, match="not a zip"):
+        parse_apkg_file(str(bogus), str(tmp_path))
+
+
+# ---------------------------------------------------------------------------
+# Background job
+# ---------------------------------------------------------------------------
+
+async def test_run_import_job_stages_cards_and_uploads_media(tmp_path, fakes):
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    apkg = _build_apkg(
+        str(work_dir / "deck.apkg"),
+        [('gato<img src="cat.png">', ""), ("perro\x1fdog", "")],
+        media={"cat.png": b"PNG"},
+    )
+    await _seed_job(fakes)
+    storage = _storage_stub()
+
+    with patch.object(import_apkg, "get_storage_backend", return_value=storage):
+        await import_apkg._run_import_job("job1", USER_ID, apkg, str(work_dir))
+
+    job = fakes["apkg_imports_collection"].documents[0]
+    assert job["status"] == "ready"
+    assert job["card_count"] == 2
+    assert job["media_count"] == 1
+    assert job["preview_cards"][0]["media"][0]["url"] == "https://cdn.example/cat.png"
+    assert storage.upload.await_args.kwargs["folder"] == f"nowry/{USER_ID}/anki/job1"
+
+    staged = sorted(fakes["apkg_import_cards_collection"].documents, key=lambda d: d["seq"])
+    assert [c["front"] for c in staged] == ["gato", "perro"]
+    assert staged[0]["media"][0]["url"] == "https://cdn.example/cat.png"
+    # Work dir (upload + extracted DB/media) is removed once the job settles.
+    assert not work_dir.exists()
+
+
+async def test_run_import_job_marks_failed_on_bad_package(tmp_path, fakes):
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    bogus = work_dir / "deck.apkg"
+    bogus.write_bytes(b"garbage")
+    await _seed_job(fakes)
+
+    await import_apkg._run_import_job("job1", USER_ID, str(bogus), str(work_dir))
+
+    job = fakes["apkg_imports_collection"].documents[0]
+    assert job["status"] == "failed"
+    assert "not a valid .apkg" in job["error"]
+    assert fakes["apkg_import_cards_collection"].documents == []
+
+
+# ---------------------------------------------------------------------------
+# Confirm
+# ---------------------------------------------------------------------------
+
+_test_app = FastAPI()
+_test_app.include_router(import_apkg.router)
+
+
+async def _mock_firebase_user() -> dict:
+    return {"user_id": USER_ID, "firebase_uid": "uid", "email": "test@example.com"}
+
+
+async def _post_confirm(import_id: str, body: dict):
+    _test_app.dependency_overrides[import_apkg.get_firebase_user] = _mock_firebase_user
+    try:
+        transport = httpx.ASGITransport(app=_test_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(f"/import/apkg/jobs/{import_id}/confirm", json=body)
+    finally:
+        _test_app.dependency_overrides.clear()
+
+
+async def test_confirm_inserts_staged_cards_in_batches(fakes):
+    total = 5
+    await _seed_job(fakes, status="ready", card_count=total)
+    await fakes["apkg_import_cards_collection"].insert_many([
+        {"import_id": "job1", "seq": i, "front": f"q{i}", "back": f"a{i}", "tags": [], "media": []}
+        for i in range(total)
+    ])
+
+    with patch.object(import_apkg, "IMPORT_BATCH_SIZE", 2):
+        response = await _post_confirm("job1", {"deck_name": "  Spanish  "})
+
+    assert response.status_code == 201
+    body = response.json()
+    assert body["cards_imported"] == total
+
+    cards = fakes["cards_collection"]
+    assert cards.insert_many_calls == 3  # 2 + 2 + 1
+    assert [c["title"] for c in cards.documents] == [f"q{i}" for i in range(total)]
+    assert all(c["ease_factor"] == 2.5 and c["repetitions"] == 0 for c in cards.documents)
+
+    deck = fakes["decks_collection"].documents[0]
+    assert str(deck["_id"]) == body["deck_id"]
+    assert deck["name"] == "Spanish"
+    assert deck["total_cards"] == total
+    assert "cards" not in deck
+
+    job = fakes["apkg_imports_collection"].documents[0]
+    assert job["status"] == "completed"
+    assert job["deck_id"] == body["deck_id"]
+    assert fakes["apkg_import_cards_collection"].documents == []
+
+
+async def test_confirm_rejects_job_that_is_not_ready(fakes):
+    await _seed_job(fakes, status="parsing")
+    response = await _post_confirm("job1", {"deck_name": "Deck"})
+    assert response.status_code == 409
+    assert fakes["decks_collection"].documents == []
+
+
+async def test_confirm_unknown_import_is_404(fakes):
+    await _seed_job(fakes, user_id="someone-else", status="ready")
+    response = await _post_confirm("job1", {"deck_name": "Deck"})
+    assert response.status_code == 404
+
+
+# ---------------------------------------------------------------------------
+# Anki scheduling + review history
+# ---------------------------------------------------------------------------
+
+def _mature_deck(tmp_path) -> str:
+    day = 86_400_000
+    return _build_apkg(
+        str(tmp_path / "deck.apkg"),
+        [("uno\x1fone", ""), ("dos\x1ftwo", ""), ("tres\x1fthree", "")],
+        cards=[
+            # Review card, due 400 days after collection creation, ivl 30, ease 2.3
+            (101, 1, 0, 2, 2, 400, 30, 2300, 7),
+            (102, 1, 1, 2, 2, 999, 99, 2500, 9),  # reverse template — ignored
+            # Brand-new card
+            (201, 2, 0, 0, 0, 5, 0, 0, 0),
+            # Review card with an over-range ease, no revlog entries
+            (301, 3, 0, 2, 2, 10, 4, 2800, 3),
+        ],
+        revlog=[
+            (1_700_000_000_000, 101, 3, 5, 1, 2500, 8000, 1),
+            (1_700_000_000_000 + day, 101, 1, -600, 5, 2300, 9000, 1),
+            (1_700_000_000_000 + 2 * day, 101, 3, 10, 1, 2300, 4000, 2),
+            (1_700_000_000_000 + 3 * day, 101, 4, 30, 10, 2300, 3000, 1),
+            (1_700_000_000_000 + 4 * day, 102, 3, 99, 50, 2500, 3000, 1),
+        ],
+    )
+
+
+def test_parse_apkg_file_maps_anki_scheduling(tmp_path):
+    from datetime import datetime, timedelta, timezone
+
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    parsed = parse_apkg_file(_mature_deck(tmp_path), str(work_dir))
+    mature, new, no_log = (c["scheduling"] for c in parsed["cards"])
+
+    created = datetime.fromtimestamp(COLLECTION_CREATED, tz=timezone.utc)
+    assert mature["interval"] == 30
+    assert mature["ease_factor"] == 2.3
+    assert mature["next_review"] == created + timedelta(days=400)
+    # Streak since the last lapse ("again") is 2, floored at 2 for review cards.
+    assert mature["repetitions"] == 2
+    assert [r["grade"] for r in mature["reviews"]] == ["good", "again", "good", "easy"]
+    assert mature["reviews"][1]["interval"] == 1  # negative (seconds) learning ivl
+    assert mature["reviews"][2]["review_type"] == "relearn"
+    assert mature["last_reviewed"] == mature["reviews"][-1]["reviewed_at"]
+
+    assert new is None
+    assert no_log["ease_factor"] == 2.5  # clamped to the SM-2 maximum
+    assert no_log["last_reviewed"] is not None  # never treated as a new card
+    assert parsed["review_count"] == 4  # reverse-template card's log excluded
+
+
+async def test_confirm_applies_scheduling_and_loads_review_history(tmp_path, fakes):
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    await _seed_job(fakes)
+    await import_apkg._run_import_job("job1", USER_ID, _mature_deck(tmp_path), str(work_dir))
+
+    job = fakes["apkg_imports_collection"].documents[0]
+    assert job["scheduled_card_count"] == 2
+    assert job["review_count"] == 4
+
+    response = await _post_confirm("job1", {"deck_name": "Numbers"})
+    assert response.status_code == 201
+    assert response.json()["reviews_imported"] == 4
+
+    cards = {c["title"]: c for c in fakes["cards_collection"].documents}
+    assert cards["uno"]["interval"] == 30
+    assert cards["uno"]["repetitions"] == 2
+    assert cards["uno"]["last_reviewed"] is not None
+    assert cards["dos"]["repetitions"] == 0
+    assert cards["dos"]["last_reviewed"] is None
+
+    reviews = fakes["card_reviews_collection"].documents
+    assert {r["card_id"] for r in reviews} == {cards["uno"]["_id"]}
+    assert all(r["user_id"] == USER_ID and r["source"] == "anki_import" for r in reviews)
+
+
+async def test_confirm_without_scheduling_imports_cards_as_new(tmp_path, fakes):
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    await _seed_job(fakes)
+    await import_apkg._run_import_job("job1", USER_ID, _mature_deck(tmp_path), str(work_dir))
+
+    response = await _post_confirm("job1", {"deck_name": "Numbers", "import_scheduling": False})
+    assert response.status_code == 201
+    assert response.json()["reviews_imported"] == 0
+    assert all(c["repetitions"] == 0 and c["last_reviewed"] is None for c in fakes["cards_collection"].documents)
+    assert fakes["card_reviews_collection"].documents == []
+
+
+# ---------------------------------------------------------------------------
+# Heartbeat / stale jobs
+# ---------------------------------------------------------------------------
+
+def _stale_heartbeat() -> datetime:
+    return (datetime.now(timezone.utc) - import_apkg.STALE_AFTER - timedelta(seconds=1)).replace(tzinfo=None)
+
+
+async def test_run_import_job_heartbeats_while_parsing(tmp_path, fakes):
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    apkg = _build_apkg(str(work_dir / "deck.apkg"), [("uno\x1fone", "")])
+    await _seed_job(fakes)
+    touches = []
+
+    async def slow_parser(apkg_path: str, work_dir: str):
+        await asyncio.sleep(0.05)
+        return parse_apkg_file(apkg_path, work_dir)
+
+    update_job = import_apkg._update_job
+
+    async def recording_update(import_id: str, **fields):
+        if not fields:
+            touches.append(import_id)
+        await update_job(import_id, **fields)
+
+    with patch.object(import_apkg, "HEARTBEAT_INTERVAL", timedelta(milliseconds=10)), \
+         patch.object(import_apkg, "_run_parser", slow_parser), \
+         patch.object(import_apkg, "_update_job", recording_update):
+        await import_apkg._run_import_job("job1", USER_ID, apkg, str(work_dir))
+        settled = len(touches)
+        await asyncio.sleep(0.03)
+
+    assert settled >= 2
+    assert len(touches) == settled  # the heartbeat stops with the job
+    assert fakes["apkg_imports_collection"].documents[0]["status"] == "ready"
+
+
+async def test_stale_job_is_failed_on_poll_and_cannot_be_confirmed(fakes):
+    await _seed_job(fakes, status="parsing", progress={"stage": "parsing"}, updated_at=_stale_heartbeat())
+    _test_app.dependency_overrides[import_apkg.get_firebase_user] = _mock_firebase_user
+    try:
+        transport = httpx.ASGITransport(app=_test_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/import/apkg/jobs/job1")
+    finally:
+        _test_app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "failed"
+    assert response.json()["error"] == import_apkg._STALE_ERROR
+    assert fakes["apkg_imports_collection"].documents[0]["status"] == "failed"
+
+    response = await _post_confirm("job1", {"deck_name": "Deck"})
+    assert response.status_code == 409
+
+
+async def test_stale_confirm_releases_unused_quota(fakes):
+    deck = {"name": "Spanish", "total_cards": 10}
+    await fakes["decks_collection"].insert_one(deck)
+    await _seed_job(
+        fakes, status="importing", card_count=10, deck_id=str(deck["_id"]),
+        progress={"stage": "importing", "done": 4, "total": 10}, updated_at=_stale_heartbeat(),
+    )
+    await _seed_job(fakes, import_id="job2", status="parsing", updated_at=datetime.now(timezone.utc))
+
+    await import_apkg._fail_stale_jobs(USER_ID, datetime.now(timezone.utc))
+
+    jobs = {j["import_id"]: j for j in fakes["apkg_imports_collection"].documents}
+    assert jobs["job1"]["status"] == "failed"
+    assert jobs["job2"]["status"] == "parsing"  # still heartbeating
+    import_apkg.quota.release.assert_awaited_once_with(USER_ID, "flashcards", 6)
+    assert fakes["decks_collection"].documents[0]["total_cards"] == 4
@@ -0,0 +1,113 @@
+"""
+Batch mutation engine — app/services/batch_mutations.py.
+
+Covers:
+  1. A reorder is one bulk_write and returns the new versions in request order
+  2. Unstamped legacy goals are authorized through their parents, once per level
+  3. A foreign document or a disallowed field rejects the batch with no writes
+  4. Milestone check-offs use array filters; a goal status change archives its priorities
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.models.batch_mutations import BatchMutation
+from app.services import batch_mutations, planning_scope
+
+USER_ID = "507f1f77bcf86cd799439011"
+
+
+def _collection(docs_per_find):
+    """A collection whose successive find() calls return the given doc lists."""
+    collection = MagicMock()
+    collection.find = MagicMock(side_effect=[
+        MagicMock(to_list=AsyncMock(return_value=docs)) for docs in docs_per_find
+    ])
+    collection.bulk_write = AsyncMock()
+    return collection
+
+
+def _db(**collections):
+    return patch.object(batch_mutations, "db", collections), patch.object(planning_scope, "db", collections)
+
+
+async def test_reorder_is_one_bulk_write_in_request_order():
+    first, second = ObjectId(), ObjectId()
+    before = [{"_id": first, "user_id": USER_ID, "order": 0}, {"_id": second, "user_id": USER_ID, "order": 1}]
+    after = [{**before[0], "order": 1}, {**before[1], "order": 0}]
+    priorities = _collection([before, after])
+
+    patch_batch, patch_scope = _db(priorities=priorities)
+    with patch_batch, patch_scope:
+        result = await batch_mutations.apply_batch("priorities", USER_ID, [
+            BatchMutation(id=str(second), changes={"order": 0}),
+            BatchMutation(id=str(first), changes={"order": 1}),
+        ])
+
+    priorities.bulk_write.assert_awaited_once()
+    operations = priorities.bulk_write.call_args[0][0]
+    assert [op._filter["_id"] for op in operations] == [second, first]
+    assert [op._doc["$set"]["order"] for op in operations] == [0, 1]
+    assert [doc["_id"] for doc in result.documents] == [second, first]
+    assert [doc["_id"] for doc in result.previous] == [second, first]
+
+
+async def test_unstamped_goals_resolved_through_parents_once_per_level():
+    plan_id, area_id = ObjectId(), ObjectId()
+    goals_docs = [{"_id": ObjectId(), "focus_area_id": str(area_id)} for _ in range(3)]
+    goals = _collection([goals_docs, goals_docs])
+    focus_areas = _collection([[{"_id": area_id, "annual_plan_id": str(plan_id)}]])
+    annual_plans = _collection([[{"_id": plan_id, "user_id": USER_ID}]])
+
+    patch_batch, patch_scope = _db(goals=goals, focus_areas=focus_areas, annual_plans=annual_plans)
+    with patch_batch, patch_scope:
+        await batch_mutations.apply_batch(
+            "goals", USER_ID, [BatchMutation(id=str(g["_id"]), changes={"progress": 50}) for g in goals_docs],
+        )
+
+    assert focus_areas.find.call_count == 1
+    assert annual_plans.find.call_count == 1
+    goals.bulk_write.assert_awaited_once()
+
+
+async def test_foreign_document_or_bad_field_writes_nothing():
+    mine, theirs = ObjectId(), ObjectId()
+    tasks = _collection([[{"_id": mine, "user_id": USER_ID}, {"_id": theirs, "user_id": "someone-else"}]])
+
+    patch_batch, patch_scope = _db(tasks=tasks)
+    with patch_batch, patch_scope:
+        with pytest.raises(HTTPException) as forbidden:
+            await batch_mutations.apply_batch("tasks", USER_ID, [
+                BatchMutation(id=str(mine), changes={"is_completed": True}),
+                BatchMutation(id=str(theirs), changes={"is_completed": True}),
+            ])
+        with pytest.raises(HTTPException) as not_allowed:
+            await batch_mutations.apply_batch("tasks", USER_ID, [
+                BatchMutation(id=str(mine), changes={"user_id": "someone-else"}),
+            ])
+
+    assert forbidden.value.status_code == 403
+    assert not_allowed.value.status_code == 422
+    tasks.bulk_write.assert_not_called()
+
+
+async def test_milestone_check_off_and_goal_completion():
+    goal_id = ObjectId()
+    goal = {"_id": goal_id, "user_id": USER_ID, "milestones": [{"id": "m-1", "completed": False}]}
+    goals = _collection([[goal], [goal]])
+    priorities = _collection([])
+
+    patch_batch, patch_scope = _db(goals=goals, priorities=priorities)
+    with patch_batch, patch_scope:
+        await batch_mutations.apply_batch("goals", USER_ID, [
+            BatchMutation(id=str(goal_id), changes={"status": "completed"}, milestones={"m-1": {"completed": True}}),
+        ])
+
+    update = goals.bulk_write.call_args[0][0][0]
+    assert update._doc["$set"]["milestones.$[m0].completed"] is True
+    assert update._array_filters == [{"m0.id": "m-1"}]
+    linked = priorities.bulk_write.call_args[0][0][0]
+    assert linked._filter == {"linked_entity_id": {"$in": [str(goal_id)]}, "linked_entity_type": "goal"}
+    assert linked._doc["$set"]["is_completed"] is True
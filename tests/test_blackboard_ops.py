@@ -0,0 +1,345 @@
+"""
+Op-based blackboard saves — app/utils/blackboard_ops.py and
+PATCH /blackboards/{board_id}.
+
+The pipeline update is run through a small evaluator for the handful of
+aggregation operators it uses, so the tests check what Mongo would store.
+
+Covers:
+  1. Compaction: moves collapse, updates merge, edits after a delete drop,
+     adds absorb later edits, deleting a node drops edges added to it
+  2. The pipeline applies add / move / update / delete (with edge cascade),
+     bumps the version and drops a legacy op_log array from the board
+  3. PATCH with the current If-Match applies in one write and logs it in the
+     op log collection
+  4. A stale patch touching other objects is rebased; one touching the same
+     node gets 409; missing If-Match gets 428
+  5. A whole-board PUT is not logged, so older patches cannot rebase across it
+     and catch-up reports the gap; the log is trimmed to OP_LOG_LIMIT
+"""
+import copy
+import sys
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+for mod in ["app.models.agent_models", "langfuse", "langfuse.langchain"]:
+    if mod not in sys.modules:
+        sys.modules[mod] = MagicMock()
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.models.Blackboard import BlackboardPatchRequest, BlackboardUpdate
+from app.utils import blackboard_ops
+
+USER_ID = "507f1f77bcf86cd799439011"
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+# --------------------------------------------------------------------------- #
+# Minimal aggregation-expression evaluator
+# --------------------------------------------------------------------------- #
+def _path(doc, variables, ref):
+    if ref.startswith("$$"):
+        name, *rest = ref[2:].split(".")
+        value = variables[name]
+    else:
+        rest = ref[1:].split(".")
+        value = doc
+    for part in rest:
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def evaluate(expr, doc, variables=None):
+    variables = variables or {}
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _path(doc, variables, expr)
+    if isinstance(expr, list):
+        return [evaluate(e, doc, variables) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) == 1 and next(iter(expr)).startswith("$"):
+        (op, arg), = expr.items()
+        ev = lambda e, extra=None: evaluate(e, doc, {**variables, **(extra or {})})
+        if op == "$literal":
+            return copy.deepcopy(arg)
+        if op == "$ifNull":
+            value = ev(arg[0])
+            return ev(arg[1]) if value is None else value
+        if op == "$filter":
+            return [x for x in ev(arg["input"]) if ev(arg["cond"], {arg["as"]: x})]
+        if op == "$map":
+            return [ev(arg["in"], {arg["as"]: x}) for x in ev(arg["input"])]
+        if op == "$switch":
+            for branch in arg["branches"]:
+                if ev(branch["case"]):
+                    return ev(branch["then"])
+            return ev(arg["default"])
+        if op == "$not":
+            return not ev(arg[0])
+        if op == "$and":
+            return all(ev(a) for a in arg)
+        if op == "$in":
+            return ev(arg[0]) in ev(arg[1])
+        if op == "$eq":
+            return ev(arg[0]) == ev(arg[1])
+        if op == "$add":
+            return sum(ev(a) for a in arg)
+        if op == "$mergeObjects":
+            merged = {}
+            for part in arg:
+                merged.update(ev(part) or {})
+            return merged
+        if op == "$concatArrays":
+            return [x for part in arg for x in ev(part)]
+        if op == "$slice":
+            values, n = ev(arg[0]), arg[1]
+            return values[n:] if n < 0 else values[:n]
+        raise NotImplementedError(op)
+    return {k: evaluate(v, doc, variables) for k, v in expr.items()}
+
+
+def run_pipeline(doc, pipeline):
+    doc = copy.deepcopy(doc)
+    for stage in pipeline:
+        if "$unset" in stage:
+            doc.pop(stage["$unset"], None)
+            continue
+        doc.update({k: evaluate(v, doc) for k, v in stage["$set"].items()})
+    return doc
+
+
+def matches(doc, query):
+    for key, expected in query.items():
+        if key == "$and":
+            if not all(matches(doc, q) for q in expected):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, q) for q in expected):
+                return False
+        else:
+            actual = doc.get(key)
+            if isinstance(expected, dict) and "$in" in expected:
+                if actual not in expected["$in"]:
+                    return False
+            elif isinstance(actual, list) and not isinstance(expected, list):
+                if expected not in actual:
+                    return False
+            elif actual != expected:
+                return False
+    return True
+
+
+class FakeBoards:
+    def __init__(self, doc):
+        self.doc = doc
+        self.writes = 0
+
+    async def find_one(self, query, projection=None):
+        return copy.deepcopy(self.doc) if matches(self.doc, query) else None
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=False):
+        if not matches(self.doc, query):
+            return None
+        self.writes += 1
+        self.doc = run_pipeline(self.doc, update)
+        return copy.deepcopy(self.doc)
+
+
+class FakeOpLog:
+    def __init__(self):
+        self.entries = []
+
+    async def insert_one(self, entry):
+        self.entries.append(copy.deepcopy(entry))
+
+    async def delete_many(self, query):
+        self.entries = [
+            e for e in self.entries
+            if not (e["board_id"] == query["board_id"] and e["v"] <= query["v"]["$lte"])
+        ]
+
+    def find(self, query, projection=None):
+        low, high = query["v"]["$gt"], query["v"]["$lte"]
+        found = sorted(
+            ({k: v for k, v in e.items() if k not in ("board_id", "created_at")} for e in self.entries
+             if e["board_id"] == query["board_id"] and low < e["v"] <= high),
+            key=lambda e: e["v"],
+        )
+        cursor = MagicMock()
+        cursor.sort.return_value.to_list = AsyncMock(return_value=found)
+        return cursor
+
+
+def node(node_id, x=0, y=0, **data):
+    return {"id": node_id, "type": "stickyNote", "position": {"x": x, "y": y}, "data": data}
+
+
+@pytest.fixture
+def board():
+    return {
+        "_id": ObjectId(),
+        "owner_user_id": USER_ID,
+        "user_id": USER_ID,
+        "collaborators": [],
+        "name": "Board",
+        "nodes": [node("a", text="A"), node("b", text="B"), node("c", text="C")],
+        "edges": [{"id": "ab", "source": "a", "target": "b"}, {"id": "bc", "source": "b", "target": "c"}],
+        "viewport": {"x": 0, "y": 0, "zoom": 1},
+    }
+
+
+@pytest.fixture
+def op_log():
+    log = FakeOpLog()
+    with patch.object(blackboard_ops, "blackboard_op_log_collection", log):
+        yield log
+
+
+@pytest.fixture
+def boards(board, op_log):
+    from app.routers import blackboards
+
+    from app.services.blackboard_sync import BoardSyncHub, LocalPubSub
+
+    fake = FakeBoards(board)
+    with patch.object(blackboards, "db", MagicMock(blackboards=fake)), \
+         patch.object(blackboards, "sync_hub", BoardSyncHub(LocalPubSub())):
+        yield fake
+
+
+async def _patch(board_id, ops, if_match):
+    from app.routers.blackboards import patch_blackboard
+
+    response = MagicMock(headers={})
+    result = await patch_blackboard(
+        board_id=board_id,
+        body=BlackboardPatchRequest(ops=ops),
+        response=response,
+        if_match=if_match,
+        current_user={"user_id": USER_ID},
+    )
+    return result, response
+
+
+# --------------------------------------------------------------------------- #
+# Compaction and pipeline
+# --------------------------------------------------------------------------- #
+def test_compaction_folds_batch():
+    ops = blackboard_ops.compact_ops([
+        {"op": "move_node", "id": "a", "value": {"x": 1, "y": 1}},
+        {"op": "move_node", "id": "a", "value": {"x": 5, "y": 6}},
+        {"op": "update_node", "id": "a", "value": {"data": {"text": "A1"}}},
+        {"op": "update_node", "id": "a", "value": {"data": {"color": "red"}}},
+        {"op": "update_node", "id": "b", "value": {"data": {"text": "gone"}}},
+        {"op": "delete_node", "id": "b"},
+        {"op": "move_node", "id": "b", "value": {"x": 9, "y": 9}},
+        {"op": "add_node", "id": "d", "value": node("d")},
+        {"op": "move_node", "id": "d", "value": {"x": 3, "y": 3}},
+        {"op": "add_edge", "id": "cx", "value": {"source": "c", "target": "x"}},
+        {"op": "delete_node", "id": "x"},
+    ])
+
+    assert ops == [
+        {"op": "patch", "kind": "node", "id": "a",
+         "value": {"position": {"x": 5, "y": 6}, "data": {"text": "A1", "color": "red"}}},
+        {"op": "delete", "kind": "node", "id": "b", "cascade": True},
+        {"op": "add", "kind": "node", "id": "d", "value": {**node("d"), "position": {"x": 3, "y": 3}}},
+        {"op": "delete", "kind": "node", "id": "x", "cascade": True},
+    ]
+
+
+def test_pipeline_applies_ops(board):
+    ops = blackboard_ops.compact_ops([
+        {"op": "move_node", "id": "a", "value": {"x": 10, "y": 20}},
+        {"op": "update_node", "id": "c", "value": {"data": {"color": "blue"}}},
+        {"op": "delete_node", "id": "b"},
+        {"op": "add_node", "id": "d", "value": node("d", text="$not_a_field")},
+        {"op": "add_edge", "id": "ad", "value": {"source": "a", "target": "d"}},
+    ])
+
+    legacy = {**board, "op_log": [{"v": 0, "ids": [], "ops": []}]}
+    result = run_pipeline(legacy, blackboard_ops.patch_pipeline(ops, NOW))
+
+    by_id = {n["id"]: n for n in result["nodes"]}
+    assert list(by_id) == ["a", "c", "d"]
+    assert by_id["a"]["position"] == {"x": 10, "y": 20} and by_id["a"]["data"] == {"text": "A"}
+    assert by_id["c"]["data"] == {"text": "C", "color": "blue"}
+    assert by_id["d"]["data"] == {"text": "$not_a_field"}
+    assert [e["id"] for e in result["edges"]] == ["ad"]
+    assert result["version"] == 1
+    assert "op_log" not in result
+
+
+# --------------------------------------------------------------------------- #
+# PATCH endpoint
+# --------------------------------------------------------------------------- #
+async def test_patch_with_current_version(boards, board, op_log):
+    result, response = await _patch(
+        str(board["_id"]), [{"op": "move_node", "id": "a", "value": {"x": 1, "y": 2}}], '"0"'
+    )
+
+    assert (result.version, result.applied, result.rebased) == (1, 1, False)
+    assert response.headers["ETag"] == '"1"'
+    assert boards.writes == 1
+    assert boards.doc["nodes"][0]["position"] == {"x": 1, "y": 2}
+    (entry,) = op_log.entries
+    assert (entry["board_id"], entry["v"], entry["user_id"]) == (str(board["_id"]), 1, USER_ID)
+    assert entry["ids"] == ["node:a"]
+
+
+async def test_stale_patch_rebases_or_conflicts(boards, board):
+    board_id = str(board["_id"])
+    await _patch(board_id, [{"op": "move_node", "id": "a", "value": {"x": 1, "y": 1}}], '"0"')
+
+    # A collaborator still on version 0 edits a different node: merged.
+    result, _ = await _patch(board_id, [{"op": "update_node", "id": "c", "value": {"data": {"text": "C!"}}}], 'W/"0"')
+    assert (result.version, result.rebased) == (2, True)
+    assert boards.doc["nodes"][0]["position"] == {"x": 1, "y": 1}
+
+    # ...or the same node: rejected without writing.
+    with pytest.raises(HTTPException) as exc:
+        await _patch(board_id, [{"op": "move_node", "id": "a", "value": {"x": 9, "y": 9}}], '"0"')
+    assert exc.value.status_code == 409
+    assert boards.writes == 2
+
+    with pytest.raises(HTTPException) as exc:
+        await _patch(board_id, [{"op": "delete_node", "id": "a"}], None)
+    assert exc.value.status_code == 428
+
+
+async def test_put_blocks_rebase_across_it(boards, board, op_log):
+    from app.routers.blackboards import get_blackboard_ops, save_blackboard
+
+    board_id = str(board["_id"])
+    await _patch(board_id, [{"op": "move_node", "id": "a", "value": {"x": 1, "y": 1}}], '"0"')
+    saved = await save_blackboard(
+        board_id=board_id,
+        update=BlackboardUpdate(nodes=[node("z")]),
+        if_match=None,
+        current_user={"user_id": USER_ID},
+    )
+    assert saved["version"] == 2 and "op_log" not in saved
+    assert [e["v"] for e in op_log.entries] == [1]
+
+    with pytest.raises(HTTPException) as exc:
+        await _patch(board_id, [{"op": "update_node", "id": "q", "value": {"data": {}}}], '"1"')
+    assert exc.value.status_code == 409
+
+    catch_up = await get_blackboard_ops(board_id=board_id, since=0, current_user={"user_id": USER_ID})
+    assert (catch_up.version, catch_up.complete, catch_up.entries) == (2, False, [])
+
+
+async def test_op_log_is_trimmed_per_board(op_log):
+    board_id = str(ObjectId())
+    limit = blackboard_ops.OP_LOG_LIMIT
+    other = str(ObjectId())
+    await blackboard_ops.record(other, 1, USER_ID, [], NOW)
+    for version in range(1, limit + 3):
+        await blackboard_ops.record(board_id, version, USER_ID, [], NOW)
+
+    kept = [e["v"] for e in op_log.entries if e["board_id"] == board_id]
+    assert kept == list(range(3, limit + 3))
+    assert any(e["board_id"] == other for e in op_log.entries)
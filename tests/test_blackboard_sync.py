@@ -0,0 +1,302 @@
+"""
+Realtime blackboard sync — app/services/blackboard_sync.py and
+WS /blackboards/{board_id}/ws.
+
+Covers:
+  1. apply_ops (room state) matches what the Mongo pipeline stores
+  2. Ops from one socket reach the other sockets in the room; nothing is
+     written until the room is snapshotted, then as ONE compacted patch
+  3. Two workers (hubs) sharing a pub/sub: ops fan out across them
+  4. A REST whole-board save makes open rooms reload and re-send a snapshot
+  5. The change stream reopens from its resume token after a transient
+     failure; only a deployment without change streams falls back to local
+  6. The WebSocket endpoint: a handshake from a foreign origin is refused;
+     unauthenticated sockets are closed with 4401; an authenticated
+     collaborator gets a snapshot and an ack for its ops
+"""
+import asyncio
+import copy
+import sys
+from unittest.mock import AsyncMock, MagicMock, patch
+
+for mod in ["app.models.agent_models", "langfuse", "langfuse.langchain"]:
+    if mod not in sys.modules:
+        sys.modules[mod] = MagicMock()
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pymongo.errors import AutoReconnect, OperationFailure
+from starlette.websockets import WebSocketDisconnect
+
+from app.services import blackboard_sync
+from app.services.blackboard_sync import BoardSyncHub, LocalPubSub
+from app.utils import blackboard_ops
+from tests.test_blackboard_ops import FakeBoards, FakeOpLog, node, run_pipeline
+
+USER_ID = "507f1f77bcf86cd799439011"
+OTHER_ID = "507f1f77bcf86cd799439099"
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+    def of_type(self, kind):
+        return [m for m in self.sent if m["type"] == kind]
+
+
+class SharedPubSub:
+    """Stands in for the change stream: every hub sees every event."""
+
+    def __init__(self):
+        self.handlers = []
+
+    def attach(self):
+        bus = self
+
+        class _Link(LocalPubSub):
+            async def start(self, handler):
+                bus.handlers.append(handler)
+
+            async def publish(self, event):
+                for handler in bus.handlers:
+                    await handler(event)
+
+        return _Link()
+
+
+class FlushRecorder(FakeBoards):
+    def __init__(self, doc):
+        super().__init__(doc)
+        self.updates = []
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=False):
+        self.updates.append(update)
+        return await super().find_one_and_update(query, update, projection, return_document)
+
+
+@pytest.fixture
+def board():
+    return {
+        "_id": ObjectId(),
+        "owner_user_id": USER_ID,
+        "user_id": USER_ID,
+        "collaborators": [OTHER_ID],
+        "name": "Board",
+        "nodes": [node("a", text="A"), node("b", text="B")],
+        "edges": [{"id": "ab", "source": "a", "target": "b"}],
+    }
+
+
+@pytest.fixture
+def store(board):
+    fake = FlushRecorder(copy.deepcopy(board))
+    fake.op_log = FakeOpLog()
+    with patch.object(blackboard_sync, "blackboards_collection", fake), \
+         patch.object(blackboard_ops, "blackboard_op_log_collection", fake.op_log), \
+         patch.object(blackboard_sync, "SNAPSHOT_SECONDS", 3600):
+        yield fake
+
+
+def test_apply_ops_matches_pipeline(board):
+    ops = blackboard_ops.compact_ops([
+        {"op": "move_node", "id": "a", "value": {"x": 4, "y": 2}},
+        {"op": "update_node", "id": "a", "value": {"data": {"color": "red"}, "type": "shape"}},
+        {"op": "add_node", "id": "c", "value": node("c")},
+        {"op": "add_edge", "id": "ac", "value": {"source": "a", "target": "c"}},
+        {"op": "delete_node", "id": "b"},
+    ])
+
+    nodes, edges = blackboard_ops.apply_ops(board["nodes"], board["edges"], ops)
+    stored = run_pipeline(board, blackboard_ops.patch_pipeline(ops, None))
+
+    assert (nodes, edges) == (stored["nodes"], stored["edges"])
+
+
+async def test_room_broadcasts_and_snapshots_once(store, board):
+    hub = BoardSyncHub(LocalPubSub())
+    alice, bob = FakeSocket(), FakeSocket()
+    room = await hub.join(board, alice, USER_ID)
+    await hub.join(board, bob, OTHER_ID)
+    assert bob.of_type("snapshot")[0]["nodes"] == board["nodes"]
+
+    for x in range(5):
+        await hub.submit(room, [{"op": "move_node", "id": "a", "value": {"x": x, "y": 0}}], USER_ID, alice)
+
+    assert len(bob.of_type("ops")) == 5 and not alice.of_type("ops")
+    assert [m["seq"] for m in alice.of_type("ack")] == [1, 2, 3, 4, 5]
+    assert store.updates == []
+
+    await hub.leave(room, bob)
+    await hub.leave(room, alice)
+
+    assert len(store.updates) == 1
+    assert store.doc["nodes"][0]["position"] == {"x": 4, "y": 0}
+    (entry,) = store.op_log.entries
+    assert (entry["v"], entry["user_id"]) == (1, "realtime")
+    assert entry["ops"] == [
+        {"op": "patch", "kind": "node", "id": "a", "value": {"position": {"x": 4, "y": 0}}}
+    ]
+    assert hub.rooms == {}
+    await hub.stop()
+
+
+async def test_ops_fan_out_across_workers(store, board):
+    bus = SharedPubSub()
+    worker_one, worker_two = BoardSyncHub(bus.attach()), BoardSyncHub(bus.attach())
+    alice, bob = FakeSocket(), FakeSocket()
+    room_one = await worker_one.join(board, alice, USER_ID)
+    room_two = await worker_two.join(board, bob, OTHER_ID)
+
+    await worker_one.submit(room_one, [{"op": "delete_node", "id": "b"}], USER_ID, alice)
+
+    (message,) = bob.of_type("ops")
+    assert message["user_id"] == USER_ID
+    assert [n["id"] for n in room_two.nodes] == ["a"] and room_two.edges == []
+    # Only the worker that received the ops writes them back.
+    assert room_two.pending == [] and len(room_one.pending) == 1
+    await worker_one.stop()
+    await worker_two.stop()
+
+
+async def test_rest_replace_reloads_open_rooms(store, board):
+    hub = BoardSyncHub(LocalPubSub())
+    alice = FakeSocket()
+    await hub.join(board, alice, USER_ID)
+    store.doc["nodes"] = [node("z")]
+
+    await hub.publish({"board_id": str(board["_id"]), "kind": "reload"})
+
+    assert [n["id"] for n in alice.of_type("snapshot")[-1]["nodes"]] == ["z"]
+    await hub.stop()
+
+
+async def test_clear_empties_open_rooms_and_drops_pending_ops(store, board):
+    from app.routers import blackboards
+
+    hub = BoardSyncHub(LocalPubSub())
+    alice, bob = FakeSocket(), FakeSocket()
+    room = await hub.join(board, alice, USER_ID)
+    await hub.join(board, bob, OTHER_ID)
+    await hub.submit(room, [{"op": "move_node", "id": "a", "value": {"x": 9, "y": 9}}], USER_ID, alice)
+
+    async def update_one(query, update):
+        store.doc.update(update["$set"])
+
+    store.update_one = update_one
+    with patch.object(blackboards, "db", MagicMock(blackboards=store)), \
+         patch.object(blackboards, "sync_hub", hub):
+        await blackboards.clear_blackboard(board_id=str(board["_id"]), current_user={"user_id": USER_ID})
+
+    assert (room.nodes, room.edges, room.pending) == ([], [], [])
+    assert bob.of_type("snapshot")[-1]["nodes"] == [] and bob.of_type("snapshot")[-1]["edges"] == []
+    await hub.leave(room, alice)
+    assert store.updates == [] and store.doc["nodes"] == []
+    await hub.stop()
+
+
+class FlakyEvents:
+    """A change stream that fails once mid-stream, then resumes."""
+
+    def __init__(self, failures):
+        self.failures = list(failures)
+        self.resumed_from = []
+
+    def watch(self, pipeline, resume_after=None):
+        self.resumed_from.append(resume_after)
+        events = self
+
+        class _Stream:
+            async def __aenter__(self):
+                if events.failures:
+                    raise events.failures.pop(0)
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            def __aiter__(self):
+                return self._changes()
+
+            async def _changes(self):
+                if resume_after is None:
+                    yield {"_id": "token-1", "fullDocument": {"n": 1}}
+                    raise AutoReconnect("stepdown")
+                yield {"_id": "token-2", "fullDocument": {"n": 2}}
+                await asyncio.Event().wait()
+
+        return _Stream()
+
+
+async def test_change_stream_reopens_after_transient_failure():
+    events = FlakyEvents([AutoReconnect("network")])
+    received = []
+
+    async def handler(event):
+        received.append(event)
+
+    pubsub = blackboard_sync.MongoChangeStreamPubSub()
+    with patch.object(blackboard_sync, "blackboard_events_collection", events), \
+         patch.object(blackboard_sync, "WATCH_RETRY_SECONDS", 0):
+        await pubsub.start(handler)
+        for _ in range(20):
+            await asyncio.sleep(0)
+        await pubsub.stop()
+
+    assert received == [{"n": 1}, {"n": 2}]
+    assert events.resumed_from == [None, None, "token-1"]
+    assert pubsub._available
+
+
+async def test_standalone_server_falls_back_to_local_fan_out():
+    events = FlakyEvents([OperationFailure("replica sets only", code=40573)])
+    pubsub = blackboard_sync.MongoChangeStreamPubSub()
+    with patch.object(blackboard_sync, "blackboard_events_collection", events):
+        await pubsub.start(AsyncMock())
+        await pubsub._task
+
+    assert not pubsub._available and events.resumed_from == [None]
+
+
+def test_websocket_endpoint(store, board):
+    from app.routers import blackboards
+
+    app = FastAPI()
+    app.include_router(blackboards.router)
+    hub = BoardSyncHub(LocalPubSub())
+
+    async def fake_user(websocket, timeout=10.0):
+        frame = await websocket.receive_json()
+        return {"user_id": OTHER_ID} if frame.get("token") == "good" else None
+
+    with patch.object(blackboards, "db", MagicMock(blackboards=store)), \
+         patch.object(blackboards, "sync_hub", hub), \
+         patch.object(blackboards, "get_websocket_user", fake_user):
+        client = TestClient(app)
+        path = f"/blackboards/{board['_id']}/ws"
+
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect(path, headers={"Origin": "https://evil.example"}):
+                pass
+
+        with client.websocket_connect(path) as socket:
+            socket.send_json({"type": "auth", "token": "bad"})
+            with pytest.raises(WebSocketDisconnect) as exc:
+                socket.receive_json()
+            assert exc.value.code == 4401
+
+        with client.websocket_connect(path, headers={"Origin": "https://nowry.app"}) as socket:
+            socket.send_json({"type": "auth", "token": "good"})
+            assert socket.receive_json()["type"] == "snapshot"
+            assert socket.receive_json() == {"type": "presence", "users": [OTHER_ID]}
+            socket.send_json({"type": "ops", "ops": [{"op": "move_node", "id": "a"}]})
+            assert socket.receive_json() == {"type": "error", "detail": "invalid_ops"}
+            socket.send_json({"type": "ops", "ops": [{"op": "move_node", "id": "a", "value": {"x": 1, "y": 1}}]})
+            assert socket.receive_json() == {"type": "ack", "seq": 1}
+
+    assert store.doc["nodes"][0]["position"] == {"x": 1, "y": 1}
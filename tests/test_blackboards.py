@@ -72,7 +72,7 @@ def make_filtering_find(docs: list) -> MagicMock:
                 return False
         return True
 
-    return MagicMock(side_effect=lambda query: make_cursor(
+    return MagicMock(side_effect=lambda query, projection=None: make_cursor(
         [doc for doc in docs if _matches(doc, query)]
     ))
 
@@ -248,9 +248,11 @@ async def test_clear_board_by_object_id(mock_blackboards_collection, mock_fireba
     board = make_board(owner_user_id=mock_firebase_user["user_id"])
     assert "board_id" not in board  # Phase-7 shape: `_id` only
 
-    with patch("app.routers.blackboards.db") as mock_db:
+    with patch("app.routers.blackboards.db") as mock_db, \
+         patch("app.routers.blackboards.sync_hub") as mock_hub:
         mock_db.blackboards.find_one = AsyncMock(return_value=board)
         mock_db.blackboards.update_one = AsyncMock()
+        mock_hub.publish = AsyncMock()
 
         result = await clear_blackboard(
             board_id=str(board["_id"]),
@@ -264,6 +266,7 @@ async def test_clear_board_by_object_id(mock_blackboards_collection, mock_fireba
     assert "board_id" not in filter_arg
     assert update_arg["$set"]["nodes"] == []
     assert update_arg["$set"]["edges"] == []
+    mock_hub.publish.assert_awaited_once()
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,260 @@
+"""
+Block storage for book content — app/utils/book_content.py.
+
+Covers:
+  1. A whole-document save splits the book into blocks with a section index
+     and the compatibility view rebuilds the same full_content
+  2. Re-saving with one paragraph edited writes exactly that block under a
+     new id and deletes its old version after the commit
+  3. Block patches: update / insert / delete, section index follows headings
+  4. Version guard: stale base_version or a concurrent save gets 409 and
+     leaves no block behind; the index is committed only after the blocks
+     it references are written
+  5. Non-Lexical (legacy HTML) content stays a plain string
+"""
+import json
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import InsertOne
+
+from app.utils import book_content
+
+BOOK_ID = ObjectId("60b8d295f1d2c17f4e4b1234")
+USER_ID = "507f1f77bcf86cd799439011"
+NOW = datetime(2026, 1, 1)
+
+
+def paragraph(text):
+    return {"type": "paragraph", "children": [{"type": "text", "text": text}]}
+
+
+def heading(text):
+    return {"type": "heading", "tag": "h2", "children": [{"type": "text", "text": text}]}
+
+
+def lexical(*nodes):
+    return json.dumps({"root": {"type": "root", "direction": "ltr", "format": "", "indent": 0,
+                                "version": 1, "children": list(nodes)}})
+
+
+def _matches(document, query):
+    for field, condition in query.items():
+        value = document.get(field)
+        if isinstance(condition, dict) and "$in" in condition:
+            if value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self._iter = iter(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeBlocks:
+    def __init__(self):
+        self.documents = {}
+        self.bulk_calls = []
+        self.fail_writes = False
+
+    def find(self, query, *args, **kwargs):
+        return FakeCursor([dict(d) for d in self.documents.values() if _matches(d, query)])
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_calls.append(operations)
+        for op in operations:
+            assert isinstance(op, InsertOne)
+            self.documents[op._doc["_id"]] = dict(op._doc)
+        if self.fail_writes:
+            raise RuntimeError("write failed")
+
+    async def delete_many(self, query):
+        for key in [k for k, d in self.documents.items() if _matches(d, query)]:
+            del self.documents[key]
+
+
+class FakeBooks:
+    def __init__(self, book, blocks=None):
+        self.book = dict(book)
+        self.blocks = blocks
+
+    async def find_one(self, query, *args, **kwargs):
+        return dict(self.book) if query["_id"] == self.book["_id"] else None
+
+    async def update_one(self, query, update):
+        expected = query.get("content_version")
+        stored = self.book.get("content_version")
+        ok = stored in expected["$in"] if isinstance(expected, dict) else stored == expected
+        if not ok:
+            return MagicMock(matched_count=0)
+        for entry in update.get("$set", {}).get("block_index", []) if self.blocks else []:
+            # The index must only ever reference blocks that are already written.
+            assert ObjectId(entry["id"]) in self.blocks.documents
+        self.book.update(update.get("$set", {}))
+        for field in update.get("$unset", {}):
+            self.book.pop(field, None)
+        self.book["content_version"] = (stored or 0) + update["$inc"]["content_version"]
+        return MagicMock(matched_count=1)
+
+
+@pytest.fixture
+def store():
+    blocks = FakeBlocks()
+    books = FakeBooks({
+        "_id": BOOK_ID,
+        "user_id": USER_ID,
+        "full_content": lexical(paragraph("Intro"), heading("Chapter 1"), paragraph("One"), paragraph("Two")),
+    }, blocks)
+    with patch.object(book_content, "book_blocks_collection", blocks), \
+         patch.object(book_content, "books_collection", books):
+        yield books, blocks
+
+
+async def _reload(books):
+    book = await books.find_one({"_id": BOOK_ID})
+    book["_id"] = str(book["_id"])
+    return book
+
+
+async def test_first_save_splits_into_blocks(store):
+    books, blocks = store
+    book = await _reload(books)
+    content = book["full_content"]
+
+    await book_content.save_full_content(book, content, NOW)
+
+    stored = await _reload(books)
+    assert "full_content" not in stored
+    assert stored["content_format"] == "blocks"
+    assert len(blocks.documents) == 4
+    assert stored["sections"] == [
+        {"title": None, "start": 0, "count": 1},
+        {"title": "Chapter 1", "start": 1, "count": 3},
+    ]
+    rebuilt = await book_content.with_full_content(stored)
+    assert json.loads(rebuilt["full_content"]) == json.loads(content)
+    assert not any(field in rebuilt for field in book_content.BLOCK_FIELDS)
+
+
+async def test_resave_writes_only_changed_blocks(store):
+    books, blocks = store
+    book = await _reload(books)
+    await book_content.save_full_content(book, book["full_content"], NOW)
+    book = await _reload(books)
+    ids_before = [e["id"] for e in book["block_index"]]
+
+    edited = lexical(paragraph("Intro"), heading("Chapter 1"), paragraph("One, revised"), paragraph("Two"))
+    await book_content.save_full_content(book, edited, NOW)
+
+    (operations,) = blocks.bulk_calls[-1:]
+    assert len(operations) == 1
+    book = await _reload(books)
+    ids_after = [e["id"] for e in book["block_index"]]
+    assert ids_after[2] != ids_before[2]
+    assert ids_after[:2] + ids_after[3:] == ids_before[:2] + ids_before[3:]
+    assert ObjectId(ids_before[2]) not in blocks.documents
+    assert len(blocks.documents) == 4
+
+    inserted = lexical(paragraph("Intro"), heading("Chapter 1"), paragraph("One, revised"),
+                       paragraph("New"), paragraph("Two"))
+    await book_content.save_full_content(book, inserted, NOW)
+    operations = blocks.bulk_calls[-1]
+    assert len(operations) == 1 and isinstance(operations[0], InsertOne)
+    assert len(blocks.documents) == 5
+
+
+async def test_patch_blocks_and_section_range(store):
+    books, blocks = store
+    book = await book_content.ensure_blocks(await _reload(books), NOW)
+    intro_id, _, one_id, two_id = [e["id"] for e in book["block_index"]]
+
+    result = await book_content.patch_blocks(
+        book,
+        [
+            {"op": "update", "id": one_id, "node": paragraph("One!")},
+            # Later ops may still use the id the client loaded.
+            {"op": "insert", "after": one_id, "node": heading("Chapter 2")},
+            {"op": "delete", "id": intro_id},
+        ],
+        base_version=book["content_version"],
+        now=NOW,
+    )
+
+    assert result["content_version"] == book["content_version"] + 1
+    new_one_id = result["replaced_ids"][one_id]
+    assert ObjectId(one_id) not in blocks.documents
+    assert blocks.documents[ObjectId(new_one_id)]["node"] == paragraph("One!")
+    assert [s["title"] for s in result["sections"]] == ["Chapter 1", "Chapter 2"]
+    assert result["sections"][1] == {"title": "Chapter 2", "start": 2, "count": 2}
+
+    book = await _reload(books)
+    chapter_two = await book_content.load_blocks(book, 2, 4)
+    assert chapter_two[0]["node"]["type"] == "heading"
+    assert chapter_two[1]["id"] == two_id
+    assert ObjectId(intro_id) not in blocks.documents
+
+
+async def test_stale_version_conflicts_before_writing(store):
+    books, blocks = store
+    book = await book_content.ensure_blocks(await _reload(books), NOW)
+    writes = len(blocks.bulk_calls)
+
+    with pytest.raises(HTTPException) as exc:
+        await book_content.patch_blocks(
+            book, [{"op": "delete", "id": book["block_index"][0]["id"]}], base_version=0, now=NOW
+        )
+    assert exc.value.status_code == 409
+
+    assert len(blocks.bulk_calls) == writes
+
+    # A second save working from the same (now stale) copy of the book.
+    await book_content.save_full_content(book, lexical(paragraph("A")), NOW)
+    with pytest.raises(HTTPException) as exc:
+        await book_content.save_full_content(book, lexical(paragraph("B")), NOW)
+    assert exc.value.status_code == 409
+    # The losing save's block was written, never referenced, and removed.
+    stored = await _reload(books)
+    assert {ObjectId(e["id"]) for e in stored["block_index"]} == set(blocks.documents)
+
+
+async def test_failed_block_write_leaves_the_book_unchanged(store):
+    books, blocks = store
+    book = await book_content.ensure_blocks(await _reload(books), NOW)
+    before = dict(blocks.documents)
+
+    blocks.fail_writes = True
+    with pytest.raises(RuntimeError):
+        await book_content.save_full_content(book, lexical(paragraph("Rewritten")), NOW)
+
+    assert (await _reload(books))["content_version"] == book["content_version"]
+    assert blocks.documents == before
+
+
+async def test_legacy_html_stays_a_string(store):
+    books, blocks = store
+    book = await _reload(books)
+
+    await book_content.save_full_content(book, "<p>Old HTML book</p>", NOW)
+
+    stored = await _reload(books)
+    assert stored["full_content"] == "<p>Old HTML book</p>"
+    assert "content_format" not in stored
+    assert await book_content.load_full_content(stored) == "<p>Old HTML book</p>"
+    with pytest.raises(HTTPException) as exc:
+        await book_content.ensure_blocks(stored, NOW)
+    assert exc.value.status_code == 422
@@ -0,0 +1,253 @@
+"""
+Book images moved out of full_content — app/utils/book_images.py and
+app/migrations/externalize_book_images.py.
+
+Covers:
+  1. Distinct images are uploaded once and their data: URIs replaced by URLs
+  2. An image already stored for the user is reused, not re-uploaded
+  3. A failed upload leaves that image inline and the rest of the text intact
+  4. The HTML -> Lexical converter keeps <img> as image nodes
+  5. The migration is read-only by default, rewrites books on --apply, and
+     does not overwrite a book edited mid-run
+  6. Block-stored books are found through book_blocks and rewritten once
+     each through save_full_content
+"""
+import base64
+import json
+import re
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+
+from app.utils import book_images
+from app.utils.html_to_lexical import html_to_lexical_json
+
+USER_ID = "507f1f77bcf86cd799439011"
+LOGO = b"\x89PNG\r\n\x1a\n" + b"logo" * 50
+FIGURE = b"\xff\xd8\xff" + b"figure" * 50
+
+
+def data_uri(content: bytes, ext: str = "png") -> str:
+    return f"data:image/{ext};base64,{base64.b64encode(content).decode()}"
+
+
+def _matches(document: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        value = document.get(field)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$gt" in condition and not value > condition["$gt"]:
+                return False
+            if "$regex" in condition and not re.search(condition["$regex"], value or ""):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents[:length] if length else list(self.documents)
+
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, documents=()):
+        self.documents = [dict(d) for d in documents]
+
+    def find(self, query, *args, **kwargs):
+        return FakeCursor([dict(d) for d in self.documents if _matches(d, query)])
+
+    async def find_one(self, query, *args, **kwargs):
+        return next((dict(d) for d in self.documents if _matches(d, query)), None)
+
+    async def insert_one(self, document):
+        self.documents.append(dict(document))
+        return MagicMock(inserted_id=ObjectId())
+
+    async def update_one(self, query, update):
+        for document in self.documents:
+            if _matches(document, query):
+                document.update(update.get("$set", {}))
+                return MagicMock(modified_count=1)
+        return MagicMock(modified_count=0)
+
+
+class FakeStorage:
+    def __init__(self, fail=()):
+        self.uploads = []
+        self.fail = set(fail)
+
+    async def upload(self, file_content, filename, folder="", **options):
+        if file_content in self.fail:
+            raise RuntimeError("storage down")
+        self.uploads.append((folder, options["public_id"]))
+        return {"secure_url": f"https://cdn.test/{options['public_id']}", "public_id": options["public_id"]}
+
+
+class FakeBlocks(FakeCollection):
+    def find(self, query, *args, **kwargs):
+        # Stands in for BLOCK_FILTER: any image URI anywhere in the node.
+        assert "$or" in query
+        after = query.get("_id", {}).get("$gt")
+        return FakeCursor([
+            dict(d) for d in self.documents
+            if "data:image/" in json.dumps(d["node"]) and (after is None or d["_id"] > after)
+        ])
+
+
+@pytest.fixture
+def images_collection():
+    collection = FakeCollection()
+    with patch.object(book_images, "book_images_collection", collection):
+        yield collection
+
+
+async def test_each_distinct_image_uploaded_once(images_collection):
+    storage = FakeStorage()
+    text = f'<img src="{data_uri(LOGO)}"/><p>a</p><img src="{data_uri(LOGO)}"/><img src="{data_uri(FIGURE, "jpeg")}"/>'
+
+    new_text, stats = await book_images.externalize_inline_images(text, USER_ID, storage)
+
+    assert "data:image" not in new_text
+    assert len(storage.uploads) == 2
+    assert all(folder == f"nowry/{USER_ID}/books/images" for folder, _ in storage.uploads)
+    assert (stats.found, stats.uploaded, stats.reused, stats.failed) == (2, 2, 0, 0)
+    assert new_text.count("https://cdn.test/") == 3
+    assert len(images_collection.documents) == 2
+
+
+async def test_known_image_is_reused(images_collection):
+    storage = FakeStorage()
+    await book_images.externalize_inline_images(data_uri(LOGO), USER_ID, storage)
+
+    new_text, stats = await book_images.externalize_inline_images(
+        json.dumps({"src": data_uri(LOGO)}), USER_ID, storage
+    )
+
+    assert len(storage.uploads) == 1
+    assert stats.reused == 1 and stats.uploaded == 0
+    assert json.loads(new_text)["src"].startswith("https://cdn.test/")
+
+
+async def test_failed_upload_stays_inline(images_collection):
+    storage = FakeStorage(fail={FIGURE})
+    text = f"{data_uri(LOGO)} and {data_uri(FIGURE)}"
+
+    new_text, stats = await book_images.externalize_inline_images(text, USER_ID, storage)
+
+    assert data_uri(FIGURE) in new_text
+    assert data_uri(LOGO) not in new_text
+    assert stats.failed == 1 and stats.uploaded == 1
+
+
+def test_converter_keeps_images():
+    lexical = html_to_lexical_json(
+        '<div><p>Intro</p><img src="https://cdn.test/x" alt="Imported Image" /></div>'
+    )
+    image_nodes = [
+        child
+        for node in lexical["root"]["children"]
+        for child in node["children"]
+        if child["type"] == "image"
+    ]
+    assert image_nodes and image_nodes[0]["src"] == "https://cdn.test/x"
+    assert image_nodes[0]["altText"] == "Imported Image"
+
+
+async def test_migration_dry_run_then_apply(images_collection):
+    from app.migrations import externalize_book_images as migration
+
+    book_id = ObjectId()
+    content = json.dumps({"root": {"children": [{"type": "image", "src": data_uri(LOGO)}]}})
+    books = FakeCollection([
+        {"_id": book_id, "user_id": USER_ID, "updated_at": 1, "full_content": content},
+        {"_id": ObjectId(), "user_id": USER_ID, "updated_at": 1, "full_content": '{"root": {}}'},
+    ])
+    storage = FakeStorage()
+
+    with patch.object(migration, "books_collection", books), \
+         patch.object(migration, "book_blocks_collection", FakeBlocks()), \
+         patch.object(book_images, "get_storage_backend", return_value=storage):
+        dry = await migration.externalize_book_images()
+        assert dry.images_found == 1 and dry.documents_written == 0
+        assert books.documents[0]["full_content"] == content
+        assert storage.uploads == []
+
+        applied = await migration.externalize_book_images(apply_changes=True)
+        assert applied.documents_written == 1
+        assert "data:image" not in books.documents[0]["full_content"]
+
+        again = await migration.externalize_book_images(apply_changes=True)
+        assert again.scanned == 0
+
+
+async def test_migration_skips_book_edited_mid_run(images_collection):
+    from app.migrations import externalize_book_images as migration
+
+    books = FakeCollection([
+        {"_id": ObjectId(), "user_id": USER_ID, "updated_at": 1, "full_content": data_uri(LOGO)},
+    ])
+    storage = FakeStorage()
+    original_upload = storage.upload
+
+    async def upload_then_edit(*args, **kwargs):
+        books.documents[0]["updated_at"] = 2
+        return await original_upload(*args, **kwargs)
+
+    storage.upload = upload_then_edit
+
+    with patch.object(migration, "books_collection", books), \
+         patch.object(migration, "book_blocks_collection", FakeBlocks()), \
+         patch.object(book_images, "get_storage_backend", return_value=storage):
+        stats = await migration.externalize_book_images(apply_changes=True)
+
+    assert stats.documents_written == 0 and stats.documents_skipped == 1
+    assert books.documents[0]["full_content"] == data_uri(LOGO)
+
+
+async def test_migration_rewrites_block_stored_books_once(images_collection):
+    from app.migrations import externalize_book_images as migration
+
+    book_id = ObjectId()
+    paragraph = {"type": "paragraph", "children": [{"type": "image", "src": data_uri(LOGO)}]}
+    blocks = FakeBlocks([
+        {"_id": ObjectId(), "book_id": str(book_id), "node": paragraph},
+        {"_id": ObjectId(), "book_id": str(book_id), "node": {"type": "image", "src": data_uri(FIGURE)}},
+        {"_id": ObjectId(), "book_id": str(book_id), "node": {"type": "paragraph", "children": []}},
+    ])
+    books = FakeCollection([{"_id": book_id, "user_id": USER_ID, "content_format": "blocks"}])
+    content = json.dumps({"root": {"children": [doc["node"] for doc in blocks.documents]}})
+    save = AsyncMock(return_value=2)
+
+    with patch.object(migration, "books_collection", books), \
+         patch.object(migration, "book_blocks_collection", blocks), \
+         patch.object(migration, "load_full_content", AsyncMock(return_value=content)), \
+         patch.object(migration, "save_full_content", save), \
+         patch.object(book_images, "get_storage_backend", return_value=FakeStorage()):
+        dry = await migration.externalize_book_images()
+        assert (dry.blocks_scanned, dry.images_found) == (2, 2)
+        save.assert_not_awaited()
+
+        applied = await migration.externalize_book_images(apply_changes=True)
+
+    assert applied.documents_written == 1 and applied.images_uploaded == 2
+    save.assert_awaited_once()
+    assert "data:image" not in save.call_args.args[1]
@@ -0,0 +1,109 @@
+"""
+Full-book lexical retrieval — app/utils/book_search.py and
+agent_tools.read_book_section.
+
+Covers:
+  1. BM25 ranks the passage about the queried topic first, wherever it is
+  2. The LRU evicts the least recently used book and drops stale versions
+  3. read_book_section answers from a chapter far past the old 8,000-char
+     window; short books are still returned whole
+  4. Vector hits are fused with the BM25 ranking (RRF)
+  5. A cache miss builds the index in a worker thread, not on the event loop
+"""
+import json
+import threading
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from bson import ObjectId
+
+from app.utils import agent_tools, book_rag, book_search, book_text
+
+USER_ID = "507f1f77bcf86cd799439011"
+FILLER = "Spaced repetition schedules each review just before the memory would fade. "
+
+
+def _book(*paragraphs, book_id=None):
+    nodes = [{"type": "paragraph", "children": [{"type": "text", "text": p}]} for p in paragraphs]
+    return {
+        "_id": book_id or ObjectId(),
+        "user_id": USER_ID,
+        "title": "Notes",
+        "full_content": json.dumps({"root": {"type": "root", "children": nodes}}),
+        "content_version": 1,
+    }
+
+
+def _long_book():
+    chapters = [FILLER * 12 for _ in range(30)]
+    chapters[25] = "Mitochondria produce ATP through oxidative phosphorylation in the inner membrane."
+    return _book(*chapters)
+
+
+def test_bm25_ranks_relevant_passage_first():
+    index = book_search.BookIndex.from_derivative(
+        book_text.extract_text(_long_book()["full_content"]), content_version=1
+    )
+
+    (best, *_) = index.search("how do mitochondria make ATP?")
+
+    assert best["text"].startswith("Mitochondria produce ATP")
+    assert best["start"] > 8000
+    assert index.search("quantum chromodynamics") == []
+
+
+def test_lru_eviction_and_version_check():
+    cache = book_search.IndexCache(max_books=2)
+    for book_id in ("a", "b"):
+        cache.put(book_id, book_search.BookIndex([], content_version=1))
+    assert cache.get("a", 1) is not None  # "b" is now least recently used
+    cache.put("c", book_search.BookIndex([], content_version=1))
+
+    assert cache.get("b", 1) is None and len(cache) == 2
+    assert cache.get("a", 2) is None  # a newer save makes the entry stale
+
+
+async def test_read_book_section_searches_whole_book():
+    long_book, short_book = _long_book(), _book("Short note about ATP.")
+    books = MagicMock()
+    books.find_one = AsyncMock(side_effect=[long_book, short_book])
+
+    with patch.object(agent_tools, "books_collection", books), \
+         patch.object(book_search, "cache", book_search.IndexCache()), \
+         patch.object(book_rag, "retrieve_book_chunks", AsyncMock(return_value=[])):
+        result = await agent_tools.read_book_section(USER_ID, str(long_book["_id"]), "mitochondria ATP")
+        short = await agent_tools.read_book_section(USER_ID, str(short_book["_id"]), "mitochondria")
+
+    assert result["content"].startswith("Mitochondria produce ATP")
+    assert len(result["content"]) <= 4000
+    assert short["content"] == "Short note about ATP."
+
+
+async def test_hybrid_fuses_vector_hits():
+    book = _book("Alpha beta gamma.", FILLER * 12, "Delta epsilon.", FILLER * 12)
+    vector_hits = [{"text": "Delta epsilon.", "chunk_index": 2}, {"text": "Unindexed chunk.", "chunk_index": 9}]
+
+    with patch.object(book_search, "cache", book_search.IndexCache()), \
+         patch.object(book_rag, "retrieve_book_chunks", AsyncMock(return_value=vector_hits)):
+        lexical_only = [hit["text"] for hit in (await book_search.get_index(book)).search("alpha beta delta")]
+        fused = await book_search.hybrid_search(book, USER_ID, "alpha beta delta", top_k=3)
+
+    assert lexical_only[0] == "Alpha beta gamma."
+    assert fused[0] == "Delta epsilon." and "Unindexed chunk." in fused
+
+
+async def test_cache_miss_builds_index_off_the_event_loop():
+    book = _book("Alpha beta gamma.")
+    build = book_search.BookIndex.from_derivative
+    threads = []
+
+    def recording_build(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return build(*args, **kwargs)
+
+    with patch.object(book_search, "cache", book_search.IndexCache()), \
+         patch.object(book_search.BookIndex, "from_derivative", side_effect=recording_build):
+        index = await book_search.get_index(book)
+        again = await book_search.get_index(book)
+
+    assert again is index and len(threads) == 1
+    assert threads[0] != threading.get_ident()
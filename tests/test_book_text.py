@@ -0,0 +1,153 @@
+"""
+Plain-text derivative of book content — app/utils/book_text.py.
+
+Covers:
+  1. One extractor: nested nodes, line breaks, heading outline, and block
+     offsets that slice the text exactly; legacy HTML is stripped
+  2. After a save, refresh_book_text stores the derivative (with block ids)
+     and marks the book; load_book_text then serves the stored copy
+  3. A stale marker never reads book_texts — the text is extracted on the spot
+  4. Unchanged text reports changed=False (RAG re-embed skipped); a refresh
+     for an older content_version never overwrites a newer derivative
+  5. max_chars stops loading block batches early
+"""
+import copy
+from unittest.mock import MagicMock, patch
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.utils import book_content, book_text
+from tests.test_book_blocks import (
+    BOOK_ID,
+    NOW,
+    FakeBlocks,
+    FakeBooks,
+    _reload,
+    heading,
+    lexical,
+    paragraph,
+)
+
+
+class MarkingBooks(FakeBooks):
+    """FakeBooks that also accepts the $set-only marker update."""
+
+    async def update_one(self, query, update):
+        if "$inc" in update:
+            return await super().update_one(query, update)
+        expected = query.get("content_version")
+        stored = self.book.get("content_version")
+        if (stored in expected["$in"]) if isinstance(expected, dict) else stored == expected:
+            self.book.update(update["$set"])
+        return MagicMock()
+
+
+class FakeTexts:
+    def __init__(self):
+        self.documents = {}
+        self.reads = 0
+
+    async def find_one(self, query, *args, **kwargs):
+        self.reads += 1
+        doc = self.documents.get(query["_id"])
+        return copy.deepcopy(doc) if doc else None
+
+    async def find_one_and_replace(self, query, document, projection=None, upsert=False):
+        previous = self.documents.get(query["_id"])
+        if previous and previous["content_version"] > query["content_version"]["$lte"]:
+            raise DuplicateKeyError("E11000 duplicate key")
+        self.documents[query["_id"]] = {"_id": query["_id"], **document}
+        return previous
+
+
+@pytest.fixture
+def store():
+    blocks, texts = FakeBlocks(), FakeTexts()
+    books = MarkingBooks({
+        "_id": BOOK_ID,
+        "user_id": "u1",
+        "full_content": lexical(heading("Chapter 1"), paragraph("One"), paragraph("Two")),
+    })
+    with patch.object(book_content, "book_blocks_collection", blocks), \
+         patch.object(book_content, "books_collection", books), \
+         patch.object(book_text, "books_collection", books), \
+         patch.object(book_text, "book_texts_collection", texts):
+        yield books, blocks, texts
+
+
+def test_extract_text_blocks_and_outline():
+    nested = {"type": "list", "children": [
+        {"type": "listitem", "children": [{"type": "text", "text": "a"}]},
+        {"type": "listitem", "children": [{"type": "text", "text": "b"}, {"type": "linebreak"},
+                                          {"type": "text", "text": "c"}]},
+    ]}
+    derivative = book_text.extract_text(lexical(heading("Title"), paragraph("Body"), nested))
+
+    assert derivative["text"] == "Title\n\nBody\n\na\nb\nc"
+    assert [derivative["text"][b["start"]:b["end"]] for b in derivative["blocks"]] == ["Title", "Body", "a\nb\nc"]
+    assert derivative["outline"] == [{"title": "Title", "level": 2, "block": 0, "offset": 0}]
+    assert book_text.block_at(derivative, derivative["text"].index("Body")) == 1
+
+    assert book_text.plain_text("<p>Hello <b>world</b></p>") == "Hello  world"
+
+
+async def test_refresh_stores_and_load_serves_it(store):
+    books, _, texts = store
+    await book_content.ensure_blocks(await _reload(books), NOW)
+
+    refreshed = await book_text.refresh_book_text(str(BOOK_ID))
+
+    stored = texts.documents[BOOK_ID]
+    assert refreshed["changed"] is True
+    assert stored["text"] == "Chapter 1\n\nOne\n\nTwo"
+    assert [b["id"] for b in stored["blocks"]] == [e["id"] for e in books.book["block_index"]]
+    assert books.book["text_version"] == f"{book_text.TEXT_VERSION}:1"
+
+    loaded = await book_text.load_book_text(await _reload(books))
+    assert texts.reads == 1 and loaded["extractor_version"] == book_text.TEXT_VERSION
+    assert (await book_text.load_book_text(await _reload(books), max_chars=5))["text"] == "Chapt"
+
+
+async def test_stale_marker_extracts_without_reading_store(store):
+    books, _, texts = store
+    book = await _reload(books)
+    book["text_version"] = f"{book_text.TEXT_VERSION - 1}:0"
+
+    derivative = await book_text.load_book_text(book)
+
+    assert derivative["text"] == "Chapter 1\n\nOne\n\nTwo"
+    assert texts.reads == 0 and texts.documents == {}
+
+
+async def test_unchanged_text_and_stale_refresh(store):
+    books, _, texts = store
+    await book_content.ensure_blocks(await _reload(books), NOW)
+    await book_text.refresh_book_text(str(BOOK_ID))
+
+    # A save that changes only formatting leaves the text as it was.
+    book = await _reload(books)
+    bold = lexical(heading("Chapter 1"), {"type": "paragraph", "children": [
+        {"type": "text", "text": "One", "format": 1}]}, paragraph("Two"))
+    await book_content.save_full_content(book, bold, NOW)
+    assert (await book_text.refresh_book_text(str(BOOK_ID)))["changed"] is False
+    assert texts.documents[BOOK_ID]["content_version"] == 2
+
+    # A late refresh still reading version 1 must not overwrite version 2.
+    texts.documents[BOOK_ID]["content_version"] = 3
+    await book_text.refresh_book_text(str(BOOK_ID))
+    assert texts.documents[BOOK_ID]["content_version"] == 3
+    assert books.book["text_version"] == f"{book_text.TEXT_VERSION}:2"
+
+
+async def test_max_chars_stops_loading_batches(store):
+    books, blocks, _ = store
+    content = lexical(*[paragraph(f"Paragraph {i}") for i in range(500)])
+    await book_content.save_full_content(await _reload(books), content, NOW)
+    book = await _reload(books)
+
+    with patch.object(book_content, "load_blocks", wraps=book_content.load_blocks) as loads:
+        derivative = await book_text.compute_book_text(book, max_chars=100)
+
+    assert loads.call_count == 1
+    assert derivative["truncated"] and derivative["chars"] == 100
@@ -125,7 +125,7 @@ class FakeDecksCollection:
     def _selected(self) -> list:
         return [doc for doc in self.docs if matches(doc, self.last_filter)]
 
-    def find(self, query: dict):
+    def find(self, query: dict, projection=None):
         self.last_filter = query
         cursor = MagicMock()
         cursor.sort = MagicMock(return_value=cursor)
@@ -255,8 +255,8 @@ async def test_browse_stays_bounded_under_search():
     cursors = []
     original_find = collection.find
 
-    def recording_find(query):
-        cursor = original_find(query)
+    def recording_find(query, projection=None):
+        cursor = original_find(query, projection)
         cursors.append(cursor)
         return cursor
 
@@ -0,0 +1,148 @@
+"""
+Soft-delete cascade engine — app/services/cascade.py.
+
+Covers:
+  1. A plan deletion reaches every level in batches, with no cap on fan-out
+  2. Restore brings back exactly what that deletion took
+  3. A run that fails half way is finished by re-running it
+  4. Deck cards are matched by ObjectId or string deck_id and unpublished
+"""
+from unittest.mock import patch
+
+import pytest
+from bson import ObjectId
+
+from app.services import cascade
+
+USER_ID = "507f1f77bcf86cd799439011"
+
+
+def _matches(doc, selector):
+    for field, condition in selector.items():
+        value = doc.get(field)
+        if isinstance(condition, dict) and "$in" in condition:
+            if value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def limit(self, n):
+        return _Cursor(self._docs[:n])
+
+    async def to_list(self, length):
+        return self._docs[:length]
+
+
+class _Result:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = [dict(d) for d in docs]
+        self.fail_updates = 0
+
+    def find(self, selector, projection=None):
+        return _Cursor([{"_id": d["_id"]} for d in self.docs if _matches(d, selector)])
+
+    async def update_many(self, selector, update):
+        if self.fail_updates:
+            self.fail_updates -= 1
+            raise RuntimeError("connection reset")
+        modified = 0
+        for doc in self.docs:
+            if _matches(doc, selector):
+                doc.update(update.get("$set", {}))
+                for field in update.get("$unset", {}):
+                    doc.pop(field, None)
+                modified += 1
+        return _Result(modified)
+
+
+@pytest.fixture
+def plan_db():
+    plan_id = ObjectId()
+    area_id = ObjectId()
+    goals = [{"_id": ObjectId(), "focus_area_id": str(area_id), "deleted_at": None} for _ in range(5)]
+    goals[0]["deleted_at"] = "earlier"  # deleted on its own before the plan
+    db = {
+        "annual_plans": FakeCollection([{"_id": plan_id, "user_id": USER_ID, "deleted_at": None}]),
+        "focus_areas": FakeCollection([{"_id": area_id, "annual_plan_id": str(plan_id), "deleted_at": None}]),
+        "priorities": FakeCollection([
+            {"_id": ObjectId(), "annual_plan_id": str(plan_id), "deleted_at": None},
+            {"_id": ObjectId(), "annual_plan_id": str(plan_id), "focus_area_id": str(area_id), "deleted_at": None},
+        ]),
+        "goals": FakeCollection(goals),
+        "activities": FakeCollection(
+            [{"_id": ObjectId(), "goal_id": str(g["_id"]), "deleted_at": None} for g in goals[1:] for _ in range(3)]
+        ),
+    }
+    with patch.object(cascade, "db", db), patch.object(cascade, "BATCH_SIZE", 2):
+        yield db, plan_id
+
+
+async def test_plan_delete_reaches_every_level(plan_db):
+    db, plan_id = plan_db
+    via = cascade.root_key("annual_plans", plan_id)
+
+    counts = await cascade.soft_delete("annual_plans", {"_id": plan_id}, via=via, user_id=USER_ID)
+
+    assert counts == {"annual_plans": 1, "focus_areas": 1, "priorities": 2, "goals": 4, "activities": 12}
+    for collection in db.values():
+        assert all(doc["deleted_at"] is not None for doc in collection.docs)
+    assert db["goals"].docs[0]["deleted_at"] == "earlier"
+    assert "deleted_via" not in db["goals"].docs[0]
+    assert {doc["deleted_via"] for doc in db["activities"].docs} == {via}
+
+
+async def test_restore_returns_exactly_what_the_deletion_took(plan_db):
+    db, plan_id = plan_db
+    via = cascade.root_key("annual_plans", plan_id)
+    await cascade.soft_delete("annual_plans", {"_id": plan_id}, via=via, user_id=USER_ID)
+
+    counts = await cascade.restore("annual_plans", {"_id": plan_id}, via=via)
+
+    assert counts == {"annual_plans": 1, "focus_areas": 1, "priorities": 2, "goals": 4, "activities": 12}
+    assert [doc["deleted_at"] for doc in db["goals"].docs] == ["earlier", None, None, None, None]
+    assert not any("deleted_via" in doc for collection in db.values() for doc in collection.docs)
+
+
+async def test_interrupted_delete_finishes_on_rerun(plan_db):
+    db, plan_id = plan_db
+    via = cascade.root_key("annual_plans", plan_id)
+    db["goals"].fail_updates = 1
+
+    with pytest.raises(RuntimeError):
+        await cascade.soft_delete("annual_plans", {"_id": plan_id}, via=via, user_id=USER_ID)
+    # Children go first, so the plan itself is still live and findable.
+    assert db["annual_plans"].docs[0]["deleted_at"] is None
+
+    await cascade.soft_delete("annual_plans", {"_id": plan_id}, via=via, user_id=USER_ID)
+    for collection in db.values():
+        assert all(doc["deleted_at"] is not None for doc in collection.docs)
+
+
+async def test_deck_cards_matched_in_both_id_forms_and_unpublished():
+    deck_id = ObjectId()
+    db = {
+        "decks": FakeCollection([{"_id": deck_id, "is_public": True, "deleted_at": None}]),
+        "cards": FakeCollection([
+            {"_id": ObjectId(), "deck_id": deck_id, "is_public": True, "deleted_at": None},
+            {"_id": ObjectId(), "deck_id": str(deck_id), "deleted_at": None},
+            {"_id": ObjectId(), "deck_id": str(ObjectId()), "deleted_at": None},
+        ]),
+    }
+    with patch.object(cascade, "db", db):
+        counts = await cascade.soft_delete("decks", {"_id": deck_id}, via=cascade.root_key("decks", deck_id))
+
+    assert counts == {"decks": 1, "cards": 2}
+    assert db["decks"].docs[0]["is_public"] is False
+    assert [doc["deleted_at"] is not None for doc in db["cards"].docs] == [True, True, False]
+    assert db["cards"].docs[0]["is_public"] is False
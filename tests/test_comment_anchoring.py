@@ -0,0 +1,148 @@
+"""
+Server-side comment re-anchoring — app/utils/comment_anchoring.py.
+
+Covers:
+  1. Text inserted before a comment shifts its anchor by diff alone
+  2. A comment whose sentence was edited is re-found by fuzzy (bitap) search
+  3. A comment whose quote was deleted is marked orphaned
+  4. All changes go out in ONE bulk_write; an unchanged book writes nothing
+  5. bitap finds approximate matches within the error budget only, and the
+     fuzzy search stays near the expected position on long texts and within
+     the pass's character budget
+  6. An orphaned comment is searched for again only when the edit touched
+     the text around it
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+
+from app.utils import comment_anchoring
+from app.utils.book_text import extract_text
+from tests.test_book_blocks import lexical, paragraph
+
+BOOK_ID = "60b8d295f1d2c17f4e4b1234"
+
+INTRO = "Memory fades along a forgetting curve."
+MIDDLE = "Each successful review roughly doubles the interval before the next one."
+ENDING = "Interleaving topics improves long-term retention."
+
+
+def _derivative(*texts):
+    return extract_text(lexical(*[paragraph(t) for t in texts]))
+
+
+def _comment(derivative, quote):
+    start = derivative["text"].index(quote)
+    return {
+        "_id": ObjectId(),
+        "anchor": {"quote": quote, "prefix": "", "suffix": "", "start_offset": start,
+                   "end_offset": start + len(quote), "block_index": None},
+    }
+
+
+@pytest.fixture
+def comments():
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock()
+
+    def install(docs):
+        cursor = MagicMock()
+        cursor.to_list = AsyncMock(return_value=docs)
+        collection.find = MagicMock(return_value=cursor)
+        return collection
+
+    with patch.object(comment_anchoring, "comments_collection", collection):
+        yield install
+
+
+async def test_reanchor_shift_fuzzy_and_orphan_in_one_bulk_write(comments):
+    old = _derivative(INTRO, MIDDLE, ENDING)
+    shifted, edited, deleted = (_comment(old, q) for q in ("Interleaving topics", "roughly doubles the interval", INTRO))
+    collection = comments([shifted, edited, deleted])
+    new = _derivative("A new opening paragraph.",
+                      "Each successful review roughly doubled the interval before the next one.", ENDING)
+
+    stats = await comment_anchoring.reanchor_comments(BOOK_ID, old, new)
+
+    assert stats == {"kept": 0, "shifted": 1, "fuzzy": 1, "orphaned": 1}
+    collection.bulk_write.assert_awaited_once()
+    operations = {op._filter["_id"]: op._doc["$set"] for op in collection.bulk_write.call_args.args[0]}
+
+    moved = operations[shifted["_id"]]["anchor"]
+    assert new["text"][moved["start_offset"]:moved["end_offset"]] == "Interleaving topics"
+    assert moved["block_index"] == 2 and moved["suffix"].startswith(" improves")
+
+    refound = operations[edited["_id"]]["anchor"]
+    assert refound["quote"].startswith("roughly doubled the interval")
+    assert refound["block_index"] == 1
+
+    assert operations[deleted["_id"]]["orphaned"] is True and "anchor" not in operations[deleted["_id"]]
+
+
+async def test_unchanged_anchors_write_nothing(comments):
+    derivative = _derivative(INTRO, MIDDLE)
+    comment = _comment(derivative, "forgetting curve")
+    comment["anchor"] = {**comment["anchor"], **comment_anchoring._context(
+        derivative["text"], comment["anchor"]["start_offset"], comment["anchor"]["end_offset"]), "block_index": 0}
+    collection = comments([comment])
+
+    stats = await comment_anchoring.reanchor_comments(BOOK_ID, derivative, _derivative(INTRO, MIDDLE, ENDING))
+
+    assert stats["kept"] == 1
+    collection.bulk_write.assert_not_awaited()
+
+
+def test_without_previous_text_offsets_are_verified():
+    new = _derivative(INTRO, MIDDLE)
+    comment = _comment(new, "successful review")
+    comment["anchor"]["start_offset"] += 3  # written against different offsets
+    comment["anchor"]["end_offset"] += 3
+
+    moves, orphans, stats = comment_anchoring.plan_reanchor(None, new, [comment])
+
+    assert stats["fuzzy"] == 1 and not orphans
+    assert moves[0][1]["start_offset"] == new["text"].index("successful review")
+
+
+def test_orphans_retried_only_near_the_edit():
+    old = _derivative(INTRO, MIDDLE, ENDING)
+    near, far = _comment(old, "forgetting curve"), _comment(old, "Interleaving topics")
+    for comment in (near, far):
+        comment["orphaned"] = True
+    new = _derivative("Memory fades along a forgetting curve, fast.", MIDDLE, ENDING)
+
+    with patch.object(comment_anchoring, "locate", wraps=comment_anchoring.locate) as locate:
+        moves, orphans, stats = comment_anchoring.plan_reanchor(old, new, [near, far])
+
+    assert locate.call_count == 1
+    assert [comment_id for comment_id, _ in moves] == [near["_id"]]
+    assert not orphans and stats["orphaned"] == 1
+
+
+def test_changed_regions_include_insertions():
+    runs = comment_anchoring.unchanged_runs("a\nb\n", "a\nnew\nb\n")
+
+    assert comment_anchoring.changed_regions(runs, 4, 8) == [(2, 2)]
+
+
+def test_bitap_error_budget():
+    text = "the quick brown fox jumps"
+
+    assert (19, 0) in comment_anchoring.bitap(text, "brown fox", 1)
+    assert any(errors == 1 for _, errors in comment_anchoring.bitap(text, "brwn fox", 1))
+    assert comment_anchoring.bitap(text, "purple cat", 2) == []
+
+
+def test_fuzzy_search_is_bounded():
+    quote = "roughly doubled the interval"
+    anchor = {"quote": quote.replace("doubled", "doubles")}
+    filler = "lorem ipsum " * 3000
+    long_text = filler + quote + filler
+
+    assert comment_anchoring.locate(long_text, anchor, expected=len(long_text) // 2) is not None
+    assert comment_anchoring.locate(long_text, anchor, expected=0) is None  # no whole-text scan
+
+    budget = comment_anchoring.FuzzyBudget(chars=5000)
+    assert comment_anchoring.locate(long_text, anchor, len(filler), budget) is not None
+    assert comment_anchoring.locate(long_text, anchor, len(filler), budget) is None
@@ -0,0 +1,77 @@
+"""
+Daily activity rollups — app/services/activity.py.
+
+Covers:
+  1. A review upserts one $inc on the (user, day) document, by card type
+  2. A book save counts the save and adds the book to the day's distinct set
+  3. A lost first-write race retries without upsert; any other failure is swallowed
+  4. weekly() / streak() read the rollups in the weekly_progress shape
+"""
+from datetime import date, datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.services import activity
+
+USER_ID = "507f1f77bcf86cd799439011"
+MOMENT = datetime(2026, 10, 19, 23, 30, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def rollups():
+    collection = MagicMock()
+    collection.update_one = AsyncMock()
+    with patch.object(activity, "activity_days_collection", collection):
+        yield collection
+
+
+async def test_review_increments_typed_counter(rollups):
+    await activity.record(USER_ID, card_type="quiz", reviews=1, at=MOMENT)
+
+    selector, update = rollups.update_one.call_args.args
+    assert selector == {"_id": f"{USER_ID}:2026-10-19"}
+    assert update["$inc"] == {"reviews.quiz": 1, "reviews_total": 1}
+    assert update["$setOnInsert"] == {"user_id": USER_ID, "day": "2026-10-19"}
+    assert rollups.update_one.call_args.kwargs == {"upsert": True}
+
+
+async def test_book_save_and_session(rollups):
+    await activity.record(USER_ID, book_id="b1", at=MOMENT)
+    await activity.record(USER_ID, sessions=1, study_seconds=95, at=MOMENT)
+
+    save, session = (call.args[1] for call in rollups.update_one.call_args_list)
+    assert save["$inc"] == {"book_saves": 1}
+    assert save["$addToSet"] == {"book_ids": "b1"}
+    assert session["$inc"] == {"sessions": 1, "study_seconds": 95}
+    assert "$addToSet" not in session
+
+
+async def test_upsert_race_retries_and_failures_never_raise(rollups):
+    rollups.update_one.side_effect = [DuplicateKeyError("dup"), None]
+    await activity.record(USER_ID, reviews=1, at=MOMENT)
+    assert rollups.update_one.await_count == 2
+    assert rollups.update_one.call_args.kwargs == {}
+
+    rollups.update_one.side_effect = RuntimeError("mongo down")
+    await activity.record(USER_ID, reviews=1, at=MOMENT)  # logged, not raised
+
+
+def test_weekly_and_streak_from_rollups():
+    today = date(2026, 10, 19)
+    days = {
+        "2026-10-19": {"day": "2026-10-19", "reviews": {"flashcard": 2, "visual": 1}, "reviews_total": 3,
+                       "book_ids": ["b1"], "study_seconds": 125},
+        "2026-10-18": {"day": "2026-10-18", "reviews_total": 1},
+        "2026-10-17": {"day": "2026-10-17", "book_ids": ["b2"]},  # a save alone is no study day
+        "2026-10-16": {"day": "2026-10-16", "reviews_total": 4},
+    }
+
+    week = activity.weekly(days, today)
+
+    assert [entry["date"] for entry in week][-1] == "2026-10-19"
+    assert week[-1] == {"day": "Mon", "date": "2026-10-19", "cards": 3, "flashcards": 2, "quizzes": 0,
+                        "visual": 1, "books": 1, "minutes": 2}
+    assert week[-3]["books"] == 1 and week[-3]["cards"] == 0
+    assert activity.streak(activity.active_days(days), today) == 2
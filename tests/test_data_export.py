@@ -0,0 +1,150 @@
+"""
+Streaming data export — app/services/data_export.py.
+
+Covers:
+  1. stream_json emits the legacy export document, parseable as one JSON value
+  2. stream_zip writes one NDJSON file per collection plus a manifest with counts
+  3. Goals are found through the user's plans and their focus areas
+  4. Output is flushed in chunks rather than buffered whole
+  5. A user has one running background job; one whose heartbeat is stale
+     is marked failed
+"""
+import io
+import json
+import zipfile
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+
+from app.services import data_export
+
+USER_ID = "507f1f77bcf86cd799439011"
+EXPORTED_AT = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+PLAN_ID = ObjectId()
+FOCUS_AREA_ID = ObjectId()
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._docs:
+            yield dict(doc)
+
+
+def _collection(docs):
+    collection = MagicMock()
+    collection.find = MagicMock(side_effect=lambda *args, **kwargs: _Cursor(docs))
+    return collection
+
+
+@pytest.fixture
+def collections():
+    fakes = {
+        "books_collection": _collection([{"_id": ObjectId(), "title": "Ñandú", "full_content": "x" * 100}]),
+        "decks_collection": _collection([{"_id": ObjectId(), "name": "Deck"}]),
+        "study_cards_collection": _collection(
+            [{"_id": ObjectId(), "front": f"q{i}", "created_at": EXPORTED_AT} for i in range(3)]
+        ),
+        "tasks_collection": _collection([]),
+        "annual_plans_collection": _collection([{"_id": PLAN_ID, "year": 2026}]),
+        "focus_areas_collection": _collection([{"_id": FOCUS_AREA_ID}]),
+        "goals_collection": _collection([{"_id": ObjectId(), "focus_area_id": str(FOCUS_AREA_ID)}]),
+    }
+    with patch.multiple(data_export, **fakes):
+        yield fakes
+
+
+async def _collect(stream):
+    return [chunk async for chunk in stream]
+
+
+async def test_json_export_keeps_legacy_shape(collections):
+    chunks = await _collect(data_export.stream_json(USER_ID, "a@b.c", EXPORTED_AT))
+    exported = json.loads(b"".join(chunks))
+
+    assert list(exported) == ["exported_at", "user_email", "books", "decks", "cards", "tasks", "annual_plans", "goals"]
+    assert exported["exported_at"] == EXPORTED_AT.isoformat()
+    assert exported["books"][0]["title"] == "Ñandú"
+    assert len(exported["cards"]) == 3
+    assert exported["cards"][0]["created_at"] == EXPORTED_AT.isoformat()
+    assert exported["tasks"] == []
+
+
+async def test_zip_export_has_ndjson_per_collection_and_manifest(collections):
+    counts = {}
+    chunks = await _collect(data_export.stream_zip(USER_ID, "a@b.c", EXPORTED_AT, counts))
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+    assert archive.namelist() == [f"{name}.ndjson" for name, _ in data_export.export_sections(USER_ID)] + ["manifest.json"]
+    cards = [json.loads(line) for line in archive.read("cards.ndjson").splitlines()]
+    assert [card["front"] for card in cards] == ["q0", "q1", "q2"]
+    assert archive.read("tasks.ndjson") == b""
+
+    manifest = json.loads(archive.read("manifest.json"))
+    assert manifest["record_counts"] == counts
+    assert counts == {"books": 1, "decks": 1, "cards": 3, "tasks": 0, "annual_plans": 1, "goals": 1}
+
+
+async def test_goals_follow_plans_and_focus_areas(collections):
+    lines = b"".join(await _collect(data_export.stream_ndjson(USER_ID, "a@b.c", EXPORTED_AT))).splitlines()
+    records = [json.loads(line) for line in lines[1:]]
+
+    assert [r["collection"] for r in records if r["collection"] == "goals"] == ["goals"]
+    focus_filter = collections["focus_areas_collection"].find.call_args.args[0]
+    assert focus_filter["annual_plan_id"] == {"$in": [str(PLAN_ID)]}
+    goals_filter = collections["goals_collection"].find.call_args.args[0]
+    assert goals_filter["focus_area_id"] == {"$in": [str(FOCUS_AREA_ID)]}
+
+
+async def test_large_export_is_flushed_in_chunks(collections):
+    collections["study_cards_collection"].find.side_effect = lambda *a, **k: _Cursor(
+        [{"_id": ObjectId(), "front": "q" * 1000} for _ in range(300)]
+    )
+    with patch.object(data_export, "CHUNK_BYTES", 16 * 1024):
+        chunks = await _collect(data_export.stream_json(USER_ID, "a@b.c", EXPORTED_AT))
+
+    assert len(chunks) > 10
+    assert max(len(chunk) for chunk in chunks) < 20 * 1024
+    assert len(json.loads(b"".join(chunks))["cards"]) == 300
+
+
+def _jobs_collection(running):
+    jobs = MagicMock()
+    jobs.update_many = AsyncMock()
+    jobs.find_one = AsyncMock(return_value=running)
+    jobs.insert_one = AsyncMock()
+    return jobs
+
+
+async def test_start_export_job_returns_the_running_job():
+    running = {"export_id": "abc", "user_id": USER_ID, "status": "running"}
+    jobs = _jobs_collection(running)
+    with patch.object(data_export, "export_jobs_collection", jobs), \
+         patch.object(data_export.asyncio, "create_task") as create_task:
+        job = await data_export.start_export_job(USER_ID, "a@b.c")
+
+    assert job is running
+    jobs.insert_one.assert_not_awaited()
+    create_task.assert_not_called()
+    stale_filter = jobs.update_many.call_args.args[0]
+    assert stale_filter["status"] == "running" and "$lt" in stale_filter["updated_at"]
+
+
+async def test_polling_a_job_with_a_stale_heartbeat_marks_it_failed():
+    heartbeat = (datetime.now(timezone.utc) - data_export.STALE_AFTER - timedelta(seconds=1)).replace(tzinfo=None)
+    jobs = _jobs_collection({"export_id": "abc", "user_id": USER_ID, "status": "running", "updated_at": heartbeat})
+    with patch.object(data_export, "export_jobs_collection", jobs):
+        job = await data_export.get_export_job("abc", USER_ID)
+
+    assert job["status"] == "failed" and job["error"]
+    assert jobs.update_many.call_args.args[1]["$set"]["status"] == "failed"
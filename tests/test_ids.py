@@ -0,0 +1,76 @@
+"""
+Canonical id helpers — app/utils/ids.py and app/migrations/normalize_ids.py.
+
+Covers:
+  1. Before normalization, reads match both the ObjectId and string form
+  2. After normalization, reads are a single canonical value per field
+  3. Writes always store the canonical form
+  4. The migration converts only what it can and reports the rest, one
+     batch at a time in dry runs too
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from bson import ObjectId
+
+from app.migrations import normalize_ids
+from app.utils import ids
+
+OID = ObjectId("507f1f77bcf86cd799439011")
+
+
+def test_unnormalized_reads_match_both_forms():
+    assert ids.id_value("annual_plans", str(OID)) == {"$in": [OID, str(OID)]}
+    assert ids.ref_value("cards", "deck_id", OID) == {"$in": [OID, str(OID)]}
+    assert ids.ref_values("goals", "focus_area_id", [OID, "legacy"]) == [OID, str(OID), "legacy"]
+
+
+def test_normalized_reads_are_single_values():
+    with patch.object(ids, "_normalized", frozenset({"cards", "goals", "annual_plans"})):
+        assert ids.id_value("annual_plans", str(OID)) == OID
+        assert ids.ref_value("cards", "deck_id", str(OID)) == OID
+        assert ids.ref_values("goals", "focus_area_id", [OID]) == [str(OID)]
+        # Collections the migration hasn't finished keep matching both forms.
+        assert ids.ref_value("activities", "goal_id", OID) == {"$in": [OID, str(OID)]}
+
+
+def test_canonical_ref_for_writes():
+    assert ids.canonical_ref("cards", "deck_id", str(OID)) == OID
+    assert ids.canonical_ref("priorities", "annual_plan_id", OID) == str(OID)
+
+
+def test_migration_conversion():
+    assert normalize_ids._convert(str(OID), ids.OBJECT_ID) == OID
+    assert normalize_ids._convert("not-an-id", ids.OBJECT_ID) is None
+    assert normalize_ids._convert(OID, ids.STRING) == str(OID)
+    assert normalize_ids._non_canonical("deck_id", ids.OBJECT_ID) == {"deck_id": {"$type": "string"}}
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+async def test_conversion_is_counted_and_flushed_per_batch_in_both_modes():
+    docs = [{"_id": ObjectId(), "deck_id": str(ObjectId())} for _ in range(5)]
+    for apply_changes in (False, True):
+        collection = MagicMock()
+        collection.find = MagicMock(return_value=_Cursor(docs))
+        batches = []
+        collection.bulk_write = AsyncMock(side_effect=lambda ops, ordered: batches.append(len(ops)))
+        stats = {"unconvertible": 0}
+        with patch.object(normalize_ids, "db", {"cards": collection}), \
+             patch.object(normalize_ids, "BATCH_SIZE", 2):
+            await normalize_ids._convert_field("cards", "deck_id", ids.OBJECT_ID, apply_changes, stats)
+
+        assert stats["deck_id"] == 5
+        assert batches == ([2, 2, 1] if apply_changes else [])
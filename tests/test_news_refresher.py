@@ -0,0 +1,162 @@
+"""
+Background RSS refresher — app/services/news_refresher.py.
+
+Covers:
+  1. A cold feed is fetched once, parsed, and stored with its validators
+  2. A refresh sends If-None-Match / If-Modified-Since; a 304 keeps the
+     stored articles and only bumps fetched_at
+  3. A fresh feed is not refetched; a stale one is served immediately and
+     revalidated in the background
+  4. While one worker holds the refresh lease, another does not fetch
+"""
+import asyncio
+import copy
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.services import news_refresher
+
+RSS = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Feed</title>
+<item><title>First</title><link>https://example.com/1</link>
+<description>&lt;p&gt;Hello &lt;img src="https://img.example.com/1.jpg"&gt;&lt;/p&gt;</description></item>
+<item><title>Second</title><link>https://example.com/2</link><description>Plain</description></item>
+</channel></rss>"""
+
+
+def _value_matches(actual, condition):
+    if isinstance(condition, dict) and "$lte" in condition:
+        return actual is not None and actual <= condition["$lte"]
+    return actual == condition
+
+
+def _matches(doc, query):
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(_matches(doc, q) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(doc, q) for q in condition):
+                return False
+        elif not _value_matches(doc.get(key), condition):
+            return False
+    return True
+
+
+class FakeFeeds:
+    def __init__(self):
+        self.documents = {}
+
+    async def find_one(self, query):
+        doc = self.documents.get(query["_id"])
+        return copy.deepcopy(doc) if doc else None
+
+    async def find_one_and_update(self, query, update, upsert=False):
+        doc = self.documents.get(query["_id"])
+        if doc is None:
+            doc = {"_id": query["_id"], **update.get("$setOnInsert", {}), **update["$set"]}
+            self.documents[query["_id"]] = doc
+            return None
+        if not _matches(doc, query):
+            if upsert:
+                raise DuplicateKeyError("E11000 duplicate key")
+            return None
+        previous = copy.deepcopy(doc)
+        doc.update(update["$set"])
+        return previous
+
+    async def update_one(self, query, update):
+        self.documents[query["_id"]].update(update["$set"])
+
+    async def delete_many(self, query):
+        count = len(self.documents)
+        self.documents.clear()
+        return MagicMock(deleted_count=count)
+
+
+class Origin:
+    """RSS origin honouring ETag validators."""
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=RSS, headers={"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2026 00:00:00 GMT"})
+
+
+@pytest.fixture
+def feeds():
+    store = FakeFeeds()
+    origin = Origin()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(origin))
+    with patch.object(news_refresher, "news_feeds_collection", store), \
+         patch.object(news_refresher, "_client", client):
+        yield store, origin
+
+
+def _doc(store):
+    (doc,) = store.documents.values()
+    return doc
+
+
+async def test_cold_feed_is_fetched_and_stored(feeds):
+    store, origin = feeds
+
+    result = await news_refresher.get_articles("en", "technology")
+
+    assert [a["title"] for a in result["articles"]] == ["First", "Second"]
+    assert result["articles"][0]["urlToImage"] == "https://img.example.com/1.jpg"
+    assert result["articles"][1]["urlToImage"].startswith("https://picsum.photos/seed/")
+    assert result["stale"] is False
+    assert len(origin.requests) == 1
+    doc = _doc(store)
+    assert doc["etag"] == '"v1"' and doc["refreshing_until"] is None
+
+
+async def test_conditional_refresh_keeps_articles_on_304(feeds):
+    store, origin = feeds
+    await news_refresher.refresh_feed("en", "general")
+    articles = _doc(store)["articles"]
+    _doc(store)["fetched_at"] -= timedelta(hours=1)
+
+    assert await news_refresher.refresh_feed("en", "general") is True
+
+    request = origin.requests[-1]
+    assert request.headers["If-None-Match"] == '"v1"'
+    assert request.headers["If-Modified-Since"] == "Mon, 01 Jan 2026 00:00:00 GMT"
+    assert _doc(store)["articles"] == articles
+    assert datetime.now(timezone.utc) - _doc(store)["fetched_at"] < timedelta(minutes=1)
+
+
+async def test_stale_while_revalidate(feeds):
+    store, origin = feeds
+    await news_refresher.refresh_feed("en", "science")
+
+    fresh = await news_refresher.get_articles("en", "science")
+    assert fresh["stale"] is False and len(origin.requests) == 1
+
+    _doc(store)["fetched_at"] -= news_refresher.REFRESH_INTERVAL
+    stale = await news_refresher.get_articles("en", "science")
+    assert stale["stale"] is True and stale["articles"] == fresh["articles"]
+    assert len(origin.requests) == 1  # served before the refetch
+    await asyncio.gather(*news_refresher._background)
+    assert len(origin.requests) == 2
+
+
+async def test_lease_prevents_duplicate_fetches(feeds):
+    store, origin = feeds
+    await news_refresher.refresh_feed("fr", "general")
+    doc = _doc(store)
+    doc["fetched_at"] -= timedelta(hours=1)
+    doc["refreshing_until"] = datetime.now(timezone.utc) + timedelta(seconds=30)
+
+    assert await news_refresher.refresh_feed("fr", "general") is False
+    assert await news_refresher.refresh_feed("fr", "general", force=True) is False
+    assert len(origin.requests) == 1
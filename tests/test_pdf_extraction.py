@@ -0,0 +1,125 @@
+"""
+PDF/DOCX extraction off the event loop — app/utils/file_import.py.
+
+Covers:
+  1. extract_pdf_page_range honours [start, stop) and 1-based page numbers
+  2. 2-column pages are detected and rendered as a two-column grid
+  3. Each image xref is extracted once, even when repeated across pages
+  4. iter_pdf_pages splits the document into ranges and yields pages in
+     document order; max_pages limits extraction (preview mode)
+  5. extract_pages reports the real page count alongside a limited extraction
+
+PDFs are generated with PyMuPDF at test time. The process pool is replaced
+with an inline runner so the tests never spawn workers.
+"""
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import fitz
+import pytest
+
+from app.utils import file_import
+
+LOREM = (
+    "Spaced repetition schedules each review just before the memory would "
+    "otherwise fade, so the interval between reviews grows with every success. "
+)
+
+
+def _write_pdf(path, pages: int, two_column: bool = False, image_every_page: bool = False) -> str:
+    doc = fitz.open()
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 16, 16), False)
+    pixmap.clear_with(200)
+    logo_xref = 0
+    for number in range(pages):
+        page = doc.new_page()
+        width = page.rect.width
+        if two_column:
+            page.insert_textbox(fitz.Rect(40, 60, width / 2 - 20, 780), f"Left {number} " + LOREM * 6)
+            page.insert_textbox(fitz.Rect(width / 2 + 20, 60, width - 40, 780), f"Right {number} " + LOREM * 6)
+        else:
+            page.insert_textbox(fitz.Rect(40, 60, width - 40, 780), f"Page {number} " + LOREM * 6)
+        if image_every_page:
+            rect = fitz.Rect(40, 10, 60, 30)
+            if logo_xref:
+                page.insert_image(rect, xref=logo_xref)
+            else:
+                logo_xref = page.insert_image(rect, pixmap=pixmap)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+async def _inline_run_in_process(fn, *args):
+    return fn(*args)
+
+
+def test_page_range_extracts_only_requested_pages(tmp_path):
+    pdf = _write_pdf(tmp_path / "book.pdf", pages=6)
+    pages = file_import.extract_pdf_page_range(pdf, 2, 4)
+    assert [p["page_number"] for p in pages] == [3, 4]
+    assert "Page 2" in pages[0]["content"]
+    assert pages[0]["word_count"] > 50
+
+
+def test_two_column_page_is_detected(tmp_path):
+    pdf = _write_pdf(tmp_path / "paper.pdf", pages=1, two_column=True)
+    (page,) = file_import.extract_pdf_page_range(pdf)
+    assert page["has_columns"] is True
+    assert 'class="column-left"' in page["content"]
+    assert page["content"].index("Left 0") < page["content"].index("Right 0")
+
+
+def test_repeated_image_is_extracted_once(tmp_path):
+    pdf = _write_pdf(tmp_path / "logo.pdf", pages=4, image_every_page=True)
+    original = fitz.Document.extract_image
+    calls = []
+
+    def counting_extract_image(self, xref):
+        calls.append(xref)
+        return original(self, xref)
+
+    with patch.object(fitz.Document, "extract_image", counting_extract_image):
+        pages = file_import.extract_pdf_page_range(pdf)
+
+    assert len(calls) == 1
+    assert all("data:image/" in p["content"] for p in pages)
+
+
+async def test_iter_pdf_pages_yields_ranges_in_order(tmp_path):
+    pdf = _write_pdf(tmp_path / "long.pdf", pages=9)
+    submitted = []
+
+    async def recording_runner(fn, *args):
+        submitted.append(args[1:])
+        return fn(*args)
+
+    with patch.object(file_import, "PDF_MIN_PAGES_PER_TASK", 2), \
+         patch.object(file_import, "PROCESS_POOL_WORKERS", 2), \
+         patch.object(file_import, "run_in_process", recording_runner):
+        pages = [p async for p in file_import.iter_pdf_pages(pdf)]
+
+    assert [p["page_number"] for p in pages] == list(range(1, 10))
+    assert submitted == [(0, 3), (3, 6), (6, 9)]
+
+
+async def test_extract_pages_preview_limits_extraction(tmp_path):
+    pdf = _write_pdf(tmp_path / "long.pdf", pages=12)
+    with patch.object(file_import, "run_in_process", _inline_run_in_process):
+        pages, page_count = await file_import.extract_pages("long.pdf", pdf, max_pages=3)
+
+    assert page_count == 12
+    assert [p["page_number"] for p in pages] == [1, 2, 3]
+    # The metadata reports the whole document, not the sampled pages.
+    assert pages[0]["extraction_metadata"]["total_pages"] == 12
+
+
+async def test_extract_pages_txt_runs_through_pool(tmp_path):
+    txt = tmp_path / "notes.txt"
+    txt.write_text("First paragraph.\n\nSecond paragraph.", encoding="utf-8")
+    with patch.object(file_import, "run_in_process", _inline_run_in_process):
+        pages, page_count = await file_import.extract_pages("notes.txt", str(txt))
+
+    assert page_count == 1
+    assert "<p>Second paragraph.</p>" in pages[0]["content"]
@@ -17,7 +17,6 @@ from unittest.mock import MagicMock
 # Prevent langfuse from failing on Python 3.9 type syntax during collection
 sys.modules.setdefault("langfuse", MagicMock())
 
-import builtins
 import importlib
 import json
 import logging
@@ -26,18 +25,35 @@ from pathlib import Path
 from unittest.mock import patch, MagicMock
 
 
-def test_get_prompt_uses_langfuse(monkeypatch):
-    """PM-01: get_prompt() returns Langfuse-hosted prompt when client is available."""
+async def test_get_prompt_uses_langfuse(monkeypatch):
+    """PM-01: get_prompt() serves the Langfuse-hosted prompt once the refresher has fetched it."""
     import app.core.prompt_manager as pm
     importlib.reload(pm)
     fake_client = MagicMock()
     fake_prompt = MagicMock()
-    fake_prompt.compile.return_value = "compiled-from-langfuse"
+    fake_prompt.prompt = "From Langfuse: {prompt} / {sample_text}"
+    fake_prompt.version = 7
     fake_client.get_prompt.return_value = fake_prompt
-    with patch("app.core.prompt_manager._prompt_cache", {}):
+    with patch("app.core.prompt_manager._prompt_cache", {}), \
+         patch("app.core.prompt_manager._write_snapshot"):
         with patch("app.core.langfuse_client.get_langfuse_client", return_value=fake_client):
+            await pm.refresh()
             result = pm.get_prompt("nowry-cards-magic", prompt="test", sample_text="ctx", sample_number=5)
-    assert result == "compiled-from-langfuse"
+            version = pm.prompt_version("nowry-cards-magic")
+    assert result == "From Langfuse: test / ctx"
+    assert version == 7
+
+
+def test_get_prompt_never_calls_langfuse():
+    """A cache miss serves the hardcoded fallback — requests never wait on Langfuse."""
+    import app.core.prompt_manager as pm
+    importlib.reload(pm)
+    fake_client = MagicMock()
+    with patch("app.core.prompt_manager._prompt_cache", {}):
+        with patch("app.core.langfuse_client.get_langfuse_client", return_value=fake_client):
+            result = pm.get_prompt("nowry-quiz-intent", lang_name="French")
+    assert "French" in result
+    fake_client.get_prompt.assert_not_called()
 
 
 def test_get_prompt_fallback(monkeypatch):
@@ -86,18 +102,54 @@ async def test_prewarm_writes_prompts(tmp_path):
     cache_file = tmp_path / "langfuse_cache.json"
     cache_file.write_text(json.dumps({"version": 1, "updated_at": None, "prompts": {}, "model_config": {}}))
     with patch("app.core.langfuse_client.get_langfuse_client", return_value=None):
-        with patch("app.core.prompt_manager._prompt_cache", {}):
-            real_open = builtins.open
-
-            def patched_open(path, *args, **kwargs):
-                if "langfuse_cache.json" in str(path):
-                    return real_open(str(cache_file), *args, **kwargs)
-                return real_open(path, *args, **kwargs)
-
-            with patch("builtins.open", side_effect=patched_open):
-                await pm.prewarm()
+        with patch("app.core.prompt_manager._prompt_cache", {}), \
+             patch.object(pm, "_CACHE_PATH", cache_file):
+            await pm.prewarm()
+    assert [p.name for p in tmp_path.iterdir()] == ["langfuse_cache.json"]
     data = json.loads(cache_file.read_text())
     assert "prompts" in data
     assert len(data["prompts"]) == 8
     for name in pm._FALLBACKS:
         assert name in data["prompts"], f"prewarm() must write prompt '{name}' to cache"
+
+
+@pytest.mark.asyncio
+async def test_refresh_rejects_template_with_unknown_variables():
+    """A hosted version needing variables callers never pass keeps the current entry."""
+    import app.core.prompt_manager as pm
+    importlib.reload(pm)
+    fake_client = MagicMock()
+    fake_prompt = MagicMock()
+    fake_prompt.prompt = "Answer in {lang_name} about {topic}"
+    fake_prompt.version = 3
+    fake_client.get_prompt.return_value = fake_prompt
+    with patch("app.core.prompt_manager._prompt_cache", {}), \
+         patch("app.core.prompt_manager._write_snapshot"):
+        with patch("app.core.langfuse_client.get_langfuse_client", return_value=fake_client):
+            await pm.refresh()
+            metadata = pm.version_metadata("nowry-quiz-intent")
+            result = pm.get_prompt("nowry-quiz-intent", lang_name="German")
+    assert metadata == {"prompt_name": "nowry-quiz-intent", "prompt_version": "fallback"}
+    assert result == pm._FALLBACKS["nowry-quiz-intent"].format(lang_name="German")
+
+
+@pytest.mark.asyncio
+async def test_refresh_survives_template_with_positional_field():
+    """A hosted '{}' template is rejected for its prompt; the other prompts still refresh."""
+    import app.core.prompt_manager as pm
+    importlib.reload(pm)
+    fake_client = MagicMock()
+
+    def get_prompt(name, **kwargs):
+        prompt = MagicMock()
+        prompt.prompt = "hello {}" if name == "nowry-quiz-intent" else pm._FALLBACKS[name]
+        prompt.version = 3
+        return prompt
+
+    fake_client.get_prompt.side_effect = get_prompt
+    with patch("app.core.prompt_manager._prompt_cache", {}), \
+         patch("app.core.prompt_manager._write_snapshot"):
+        with patch("app.core.langfuse_client.get_langfuse_client", return_value=fake_client):
+            await pm.refresh()
+            assert pm.version_metadata("nowry-quiz-intent")["prompt_version"] == "fallback"
+            assert pm.version_metadata("nowry-book-expand")["prompt_version"] == "3"
@@ -0,0 +1,152 @@
+"""
+Cross-user quiz question bank — app/utils/question_bank.py and
+app/routers/quiz.py (_banked_question_text).
+
+Covers:
+  1. Identical card content shares one key; different content, question type
+     or prompt version do not
+  2. An entry accepts at most BANK_VARIANTS phrasings and ignores duplicates
+  3. A bank hit is served with no LLM call; a full entry schedules no top-up
+  4. A miss generates once and stores the question; fallback text is not stored
+  5. Editing a card (new field hash) misses the old entry
+"""
+import asyncio
+import sys
+from unittest.mock import MagicMock, patch
+
+if "groq" not in sys.modules:
+    sys.modules["groq"] = MagicMock()
+
+# Full-suite ordering guard (see tests/test_quiz_prefetch.py).
+import importlib as _importlib
+
+if not isinstance(getattr(sys.modules.get("app.models.quiz"), "QuizDecksResponse", None), type):
+    sys.modules.pop("app.models.quiz", None)
+    sys.modules["app.models.quiz"] = _importlib.import_module("app.models.quiz")
+    sys.modules.pop("app.routers.quiz", None)
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.utils import question_bank
+
+quiz = _importlib.import_module("app.routers.quiz")
+
+FIELDS = {"term": "精々", "definition": "at most"}
+
+
+class FakeBank:
+    def __init__(self):
+        self.documents = {}
+
+    async def find_one_and_update(self, query, update, projection=None):
+        doc = self.documents.get(query["_id"])
+        if doc is None:
+            return None
+        doc.update(update["$set"])
+        return {"_id": doc["_id"], "variants": list(doc["variants"])}
+
+    async def update_one(self, query, update, upsert=False):
+        key = query["_id"]
+        (path,) = [k for k in query if k.startswith("variants.")]
+        index = int(path.split(".")[1])
+        doc = self.documents.get(key)
+        if doc is not None and len(doc["variants"]) > index:
+            if upsert:
+                raise DuplicateKeyError("E11000 duplicate key")
+            return MagicMock(matched_count=0, modified_count=0, upserted_id=None)
+        if doc is None:
+            doc = {"_id": key, "variants": [], **update["$setOnInsert"]}
+            self.documents[key] = doc
+            upserted = key
+        else:
+            upserted = None
+        text = update["$addToSet"]["variants"]
+        added = text not in doc["variants"]
+        if added:
+            doc["variants"].append(text)
+        return MagicMock(matched_count=1, modified_count=int(added and not upserted), upserted_id=upserted)
+
+
+def make_client():
+    client = MagicMock()
+    client.calls = 0
+
+    def create(**kwargs):
+        client.calls += 1
+        completion = MagicMock()
+        completion.choices[0].message.content = f"What does 精々 mean? ({client.calls})"
+        return completion
+
+    client.chat.completions.create.side_effect = create
+    return client
+
+
+@pytest.fixture
+def bank():
+    fake = FakeBank()
+    with patch.object(question_bank, "question_bank_collection", fake):
+        yield fake
+
+
+def test_key_is_content_addressed():
+    key = question_bank.bank_key(FIELDS, "definition", "q1")
+
+    assert key == question_bank.bank_key(dict(reversed(list(FIELDS.items()))), "definition", "q1")
+    assert key != question_bank.bank_key({**FIELDS, "definition": "at best"}, "definition", "q1")
+    assert key != question_bank.bank_key(FIELDS, "open_recall", "q1")
+    assert key != question_bank.bank_key(FIELDS, "definition", "q2")
+
+
+async def test_entry_is_capped_and_deduplicated(bank):
+    stored = [await question_bank.add_variant(FIELDS, "definition", "q1", f"Q{i}?")
+              for i in range(question_bank.BANK_VARIANTS + 1)]
+    duplicate = await question_bank.add_variant(FIELDS, "open_recall", "q1", "Same?")
+    again = await question_bank.add_variant(FIELDS, "open_recall", "q1", "Same?")
+
+    assert stored == [True] * question_bank.BANK_VARIANTS + [False]
+    entry = await question_bank.get_entry(FIELDS, "definition", "q1")
+    assert len(entry["variants"]) == question_bank.BANK_VARIANTS
+    assert (duplicate, again) == (True, False)
+
+
+async def test_full_entry_is_served_without_llm(bank):
+    for i in range(question_bank.BANK_VARIANTS):
+        await question_bank.add_variant(FIELDS, "definition", quiz.QUESTION_PROMPT_VERSION, f"Banked {i}?")
+    client = make_client()
+
+    text = await quiz._banked_question_text(FIELDS, "definition", client)
+    await asyncio.sleep(0)
+
+    assert text.startswith("Banked")
+    assert client.calls == 0
+
+
+async def test_miss_generates_once_and_stores(bank):
+    client = make_client()
+
+    first = await quiz._banked_question_text(FIELDS, "definition", client)
+    second = await quiz._banked_question_text(FIELDS, "definition", client)
+    await asyncio.gather(*quiz._prefetch_tasks)
+
+    assert second == first
+    # One on-demand call for the miss, one background top-up after the hit.
+    assert client.calls == 2
+    entry = await question_bank.get_entry(FIELDS, "definition", quiz.QUESTION_PROMPT_VERSION)
+    assert len(entry["variants"]) == 2
+
+    failing = make_client()
+    failing.chat.completions.create.side_effect = RuntimeError("rate limited")
+    fallback = await quiz._banked_question_text({"term": "other"}, "definition", failing)
+    assert fallback in quiz._FALLBACK_QUESTIONS
+    assert await question_bank.get_entry({"term": "other"}, "definition", quiz.QUESTION_PROMPT_VERSION) is None
+
+
+async def test_edited_card_misses_old_entry(bank):
+    await question_bank.add_variant(FIELDS, "definition", quiz.QUESTION_PROMPT_VERSION, "Old?")
+    client = make_client()
+
+    text = await quiz._banked_question_text({**FIELDS, "definition": "at the very most"}, "definition", client)
+
+    assert text != "Old?"
+    assert client.calls == 1
@@ -0,0 +1,150 @@
+"""
+Speculative next-question prefetch for deck quiz sessions — app/routers/quiz.py.
+
+Covers:
+  1. The prefetcher fills the window of upcoming cards and skips ones already stored
+  2. A stored question is served without an LLM call (prefetch hit)
+  3. A cold session falls back to on-demand generation (miss) and stores it
+  4. A miss while the prefetch for that card is in flight awaits it instead
+     of paying for a second LLM call
+"""
+import asyncio
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+if "groq" not in sys.modules:
+    sys.modules["groq"] = MagicMock()
+
+# Full-suite ordering guard: earlier tests may leave a MagicMock at
+# app.models.quiz, which FastAPI rejects as a response_model. Re-import the
+# real models (and the router against them) when that happened.
+import importlib as _importlib
+
+if not isinstance(getattr(sys.modules.get("app.models.quiz"), "QuizDecksResponse", None), type):
+    sys.modules.pop("app.models.quiz", None)
+    sys.modules["app.models.quiz"] = _importlib.import_module("app.models.quiz")
+    sys.modules.pop("app.routers.quiz", None)
+
+import pytest
+from bson import ObjectId
+
+quiz = _importlib.import_module("app.routers.quiz")
+
+SESSION_ID = "session-1"
+CARDS = [{"_id": ObjectId(), "title": f"term {i}", "content": f"meaning {i}"} for i in range(6)]
+CARD_IDS = [str(c["_id"]) for c in CARDS]
+
+
+class FakeSessions:
+    def __init__(self, prefetched=None):
+        self.doc = {"session_id": SESSION_ID, "prefetched_questions": dict(prefetched or {})}
+
+    async def find_one(self, query, projection=None):
+        return {"session_id": SESSION_ID, "prefetched_questions": dict(self.doc["prefetched_questions"])}
+
+    async def update_one(self, query, update):
+        for path, value in update.get("$set", {}).items():
+            index = path.split(".", 1)[1]
+            exists_guard = query.get(path, {}).get("$exists") is False
+            if exists_guard and index in self.doc["prefetched_questions"]:
+                return MagicMock(matched_count=0)
+            self.doc["prefetched_questions"][index] = value
+        return MagicMock(matched_count=1)
+
+
+class EmptyBank:
+    """Question bank that never has a match, so every card needs the LLM."""
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return None
+
+    async def update_one(self, *args, **kwargs):
+        return MagicMock(modified_count=0, upserted_id=None)
+
+
+class FakeCards:
+    async def find_one(self, query, *args, **kwargs):
+        return next((dict(c) for c in CARDS if c["_id"] == query["_id"]), None)
+
+
+def make_client(gate: threading.Event | None = None):
+    client = MagicMock()
+    client.calls = 0
+
+    def create(**kwargs):
+        client.calls += 1
+        if gate is not None:
+            gate.wait(timeout=5)
+        completion = MagicMock()
+        completion.choices[0].message.content = f"Question {client.calls}?"
+        return completion
+
+    client.chat.completions.create.side_effect = create
+    return client
+
+
+@pytest.fixture
+def sessions():
+    fake = FakeSessions()
+    with patch.object(quiz, "quiz_sessions_collection", fake), \
+         patch.object(quiz, "cards_collection", FakeCards()), \
+         patch.object(quiz, "QUIZ_PREFETCH_AHEAD", 3), \
+         patch.object(quiz.question_bank, "question_bank_collection", EmptyBank()):
+        yield fake
+
+
+async def test_prefetch_fills_window_and_skips_stored(sessions):
+    sessions.doc["prefetched_questions"]["2"] = {
+        "card_id": CARD_IDS[2], "question_type": "definition", "question_text": "Stored?",
+    }
+    client = make_client()
+
+    await quiz._prefetch_questions(SESSION_ID, CARD_IDS, 1, client)
+
+    assert sorted(sessions.doc["prefetched_questions"]) == ["1", "2", "3"]
+    assert sessions.doc["prefetched_questions"]["2"]["question_text"] == "Stored?"
+    assert client.calls == 2
+
+
+async def test_stored_question_is_a_hit(sessions):
+    sessions.doc["prefetched_questions"]["1"] = {
+        "card_id": CARD_IDS[1], "question_type": "open_recall", "question_text": "Ready?",
+    }
+    client = make_client()
+
+    question, hit = await quiz._next_question(SESSION_ID, CARD_IDS, 1, client)
+
+    assert hit is True
+    assert question.question_text == "Ready?" and question.card_index == 1
+    assert client.calls == 0
+
+
+async def test_cold_session_generates_on_demand(sessions):
+    client = make_client()
+
+    question, hit = await quiz._next_question(SESSION_ID, CARD_IDS, 4, client)
+
+    assert hit is False
+    assert question.card_id == CARD_IDS[4]
+    assert client.calls == 1
+    assert sessions.doc["prefetched_questions"]["4"]["question_text"] == question.question_text
+
+
+async def test_miss_awaits_inflight_prefetch(sessions):
+    gate = threading.Event()
+    client = make_client(gate)
+
+    prefetch = asyncio.create_task(quiz._prefetch_questions(SESSION_ID, CARD_IDS, 1, client))
+    while (SESSION_ID, 1) not in quiz._inflight_questions:
+        await asyncio.sleep(0)
+
+    pending = asyncio.create_task(quiz._next_question(SESSION_ID, CARD_IDS, 1, client))
+    await asyncio.sleep(0.05)
+    gate.set()
+    question, hit = await pending
+    await prefetch
+
+    assert hit is False
+    assert question.question_text == sessions.doc["prefetched_questions"]["1"]["question_text"]
+    assert client.calls == 3
@@ -0,0 +1,116 @@
+"""
+Plan usage counters — app/services/quota.py.
+
+Covers:
+  1. A create is admitted by one conditional $inc with the limit per tier
+  2. A full counter rejects with the plan's 403 and never counts documents
+  3. A missing counter is seeded once from count_documents, then retried
+  4. The reconciler writes only drifted counters, as compare-and-set
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.services import quota
+
+USER_ID = "507f1f77bcf86cd799439011"
+
+
+def _users(modified=(1,), found=None):
+    users = MagicMock()
+    users.update_one = AsyncMock(side_effect=[MagicMock(modified_count=m) for m in modified])
+    users.find_one = AsyncMock(return_value=found)
+    users.bulk_write = AsyncMock()
+    return users
+
+
+async def test_reserve_is_one_conditional_inc():
+    users = _users()
+    cards = MagicMock(count_documents=AsyncMock())
+    with patch.object(quota, "users_collection", users), patch.object(quota, "cards_collection", cards):
+        await quota.reserve(USER_ID, quota.card_quota_key("flashcard"))
+
+    users.update_one.assert_awaited_once()
+    users.find_one.assert_not_called()
+    cards.count_documents.assert_not_called()
+    query, update = users.update_one.call_args[0]
+    assert query["_id"] == ObjectId(USER_ID)
+    assert {"subscription.tier": {"$nin": ["plus", "pro"]}, "usage.flashcards": {"$lte": 49}} in query["$or"]
+    assert {"subscription.tier": "pro", "usage.flashcards": {"$exists": True}} in query["$or"]
+    assert update == {"$inc": {"usage.flashcards": 1}}
+
+
+async def test_full_counter_rejects_without_counting():
+    users = _users(modified=(0,), found={"_id": ObjectId(USER_ID), "usage": {"quiz_questions": 10}})
+    cards = MagicMock(count_documents=AsyncMock())
+    with patch.object(quota, "users_collection", users), patch.object(quota, "cards_collection", cards):
+        with pytest.raises(HTTPException) as full:
+            await quota.reserve(USER_ID, quota.card_quota_key("quiz"))
+
+    assert full.value.status_code == 403
+    assert full.value.detail == "Quiz Questions limit reached for Free plan. Upgrade to create more."
+    cards.count_documents.assert_not_called()
+
+
+async def test_missing_counter_is_seeded_then_retried():
+    users = _users(modified=(0, 1, 1), found={"_id": ObjectId(USER_ID)})
+    books = MagicMock(count_documents=AsyncMock(return_value=2))
+    with patch.object(quota, "users_collection", users), patch.object(quota, "books_collection", books):
+        assert await quota.try_reserve(USER_ID, "books") is True
+
+    books.count_documents.assert_awaited_once_with({"user_id": USER_ID, "deleted_at": None})
+    seed_query, seed_update = users.update_one.call_args_list[1][0]
+    assert seed_query == {"_id": ObjectId(USER_ID), "usage.books": {"$exists": False}}
+    assert seed_update == {"$set": {"usage.books": 2}}
+    assert users.update_one.call_count == 3
+
+
+async def test_reconcile_corrects_only_drifted_counters():
+    user_oid = ObjectId(USER_ID)
+    stored = {"flashcards": 7, "quiz_questions": 0, "visual_diagrams": 0, "books": 1}
+    users = _users()
+    users.find = MagicMock(return_value=MagicMock(batch_size=MagicMock(return_value=_cursor(
+        [{"_id": user_oid, "usage": stored}]
+    ))))
+
+    to_lists = []
+
+    def aggregate(pipeline):
+        books_pipeline = pipeline[1]["$group"]["_id"] == "$user_id"
+        rows = [{"_id": USER_ID, "n": 1}] if books_pipeline else [
+            {"_id": {"user_id": USER_ID, "key": "flashcards"}, "n": 5},
+        ]
+        to_list = AsyncMock(return_value=rows)
+        to_lists.append(to_list)
+        return MagicMock(to_list=to_list)
+
+    with patch.object(quota, "users_collection", users), \
+            patch.object(quota, "cards_collection", MagicMock(aggregate=aggregate)), \
+            patch.object(quota, "books_collection", MagicMock(aggregate=aggregate)):
+        report = await quota.reconcile()
+
+    assert report == {"users": 1, "corrected": 1}
+    (correction,) = users.bulk_write.call_args[0][0]
+    assert correction._filter == {"_id": user_oid, "usage.flashcards": 7}
+    assert correction._doc == {"$set": {"usage.flashcards": 5}}
+    # Both aggregations are bounded: one row per user and counter.
+    assert [call.kwargs["length"] for t in to_lists for call in t.await_args_list] == [
+        len(quota.QUOTA_KEYS), 1
+    ]
+
+
+def _cursor(docs):
+    class Cursor:
+        def __aiter__(self):
+            self._docs = iter(docs)
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self._docs)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    return Cursor()
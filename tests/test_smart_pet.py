@@ -150,6 +150,7 @@ from app.routers.agent import (  # noqa: E402
     _build_context_injection,
     _build_session_summary_message,
     _INTERVENTION_PROMPT_TEMPLATES,
+    _VisibleReplyStream,
     InterventionRequest,
 )
 
@@ -262,3 +263,25 @@ def test_session_summary_fallback_uses_needs_attention_framing():
     lowered_multi = multi_miss_message.lower()
     assert "wrong" not in lowered_multi
     assert "missed" not in lowered_multi
+
+
+# --------------------------------------------------------------------------- #
+# /agent/chat/stream — streamed tokens never show what chat() strips
+# --------------------------------------------------------------------------- #
+
+def test_visible_reply_stream_withholds_markers_split_across_tokens():
+    visible = _VisibleReplyStream()
+    streamed = [visible.feed(t) for t in ["Photosynthesis turns light ", "into sugar. [[QUIZ", "_OFFER:plants]]"]]
+    streamed.append(visible.flush())
+    assert "".join(streamed) == "Photosynthesis turns light into sugar. "
+    assert streamed[1] == "into sugar. "
+
+    visible = _VisibleReplyStream()
+    streamed = [visible.feed(t) for t in ["Let me check <", "function=list_decks/>"]]
+    streamed.append(visible.flush())
+    assert "".join(streamed) == "Let me check "
+
+    visible = _VisibleReplyStream()
+    assert visible.feed("x < y") == "x < y"
+    assert visible.feed("[") == ""
+    assert visible.flush() == "["
@@ -0,0 +1,129 @@
+"""
+Fast startup — create_indexes() fingerprint skip and prompt snapshot loading.
+
+Covers:
+  1. A stored fingerprint matching INDEX_SPECS skips every index call
+  2. A missing fingerprint checks all collections and records it
+  3. _ensure_collection_indexes creates missing indexes and collMods a changed TTL
+  4. load_snapshot() serves prompts from langfuse_cache.json, fallbacks for gaps
+"""
+import importlib.util
+import inspect
+import json
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock, mock_open, patch
+
+from app.core import prompt_manager
+
+
+def load_database_module():
+    """Return the real `app.config.database` module.
+
+    Several test modules install a bare MagicMock at
+    `sys.modules["app.config.database"]`, so under full-suite ordering a plain
+    import here yields mocks. Loading the module from source under a private
+    name gives the real functions without mutating `sys.modules` for anyone else.
+    """
+    module = sys.modules.get("app.config.database")
+    if inspect.iscoroutinefunction(getattr(module, "create_indexes", None)):
+        return module
+
+    source = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "app", "config", "database.py",
+    )
+    spec = importlib.util.spec_from_file_location("_real_app_config_database", source)
+    real = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(real)
+    return real
+
+
+database = load_database_module()
+
+
+def _meta(stored=None):
+    meta = MagicMock()
+    meta.find_one = AsyncMock(return_value=stored)
+    meta.update_one = AsyncMock()
+    return meta
+
+
+async def test_matching_fingerprint_skips_index_checks():
+    ensure = AsyncMock()
+    meta = _meta({"_id": "indexes", "fingerprint": database.index_fingerprint()})
+
+    with patch.object(database, "schema_meta_collection", meta), \
+         patch.object(database, "_ensure_collection_indexes", ensure), \
+         patch.dict("os.environ", {"FORCE_INDEX_SYNC": ""}):
+        checked = await database.create_indexes()
+
+    assert checked is False
+    ensure.assert_not_awaited()
+    meta.update_one.assert_not_awaited()
+
+
+async def test_new_fingerprint_checks_all_collections_and_records_it():
+    ensure = AsyncMock()
+    meta = _meta(None)
+
+    with patch.object(database, "schema_meta_collection", meta), \
+         patch.object(database, "_ensure_collection_indexes", ensure), \
+         patch.object(database, "create_curation_indexes", AsyncMock(return_value=[])), \
+         patch.object(database, "create_fork_indexes", AsyncMock(return_value=[])):
+        checked = await database.create_indexes()
+
+    assert checked is True
+    assert {call.args[0] for call in ensure.await_args_list} == {spec[0] for spec in database.INDEX_SPECS}
+    meta.update_one.assert_awaited_once()
+    assert meta.update_one.call_args.args[1]["$set"]["fingerprint"] == database.index_fingerprint()
+
+
+async def test_failed_collection_leaves_fingerprint_unrecorded():
+    meta = _meta(None)
+
+    with patch.object(database, "schema_meta_collection", meta), \
+         patch.object(database, "_ensure_collection_indexes", AsyncMock(side_effect=RuntimeError("down"))), \
+         patch.object(database, "create_curation_indexes", AsyncMock(return_value=[])), \
+         patch.object(database, "create_fork_indexes", AsyncMock(return_value=[])):
+        await database.create_indexes()
+
+    meta.update_one.assert_not_awaited()
+
+
+async def test_ensure_creates_missing_and_updates_changed_ttl():
+    collection = MagicMock()
+    collection.index_information = AsyncMock(return_value={
+        "_id_": {"key": [("_id", 1)]},
+        "deleted_at_ttl": {"key": [("deleted_at", 1)], "expireAfterSeconds": 60},
+    })
+    collection.create_index = AsyncMock()
+    fake_db = MagicMock()
+    fake_db.__getitem__.return_value = collection
+    fake_db.command = AsyncMock()
+    specs = [
+        database._index("widgets", [("deleted_at", 1)], name="deleted_at_ttl", expireAfterSeconds=120),
+        database._index("widgets", [("user_id", 1)]),
+    ]
+
+    with patch.object(database, "db", fake_db):
+        await database._ensure_collection_indexes("widgets", specs)
+
+    collection.create_index.assert_awaited_once_with([("user_id", 1)], name="user_id_1")
+    fake_db.command.assert_awaited_once_with(
+        "collMod", "widgets", index={"name": "deleted_at_ttl", "expireAfterSeconds": 120}
+    )
+
+
+def test_load_snapshot_prefers_snapshot_and_fills_gaps():
+    snapshot = {"prompts": {"nowry-book-expand": "snapshot template"}}
+
+    with patch.object(prompt_manager, "_prompt_cache", {}), \
+         patch("builtins.open", mock_open(read_data=json.dumps(snapshot))):
+        loaded = prompt_manager.load_snapshot()
+        cache = dict(prompt_manager._prompt_cache)
+
+    assert loaded == 1
+    assert cache["nowry-book-expand"].template == "snapshot template"
+    assert set(cache) == set(prompt_manager._FALLBACKS)
+    assert cache["nowry-quiz-intent"].template == prompt_manager._FALLBACKS["nowry-quiz-intent"]
@@ -2,10 +2,10 @@
 Phase 31 — D-08 regression: Browse sessions must never move the streak.
 
 Verification test only (no production code change). `review_card` in
-study_cards.py is the SOLE writer of `last_reviewed`, and Browse never
-calls it (Phase 30's structural guarantee). This test locks in that a session
-with no `last_reviewed` writes in the reviewed-cards window computes a
-streak of 0 in app.routers.users.get_user_stats.
+study_cards.py is the SOLE writer of `last_reviewed` and of review counts in
+the daily activity rollups, and Browse never calls it (Phase 30's structural
+guarantee). This test locks in that a session with no review writes computes
+a streak of 0 in app.routers.users.get_user_stats.
 """
 import sys
 from unittest.mock import AsyncMock, MagicMock, patch
@@ -29,11 +29,18 @@ if "app.auth.firebase_auth" not in sys.modules:
 import pytest
 
 
+def _empty_activity_days():
+    """activity_days collection with no rollups in the window."""
+    collection = MagicMock()
+    collection.find.return_value.sort.return_value.to_list = AsyncMock(return_value=[])
+    return collection
+
+
 @pytest.mark.asyncio
 async def test_streak_unaffected_when_last_reviewed_untouched(mock_users_collection):
     """D-08 regression: a Browse session that wrote no last_reviewed
     timestamps must not extend/create a streak — get_user_stats returns
-    study_streak == 0 when the reviewed-cards cursor yields nothing."""
+    study_streak == 0 when no day in the window has a recorded review."""
     from app.routers.users import get_user_stats
 
     mock_books_collection = MagicMock()
@@ -41,13 +48,11 @@ async def test_streak_unaffected_when_last_reviewed_untouched(mock_users_collect
 
     mock_study_cards_collection = MagicMock()
     mock_study_cards_collection.count_documents = AsyncMock(return_value=0)
-    mock_agg_cursor = MagicMock()
-    mock_agg_cursor.to_list = AsyncMock(return_value=[])  # no distinct reviewed dates this window
-    mock_study_cards_collection.aggregate = MagicMock(return_value=mock_agg_cursor)
 
     with patch("app.routers.users.study_cards_collection", mock_study_cards_collection), \
          patch("app.routers.users.books_collection", mock_books_collection), \
-         patch("app.routers.users.users_collection", mock_users_collection):
+         patch("app.routers.users.users_collection", mock_users_collection), \
+         patch("app.services.activity.activity_days_collection", _empty_activity_days()):
         stats = await get_user_stats("507f1f77bcf86cd799439011")
 
     assert stats["study_streak"] == 0
@@ -57,7 +62,7 @@ async def test_streak_unaffected_when_last_reviewed_untouched(mock_users_collect
 async def test_streak_stays_zero_across_multiple_stat_queries(mock_users_collection):
     """Behavioral invariant, not a source-level check (per plan note): even
     though get_user_stats issues several independent count_documents calls
-    (total/flashcards/reviewed/quiz/visual) alongside the streak cursor, a
+    (total/flashcards/reviewed/quiz/visual) alongside the streak read, a
     completely untouched review window still yields study_streak == 0 —
     documenting that Browse's lack of last_reviewed writes is the sole
     input the streak calculation depends on."""
@@ -69,15 +74,13 @@ async def test_streak_stays_zero_across_multiple_stat_queries(mock_users_collect
     mock_study_cards_collection = MagicMock()
     # Non-zero counts for unrelated stats (total_cards, flashcards_count, etc.)
     # must not influence the streak calculation, which is driven solely by
-    # the separate find()->cursor path below.
+    # the activity rollups.
     mock_study_cards_collection.count_documents = AsyncMock(return_value=42)
-    mock_agg_cursor = MagicMock()
-    mock_agg_cursor.to_list = AsyncMock(return_value=[])
-    mock_study_cards_collection.aggregate = MagicMock(return_value=mock_agg_cursor)
 
     with patch("app.routers.users.study_cards_collection", mock_study_cards_collection), \
          patch("app.routers.users.books_collection", mock_books_collection), \
-         patch("app.routers.users.users_collection", mock_users_collection):
+         patch("app.routers.users.users_collection", mock_users_collection), \
+         patch("app.services.activity.activity_days_collection", _empty_activity_days()):
         stats = await get_user_stats("507f1f77bcf86cd799439011")
 
     assert stats["study_streak"] == 0
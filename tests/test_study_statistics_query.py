@@ -1,16 +1,12 @@
 """
-Phase 33 Plan 04 — get_statistics equivalence + BOLA $match-scoping tests.
-
-RESEARCH.md Pattern 4: `get_statistics` (study_cards.py) replaces a
-`to_list(length=2000)` fetch + nested Python day-bucketing/streak loop with a
-MongoDB aggregation pipeline (copying the `get_card_tags` $match-first
-pattern). This test is written against the POST-fix aggregation shape and is
-EXPECTED TO FAIL (RED) until Task 2 lands the aggregation pipeline in
-study_cards.py — `collection.aggregate(...)` is not called by `get_statistics`
-yet, and `app.routers.study_cards.books_collection` does not exist as a
-module-level name yet (it is a local import inside the function today), so
-the `patch(...)` target in this file's fixtures will raise AttributeError
-until Task 2 hoists it to module level.
+get_statistics equivalence + user-scoping tests.
+
+`get_statistics` (study_cards.py) reads weekly progress, books touched per
+day and the streak from the per-user daily activity rollups
+(app/services/activity.py) instead of aggregating cards' last_reviewed and
+loading the user's books. These tests feed rollup documents through a mocked
+`activity_days` collection and check the response shape is unchanged and
+every read is scoped to the requesting user.
 """
 import sys
 from datetime import datetime, timedelta, timezone
@@ -47,10 +43,9 @@ def _make_cursor(return_value):
     return cursor
 
 
-def _make_mock_collection(grouped_rows, recent_cards, struggle_cards, counts):
+def _make_mock_collection(recent_cards, struggle_cards, counts):
     """Build a mock `cards_collection` covering every query get_statistics
     issues:
-      - `.aggregate(pipeline)` -> weekly/streak grouped-day-count rows
       - `.find({..., "last_reviewed": {"$ne": None}}).sort(...).limit(10).to_list(...)`
         -> top-10 recent_performance record docs
       - `.find({..., "repetitions": {"$lte": 1}}).sort(...).to_list(...)`
@@ -60,8 +55,6 @@ def _make_mock_collection(grouped_rows, recent_cards, struggle_cards, counts):
     """
     collection = MagicMock()
 
-    collection.aggregate = MagicMock(return_value=_make_cursor(grouped_rows))
-
     recent_find_result = MagicMock()
     recent_find_result.sort.return_value.limit.return_value.to_list = AsyncMock(
         return_value=recent_cards
@@ -83,19 +76,32 @@ def _make_mock_collection(grouped_rows, recent_cards, struggle_cards, counts):
     return collection
 
 
+def _make_activity_days(rollups):
+    """A mock `activity_days` collection returning ``rollups`` for the day-range read."""
+    activity_days = MagicMock()
+    activity_days.find.return_value.sort.return_value.to_list = AsyncMock(return_value=rollups)
+    return activity_days
+
+
+def _make_books(recent_books):
+    books = MagicMock()
+    books.find.return_value.sort.return_value.limit.return_value.to_list = AsyncMock(return_value=recent_books)
+    return books
+
+
 @pytest.mark.asyncio
 async def test_get_statistics_equivalence_shape():
     """weekly_progress/recent_performance/summary keep the current response
-    shape and values when fed by the aggregation's grouped day/type rows."""
+    shape and values when fed by daily activity rollups."""
     now = datetime.now(timezone.utc).replace(tzinfo=None)
     today = now.replace(hour=0, minute=0, second=0, microsecond=0)
     today_str = today.strftime("%Y-%m-%d")
     yesterday_str = (today - timedelta(days=1)).strftime("%Y-%m-%d")
 
-    grouped_rows = [
-        {"_id": {"day": today_str, "type": "flashcard"}, "count": 3},
-        {"_id": {"day": today_str, "type": "quiz"}, "count": 1},
-        {"_id": {"day": yesterday_str, "type": "flashcard"}, "count": 2},
+    rollups = [
+        {"day": today_str, "reviews": {"flashcard": 3, "quiz": 1}, "reviews_total": 4,
+         "book_ids": ["b1", "b2"], "study_seconds": 600},
+        {"day": yesterday_str, "reviews": {"flashcard": 2}, "reviews_total": 2},
     ]
     recent_cards = [
         {
@@ -105,18 +111,16 @@ async def test_get_statistics_equivalence_shape():
             "last_reviewed": now,
         }
     ]
-    struggle_cards = []
 
     collection = _make_mock_collection(
-        grouped_rows=grouped_rows,
         recent_cards=recent_cards,
-        struggle_cards=struggle_cards,
+        struggle_cards=[],
         counts=[10, 6, 4],  # total_cards, reviewed_cards, due_today
     )
+    books = _make_books([{"title": "Book A", "updated_at": now}])
 
-    with patch("app.routers.study_cards.books_collection") as mock_books_collection:
-        mock_books_collection.find.return_value.to_list = AsyncMock(return_value=[])
-
+    with patch("app.routers.study_cards.books_collection", books), \
+         patch("app.services.activity.activity_days_collection", _make_activity_days(rollups)):
         result = await get_statistics(
             collection=collection,
             current_user={"user_id": USER_ID},
@@ -129,12 +133,17 @@ async def test_get_statistics_equivalence_shape():
     assert isinstance(result["weekly_progress"], list)
     assert len(result["weekly_progress"]) == 7
     # Last entry is always "today" (the loop walks 6 days ago -> today).
-    assert result["weekly_progress"][-1]["date"] == today_str
-    assert result["weekly_progress"][-1]["flashcards"] == 3
-    assert result["weekly_progress"][-1]["quizzes"] == 1
-    assert result["weekly_progress"][-1]["visual"] == 0
+    today_entry = result["weekly_progress"][-1]
+    assert today_entry["date"] == today_str
+    assert today_entry["flashcards"] == 3
+    assert today_entry["quizzes"] == 1
+    assert today_entry["visual"] == 0
+    assert today_entry["cards"] == 4
+    assert today_entry["books"] == 2
+    assert today_entry["minutes"] == 10
 
     assert any(rp.get("card_title") == "Card A" for rp in result["recent_performance"])
+    assert result["recent_performance"][0]["card_title"] == "Book A"
 
     summary = result["summary"]
     for key in (
@@ -150,36 +159,33 @@ async def test_get_statistics_equivalence_shape():
     assert summary["reviewed_cards"] == 6
     assert summary["new_cards"] == 4
     assert summary["due_today"] == 4
-    # today + yesterday both have grouped rows -> 2-day streak, no gap.
+    # today + yesterday both have reviews -> 2-day streak, no gap.
     assert summary["current_streak"] == 2
     assert summary["last_session_struggle"] is None
 
 
 @pytest.mark.asyncio
-async def test_get_statistics_bola_match_scoping():
-    """The aggregate pipeline's FIRST stage must be a $match scoped to the
-    requesting user's own, non-deleted cards — the sole enforcement point
-    for the aggregation (T-33-01)."""
+async def test_get_statistics_reads_are_user_scoped():
+    """Rollups and recent books are read for the requesting user only, and no
+    book body is loaded to build the chart."""
     collection = _make_mock_collection(
-        grouped_rows=[],
         recent_cards=[],
         struggle_cards=[],
         counts=[0, 0, 0],
     )
+    activity_days = _make_activity_days([])
+    books = _make_books([])
 
-    with patch("app.routers.study_cards.books_collection") as mock_books_collection:
-        mock_books_collection.find.return_value.to_list = AsyncMock(return_value=[])
+    with patch("app.routers.study_cards.books_collection", books), \
+         patch("app.services.activity.activity_days_collection", activity_days):
         await get_statistics(collection=collection, current_user={"user_id": USER_ID})
 
-    assert collection.aggregate.called, "get_statistics must call collection.aggregate(...)"
-    pipeline_arg = collection.aggregate.call_args[0][0]
-    assert isinstance(pipeline_arg, list) and len(pipeline_arg) > 0
-
-    first_stage = pipeline_arg[0]
-    assert "$match" in first_stage, "First pipeline stage must be a $match (BOLA enforcement point)"
+    rollup_filter = activity_days.find.call_args.args[0]
+    assert rollup_filter["user_id"] == USER_ID
+    assert "$gte" in rollup_filter["day"]
 
-    match_clause = first_stage["$match"]
-    assert "user_id" in match_clause
-    assert "deleted_at" in match_clause
-    assert match_clause["user_id"] == USER_ID
-    assert match_clause["deleted_at"] is None
+    book_filter, book_projection = books.find.call_args.args
+    assert book_filter["user_id"] == USER_ID
+    assert book_filter["deleted_at"] is None
+    assert "full_content" not in book_projection
+    books.find.return_value.sort.return_value.limit.assert_called_once_with(3)
@@ -27,16 +27,19 @@ def make_collection(matched_count: int = 1, docs=None) -> MagicMock:
 
     `count_documents` returns 0 so the public-content guard passes, and `find`
     yields a cursor whose bounded `.to_list()` resolves to `docs` (default empty,
-    which short-circuits the annual-plan sub-cascades).
+    which short-circuits the cascade below plans, decks and books).
     """
     collection = MagicMock()
     result = MagicMock()
     result.matched_count = matched_count
+    result.modified_count = matched_count
     collection.update_one = AsyncMock(return_value=result)
     collection.update_many = AsyncMock(return_value=result)
     collection.count_documents = AsyncMock(return_value=0)
+    collection.delete_many = AsyncMock(return_value=result)
     cursor = MagicMock()
     cursor.to_list = AsyncMock(return_value=list(docs or []))
+    cursor.limit = MagicMock(return_value=cursor)
     collection.find = MagicMock(return_value=cursor)
     return collection
 
@@ -52,34 +55,28 @@ async def test_delete_account_cascades_blackboards(mock_firebase_user):
     # Record cascade-vs-revocation ordering to pin D-08 (all MongoDB soft-deletes
     # commit BEFORE Firebase credentials are revoked).
     order: list = []
-    mock_blackboards.update_many.side_effect = lambda *a, **kw: order.append("cascade")
+    cascade_result = mock_blackboards.update_many.return_value
+    mock_blackboards.update_many.side_effect = lambda *a, **kw: order.append("cascade") or cascade_result
 
     # firebase_admin is imported inside delete_account's try block; stubbing it in
     # sys.modules keeps the test hermetic (no credential resolution / network).
     mock_fb_auth = MagicMock()
     mock_fb_auth.revoke_refresh_tokens.side_effect = lambda uid: order.append("revoke")
 
-    # priorities/activities/daily_routines are imported INSIDE delete_account, so
-    # they resolve from app.config.database at call time and must be patched there.
-    # patch.object on the module object is deliberate: other test modules install a
-    # bare MagicMock at sys.modules["app.config.database"], which leaves app.config
-    # without a `database` attribute and makes patch()'s dotted lookup fail under
-    # full-suite ordering.
-    db_module = sys.modules["app.config.database"]
+    # The content cascade resolves collections by name through app.services.cascade.db;
+    # every collection but blackboards gets an empty stand-in.
+    collections = {"blackboards": mock_blackboards}
+    fake_db = MagicMock()
+    fake_db.__getitem__.side_effect = lambda name: collections.setdefault(name, make_collection())
 
     with patch.dict(sys.modules, {"firebase_admin": MagicMock(auth=mock_fb_auth)}), \
-         patch.object(db_module, "priorities_collection", make_collection()), \
-         patch.object(db_module, "activities_collection", make_collection()), \
-         patch.object(db_module, "daily_routines_collection", make_collection()), \
+         patch("app.services.cascade.db", fake_db), \
          patch("app.routers.users.users_collection", make_collection()), \
          patch("app.routers.users.decks_collection", make_collection()), \
          patch("app.routers.users.books_collection", make_collection()), \
-         patch("app.routers.users.study_cards_collection", make_collection()), \
-         patch("app.routers.users.study_sessions_collection", make_collection()), \
-         patch("app.routers.users.annual_plans_collection", make_collection()), \
-         patch("app.routers.users.focus_areas_collection", make_collection()), \
-         patch("app.routers.users.goals_collection", make_collection()), \
-         patch("app.routers.users.tasks_collection", make_collection()), \
+         patch("app.routers.users.book_texts_collection", make_collection()), \
+         patch("app.routers.users.activity_days_collection", make_collection()), \
+         patch("app.routers.users.data_export.delete_user_exports", AsyncMock()), \
          patch("app.routers.users.blackboards_collection", mock_blackboards):
 
         await delete_account(current_user=mock_firebase_user)